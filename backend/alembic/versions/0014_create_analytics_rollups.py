@@ -0,0 +1,70 @@
+"""Crea tablas de rollups diarios de analítica del storefront
+
+analytics_daily_rollups: totales por tenant y día cerrado.
+analytics_daily_breakdowns: conteos por source/device/path/search por día.
+analytics_daily_visitors: visitor_id distintos por día (visitantes únicos del periodo).
+analytics_rollup_state: último día agregado por tenant.
+Las mantiene analytics_rollup.py; /web-analytics/summary sólo lee crudo en los bordes.
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-08-02
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0014"
+down_revision: Union[str, None] = "0013"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_daily_rollups (
+            tenant_id          UUID NOT NULL,
+            day                DATE NOT NULL,
+            sessions           INTEGER DEFAULT 0,
+            new_sessions       INTEGER DEFAULT 0,
+            bounced            INTEGER DEFAULT 0,
+            duration_sum       INTEGER DEFAULT 0,
+            duration_count     INTEGER DEFAULT 0,
+            session_pageviews  INTEGER DEFAULT 0,
+            pageviews          INTEGER DEFAULT 0,
+            updated_at         TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (tenant_id, day)
+        )
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_daily_breakdowns (
+            tenant_id      UUID NOT NULL,
+            day            DATE NOT NULL,
+            dimension      VARCHAR(10) NOT NULL,
+            key            VARCHAR NOT NULL,
+            count          INTEGER DEFAULT 0,
+            first_seen_at  TIMESTAMP,
+            PRIMARY KEY (tenant_id, day, dimension, key)
+        )
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_daily_visitors (
+            tenant_id   UUID NOT NULL,
+            day         DATE NOT NULL,
+            visitor_id  UUID NOT NULL,
+            PRIMARY KEY (tenant_id, day, visitor_id)
+        )
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+            tenant_id       UUID PRIMARY KEY,
+            rolled_through  DATE NOT NULL,
+            updated_at      TIMESTAMP DEFAULT NOW()
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS analytics_rollup_state")
+    op.execute("DROP TABLE IF EXISTS analytics_daily_visitors")
+    op.execute("DROP TABLE IF EXISTS analytics_daily_breakdowns")
+    op.execute("DROP TABLE IF EXISTS analytics_daily_rollups")
@@ -0,0 +1,142 @@
+"""Particiona analytics_pageviews / analytics_searches por mes e índices compuestos
+
+analytics_pageviews y analytics_searches pasan a PARTITION BY RANGE (created_at)
+con una partición por mes (analytics_pageviews_pYYYY_MM) más una DEFAULT de
+respaldo. La retención (analytics_retention.py) borra particiones completas en
+vez de hacer DELETE fila a fila, y crea por adelantado las de los próximos meses.
+
+analytics_sessions no se particiona: su id es el session_id del cliente y se
+usa en ON CONFLICT (id) y en UPDATE ... WHERE id = ..., y una PK particionada
+tendría que incluir started_at. Su retención es por DELETE en lotes.
+
+Las tablas particionadas se crean sin FK (como las de 0011 y 0012: ni
+session_id -> analytics_sessions ni tenant_id -> users). La integridad con
+analytics_sessions la mantiene la retención, que sólo borra sesiones sin
+pageviews ni búsquedas (ver analytics_retention); ix_analytics_searches_session_id
+sirve a esa comprobación.
+
+Los índices sólo por tenant_id se reemplazan por (tenant_id, created_at) /
+(tenant_id, started_at): todas las consultas del dashboard filtran por ambos.
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-08-04
+"""
+import datetime
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0015"
+down_revision: Union[str, None] = "0014"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_MONTHS_AHEAD = 2
+
+_COLUMNS = {
+    "analytics_pageviews": """
+            id          UUID NOT NULL DEFAULT gen_random_uuid(),
+            tenant_id   UUID NOT NULL,
+            session_id  UUID NOT NULL,
+            path        VARCHAR,
+            created_at  TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (id, created_at)""",
+    "analytics_searches": """
+            id             UUID NOT NULL DEFAULT gen_random_uuid(),
+            tenant_id      UUID NOT NULL,
+            session_id     UUID,
+            term           VARCHAR,
+            results_count  INTEGER DEFAULT 0,
+            created_at     TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (id, created_at)""",
+}
+_COPY = {
+    "analytics_pageviews": "id, tenant_id, session_id, path, COALESCE(created_at, NOW())",
+    "analytics_searches": "id, tenant_id, session_id, term, results_count, COALESCE(created_at, NOW())",
+}
+
+
+def _month_start(d: datetime.date) -> datetime.date:
+    return d.replace(day=1)
+
+
+def _next_month(d: datetime.date) -> datetime.date:
+    return (d.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _is_partitioned(conn, table: str) -> bool:
+    return bool(conn.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"
+    ), {"t": table}).scalar())
+
+
+def _partition(table: str) -> None:
+    conn = op.get_bind()
+    if _is_partitioned(conn, table):
+        return
+    legacy = f"{table}_legacy"
+    op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    op.execute(f"ALTER INDEX IF EXISTS {table}_pkey RENAME TO {legacy}_pkey")
+    op.execute(f"CREATE TABLE {table} ({_COLUMNS[table]}\n        ) PARTITION BY RANGE (created_at)")
+
+    first = conn.execute(sa.text(f"SELECT MIN(created_at) FROM {legacy}")).scalar()
+    today = datetime.date.today()
+    month = _month_start(first.date() if first else today)
+    last = _month_start(today)
+    for _ in range(_MONTHS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        nxt = _next_month(month)
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_p{month:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month}') TO ('{nxt}')"
+        )
+        month = nxt
+    op.execute(f"CREATE TABLE IF NOT EXISTS {table}_pdefault PARTITION OF {table} DEFAULT")
+
+    op.execute(f"INSERT INTO {table} SELECT {_COPY[table]} FROM {legacy}")
+    op.execute(f"DROP TABLE {legacy}")
+
+
+def upgrade() -> None:
+    _partition("analytics_pageviews")
+    _partition("analytics_searches")
+
+    op.execute("DROP INDEX IF EXISTS ix_analytics_pageviews_tenant_id")
+    op.execute("DROP INDEX IF EXISTS ix_analytics_searches_tenant_id")
+    op.execute("DROP INDEX IF EXISTS ix_analytics_sessions_tenant_id")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_pageviews_tenant_id_created_at ON analytics_pageviews (tenant_id, created_at)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_pageviews_session_id ON analytics_pageviews (session_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_pageviews_created_at ON analytics_pageviews (created_at)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_searches_tenant_id_created_at ON analytics_searches (tenant_id, created_at)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_searches_created_at ON analytics_searches (created_at)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_searches_session_id ON analytics_searches (session_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_sessions_tenant_id_started_at ON analytics_sessions (tenant_id, started_at)")
+
+
+def _unpartition(table: str) -> None:
+    conn = op.get_bind()
+    if not _is_partitioned(conn, table):
+        return
+    legacy = f"{table}_partitioned"
+    op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    op.execute(f"ALTER INDEX IF EXISTS {table}_pkey RENAME TO {legacy}_pkey")
+    op.execute(f"CREATE TABLE {table} ({_COLUMNS[table].replace('PRIMARY KEY (id, created_at)', 'PRIMARY KEY (id)')}\n        )")
+    op.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+    op.execute(f"DROP TABLE {legacy} CASCADE")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_analytics_searches_session_id")
+    _unpartition("analytics_pageviews")
+    _unpartition("analytics_searches")
+    op.execute("DROP INDEX IF EXISTS ix_analytics_sessions_tenant_id_started_at")
+    op.execute("DROP INDEX IF EXISTS ix_analytics_searches_tenant_id_created_at")
+    op.execute("DROP INDEX IF EXISTS ix_analytics_pageviews_tenant_id_created_at")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_sessions_tenant_id ON analytics_sessions (tenant_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_pageviews_tenant_id ON analytics_pageviews (tenant_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_pageviews_session_id ON analytics_pageviews (session_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_pageviews_created_at ON analytics_pageviews (created_at)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_searches_tenant_id ON analytics_searches (tenant_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_analytics_searches_created_at ON analytics_searches (created_at)")
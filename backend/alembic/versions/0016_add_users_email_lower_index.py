@@ -0,0 +1,26 @@
+"""Índice funcional sobre LOWER(email) en users
+
+crud.get_user_by_email filtra con LOWER(email) = :email en login y en cada
+request autenticada cuya identidad no está en la caché de principals; el
+índice único sobre email no sirve para esa expresión y la consulta hacía
+seq scan sobre users.
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-08-06
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0016"
+down_revision: Union[str, None] = "0015"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE INDEX IF NOT EXISTS ix_users_email_lower ON users (LOWER(email))")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_users_email_lower")
@@ -0,0 +1,41 @@
+"""Crea order_outbox (efectos secundarios de pedidos)
+
+crud.create_order escribe un evento por pedido en el mismo commit; el
+dispatcher de order_outbox.py hace en lote el upsert del CRM, el envío, la
+notificación y los emails, fuera de la transacción que bloquea el stock.
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-08-09
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0017"
+down_revision: Union[str, None] = "0016"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS order_outbox (
+            id            BIGSERIAL PRIMARY KEY,
+            order_id      UUID,
+            tenant_id     UUID,
+            event         VARCHAR(40) DEFAULT 'order_created',
+            payload       JSON,
+            status        VARCHAR(20) DEFAULT 'pending',
+            attempts      INTEGER DEFAULT 0,
+            error         VARCHAR,
+            created_at    TIMESTAMP DEFAULT NOW(),
+            processed_at  TIMESTAMP
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_order_outbox_order_id ON order_outbox (order_id)")
+    # Sólo los pendientes: el dispatcher los reclama en orden de id
+    op.execute("CREATE INDEX IF NOT EXISTS ix_order_outbox_pending ON order_outbox (id) WHERE status = 'pending'")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS order_outbox")
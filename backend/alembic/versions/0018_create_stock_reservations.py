@@ -0,0 +1,46 @@
+"""Reservas de stock para pagos pendientes
+
+product_variants.reserved_stock es el contador de unidades apartadas por
+pagos de la pasarela aún sin confirmar; stock_reservations guarda cada reserva
+con su vencimiento para que el sweeper de stock_reservations.py libere las que
+el webhook nunca confirmó.
+
+Revision ID: 0018
+Revises: 0017
+Create Date: 2026-08-11
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0018"
+down_revision: Union[str, None] = "0017"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE product_variants ADD COLUMN IF NOT EXISTS reserved_stock INTEGER DEFAULT 0")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS stock_reservations (
+            id                  UUID PRIMARY KEY,
+            payment_id          UUID REFERENCES payments(id),
+            tenant_id           UUID,
+            product_variant_id  UUID REFERENCES product_variants(id),
+            quantity            INTEGER NOT NULL,
+            status              VARCHAR(20) DEFAULT 'active',
+            expires_at          TIMESTAMP NOT NULL,
+            created_at          TIMESTAMP DEFAULT NOW(),
+            closed_at           TIMESTAMP
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_stock_reservations_payment_id ON stock_reservations (payment_id)")
+    # El sweeper sólo recorre las activas, por vencimiento
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_stock_reservations_active_expires "
+        "ON stock_reservations (expires_at) WHERE status = 'active'"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS stock_reservations")
+    op.execute("ALTER TABLE product_variants DROP COLUMN IF EXISTS reserved_stock")
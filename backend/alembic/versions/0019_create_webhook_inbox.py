@@ -0,0 +1,51 @@
+"""Crea webhook_inbox (eventos de pasarela pendientes de aplicar)
+
+El webhook de Wompi guarda el evento verificado y responde 200 de inmediato;
+los workers de webhook_inbox.py lo aplican en orden por pago, con reintentos.
+El índice único (provider, transaction_id, tx_status) descarta reentregas.
+
+Revision ID: 0019
+Revises: 0018
+Create Date: 2026-08-13
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0019"
+down_revision: Union[str, None] = "0018"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS webhook_inbox (
+            id               BIGSERIAL PRIMARY KEY,
+            provider         VARCHAR(20) NOT NULL,
+            transaction_id   VARCHAR(255) NOT NULL,
+            tx_status        VARCHAR(40) NOT NULL,
+            reference        VARCHAR(255),
+            payload          JSON,
+            status           VARCHAR(20) DEFAULT 'pending',
+            attempts         INTEGER DEFAULT 0,
+            next_attempt_at  TIMESTAMP DEFAULT NOW(),
+            locked_until     TIMESTAMP,
+            last_error       VARCHAR,
+            received_at      TIMESTAMP DEFAULT NOW(),
+            processed_at     TIMESTAMP
+        )
+    """)
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_webhook_inbox_event "
+        "ON webhook_inbox (provider, transaction_id, tx_status)"
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_webhook_inbox_reference ON webhook_inbox (reference)")
+    # Los workers sólo recorren los eventos abiertos
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_webhook_inbox_open "
+        "ON webhook_inbox (id) WHERE status IN ('pending', 'processing')"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS webhook_inbox")
@@ -0,0 +1,25 @@
+"""Añade users.sale_digest_minutes (digest de avisos de venta)
+
+Revision ID: 0020
+Revises: 0019
+Create Date: 2026-08-14
+
+Opt-in por tenant: con un valor > 0 los avisos de "Nueva venta" al dueño se
+agrupan en un solo email cada N minutos (email_queue.DIGEST_FUNC) en vez de
+uno por venta. NULL/0 conserva el comportamiento anterior.
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0020"
+down_revision: Union[str, None] = "0019"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS sale_digest_minutes INTEGER")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE users DROP COLUMN IF EXISTS sale_digest_minutes")
@@ -0,0 +1,36 @@
+"""Índices parciales de email_jobs (reclamo y retención)
+
+Revision ID: 0021
+Revises: 0020
+Create Date: 2026-08-16
+
+ix_email_jobs_status indexaba todas las filas por un status de pocos valores
+y no servía al reclamo, que filtra jobs abiertos y ordena por id. Con los
+'sent' acumulándose para siempre, el reclamo recorría el historial.
+  - ix_email_jobs_claim: (id) sólo de jobs abiertos; el reclamo de
+    email_queue repite el predicado para usarlo.
+  - ix_email_jobs_sent_at: (updated_at) de los 'sent', para que
+    email_queue.archive_sent borre los viejos en lotes sin recorrer la tabla.
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0021"
+down_revision: Union[str, None] = "0020"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_email_jobs_claim ON email_jobs (id) "
+        "WHERE status IN ('pending', 'processing')"
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_email_jobs_sent_at ON email_jobs (updated_at) WHERE status = 'sent'")
+    op.execute("DROP INDEX IF EXISTS ix_email_jobs_status")
+
+
+def downgrade() -> None:
+    op.execute("CREATE INDEX IF NOT EXISTS ix_email_jobs_status ON email_jobs (status)")
+    op.execute("DROP INDEX IF EXISTS ix_email_jobs_sent_at")
+    op.execute("DROP INDEX IF EXISTS ix_email_jobs_claim")
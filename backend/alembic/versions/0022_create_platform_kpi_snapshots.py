@@ -0,0 +1,47 @@
+"""Crea platform_kpi_snapshots e índice en users.created_at
+
+platform_kpi_snapshots: totales de plataforma (pedidos, usuarios, ventas y
+comisión, del día y del mes) hasta un watermark. Los escribe
+platform_kpis.refresh cada PLATFORM_KPI_REFRESH_S; /super-admin/stats lee el
+último y suma el delta desde el watermark.
+ix_users_created_at: para contar los usuarios nuevos de ese delta sin
+recorrer users.
+
+Revision ID: 0022
+Revises: 0021
+Create Date: 2026-08-17
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0022"
+down_revision: Union[str, None] = "0021"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS platform_kpi_snapshots (
+            id                BIGSERIAL PRIMARY KEY,
+            taken_at          TIMESTAMP NOT NULL,
+            watermark         TIMESTAMP NOT NULL,
+            day_start         TIMESTAMP NOT NULL,
+            month_start       TIMESTAMP NOT NULL,
+            total_orders      INTEGER DEFAULT 0,
+            total_users       INTEGER DEFAULT 0,
+            total_revenue     DOUBLE PRECISION DEFAULT 0.0,
+            total_commission  DOUBLE PRECISION DEFAULT 0.0,
+            revenue_day       DOUBLE PRECISION DEFAULT 0.0,
+            commission_day    DOUBLE PRECISION DEFAULT 0.0,
+            revenue_month     DOUBLE PRECISION DEFAULT 0.0,
+            commission_month  DOUBLE PRECISION DEFAULT 0.0,
+            refresh_ms        DOUBLE PRECISION
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_users_created_at ON users (created_at)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_users_created_at")
+    op.execute("DROP TABLE IF EXISTS platform_kpi_snapshots")
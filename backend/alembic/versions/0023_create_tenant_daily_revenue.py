@@ -0,0 +1,47 @@
+"""Crea tenant_daily_revenue y la llena desde orders
+
+Ventas, comisión y pedidos por tenant y día (UTC). La mantiene
+tenant_revenue.py en cada escritura de pedidos por el ORM; /super-admin/treasury
+y /super-admin/reports la leen en vez de traer los pedidos a Python.
+
+Revision ID: 0023
+Revises: 0022
+Create Date: 2026-08-18
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0023"
+down_revision: Union[str, None] = "0022"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS tenant_daily_revenue (
+            tenant_id   UUID NOT NULL,
+            day         DATE NOT NULL,
+            revenue     DOUBLE PRECISION DEFAULT 0.0,
+            commission  DOUBLE PRECISION DEFAULT 0.0,
+            orders      INTEGER DEFAULT 0,
+            PRIMARY KEY (tenant_id, day)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_tenant_daily_revenue_day ON tenant_daily_revenue (day)")
+    # Backfill: bloquea escrituras de orders mientras agrega, para no perder
+    # pedidos creados entre el SELECT y el primer upsert de la app
+    op.execute("LOCK TABLE orders IN SHARE MODE")
+    op.execute("""
+        INSERT INTO tenant_daily_revenue (tenant_id, day, revenue, commission, orders)
+        SELECT tenant_id, created_at::date, COALESCE(SUM(total_price), 0),
+               COALESCE(SUM(commission_amount), 0), COUNT(*)
+        FROM orders
+        WHERE tenant_id IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY tenant_id, created_at::date
+        ON CONFLICT (tenant_id, day) DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS tenant_daily_revenue")
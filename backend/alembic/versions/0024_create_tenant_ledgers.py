@@ -0,0 +1,84 @@
+"""Crea tenant_ledgers y la llena desde orders y liquidations
+
+Saldo corriente de liquidaciones por tenant: pendiente web y POS desde el
+último pago de cada tipo y totales pagados. La mantiene tenant_ledger.py en
+cada escritura de pedidos y liquidaciones por el ORM;
+/admin/liquidations/summary la lee en vez de sumar la historia.
+scripts/reconcile_ledger.py la compara con la historia y la corrige.
+
+Revision ID: 0024
+Revises: 0023
+Create Date: 2026-08-19
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0024"
+down_revision: Union[str, None] = "0023"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_SQL = """
+    WITH paid AS (
+        SELECT tenant_id,
+               MAX(paid_date) FILTER (WHERE liq_type = 'web') AS web_cutoff,
+               MAX(paid_date) FILTER (WHERE liq_type = 'pos_commission') AS pos_cutoff,
+               COALESCE(SUM(net_amount), 0) AS paid_net,
+               COALESCE(SUM(gross_amount), 0) AS paid_gross,
+               COALESCE(SUM(bayup_commission), 0) AS paid_bayup,
+               COUNT(*) AS paid_count
+        FROM liquidations
+        WHERE status = 'paid'
+        GROUP BY tenant_id
+    ), pending AS (
+        SELECT o.tenant_id,
+               COALESCE(SUM(o.total_price) FILTER (WHERE o.source <> 'pos'
+                   AND (p.web_cutoff IS NULL OR o.created_at > p.web_cutoff)), 0) AS web_gross,
+               COUNT(*) FILTER (WHERE o.source <> 'pos'
+                   AND (p.web_cutoff IS NULL OR o.created_at > p.web_cutoff)) AS web_count,
+               COALESCE(SUM(o.total_price) FILTER (WHERE o.source = 'pos'
+                   AND (p.pos_cutoff IS NULL OR o.created_at > p.pos_cutoff)), 0) AS pos_gross,
+               COUNT(*) FILTER (WHERE o.source = 'pos'
+                   AND (p.pos_cutoff IS NULL OR o.created_at > p.pos_cutoff)) AS pos_count
+        FROM orders o
+        LEFT JOIN paid p ON p.tenant_id = o.tenant_id
+        WHERE o.tenant_id IS NOT NULL
+          AND o.status IN ('confirmed', 'delivered', 'completed', 'pending')
+        GROUP BY o.tenant_id
+    )
+    INSERT INTO tenant_ledgers (tenant_id, web_cutoff, web_gross, web_count, pos_cutoff, pos_gross,
+                                pos_count, paid_net, paid_gross, paid_bayup, paid_count)
+    SELECT COALESCE(q.tenant_id, p.tenant_id), p.web_cutoff, COALESCE(q.web_gross, 0),
+           COALESCE(q.web_count, 0), p.pos_cutoff, COALESCE(q.pos_gross, 0), COALESCE(q.pos_count, 0),
+           COALESCE(p.paid_net, 0), COALESCE(p.paid_gross, 0), COALESCE(p.paid_bayup, 0),
+           COALESCE(p.paid_count, 0)
+    FROM pending q
+    FULL OUTER JOIN paid p ON p.tenant_id = q.tenant_id
+    ON CONFLICT (tenant_id) DO NOTHING
+"""
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS tenant_ledgers (
+            tenant_id   UUID PRIMARY KEY,
+            web_cutoff  TIMESTAMP,
+            web_gross   DOUBLE PRECISION DEFAULT 0.0,
+            web_count   INTEGER DEFAULT 0,
+            pos_cutoff  TIMESTAMP,
+            pos_gross   DOUBLE PRECISION DEFAULT 0.0,
+            pos_count   INTEGER DEFAULT 0,
+            paid_net    DOUBLE PRECISION DEFAULT 0.0,
+            paid_gross  DOUBLE PRECISION DEFAULT 0.0,
+            paid_bayup  DOUBLE PRECISION DEFAULT 0.0,
+            paid_count  INTEGER DEFAULT 0,
+            updated_at  TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    # Sin escrituras de pedidos ni liquidaciones mientras se agrega la historia
+    op.execute("LOCK TABLE orders, liquidations IN SHARE MODE")
+    op.execute(BACKFILL_SQL)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS tenant_ledgers")
@@ -0,0 +1,46 @@
+"""Crea liquidation_closes y agrega liquidations.origin
+
+liquidation_closes: un registro por cierre de periodo (liquidation_close.py):
+estado running/done, contadores y tiempos. Un cierre 'done' no se repite; uno
+'running' que quedó a medias se retoma con los tenants que faltan.
+
+liquidations.origin: 'manual' (super admin, valor por defecto) o 'close'
+(creada por un cierre). Sólo las 'close' cubren hasta su period_end (ver
+tenant_ledger.coverage); en las manuales period_end es una fecha sin hora y
+sigue valiendo paid_date, así que las filas existentes no cambian.
+
+Revision ID: 0025
+Revises: 0024
+Create Date: 2026-08-20
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0025"
+down_revision: Union[str, None] = "0024"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS liquidation_closes (
+            period_end        TIMESTAMP PRIMARY KEY,
+            status            VARCHAR NOT NULL DEFAULT 'running',
+            scheduled_date    TIMESTAMP,
+            started_at        TIMESTAMP DEFAULT NOW(),
+            finished_at       TIMESTAMP,
+            tenants           INTEGER DEFAULT 0,
+            web_liquidations  INTEGER DEFAULT 0,
+            pos_liquidations  INTEGER DEFAULT 0,
+            web_net           DOUBLE PRECISION DEFAULT 0.0,
+            pos_commission    DOUBLE PRECISION DEFAULT 0.0,
+            elapsed_ms        DOUBLE PRECISION
+        )
+    """)
+    op.execute("ALTER TABLE liquidations ADD COLUMN IF NOT EXISTS origin VARCHAR DEFAULT 'manual'")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE liquidations DROP COLUMN IF EXISTS origin")
+    op.execute("DROP TABLE IF EXISTS liquidation_closes")
@@ -0,0 +1,27 @@
+"""Agrega order_outbox.next_attempt_at (reintentos con backoff)
+
+Un evento que falla vuelve a 'pending' con next_attempt_at = ahora + backoff
+exponencial (order_outbox._backoff); el dispatcher sólo reclama los vencidos.
+Sin esto el mismo evento se reclamaba en el siguiente poll y agotaba sus
+MAX_ATTEMPTS en milisegundos ante un error transitorio. Las filas existentes
+quedan con NOW(): se pueden reclamar ya.
+
+Revision ID: 0026
+Revises: 0025
+Create Date: 2026-08-24
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0026"
+down_revision: Union[str, None] = "0025"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE order_outbox ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP DEFAULT NOW()")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE order_outbox DROP COLUMN IF EXISTS next_attempt_at")
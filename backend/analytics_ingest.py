@@ -0,0 +1,313 @@
+"""
+Ingesta bufferizada de analítica del storefront.
+
+/public/track/* es el camino con más escrituras del sistema: antes cada
+pageview hacía hasta 5 queries y un commit. Ahora el endpoint sólo valida,
+resuelve slug → tenant desde caché y deja el evento en un buffer en memoria;
+un hilo lo vuelca a la DB en lote:
+  1. visitantes: INSERT multi-fila ... ON CONFLICT DO NOTHING RETURNING
+     (lo que se insertó es "visitante nuevo", sin SELECT previo)
+  2. sesiones:   INSERT multi-fila ... ON CONFLICT DO NOTHING
+  3. pageviews y búsquedas: INSERT multi-fila
+  4. pageview_count: un UPDATE por sesión con el incremento agregado
+  5. duración de sesión (session-end): el último valor por sesión gana
+
+El vuelco ocurre cada ANALYTICS_FLUSH_MS o al juntar ANALYTICS_FLUSH_EVENTS.
+Límite de durabilidad: si el proceso muere se pierde como máximo lo que haya
+en el buffer (≤ ANALYTICS_MAX_BUFFER eventos, normalmente < 1 intervalo).
+Si el buffer se llena (DB lenta o caída) los eventos nuevos se descartan y se
+cuentan en `dropped` — la analítica nunca debe frenar el storefront ni
+acaparar el pool de conexiones.
+Un evento inválido no tira el lote: flush_isolating lo parte hasta aislarlo.
+
+Sin el flusher corriendo (tests, scripts) los eventos se escriben en línea
+con la sesión de la request, con el mismo código de volcado.
+"""
+import datetime as _dt
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import bindparam, exc, update
+
+import models
+
+logger = logging.getLogger("bayup.analytics_ingest")
+
+FLUSH_INTERVAL_MS = int(os.getenv("ANALYTICS_FLUSH_MS", "1000"))
+FLUSH_MAX_EVENTS = int(os.getenv("ANALYTICS_FLUSH_EVENTS", "500"))
+MAX_BUFFER = int(os.getenv("ANALYTICS_MAX_BUFFER", "20000"))
+_INSERT_CHUNK = 500
+# Errores atribuibles a filas concretas del lote: se parte el lote para
+# aislarlas. Cualquier otro error (DB caída, timeout) descarta el lote entero.
+_ROW_ERRORS = (exc.IntegrityError, exc.DataError, KeyError, TypeError, ValueError)
+
+_buffer: deque = deque()
+_buffer_lock = threading.Lock()
+_wakeup = threading.Event()
+
+_metrics = {
+    "enqueued": 0,
+    "dropped": 0,
+    "flushed": 0,
+    "flushes": 0,
+    "flush_errors": 0,
+    "orphan_pageviews": 0,
+    "last_flush_ms": 0.0,
+    "last_flush_events": 0,
+    "max_buffer_seen": 0,
+}
+
+
+# ── API usada por los endpoints ───────────────────────────────────────────
+
+def pageview(db, *, tenant_id, visitor_id, session_id, path: str, is_new_session: bool,
+             source: str | None = None, referrer_domain: str | None = None, device: str | None = None) -> bool:
+    return _submit(db, {
+        "kind": "pageview", "tenant_id": tenant_id, "visitor_id": visitor_id,
+        "session_id": session_id, "path": path, "is_new_session": is_new_session,
+        "source": source, "referrer_domain": referrer_domain, "device": device,
+    })
+
+
+def search(db, *, tenant_id, session_id, term: str, results_count: int) -> bool:
+    return _submit(db, {
+        "kind": "search", "tenant_id": tenant_id, "session_id": session_id,
+        "term": term, "results_count": results_count,
+    })
+
+
+def session_end(db, *, session_id, duration_seconds: int) -> bool:
+    return _submit(db, {"kind": "session_end", "session_id": session_id, "duration": duration_seconds})
+
+
+def _submit(db, event: dict) -> bool:
+    event["ts"] = _dt.datetime.utcnow()
+    if not _flusher_started:
+        try:
+            flush_events([event], db)
+        except Exception as e:
+            db.rollback()
+            logger.warning("analytics_ingest: volcado en línea falló: %s", e)
+        return True
+    with _buffer_lock:
+        if len(_buffer) >= MAX_BUFFER:
+            _metrics["dropped"] += 1
+            return False
+        _buffer.append(event)
+        _metrics["enqueued"] += 1
+        size = len(_buffer)
+        if size > _metrics["max_buffer_seen"]:
+            _metrics["max_buffer_seen"] = size
+    if size >= FLUSH_MAX_EVENTS:
+        _wakeup.set()
+    return True
+
+
+def stats() -> dict:
+    with _buffer_lock:
+        return {
+            **_metrics,
+            "buffer_size": len(_buffer),
+            "max_buffer": MAX_BUFFER,
+            "flush_interval_ms": FLUSH_INTERVAL_MS,
+            "flush_max_events": FLUSH_MAX_EVENTS,
+            "flusher_running": _flusher_started,
+        }
+
+
+# ── Volcado en lote ───────────────────────────────────────────────────────
+
+def _dialect_insert(db, table):
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def _chunks(rows: list, size: int = _INSERT_CHUNK):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def flush_events(events: list, db) -> None:
+    """Escribe un lote de eventos en una sola transacción."""
+    if not events:
+        return
+    pageviews = [e for e in events if e["kind"] == "pageview"]
+    searches = [e for e in events if e["kind"] == "search"]
+    ends = [e for e in events if e["kind"] == "session_end"]
+
+    # 1) Visitantes nuevos. Si un mismo visitante abre varias sesiones en el
+    #    lote, sólo la primera cuenta como "visitante nuevo" (igual que antes).
+    new_session_events: dict = {}
+    for e in pageviews:
+        if e["is_new_session"] and e["session_id"] not in new_session_events:
+            new_session_events[e["session_id"]] = e
+    visitor_rows = {}
+    for e in new_session_events.values():
+        visitor_rows.setdefault((e["tenant_id"], e["visitor_id"]), {
+            "tenant_id": e["tenant_id"], "visitor_id": e["visitor_id"], "first_seen_at": e["ts"],
+        })
+    inserted_visitors = set()
+    visitor_table = models.AnalyticsVisitor.__table__
+    for chunk in _chunks(list(visitor_rows.values())):
+        stmt = _dialect_insert(db, visitor_table).values(chunk).on_conflict_do_nothing().returning(
+            visitor_table.c.tenant_id, visitor_table.c.visitor_id,
+        )
+        inserted_visitors.update((r[0], r[1]) for r in db.execute(stmt))
+
+    # 2) Sesiones nuevas (idempotente ante doble disparo del cliente)
+    session_rows = []
+    for e in new_session_events.values():
+        key = (e["tenant_id"], e["visitor_id"])
+        is_new_visitor = key in inserted_visitors
+        inserted_visitors.discard(key)
+        session_rows.append({
+            "id": e["session_id"], "tenant_id": e["tenant_id"], "visitor_id": e["visitor_id"],
+            "is_new_visitor": is_new_visitor, "source": e["source"], "referrer_domain": e["referrer_domain"],
+            "device_type": e["device"], "entry_path": e["path"], "pageview_count": 0,
+            "started_at": e["ts"], "updated_at": e["ts"],
+        })
+    session_table = models.AnalyticsSession.__table__
+    for chunk in _chunks(session_rows):
+        db.execute(_dialect_insert(db, session_table).values(chunk).on_conflict_do_nothing())
+
+    # Sesiones referenciadas que no vienen en el lote: una sola consulta para
+    # saber cuáles existen (una pageview huérfana rompería la FK del lote entero).
+    known = set(new_session_events)
+    referenced = {e["session_id"] for e in pageviews + searches if e["session_id"]} - known
+    for chunk in _chunks(list(referenced)):
+        known.update(r[0] for r in db.query(models.AnalyticsSession.id).filter(models.AnalyticsSession.id.in_(chunk)))
+
+    # 3) Pageviews + búsquedas
+    pv_rows = [
+        {"tenant_id": e["tenant_id"], "session_id": e["session_id"], "path": e["path"], "created_at": e["ts"]}
+        for e in pageviews if e["session_id"] in known
+    ]
+    orphans = len(pageviews) - len(pv_rows)
+    if pv_rows:
+        db.bulk_insert_mappings(models.AnalyticsPageview, pv_rows)
+    search_rows = [
+        {"tenant_id": e["tenant_id"], "session_id": e["session_id"] if e["session_id"] in known else None,
+         "term": e["term"], "results_count": e["results_count"], "created_at": e["ts"]}
+        for e in searches
+    ]
+    if search_rows:
+        db.bulk_insert_mappings(models.AnalyticsSearch, search_rows)
+
+    # 4) pageview_count: un incremento agregado por sesión
+    increments: dict = {}
+    last_seen: dict = {}
+    for row in pv_rows:
+        increments[row["session_id"]] = increments.get(row["session_id"], 0) + 1
+        last_seen[row["session_id"]] = row["created_at"]
+    if increments:
+        db.execute(
+            update(session_table)
+            .where(session_table.c.id == bindparam("sid"))
+            .values(pageview_count=session_table.c.pageview_count + bindparam("n"), updated_at=bindparam("ts")),
+            [{"sid": sid, "n": n, "ts": last_seen[sid]} for sid, n in increments.items()],
+        )
+
+    # 5) Duración de sesión: el último session-end del lote gana
+    durations: dict = {}
+    for e in ends:
+        durations[e["session_id"]] = e
+    if durations:
+        db.execute(
+            update(session_table)
+            .where(session_table.c.id == bindparam("sid"))
+            .values(duration_seconds=bindparam("dur"), updated_at=bindparam("ts")),
+            [{"sid": sid, "dur": e["duration"], "ts": e["ts"]} for sid, e in durations.items()],
+        )
+    db.commit()
+    if orphans:
+        with _buffer_lock:
+            _metrics["orphan_pageviews"] += orphans
+
+
+def _drain() -> list:
+    with _buffer_lock:
+        batch = list(_buffer)
+        _buffer.clear()
+    return batch
+
+
+def flush_isolating(events: list, db, written: list | None = None) -> int:
+    """Como flush_events, pero si el lote falla por filas inválidas lo parte
+    en mitades y reintenta: sólo se pierden los eventos que fallan solos.
+    Las mitades se escriben en orden, así una sesión creada en la primera ya
+    existe para las pageviews de la segunda. Devuelve los eventos escritos;
+    si se pasa `written` ([0]), se acumulan ahí a medida que cada parte
+    confirma, para que el llamador sepa cuántos quedaron en la DB aunque
+    después salte un error que no es de filas."""
+    written = [0] if written is None else written
+    try:
+        flush_events(events, db)
+        written[0] += len(events)
+        return len(events)
+    except _ROW_ERRORS as e:
+        db.rollback()
+        if len(events) == 1:
+            logger.warning("analytics_ingest: evento descartado: %s", e)
+            return 0
+    mid = len(events) // 2
+    return flush_isolating(events[:mid], db, written) + flush_isolating(events[mid:], db, written)
+
+
+def flush_now() -> int:
+    """Vuelca todo el buffer en la DB. Devuelve la cantidad de eventos escritos."""
+    from database import SessionLocal
+    batch = _drain()
+    if not batch:
+        return 0
+    start = time.perf_counter()
+    db = SessionLocal()
+    written = [0]
+    try:
+        flush_isolating(batch, db, written)
+    except Exception as e:
+        db.rollback()
+        logger.warning("analytics_ingest: %d de %d eventos descartados: %s",
+                       len(batch) - written[0], len(batch), e)
+    finally:
+        db.close()
+    with _buffer_lock:
+        _metrics["flushed"] += written[0]
+        _metrics["flushes"] += 1
+        _metrics["last_flush_events"] = written[0]
+        _metrics["last_flush_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if written[0] < len(batch):
+            _metrics["flush_errors"] += 1
+            _metrics["dropped"] += len(batch) - written[0]
+    return written[0]
+
+
+def _flusher_loop() -> None:
+    while True:
+        _wakeup.wait(FLUSH_INTERVAL_MS / 1000)
+        _wakeup.clear()
+        try:
+            flush_now()
+        except Exception as e:
+            logger.warning("analytics_ingest flusher error: %s", e)
+
+
+_flusher_started = False
+_flusher_lock = threading.Lock()
+
+
+def start_flusher() -> None:
+    """Arranca el flusher en background. Idempotente — solo corre uno."""
+    global _flusher_started
+    with _flusher_lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+    t = threading.Thread(target=_flusher_loop, daemon=True, name="analytics-ingest-flusher")
+    t.start()
+    logger.info("analytics_ingest: flusher iniciado")
@@ -0,0 +1,201 @@
+"""
+Retención de las tablas crudas de analítica.
+
+analytics_pageviews, analytics_sessions y analytics_searches crecían sin
+límite. Pasados ANALYTICS_RETENTION_DAYS se eliminan, pero nunca antes de que
+sus días estén agregados en los rollups (analytics_rollup): si el job de
+rollups va atrasado para un tenant, ese tenant conserva sus filas desde su
+primer día sin agregar.
+
+- PostgreSQL con tablas particionadas (alembic 0015): se descartan
+  particiones mensuales completas cuyo rango quedó entero antes del corte.
+  ANALYTICS_RETENTION_MODE=detach las separa en vez de borrarlas, para
+  archivarlas (pg_dump) y borrarlas a mano. También crea por adelantado las
+  particiones de los próximos meses.
+- Tablas sin particionar (sessions, SQLite, PostgreSQL sin 0015): DELETE en
+  lotes de ANALYTICS_RETENTION_BATCH filas con commit por lote, para no
+  bloquear la ingesta con una transacción gigante.
+
+Las sesiones van al final y sólo se borran las que ya no tienen pageviews ni
+búsquedas: una sesión que empezó antes del corte puede tener hijos
+posteriores (o retenidos por un tenant atrasado). Así se respeta la FK
+session_id donde existe (tablas creadas desde models) y, en las tablas
+particionadas de 0015, que no la tienen, no quedan hijos huérfanos.
+
+Corre en la misma vuelta que el job de rollups, justo después de agregar.
+"""
+import datetime as _dt
+import logging
+import os
+
+from sqlalchemy import exists, text
+
+import models
+
+logger = logging.getLogger("bayup.analytics_retention")
+
+RETENTION_DAYS = int(os.getenv("ANALYTICS_RETENTION_DAYS", "400"))
+RETENTION_MODE = os.getenv("ANALYTICS_RETENTION_MODE", "drop")  # drop | detach
+RETENTION_BATCH = int(os.getenv("ANALYTICS_RETENTION_BATCH", "5000"))
+MONTHS_AHEAD = 2
+
+# (modelo, columna de tiempo)
+_TABLES = (
+    (models.AnalyticsPageview, "created_at"),
+    (models.AnalyticsSearch, "created_at"),
+    (models.AnalyticsSession, "started_at"),
+)
+
+
+def _month_start(d: _dt.date) -> _dt.date:
+    return d.replace(day=1)
+
+
+def _next_month(d: _dt.date) -> _dt.date:
+    return (d.replace(day=28) + _dt.timedelta(days=4)).replace(day=1)
+
+
+# ── Corte seguro ──────────────────────────────────────────────────────────
+
+def retention_cutoff(now: _dt.datetime) -> _dt.datetime:
+    # Nunca por debajo del horizonte del dashboard (90 días)
+    from analytics_rollup import HORIZON_DAYS
+    days = max(RETENTION_DAYS, HORIZON_DAYS + 1)
+    return _dt.datetime.combine((now - _dt.timedelta(days=days)).date(), _dt.time.min)
+
+
+def held_tenants(db, model, ts_name: str, cutoff: _dt.datetime) -> dict:
+    """Tenants con filas crudas sin agregar antes del corte: {tenant_id: corte
+    propio}, que es el inicio de su primer día pendiente."""
+    ts = getattr(model, ts_name)
+    State = models.AnalyticsRollupState
+    held = {}
+    for tenant_id, rolled in db.query(State.tenant_id, State.rolled_through).filter(
+        State.rolled_through < (cutoff - _dt.timedelta(days=1)).date(),
+    ):
+        pending_from = _dt.datetime.combine(rolled + _dt.timedelta(days=1), _dt.time.min)
+        pending = db.query(model.tenant_id).filter(
+            model.tenant_id == tenant_id, ts >= pending_from, ts < cutoff,
+        ).first()
+        if pending is not None:
+            held[tenant_id] = pending_from
+    return held
+
+
+# ── Particiones (PostgreSQL) ──────────────────────────────────────────────
+
+def _is_partitioned(db, table: str) -> bool:
+    return bool(db.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"
+    ), {"t": table}).scalar())
+
+
+def ensure_partitions(db, table: str, today: _dt.date) -> int:
+    """Crea las particiones del mes actual y los MONTHS_AHEAD siguientes."""
+    created = 0
+    month = _month_start(today)
+    for _ in range(MONTHS_AHEAD + 1):
+        nxt = _next_month(month)
+        name = f"{table}_p{month:%Y_%m}"
+        if db.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar() is None:
+            try:
+                db.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{month}') TO ('{nxt}')"
+                ))
+                db.commit()
+                created += 1
+            except Exception as e:
+                # Falla si la partición DEFAULT ya tiene filas de ese mes
+                db.rollback()
+                logger.warning("analytics_retention: no se pudo crear %s: %s", name, e)
+        month = nxt
+    return created
+
+
+def _expired_partitions(db, table: str, cutoff: _dt.datetime) -> list[str]:
+    """Particiones mensuales cuyo límite superior es <= cutoff."""
+    rows = db.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:t)"
+    ), {"t": table}).all()
+    expired = []
+    prefix = f"{table}_p"
+    for name, bound in rows:
+        suffix = name[len(prefix):] if name.startswith(prefix) else ""
+        if "DEFAULT" in (bound or "") or len(suffix) != 7:
+            continue
+        try:
+            month = _dt.date(int(suffix[:4]), int(suffix[5:]), 1)
+        except ValueError:
+            continue
+        if _dt.datetime.combine(_next_month(month), _dt.time.min) <= cutoff:
+            expired.append(name)
+    return sorted(expired)
+
+
+def _drop_partitions(db, table: str, cutoff: _dt.datetime) -> int:
+    dropped = 0
+    for name in _expired_partitions(db, table, cutoff):
+        if RETENTION_MODE == "detach":
+            db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        else:
+            db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        dropped += 1
+        logger.info("analytics_retention: partición %s %s", name,
+                    "separada" if RETENTION_MODE == "detach" else "eliminada")
+    return dropped
+
+
+# ── DELETE en lotes (sin particiones) ─────────────────────────────────────
+
+def delete_before(db, model, ts_name: str, cutoff: _dt.datetime, *filters) -> int:
+    ts = getattr(model, ts_name)
+    total = 0
+    while True:
+        ids = [r[0] for r in db.query(model.id).filter(ts < cutoff, *filters).limit(RETENTION_BATCH)]
+        if not ids:
+            return total
+        db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        total += len(ids)
+
+
+def _childless() -> tuple:
+    """Sesiones sin pageviews ni búsquedas que las referencien."""
+    S, P, Q = models.AnalyticsSession, models.AnalyticsPageview, models.AnalyticsSearch
+    return (
+        ~exists().where(P.session_id == S.id),
+        ~exists().where(Q.session_id == S.id),
+    )
+
+
+# ── Vuelta del job ────────────────────────────────────────────────────────
+
+def run_once(db, now: _dt.datetime | None = None) -> dict:
+    """Aplica la retención a las tres tablas. Devuelve lo eliminado por tabla
+    (filas, o particiones para las tablas particionadas)."""
+    now = now or _dt.datetime.utcnow()
+    postgres = db.bind.dialect.name == "postgresql"
+    cutoff = retention_cutoff(now)
+    result = {}
+    for model, ts_name in _TABLES:
+        table = model.__tablename__
+        partitioned = postgres and _is_partitioned(db, table)
+        if partitioned:
+            ensure_partitions(db, table, now.date())
+        held = held_tenants(db, model, ts_name, cutoff)
+        if held:
+            logger.info("analytics_retention: %s retiene %d tenants con rollups pendientes", table, len(held))
+        if partitioned:
+            # Una partición mezcla tenants: se descarta sólo si ninguno la retiene
+            safe = min([cutoff, *held.values()])
+            result[table] = {"partitions": _drop_partitions(db, table, safe)}
+        else:
+            extra = _childless() if model is models.AnalyticsSession else ()
+            rows = delete_before(db, model, ts_name, cutoff, model.tenant_id.notin_(list(held)), *extra)
+            for tenant_id, tenant_cutoff in held.items():
+                rows += delete_before(db, model, ts_name, tenant_cutoff, model.tenant_id == tenant_id, *extra)
+            result[table] = {"rows": rows}
+    return result
@@ -0,0 +1,353 @@
+"""
+Rollups diarios de analítica del storefront.
+
+/web-analytics/summary cargaba hasta 90 días de sesiones, pageviews y
+búsquedas en objetos ORM para contarlos en Python. Ahora un job en segundo
+plano cierra cada día por tenant en tablas pequeñas:
+  - analytics_daily_rollups:    totales del día (sumas, no promedios)
+  - analytics_daily_breakdowns: conteos por source / device / path / search
+  - analytics_daily_visitors:   visitor_id distintos del día
+  - analytics_rollup_state:     último día agregado por tenant
+
+El resumen combina los rollups de los días completos del periodo con los
+datos crudos sólo de los bordes (inicio parcial y días aún no cerrados).
+
+Un día D se cierra cuando pasaron ANALYTICS_ROLLUP_LAG_HOURS desde su fin:
+las sesiones siguen sumando pageviews y su duración llega al salir (tope 6h),
+así que agregarlo a medianoche congelaría datos incompletos. Re-agregar un
+día es idempotente (borra e inserta), por lo que varios procesos corriendo
+el job no duplican datos.
+"""
+import datetime as _dt
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import case, func, select, union
+
+import models
+
+logger = logging.getLogger("bayup.analytics_rollup")
+
+ROLLUP_INTERVAL = int(os.getenv("ANALYTICS_ROLLUP_INTERVAL_S", "900"))
+ROLLUP_LAG_HOURS = int(os.getenv("ANALYTICS_ROLLUP_LAG_HOURS", "7"))
+HORIZON_DAYS = 91  # el dashboard consulta como máximo 90 días
+
+DIMENSIONS = ("source", "device", "path", "search")
+SUMMARY_TOP = 10  # top de páginas y búsquedas del dashboard
+
+
+# ── Agregado parcial ──────────────────────────────────────────────────────
+# Estructura común a datos crudos y rollups para poder sumarlos:
+#   totales + {dimensión: {clave: [conteo, primer_visto]}} + {día: sesiones}
+
+def empty_aggregate() -> dict:
+    return {
+        "sessions": 0, "new_sessions": 0, "bounced": 0,
+        "duration_sum": 0, "duration_count": 0,
+        "session_pageviews": 0, "pageviews": 0,
+        "source": {}, "device": {}, "path": {}, "search": {},
+        "by_day": {},
+    }
+
+
+def _bump(bucket: dict, key, n: int, seen) -> None:
+    entry = bucket.get(key)
+    if entry is None:
+        bucket[key] = [n, seen]
+    else:
+        entry[0] += n
+        if seen is not None and (entry[1] is None or seen < entry[1]):
+            entry[1] = seen
+
+
+def merge(into: dict, other: dict) -> dict:
+    for k in ("sessions", "new_sessions", "bounced", "duration_sum", "duration_count", "session_pageviews", "pageviews"):
+        into[k] += other[k]
+    for dim in DIMENSIONS:
+        for key, (n, seen) in other[dim].items():
+            _bump(into[dim], key, n, seen)
+    for day, n in other["by_day"].items():
+        into["by_day"][day] = into["by_day"].get(day, 0) + n
+    return into
+
+
+def _day_key(d) -> str:
+    # func.date() devuelve str en SQLite y date en PostgreSQL
+    return d if isinstance(d, str) else d.strftime("%Y-%m-%d")
+
+
+def _ranked_rows(db, key_col, ts_col, filters, top: int | None):
+    """[(clave, conteo, primer_visto)] con GROUP BY en la DB. Con top, el
+    ORDER BY/LIMIT también va en SQL (mismo desempate que el dashboard:
+    mayor conteo y, a igual conteo, el que apareció antes)."""
+    n = func.count().label("n")
+    seen = func.min(ts_col).label("seen")
+    q = db.query(key_col, n, seen).filter(*filters).group_by(key_col)
+    if top is not None:
+        q = q.order_by(n.desc(), seen.asc()).limit(top)
+    return q.all()
+
+
+def aggregate_raw(db, tenant_id, start: _dt.datetime, end: _dt.datetime | None, top: int | None = None) -> dict:
+    """Agrega las tablas crudas en [start, end). end=None = hasta ahora.
+
+    Todo se resuelve con agregados SQL: ninguna fila cruda llega a Python.
+    top limita paths y búsquedas a los N primeros; sólo es válido cuando el
+    resultado no se va a combinar con otro agregado."""
+    agg = empty_aggregate()
+    S, P, Q = models.AnalyticsSession, models.AnalyticsPageview, models.AnalyticsSearch
+
+    s_filters = [S.tenant_id == tenant_id, S.started_at >= start]
+    p_filters = [P.tenant_id == tenant_id, P.created_at >= start]
+    q_filters = [Q.tenant_id == tenant_id, Q.created_at >= start, Q.term.isnot(None), Q.term != ""]
+    if end is not None:
+        s_filters.append(S.started_at < end)
+        p_filters.append(P.created_at < end)
+        q_filters.append(Q.created_at < end)
+
+    pv_count = func.coalesce(S.pageview_count, 0)
+    totals = db.query(
+        func.count(),
+        func.sum(case((S.is_new_visitor.is_(True), 1), else_=0)),
+        func.sum(case((pv_count <= 1, 1), else_=0)),
+        func.sum(S.duration_seconds),
+        func.count(S.duration_seconds),
+        func.sum(pv_count),
+    ).filter(*s_filters).one()
+    for k, v in zip(("sessions", "new_sessions", "bounced", "duration_sum", "duration_count", "session_pageviews"), totals):
+        agg[k] = int(v or 0)
+    if agg["sessions"]:
+        source = func.coalesce(func.nullif(S.source, ""), "direct")
+        device = func.coalesce(func.nullif(S.device_type, ""), "desktop")
+        for dim, col in (("source", source), ("device", device)):
+            for key, n, seen in _ranked_rows(db, col, S.started_at, s_filters, None):
+                agg[dim][key] = [n, seen]
+        day = func.date(S.started_at)
+        for d, n in db.query(day, func.count()).filter(*s_filters).group_by(day):
+            agg["by_day"][_day_key(d)] = n
+
+    path = func.coalesce(func.nullif(P.path, ""), "/")
+    for key, n, seen in _ranked_rows(db, path, P.created_at, p_filters, top):
+        agg["path"][key] = [n, seen]
+    agg["pageviews"] = db.query(func.count()).select_from(P).filter(*p_filters).scalar() or 0
+
+    for key, n, seen in _ranked_rows(db, Q.term, Q.created_at, q_filters, top):
+        agg["search"][key] = [n, seen]
+    return agg
+
+
+def aggregate_rollups(db, tenant_id, first_day: _dt.date, last_day: _dt.date) -> dict:
+    """Suma los rollups de [first_day, last_day] (ambos inclusive)."""
+    agg = empty_aggregate()
+    if first_day > last_day:
+        return agg
+    R = models.AnalyticsDailyRollup
+    for r in db.query(R).filter(R.tenant_id == tenant_id, R.day >= first_day, R.day <= last_day):
+        for k in ("sessions", "new_sessions", "bounced", "duration_sum", "duration_count", "session_pageviews", "pageviews"):
+            agg[k] += getattr(r, k) or 0
+        if r.sessions:
+            agg["by_day"][r.day.strftime("%Y-%m-%d")] = r.sessions
+    B = models.AnalyticsDailyBreakdown
+    rows = db.query(B.dimension, B.key, func.sum(B.count), func.min(B.first_seen_at)).filter(
+        B.tenant_id == tenant_id, B.day >= first_day, B.day <= last_day,
+    ).group_by(B.dimension, B.key).all()
+    for dim, key, n, seen in rows:
+        if dim in DIMENSIONS:
+            _bump(agg[dim], key, int(n or 0), seen)
+    return agg
+
+
+# ── Resumen de un periodo ─────────────────────────────────────────────────
+
+def _day_start(d: _dt.date) -> _dt.datetime:
+    return _dt.datetime.combine(d, _dt.time.min)
+
+
+def rolled_through(db, tenant_id) -> _dt.date | None:
+    return db.query(models.AnalyticsRollupState.rolled_through).filter(
+        models.AnalyticsRollupState.tenant_id == tenant_id,
+    ).scalar()
+
+
+def summarize(db, tenant_id, since: _dt.datetime) -> tuple[dict, int]:
+    """Agregado de [since, ahora] + visitantes únicos. Usa rollups para los
+    días completos ya cerrados y datos crudos para los bordes."""
+    first_full = since.date() if since == _day_start(since.date()) else since.date() + _dt.timedelta(days=1)
+    last_rolled = rolled_through(db, tenant_id)
+    if last_rolled is None or last_rolled < first_full:
+        agg = aggregate_raw(db, tenant_id, since, None, top=SUMMARY_TOP)
+        return agg, _unique_visitors(db, tenant_id, [(since, None)], None)
+
+    raw_ranges = [(since, _day_start(first_full)), (_day_start(last_rolled + _dt.timedelta(days=1)), None)]
+    agg = aggregate_rollups(db, tenant_id, first_full, last_rolled)
+    for start, end in raw_ranges:
+        if end is None or start < end:
+            merge(agg, aggregate_raw(db, tenant_id, start, end))
+    uniques = _unique_visitors(db, tenant_id, raw_ranges, (first_full, last_rolled))
+    return agg, uniques
+
+
+def _unique_visitors(db, tenant_id, raw_ranges, rolled_days) -> int:
+    """COUNT(DISTINCT visitor_id) sobre la unión de sesiones crudas de los
+    bordes y analytics_daily_visitors de los días cerrados."""
+    S = models.AnalyticsSession
+    parts = []
+    for start, end in raw_ranges:
+        q = select(S.visitor_id).where(S.tenant_id == tenant_id, S.visitor_id.isnot(None), S.started_at >= start)
+        if end is not None:
+            if start >= end:
+                continue
+            q = q.where(S.started_at < end)
+        parts.append(q)
+    if rolled_days:
+        V = models.AnalyticsDailyVisitor
+        parts.append(select(V.visitor_id).where(
+            V.tenant_id == tenant_id, V.day >= rolled_days[0], V.day <= rolled_days[1],
+        ))
+    if not parts:
+        return 0
+    combined = union(*parts).subquery() if len(parts) > 1 else parts[0].distinct().subquery()
+    return db.execute(select(func.count()).select_from(combined)).scalar() or 0
+
+
+# ── Job de cierre diario ──────────────────────────────────────────────────
+
+def _closable_through(now: _dt.datetime) -> _dt.date:
+    """Último día cuyo fin + lag ya pasó."""
+    return (now - _dt.timedelta(hours=ROLLUP_LAG_HOURS)).date() - _dt.timedelta(days=1)
+
+
+def roll_day(db, tenant_id, day: _dt.date) -> None:
+    """(Re)calcula los rollups de un día. No hace commit."""
+    start = _day_start(day)
+    end = start + _dt.timedelta(days=1)
+    for M in (models.AnalyticsDailyRollup, models.AnalyticsDailyBreakdown, models.AnalyticsDailyVisitor):
+        db.query(M).filter(M.tenant_id == tenant_id, M.day == day).delete(synchronize_session=False)
+
+    agg = aggregate_raw(db, tenant_id, start, end)
+    if agg["sessions"] or agg["pageviews"] or agg["search"]:
+        db.add(models.AnalyticsDailyRollup(
+            tenant_id=tenant_id, day=day,
+            **{k: agg[k] for k in ("sessions", "new_sessions", "bounced", "duration_sum",
+                                   "duration_count", "session_pageviews", "pageviews")},
+        ))
+        db.bulk_insert_mappings(models.AnalyticsDailyBreakdown, [
+            {"tenant_id": tenant_id, "day": day, "dimension": dim, "key": key, "count": n, "first_seen_at": seen}
+            for dim in DIMENSIONS for key, (n, seen) in agg[dim].items()
+        ])
+        S = models.AnalyticsSession
+        visitors = db.query(S.visitor_id).filter(
+            S.tenant_id == tenant_id, S.visitor_id.isnot(None), S.started_at >= start, S.started_at < end,
+        ).distinct().all()
+        db.bulk_insert_mappings(models.AnalyticsDailyVisitor, [
+            {"tenant_id": tenant_id, "day": day, "visitor_id": v[0]} for v in visitors
+        ])
+
+
+def roll_tenant(db, tenant_id, through: _dt.date) -> int:
+    """Cierra los días pendientes del tenant hasta `through`. Commit por día
+    para que un corte a mitad retome desde el último día cerrado."""
+    state = db.query(models.AnalyticsRollupState).filter(models.AnalyticsRollupState.tenant_id == tenant_id).first()
+    if state:
+        day = state.rolled_through + _dt.timedelta(days=1)
+    else:
+        first = db.query(func.min(models.AnalyticsSession.started_at)).filter(
+            models.AnalyticsSession.tenant_id == tenant_id,
+        ).scalar()
+        first_search = db.query(func.min(models.AnalyticsSearch.created_at)).filter(
+            models.AnalyticsSearch.tenant_id == tenant_id,
+        ).scalar()
+        candidates = [d.date() for d in (first, first_search) if d]
+        if not candidates:
+            return 0
+        day = max(min(candidates), through - _dt.timedelta(days=HORIZON_DAYS))
+    rolled = 0
+    while day <= through:
+        roll_day(db, tenant_id, day)
+        if state is None:
+            state = models.AnalyticsRollupState(tenant_id=tenant_id, rolled_through=day)
+            db.add(state)
+        else:
+            state.rolled_through = day
+        db.commit()
+        rolled += 1
+        day += _dt.timedelta(days=1)
+    return rolled
+
+
+def run_once(db, now: _dt.datetime | None = None) -> int:
+    """Cierra los días pendientes de todos los tenants con actividad reciente."""
+    now = now or _dt.datetime.utcnow()
+    through = _closable_through(now)
+    horizon = _day_start(through - _dt.timedelta(days=HORIZON_DAYS))
+    S, Q = models.AnalyticsSession, models.AnalyticsSearch
+    tenant_ids = db.execute(union(
+        select(S.tenant_id).where(S.started_at >= horizon),
+        select(Q.tenant_id).where(Q.created_at >= horizon),
+    )).scalars().all()
+    total = 0
+    for tenant_id in tenant_ids:
+        try:
+            total += roll_tenant(db, tenant_id, through)
+        except Exception as e:
+            db.rollback()
+            logger.warning("analytics_rollup: tenant %s falló: %s", tenant_id, e)
+    return total
+
+
+def _run_locked() -> int:
+    """Una vuelta del job (rollups + retención). En PostgreSQL sólo un proceso agrega a la vez: el
+    advisory lock vive en una conexión propia porque la sesión la suelta en
+    cada commit."""
+    from database import SessionLocal, engine
+    from sqlalchemy import text
+    lock_conn = None
+    if engine.dialect.name == "postgresql":
+        lock_conn = engine.connect()
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(hashtext('analytics_rollup'))")).scalar():
+            lock_conn.close()
+            return 0
+    db = SessionLocal()
+    try:
+        days = run_once(db)
+        # La retención va después: sólo borra días que ya quedaron agregados
+        import analytics_retention
+        try:
+            analytics_retention.run_once(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning("analytics_retention error: %s", e)
+        return days
+    finally:
+        db.close()
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext('analytics_rollup'))"))
+            lock_conn.close()
+
+
+def _job_loop() -> None:
+    while True:
+        try:
+            days = _run_locked()
+            if days:
+                logger.info("analytics_rollup: %d días-tenant agregados", days)
+        except Exception as e:
+            logger.warning("analytics_rollup job error: %s", e)
+        time.sleep(ROLLUP_INTERVAL)
+
+
+_job_started = False
+_job_lock = threading.Lock()
+
+
+def start_job() -> None:
+    """Arranca el job de rollups en background. Idempotente — solo corre uno."""
+    global _job_started
+    with _job_lock:
+        if _job_started:
+            return
+        _job_started = True
+    threading.Thread(target=_job_loop, daemon=True, name="analytics-rollup").start()
+    logger.info("analytics_rollup: job iniciado")
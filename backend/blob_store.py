@@ -0,0 +1,198 @@
+"""
+Blobs de adjuntos de emails, fuera de email_jobs.
+
+attach_invoice encolaba send_invoice_attachment con el PDF entero en base64
+dentro de kwargs_json: cientos de KB por fila, releídos en cada reclamo y
+reintento, y la tabla inflándose. Ahora el PDF se guarda aquí y el job sólo
+lleva la referencia ("blob:sha256:<hex>"):
+  - Claves por contenido (sha256): el mismo PDF encolado dos veces ocupa un
+    solo blob, y put() es idempotente.
+  - Almacenamiento: el bucket S3 de s3_service (prefijo email-blobs/, privado,
+    nunca bajo uploads/ que es público) si está configurado; si no, el
+    directorio local EMAIL_BLOB_DIR. Con EMAIL_WORKER_MODE=external el que
+    escribe (web) y el que lee (email_worker.py) son procesos distintos: se
+    exige S3 o un EMAIL_BLOB_DIR explícito en un volumen compartido
+    (require_shared_storage).
+  - Lectura en streaming al enviar: read_base64() codifica por bloques sin
+    cargar el archivo entero además de su base64.
+  - Recolección: cuando un job queda en 'sent' o 'failed', email_queue llama a
+    collect() con sus referencias; se borra cada blob que ningún job abierto
+    use. put() reescribe el blob aunque exista, así un blob modificado después
+    de crearse el job que terminó pertenece a un encolado más nuevo (quizá sin
+    commit todavía) y se respeta; sweep() recoge esos restos pasado GC_GRACE_S.
+"""
+import base64
+import datetime as _dt
+import hashlib
+import logging
+import os
+import pathlib
+
+from sqlalchemy import text
+
+logger = logging.getLogger("bayup.blob_store")
+
+BLOB_DIR = pathlib.Path(os.getenv("EMAIL_BLOB_DIR") or pathlib.Path(__file__).parent / "email_blobs")
+S3_PREFIX = "email-blobs/"
+REF_PREFIX = "blob:sha256:"
+GC_GRACE_S = 600
+CLOCK_SKEW_S = 5  # tolerancia entre el reloj de la app y el del bucket
+_CHUNK = 3 * 64 * 1024  # múltiplo de 3: los bloques en base64 se concatenan sin padding
+
+
+def _bucket() -> str | None:
+    if os.getenv("S3_BUCKET_NAME") and os.getenv("SUPABASE_S3_ENDPOINT"):
+        return os.getenv("S3_BUCKET_NAME")
+    return None
+
+
+def require_shared_storage() -> None:
+    """Falla al arrancar si el worker externo no va a poder leer los blobs que
+    escriben los procesos web: el directorio por defecto vive dentro de cada
+    despliegue y no se comparte."""
+    if _bucket() is None and not os.getenv("EMAIL_BLOB_DIR"):
+        raise RuntimeError(
+            "EMAIL_WORKER_MODE=external necesita un almacenamiento de blobs compartido: "
+            "configura S3 (S3_BUCKET_NAME + SUPABASE_S3_ENDPOINT) o EMAIL_BLOB_DIR "
+            "en un volumen montado por los procesos web y por email_worker.py."
+        )
+
+
+def _digest(ref: str) -> str:
+    if not isinstance(ref, str) or not ref.startswith(REF_PREFIX):
+        raise ValueError(f"referencia de blob inválida: {ref!r}")
+    digest = ref[len(REF_PREFIX):]
+    if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+        raise ValueError(f"referencia de blob inválida: {ref!r}")
+    return digest
+
+
+def _path(digest: str) -> pathlib.Path:
+    return BLOB_DIR / digest[:2] / digest
+
+
+def is_ref(value) -> bool:
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+def put(data: bytes) -> str:
+    """Guarda `data` y devuelve su referencia. Siempre escribe, aunque el blob
+    exista: su fecha de modificación marca el último encolado (ver collect)."""
+    digest = hashlib.sha256(data).hexdigest()
+    bucket = _bucket()
+    if bucket:
+        import s3_service
+        s3_service.get_s3_client().put_object(
+            Bucket=bucket, Key=S3_PREFIX + digest, Body=data, ContentType="application/octet-stream",
+        )
+    else:
+        dest = _path(digest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, dest)
+    return REF_PREFIX + digest
+
+
+def open_stream(ref: str):
+    """Archivo binario de sólo lectura con el contenido del blob."""
+    digest = _digest(ref)
+    bucket = _bucket()
+    if bucket:
+        import s3_service
+        return s3_service.get_s3_client().get_object(Bucket=bucket, Key=S3_PREFIX + digest)["Body"]
+    return open(_path(digest), "rb")
+
+
+def read_base64(ref: str) -> str:
+    """Contenido del blob en base64, leído por bloques."""
+    parts = []
+    stream = open_stream(ref)
+    try:
+        while True:
+            chunk = stream.read(_CHUNK)
+            if not chunk:
+                break
+            parts.append(base64.b64encode(chunk).decode("ascii"))
+    finally:
+        stream.close()
+    return "".join(parts)
+
+
+def _modified_at(digest: str) -> _dt.datetime | None:
+    bucket = _bucket()
+    try:
+        if bucket:
+            import s3_service
+            head = s3_service.get_s3_client().head_object(Bucket=bucket, Key=S3_PREFIX + digest)
+            return head["LastModified"].astimezone(_dt.timezone.utc).replace(tzinfo=None)
+        return _dt.datetime.utcfromtimestamp(_path(digest).stat().st_mtime)
+    except Exception:
+        return None
+
+
+def _delete(digest: str) -> None:
+    bucket = _bucket()
+    if bucket:
+        import s3_service
+        s3_service.get_s3_client().delete_object(Bucket=bucket, Key=S3_PREFIX + digest)
+    else:
+        _path(digest).unlink(missing_ok=True)
+
+
+def refs_in(kwargs: dict) -> set:
+    return {v for v in kwargs.values() if is_ref(v)}
+
+
+def _in_use(db, digest: str) -> bool:
+    # Sólo mira jobs abiertos (pocos, por el índice de status)
+    return db.execute(
+        text(
+            "SELECT 1 FROM email_jobs WHERE status IN ('pending', 'processing') "
+            "AND kwargs_json LIKE :pattern LIMIT 1"
+        ),
+        {"pattern": f"%{digest}%"},
+    ).first() is not None
+
+
+def collect(db, refs: dict) -> int:
+    """Borra los blobs de `refs` ({referencia: created_at del job más nuevo que
+    terminó con ella}) si no se reescribieron después y ningún job abierto los
+    referencia. Devuelve cuántos borró. Los errores se loguean: un blob que
+    queda lo recoge sweep()."""
+    deleted = 0
+    for ref, written_before in refs.items():
+        try:
+            digest = _digest(ref)
+            modified = _modified_at(digest)
+            if modified is None or modified > written_before + _dt.timedelta(seconds=CLOCK_SKEW_S):
+                continue
+            if _in_use(db, digest):
+                continue
+            _delete(digest)
+            deleted += 1
+        except Exception as e:
+            logger.warning("blob_store: no se pudo recolectar %s: %s", ref, e)
+    return deleted
+
+
+def _all_refs() -> list:
+    bucket = _bucket()
+    if bucket:
+        import s3_service
+        client = s3_service.get_s3_client()
+        refs = []
+        for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=S3_PREFIX):
+            refs.extend(REF_PREFIX + obj["Key"][len(S3_PREFIX):] for obj in page.get("Contents", []))
+        return refs
+    if not BLOB_DIR.exists():
+        return []
+    return [REF_PREFIX + p.name for p in BLOB_DIR.glob("??/*") if len(p.name) == 64]
+
+
+def sweep(db, now: _dt.datetime | None = None) -> int:
+    """Recolecta los blobs sin job abierto escritos hace más de GC_GRACE_S (los
+    que collect() saltó o no alcanzó a borrar). La corre el worker de
+    email_queue."""
+    cutoff = (now or _dt.datetime.utcnow()) - _dt.timedelta(seconds=GC_GRACE_S + CLOCK_SKEW_S)
+    return collect(db, {ref: cutoff for ref in _all_refs()})
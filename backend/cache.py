@@ -2,31 +2,412 @@
 Utilidades de caché en memoria y tokens de preview de corta vida.
 Módulo independiente para evitar importar main.py desde los routers.
 """
+import base64
+import datetime as _dt
+import decimal
+import json
+import logging
+import os
+import threading
 import time
 import secrets
+import uuid as _uuid
+from collections import OrderedDict
+
+logger = logging.getLogger("bayup")
+
+_INVALIDATION_CHANNEL = "bayup:cache:invalidate"
+_PROCESS_ID = _uuid.uuid4().hex
+
+
+# ── Tier compartido (Redis opcional) ──────────────────────────────────────
+# Con REDIS_URL configurado todos los workers de uvicorn comparten un segundo
+# nivel y se avisan las invalidaciones por pub/sub. Sin REDIS_URL (o sin el
+# paquete redis instalado) cada proceso usa sólo su LRU local.
+
+_shared_client = None
+_shared_checked = False
+_shared_lock = threading.Lock()
+
+
+def _shared():
+    """Cliente Redis perezoso. None si no hay tier compartido disponible."""
+    global _shared_client, _shared_checked
+    if _shared_checked:
+        return _shared_client
+    with _shared_lock:
+        if _shared_checked:
+            return _shared_client
+        url = os.getenv("REDIS_URL")
+        if url:
+            try:
+                import redis
+                _shared_client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+                _shared_client.ping()
+                logger.info("Caché: tier compartido Redis activo")
+            except Exception as e:
+                logger.warning("Caché: Redis no disponible (%s), se usa sólo caché local", e)
+                _shared_client = None
+        _shared_checked = True
+    return _shared_client
+
+
+# Los valores viajan a Redis como JSON, nunca con pickle: un valor leído de
+# Redis no puede ejecutar código. Los tipos que usan las cachés y JSON no
+# tiene (bytes, UUID, fechas, Decimal) van etiquetados; las tuplas vuelven
+# como listas. Un valor que no se puede codificar se queda sólo en local.
+
+_TAG = "__bayup__"
+_DECODERS = {
+    "bytes": lambda v: base64.b64decode(v),
+    "uuid": _uuid.UUID,
+    "datetime": _dt.datetime.fromisoformat,
+    "date": _dt.date.fromisoformat,
+    "decimal": decimal.Decimal,
+}
+
+
+def _encode_default(obj):
+    if isinstance(obj, bytes):
+        return {_TAG: "bytes", "v": base64.b64encode(obj).decode("ascii")}
+    if isinstance(obj, _uuid.UUID):
+        return {_TAG: "uuid", "v": str(obj)}
+    if isinstance(obj, _dt.datetime):
+        return {_TAG: "datetime", "v": obj.isoformat()}
+    if isinstance(obj, _dt.date):
+        return {_TAG: "date", "v": obj.isoformat()}
+    if isinstance(obj, decimal.Decimal):
+        return {_TAG: "decimal", "v": str(obj)}
+    raise TypeError(f"{type(obj).__name__} no es serializable para el tier compartido")
+
+
+def _decode_hook(obj: dict):
+    if len(obj) == 2 and obj.get(_TAG) in _DECODERS and "v" in obj:
+        return _DECODERS[obj[_TAG]](obj["v"])
+    return obj
+
+
+def _dumps(value, expires_at: float) -> str:
+    return json.dumps({"value": value, "expires_at": expires_at}, default=_encode_default, separators=(",", ":"))
+
+
+def _loads(raw) -> tuple:
+    data = json.loads(raw, object_hook=_decode_hook)
+    return data["value"], data["expires_at"]
+
+
+# ── Caché LRU + TTL ───────────────────────────────────────────────────────
+
+class TTLCache:
+    """Caché en memoria LRU con TTL por entrada, thread-safe y con contadores.
+
+    - get/set/pop mantienen la interfaz de dict que usaban los routers.
+    - get_or_load hace single-flight: ante un miss sólo un hilo ejecuta el
+      loader; los demás esperan y reutilizan el resultado.
+    - Si hay tier compartido, los set se replican y los pop/clear se publican
+      para que el resto de workers invaliden su copia local.
+    """
+
+    def __init__(self, name: str, max_size: int = 500, default_ttl: int = 60):
+        self.name = name
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data: OrderedDict = OrderedDict()  # {key: (value, expires_at)}
+        self._lock = threading.RLock()
+        self._key_locks: dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.loads = 0
+        self.coalesced = 0
+        self.shared_hits = 0
+
+    # -- nivel local --
+
+    def _local_get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def _local_set(self, key: str, value, expires_at: float) -> None:
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def _local_drop(self, key: str | None = None, prefix: str | None = None) -> int:
+        with self._lock:
+            if key is not None:
+                return 1 if self._data.pop(key, None) is not None else 0
+            if prefix is None:
+                n = len(self._data)
+                self._data.clear()
+                return n
+            keys = [k for k in self._data if k.startswith(prefix)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    # -- API pública --
+
+    def get(self, key: str, default=None):
+        entry = self._local_get(key)
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry[0]
+        client = _shared()
+        if client is not None:
+            try:
+                raw = client.get(self._shared_key(key))
+                if raw is not None:
+                    value, expires_at = _loads(raw)
+                    if expires_at > time.time():
+                        self._local_set(key, value, expires_at)
+                        with self._lock:
+                            self.hits += 1
+                            self.shared_hits += 1
+                        return value
+            except Exception as e:
+                logger.debug("Caché %s: fallo leyendo Redis: %s", self.name, e)
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key: str, value, ttl: int | None = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl
+        self._local_set(key, value, expires_at)
+        client = _shared()
+        if client is not None:
+            try:
+                client.set(self._shared_key(key), _dumps(value, expires_at), ex=max(int(ttl), 1))
+            except Exception as e:
+                logger.debug("Caché %s: fallo escribiendo Redis: %s", self.name, e)
+
+    def get_or_load(self, key: str, loader, ttl: int | None = None):
+        """Devuelve el valor cacheado o lo calcula con loader() una sola vez
+        aunque lleguen N peticiones concurrentes por la misma clave.
+        Si loader devuelve None no se cachea."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = self._local_get(key)
+            if entry is not None:
+                with self._lock:
+                    self.coalesced += 1
+                return entry[0]
+            try:
+                value = loader()
+                with self._lock:
+                    self.loads += 1
+                if value is not None:
+                    self.set(key, value, ttl)
+                return value
+            finally:
+                with self._lock:
+                    if self._key_locks.get(key) is key_lock:
+                        del self._key_locks[key]
+
+    def pop(self, key: str, default=None):
+        entry = self._local_get(key)
+        self.invalidate(key)
+        return entry[0] if entry is not None else default
+
+    def invalidate(self, key: str) -> None:
+        n = self._local_drop(key=key)
+        with self._lock:
+            self.invalidations += n
+        self._publish("key", key)
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        n = self._local_drop(prefix=prefix)
+        with self._lock:
+            self.invalidations += n
+        self._publish("prefix", prefix)
+
+    def clear(self) -> None:
+        n = self._local_drop()
+        with self._lock:
+            self.invalidations += n
+        self._publish("clear", "")
+
+    def reset(self) -> None:
+        """Vacía la caché local y los contadores sin avisar a otros workers (tests)."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+            self.invalidations = self.loads = self.coalesced = self.shared_hits = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "loads": self.loads,
+                "coalesced": self.coalesced,
+                "shared_hits": self.shared_hits,
+            }
+
+    def __contains__(self, key: str) -> bool:
+        return self._local_get(key) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    # -- tier compartido --
+
+    def _shared_key(self, key: str) -> str:
+        return f"bayup:cache:{self.name}:{key}"
+
+    def _publish(self, op: str, arg: str) -> None:
+        client = _shared()
+        if client is None:
+            return
+        try:
+            if op == "key":
+                client.delete(self._shared_key(arg))
+            else:
+                pattern = self._shared_key(arg) + "*"
+                for k in client.scan_iter(match=pattern, count=500):
+                    client.delete(k)
+            client.publish(_INVALIDATION_CHANNEL, f"{_PROCESS_ID}|{self.name}|{op}|{arg}")
+        except Exception as e:
+            logger.debug("Caché %s: fallo publicando invalidación: %s", self.name, e)
+
+    def _apply_remote(self, op: str, arg: str) -> None:
+        if op == "key":
+            n = self._local_drop(key=arg)
+        elif op == "prefix":
+            n = self._local_drop(prefix=arg)
+        else:
+            n = self._local_drop()
+        with self._lock:
+            self.invalidations += n
+
+
+_registry: dict[str, TTLCache] = {}
+
+
+def register_cache(name: str, max_size: int = 500, default_ttl: int = 60) -> TTLCache:
+    """Crea (o devuelve) una caché con nombre, visible en cache_stats()."""
+    if name not in _registry:
+        _registry[name] = TTLCache(name, max_size=max_size, default_ttl=default_ttl)
+    return _registry[name]
+
+
+def cache_stats() -> list[dict]:
+    return [c.stats() for c in _registry.values()]
+
+
+def reset_all() -> None:
+    """Vacía todas las cachés registradas de este proceso (tests)."""
+    for c in _registry.values():
+        c.reset()
+
+
+# ── Listener de invalidaciones entre workers ──────────────────────────────
+
+_listener_started = False
+
+
+def _listen_invalidations():
+    client = _shared()
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_INVALIDATION_CHANNEL)
+            for msg in pubsub.listen():
+                data = msg.get("data")
+                if isinstance(data, bytes):
+                    data = data.decode("utf-8", "replace")
+                parts = str(data).split("|", 3)
+                if len(parts) != 4 or parts[0] == _PROCESS_ID:
+                    continue
+                target = _registry.get(parts[1])
+                if target is not None:
+                    target._apply_remote(parts[2], parts[3])
+        except Exception as e:
+            logger.warning("Caché: listener de invalidaciones caído (%s), reintentando", e)
+            time.sleep(2)
+
+
+def start_invalidation_listener():
+    """Suscribe este proceso al canal de invalidaciones (sólo si hay Redis)."""
+    global _listener_started
+    if _listener_started or _shared() is None:
+        return
+    _listener_started = True
+    threading.Thread(target=_listen_invalidations, daemon=True, name="cache-invalidation").start()
+
 
 # ── Stores ────────────────────────────────────────────────────────────────
-shop_cache: dict = {}       # {slug: (data_dict, expires_at)}
-templates_cache: dict = {}  # {"list": (data_list, expires_at)}
+shop_cache = register_cache("shop", max_size=500, default_ttl=60)           # {slug: data_dict}
+templates_cache = register_cache("templates", max_size=100, default_ttl=300)  # {"list": data_list}
+catalog_cache = register_cache("catalog", max_size=2000, default_ttl=300)    # {"<tenant_id>:...": (json_bytes, etag)}
+slug_cache = register_cache("slug", max_size=5000, default_ttl=60)           # {slug: tenant_id_str}
+render_cache = register_cache("render", max_size=1000, default_ttl=3600)     # {"<slug>:<page_key>": rendered_dict}
+principal_cache = register_cache(                                             # {email_lower: principal_dict}
+    "principal", max_size=10000, default_ttl=int(os.getenv("PRINCIPAL_CACHE_TTL", "30")),
+)
+
+
+def invalidate_catalog(tenant_id) -> None:
+    """Descarta todos los listados públicos de productos cacheados del tenant."""
+    if tenant_id:
+        catalog_cache.invalidate_prefix(f"{tenant_id}:")
+
+
+def invalidate_shop(slug: str | None) -> None:
+    """Descarta la metadata pública de la tienda, la resolución slug → tenant
+    y sus páginas HTML renderizadas."""
+    if slug:
+        shop_cache.pop(slug, None)
+        slug_cache.pop(slug, None)
+        render_cache.invalidate_prefix(f"{slug}:")
 
 
-# ── Caché TTL simple ──────────────────────────────────────────────────────
+def invalidate_principal(*emails: str | None) -> None:
+    """Descarta el principal cacheado de cada email (cambio de estado, rol,
+    plan o borrado del usuario)."""
+    for email in emails:
+        if email:
+            principal_cache.invalidate(email.lower().strip())
 
-def cache_get(store: dict, key: str):
+
+# ── Helpers de compatibilidad ─────────────────────────────────────────────
+
+def cache_get(store: TTLCache, key: str):
     """Devuelve el valor cacheado si no expiró, None si falta o expiró."""
-    entry = store.get(key)
-    if entry and entry[1] > time.time():
-        return entry[0]
-    return None
+    return store.get(key)
 
 
-def cache_set(store: dict, key: str, value, ttl: int, max_size: int = 500) -> None:
-    """Almacena value en store[key] con TTL en segundos.
-    Limita el tamaño eliminando las 100 entradas más antiguas cuando supera max_size."""
-    store[key] = (value, time.time() + ttl)
-    if len(store) > max_size:
-        for k in list(store.keys())[:100]:
-            del store[k]
+def cache_set(store: TTLCache, key: str, value, ttl: int) -> None:
+    """Almacena value en store[key] con TTL en segundos (LRU al superar max_size)."""
+    store.set(key, value, ttl)
 
 
 # ── Preview tokens de corta vida (ALTA-004) ───────────────────────────────
@@ -56,300 +437,3 @@ def validate_preview_token(token: str) -> str | None:
         del _preview_tokens[token]
         return None
     return email
-
-
-# ── SDK de preview ────────────────────────────────────────────────────────
-BAYUP_PREVIEW_SDK = """
-<meta name="google" content="notranslate">
-<meta name="translate" content="no">
-<script id="bayup-preview-sdk">
-(function(){
-  var TPLID='__TPLID__',TOK='__TOK__',BASE='__BASE__';
-  var params=new URLSearchParams(window.location.search);
-  var PID=params.get('product_id');
-  var STORE={name:'Mi Tienda Demo',phone:'573000000000'};
-  var PRODUCTS=[
-    {id:'1',name:'Vestido Elegante',price:189900,img:'https://images.unsplash.com/photo-1515886657613-9f3515b0c78f?w=400&h=500&fit=crop&auto=format'},
-    {id:'2',name:'Blusa Premium',price:89900,img:'https://images.unsplash.com/photo-1551803091-e20673f15770?w=400&h=500&fit=crop&auto=format'},
-    {id:'3',name:'Falda Minimalista',price:129900,img:'https://images.unsplash.com/photo-1594938298603-c8148c4b4a35?w=400&h=500&fit=crop&auto=format'},
-    {id:'4',name:'Blazer Moderno',price:249900,img:'https://images.unsplash.com/photo-1594226801341-41427b4e5c22?w=400&h=500&fit=crop&auto=format'},
-    {id:'5',name:'Pantalon Formal',price:149900,img:'https://images.unsplash.com/photo-1506629082955-511b1aa562c8?w=400&h=500&fit=crop&auto=format'},
-    {id:'6',name:'Conjunto Casual',price:199900,img:'https://images.unsplash.com/photo-1525507119028-ed4c629a60a3?w=400&h=500&fit=crop&auto=format'}
-  ];
-  var CKEY='bayup_preview_cart';
-  function go(page,extra){
-    var u=BASE+'/super-admin/web-templates/'+TPLID+'/live-preview/'+page+'?token='+encodeURIComponent(TOK);
-    if(extra)u+='&'+extra;
-    window.location.href=u;
-  }
-  function fmt(n){return '$'+n.toString().replace(/\\B(?=(\\d{3})+(?!\\d))/g,'.');}
-  function getCart(){try{return JSON.parse(localStorage.getItem(CKEY)||'[]');}catch(e){return[];}}
-  function saveCart(c){localStorage.setItem(CKEY,JSON.stringify(c));}
-  function badge(){
-    var n=getCart().reduce(function(s,i){return s+i.qty;},0);
-    document.querySelectorAll('[data-bayup="cart-count"]').forEach(function(el){
-      el.textContent=n;el.style.display=n?'':'none';
-    });
-  }
-  function fillStore(){
-    document.querySelectorAll('[data-bayup="store-name"]').forEach(function(el){el.textContent=STORE.name;});
-    document.querySelectorAll('[data-bayup="store-phone"]').forEach(function(el){el.textContent='+57 300 000 0000';});
-  }
-  function fillGrid(){
-    var grid=document.querySelector('[data-bayup="product-grid"]');
-    var tmpl=document.querySelector('template[data-bayup="product-card-template"]');
-    if(!grid||!tmpl)return;
-    grid.innerHTML='';
-    PRODUCTS.forEach(function(p){
-      var c=tmpl.content.cloneNode(true);
-      var img=c.querySelector('[data-bayup-card="image"]');
-      var nm=c.querySelector('[data-bayup-card="name"]');
-      var pr=c.querySelector('[data-bayup-card="price"]');
-      var ab=c.querySelector('[data-bayup-action="add-to-cart"]');
-      var nb=c.querySelector('[data-bayup-action="nav-product"]');
-      if(img){img.src=p.img;img.alt=p.name;}
-      if(nm)nm.textContent=p.name;
-      if(pr)pr.textContent=fmt(p.price);
-      if(ab)ab.dataset.bayupProductId=p.id;
-      if(nb)nb.dataset.bayupProductId=p.id;
-      grid.appendChild(c);
-    });
-  }
-  function fillProduct(){
-    if(!PID)return;
-    var p=PRODUCTS.find(function(x){return x.id===PID;})||PRODUCTS[0];
-    document.querySelectorAll('[data-bayup="product-name"]').forEach(function(el){el.textContent=p.name;});
-    document.querySelectorAll('[data-bayup="product-price"]').forEach(function(el){el.textContent=fmt(p.price);});
-    document.querySelectorAll('[data-bayup="product-description"]').forEach(function(el){el.textContent='Descripcion de muestra para '+p.name+'.';});
-    document.querySelectorAll('img[data-bayup="product-image"]').forEach(function(el){el.src=p.img;el.alt=p.name;});
-    var ab=document.querySelector('[data-bayup-action="add-to-cart"]');
-    if(ab)ab.dataset.bayupProductId=p.id;
-  }
-  function fillCart(){
-    var tbody=document.querySelector('[data-bayup="cart-items"]');
-    var tmpl=document.querySelector('template[data-bayup="cart-row-template"]');
-    if(!tbody)return;
-    var cart=getCart();
-    tbody.innerHTML='';
-    if(!cart.length){
-      var r=document.createElement('tr');
-      r.innerHTML='<td colspan="4" style="text-align:center;padding:2rem;color:#9ca3af;">El carrito esta vacio</td>';
-      tbody.appendChild(r);
-    }else{
-      cart.forEach(function(item){
-        if(!tmpl)return;
-        var c=tmpl.content.cloneNode(true);
-        var fn=function(s,v){var e=c.querySelector('[data-bayup-row="'+s+'"]');if(e)e.textContent=v;};
-        fn('name',item.name);fn('price',fmt(item.price));fn('qty',item.qty);fn('subtotal',fmt(item.price*item.qty));
-        tbody.appendChild(c);
-      });
-    }
-    var total=cart.reduce(function(s,i){return s+i.price*i.qty;},0);
-    document.querySelectorAll('[data-bayup="cart-subtotal"],[data-bayup="cart-total"]').forEach(function(el){el.textContent=fmt(total);});
-  }
-  function bindActions(){
-    document.addEventListener('click',function(e){
-      var el=e.target.closest('[data-bayup-action]');
-      if(!el)return;
-      var a=el.dataset.bayupAction;
-      var MAP={
-        'nav-home':'home','nav-catalog':'catalog','nav-contact':'contact',
-        'nav-privacy':'privacy','nav-cart':'cart'
-      };
-      if(MAP[a]){e.preventDefault();go(MAP[a]);return;}
-      if(a==='nav-product'){
-        e.preventDefault();go('product','product_id='+(el.dataset.bayupProductId||'1'));return;
-      }
-      if(a==='add-to-cart'){
-        var pid=el.dataset.bayupProductId;
-        var p=PRODUCTS.find(function(x){return x.id===pid;})||PRODUCTS[0];
-        var cart=getCart();
-        var ex=cart.find(function(i){return i.id===p.id;});
-        if(ex)ex.qty++;else cart.push({id:p.id,name:p.name,price:p.price,qty:1});
-        saveCart(cart);badge();fillCart();
-        var orig=el.textContent;el.textContent='\\u2713 Agregado';
-        setTimeout(function(){el.textContent=orig;},1200);
-        return;
-      }
-      if(a==='checkout'){
-        e.preventDefault();
-        var cart=getCart();
-        if(!cart.length){alert('El carrito esta vacio (DEMO)');return;}
-        var msg='*Pedido Demo*\\n'+cart.map(function(i){return '- '+i.name+' x'+i.qty+' = '+fmt(i.price*i.qty);}).join('\\n');
-        window.open('https://wa.me/'+STORE.phone+'?text='+encodeURIComponent(msg),'_blank');
-      }
-    });
-  }
-  function init(){fillStore();fillGrid();fillProduct();fillCart();badge();bindActions();}
-  if(document.readyState==='loading'){document.addEventListener('DOMContentLoaded',init);}else{init();}
-  // Banner de modo demo
-  var bar=document.createElement('div');
-  bar.style.cssText='position:fixed;top:0;left:0;right:0;z-index:99999;background:#7c3aed;color:#fff;text-align:center;padding:6px 12px;font-size:11px;font-weight:700;letter-spacing:.05em;';
-  bar.textContent='\\u25B6 MODO PREVIEW — datos de demostración';
-  document.body.prepend(bar);
-})();
-</script>
-"""
-
-
-# ── SDK de producción (tiendas HTML activas) ────────────────────────────
-BAYUP_SDK = """
-<script id="bayup-sdk">
-(function(){
-  const SLUG = document.documentElement.dataset.bayupSlug || '';
-  const API  = document.documentElement.dataset.bayupApi  || '';
-  const PAGE = document.documentElement.dataset.bayupPage || 'home';
-
-  // --- Estado del carrito en localStorage ---
-  const CART_KEY = 'bayup_cart_' + SLUG;
-  function getCart(){ try{ return JSON.parse(localStorage.getItem(CART_KEY)||'[]'); }catch(e){ return []; } }
-  function saveCart(c){ localStorage.setItem(CART_KEY, JSON.stringify(c)); }
-
-  function cartTotal(cart){ return cart.reduce(function(s,i){ return s + i.unit_price * i.qty; }, 0); }
-  function cartCount(cart){ return cart.reduce(function(s,i){ return s + i.qty; }, 0); }
-
-  function formatCOP(n){ return '$' + Math.round(n).toLocaleString('es-CO'); }
-
-  // --- Actualiza todos los elementos del DOM ---
-  function render(store, products){
-    // Nombre e info de tienda
-    document.querySelectorAll('[data-bayup="store-name"]').forEach(function(el){ el.textContent = store.full_name || store.name || SLUG; });
-    document.querySelectorAll('[data-bayup="store-phone"]').forEach(function(el){ el.textContent = store.phone || ''; });
-    document.querySelectorAll('img[data-bayup="store-logo"]').forEach(function(el){ if(store.logo_url) el.src = store.logo_url; });
-
-    // Página de detalle de producto
-    if(PAGE === 'product'){
-      var params = new URLSearchParams(window.location.search);
-      var productId = params.get('product_id');
-      if(productId && products.length){
-        var p = products.find(function(x){ return String(x.id) === String(productId); });
-        if(p){
-          document.querySelectorAll('[data-bayup="product-name"]').forEach(function(el){ el.textContent = p.name; });
-          document.querySelectorAll('[data-bayup="product-price"]').forEach(function(el){ el.textContent = formatCOP(p.price); });
-          document.querySelectorAll('[data-bayup="product-description"]').forEach(function(el){ el.textContent = p.description || ''; });
-          document.querySelectorAll('img[data-bayup="product-image"]').forEach(function(el){ if(p.image_url&&p.image_url[0]) el.src=p.image_url[0]; });
-          document.querySelectorAll('[data-bayup-action="add-to-cart"]').forEach(function(el){
-            el.dataset.bayupProductId=String(p.id);
-            el.dataset.bayupProductName=p.name;
-            el.dataset.bayupProductPrice=String(p.price);
-          });
-        }
-      }
-    }
-
-    // Grilla de productos
-    var grid = document.querySelector('[data-bayup="product-grid"]');
-    var cardTpl = document.querySelector('template[data-bayup="product-card-template"]');
-    if(grid && cardTpl && products.length){
-      grid.innerHTML = '';
-      products.forEach(function(p){
-        var clone = cardTpl.content.cloneNode(true);
-        clone.querySelectorAll('[data-bayup-card="name"]').forEach(function(el){ el.textContent = p.name; });
-        clone.querySelectorAll('[data-bayup-card="price"]').forEach(function(el){ el.textContent = formatCOP(p.price); });
-        clone.querySelectorAll('img[data-bayup-card="image"]').forEach(function(el){ if(p.image_url&&p.image_url[0]) el.src=p.image_url[0]; });
-        clone.querySelectorAll('[data-bayup-action="add-to-cart"]').forEach(function(el){ el.dataset.bayupProductId=String(p.id); el.dataset.bayupProductName=p.name; el.dataset.bayupProductPrice=String(p.price); });
-        clone.querySelectorAll('[data-bayup-action="nav-product"]').forEach(function(el){ el.dataset.bayupProductId=String(p.id); });
-        grid.appendChild(clone);
-      });
-    }
-
-    renderCart();
-  }
-
-  function renderCart(){
-    var cart = getCart();
-    var count = cartCount(cart);
-    document.querySelectorAll('[data-bayup="cart-count"]').forEach(function(el){
-      el.textContent = count || '';
-      el.style.display = count ? '' : 'none';
-    });
-    document.querySelectorAll('[data-bayup="cart-total"]').forEach(function(el){ el.textContent = formatCOP(cartTotal(cart)); });
-    document.querySelectorAll('[data-bayup="cart-subtotal"]').forEach(function(el){ el.textContent = formatCOP(cartTotal(cart)); });
-    var cartList = document.querySelector('[data-bayup="cart-items"]');
-    var cartRowTpl = document.querySelector('template[data-bayup="cart-row-template"]');
-    if(cartList){
-      cartList.innerHTML = '';
-      if(!cart.length){
-        var empty = document.createElement('tr');
-        empty.innerHTML = '<td colspan="5" class="py-12 text-center text-slate-400">Tu carrito está vacío</td>';
-        cartList.appendChild(empty);
-      } else {
-        cart.forEach(function(item){
-          if(cartRowTpl){
-            var clone = cartRowTpl.content.cloneNode(true);
-            clone.querySelectorAll('[data-bayup-row="name"]').forEach(function(el){ el.textContent = item.name; });
-            clone.querySelectorAll('[data-bayup-row="price"]').forEach(function(el){ el.textContent = formatCOP(item.unit_price); });
-            clone.querySelectorAll('[data-bayup-row="subtotal"]').forEach(function(el){ el.textContent = formatCOP(item.unit_price * item.qty); });
-            clone.querySelectorAll('[data-bayup-row="qty"]').forEach(function(el){ el.textContent = String(item.qty); });
-            cartList.appendChild(clone);
-          } else {
-            var li = document.createElement('div');
-            li.className = 'bayup-cart-item';
-            var _s1=document.createElement('span');_s1.textContent=item.name+' x'+item.qty;
-            var _s2=document.createElement('span');_s2.textContent=formatCOP(item.unit_price*item.qty);
-            li.appendChild(_s1);li.appendChild(_s2);
-            cartList.appendChild(li);
-          }
-        });
-      }
-    }
-  }
-
-  // --- Acciones globales (delegación de eventos) ---
-  document.addEventListener('click', function(e){
-    var el = e.target.closest('[data-bayup-action]');
-    if(!el) return;
-    var action = el.dataset.bayupAction;
-
-    if(action === 'add-to-cart'){
-      var cart = getCart();
-      var id = el.dataset.bayupProductId;
-      var existing = cart.find(function(i){ return i.product_id === id; });
-      if(existing){ existing.qty += 1; }
-      else{ cart.push({ product_id:id, name:el.dataset.bayupProductName, unit_price:Number(el.dataset.bayupProductPrice), qty:1 }); }
-      saveCart(cart);
-      renderCart();
-      el.textContent = '✓ Añadido';
-      setTimeout(function(){ el.textContent = 'Agregar'; }, 1200);
-    }
-
-    if(action === 'checkout'){
-      var cart = getCart();
-      if(!cart.length){ alert('Tu carrito está vacío'); return; }
-      var phone = document.documentElement.dataset.bayupPhone || '';
-      var lines  = ['*Nuevo pedido*',''];
-      cart.forEach(function(i){ lines.push('• ' + i.name + ' ×' + i.qty + '  → ' + formatCOP(i.unit_price * i.qty)); });
-      lines.push('','*Total: ' + formatCOP(cartTotal(cart)) + ' COP*');
-      var text  = encodeURIComponent(lines.join('\\n'));
-      var clean = phone.replace(/[^0-9]/g,'');
-      window.open('https://wa.me/' + clean + '?text=' + text, '_blank');
-    }
-
-    if(action === 'nav-home')    window.location.href = '/html-shop/' + SLUG + '/home';
-    if(action === 'nav-catalog') window.location.href = '/html-shop/' + SLUG + '/catalog';
-    if(action === 'nav-cart')    window.location.href = '/html-shop/' + SLUG + '/cart';
-    if(action === 'nav-contact') window.location.href = '/html-shop/' + SLUG + '/contact';
-    if(action === 'nav-privacy') window.location.href = '/html-shop/' + SLUG + '/privacy';
-    if(action === 'nav-product') window.location.href = '/html-shop/' + SLUG + '/product?product_id=' + (el.dataset.bayupProductId||'');
-  });
-
-  // --- Bootstrap: carga datos de la tienda y productos ---
-  async function init(){
-    try{
-      var [storeRes, productsRes] = await Promise.all([
-        fetch(API + '/public/shop-info/' + SLUG),
-        fetch(API + '/public/shop/' + SLUG + '/products?limit=100'),
-      ]);
-      var store    = storeRes.ok    ? await storeRes.json()    : {};
-      var products = productsRes.ok ? await productsRes.json() : [];
-      render(store, Array.isArray(products) ? products : []);
-    } catch(err){
-      console.warn('[Bayup SDK] Error cargando datos:', err);
-    }
-  }
-
-  if(document.readyState === 'loading'){ document.addEventListener('DOMContentLoaded', init); }
-  else { init(); }
-})();
-</script>
-"""
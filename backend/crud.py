@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session, joinedload, selectinload
 import uuid
 from typing import Optional, List
 import models, schemas, security
+import order_outbox
 from fastapi import HTTPException, status
 
 logger = logging.getLogger("bayup.crud")
@@ -102,6 +103,28 @@ def get_product(db: Session, product_id: uuid.UUID, tenant_id: Optional[uuid.UUI
 def get_product_variant(db: Session, variant_id: uuid.UUID) -> models.ProductVariant | None:
     return db.query(models.ProductVariant).filter(models.ProductVariant.id == variant_id).first()
 
+def load_variant_rows(db: Session, ids, tenant_id: Optional[uuid.UUID] = None) -> tuple[dict, dict]:
+    """Carga en dos consultas las variantes `ids` y sus productos: devuelve
+    (variants, products), ambos por id. Los ids que no son de una variante se
+    buscan como producto (producto sin variantes) y quedan sólo en products.
+    Con tenant_id sólo se cargan productos de ese tenant: una variante cuyo
+    producto falta en products no pertenece a la tienda."""
+    ids = set(ids)
+    if not ids:
+        return {}, {}
+    variants = {
+        v.id: v for v in db.query(models.ProductVariant).filter(models.ProductVariant.id.in_(ids))
+    }
+    wanted = {v.product_id for v in variants.values()} | (ids - set(variants))
+    query = db.query(models.Product).filter(models.Product.id.in_(wanted))
+    if tenant_id:
+        query = query.filter(models.Product.owner_id == tenant_id)
+    return variants, {p.id: p for p in query}
+
+def item_display_name(variant: models.ProductVariant | None, product: models.Product | None) -> str:
+    """Nombre de una línea de pedido para emails, tracking y WhatsApp."""
+    return (product.name if product else "Producto") + (f" — {variant.name}" if variant and variant.name else "")
+
 def get_all_products(db: Session, tenant_id: Optional[uuid.UUID] = None, skip: int = 0, limit: int = 100) -> list[models.Product]:
     query = db.query(models.Product).options(
         joinedload(models.Product.variants),
@@ -210,34 +233,46 @@ def delete_product(db: Session, product_id: uuid.UUID, owner_id: uuid.UUID) -> b
             return False
 
 # --- Order CRUD ---
-def create_order(db: Session, order: schemas.OrderCreate, customer_id: uuid.UUID, tenant_id: Optional[uuid.UUID] = None) -> models.Order:
+def create_order(db: Session, order: schemas.OrderCreate, customer_id: uuid.UUID, tenant_id: Optional[uuid.UUID] = None,
+                 flow: str = "admin", before_commit=None) -> models.Order:
     """
     Crea una orden con ATOMICIDAD de inventario y validación de Multitenancy.
-    Utiliza SELECT ... FOR UPDATE para evitar sobreventas.
+    Utiliza SELECT ... FOR UPDATE para evitar sobreventas: todas las variantes
+    del pedido se bloquean en una sola consulta ordenada por id, de modo que
+    dos carritos con las mismas variantes en distinto orden toman los locks en
+    el mismo orden y no se bloquean mutuamente (sin deadlock).
+    before_commit(db_order), si se pasa, corre antes del commit: lo que cambie
+    se confirma junto con la orden (p. ej. el pago que la originó).
     """
     subtotal = 0
     items_to_create = []
     actual_tenant_id = tenant_id if tenant_id else customer_id
 
-    # 1. Validación de ítems y bloqueo de stock
-    for item in order.items:
-        # Bloqueamos la fila de la variante para asegurar que nadie más la toque durante esta transacción
-        v = db.query(models.ProductVariant).filter(
-            models.ProductVariant.id == item.product_variant_id
-        ).with_for_update().first()
-
-        # Fallback: si el ID no corresponde a una variante, puede ser el ID del producto (sin variantes)
-        product = None
-        if not v:
-            product = db.query(models.Product).filter(
-                models.Product.id == item.product_variant_id,
+    # 1. Bloqueo de stock: una consulta para todas las variantes, en orden de PK
+    requested_ids = sorted({item.product_variant_id for item in order.items})
+    variants = {
+        v.id: v for v in db.query(models.ProductVariant).filter(
+            models.ProductVariant.id.in_(requested_ids)
+        ).order_by(models.ProductVariant.id).with_for_update().populate_existing().all()
+    } if requested_ids else {}
+
+    # Fallback: si el ID no corresponde a una variante, puede ser el ID del producto (sin variantes)
+    missing = [i for i in requested_ids if i not in variants]
+    products = {}
+    if missing:
+        products = {
+            p.id: p for p in db.query(models.Product).filter(
+                models.Product.id.in_(missing),
                 models.Product.owner_id == actual_tenant_id
-            ).first()
-            if not product:
-                db.rollback()
-                raise HTTPException(status_code=404, detail="Producto no encontrado")
+            ).all()
+        }
+        if len(products) < len(missing):
+            db.rollback()
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        for product_id in missing:
+            product = products[product_id]
             # Crear variante real en DB para este producto sin variantes
-            v = models.ProductVariant(
+            variants[product_id] = models.ProductVariant(
                 id=uuid.uuid4(),
                 product_id=product.id,
                 name="Base",
@@ -245,35 +280,51 @@ def create_order(db: Session, order: schemas.OrderCreate, customer_id: uuid.UUID
                 stock=9999,
                 price=product.price or 0,
             )
-            db.add(v)
-            db.flush()
-
-        # Validación Quirúrgica de Multitenancy: ¿Esta variante pertenece al comercio actual?
-        if not product:
-            product = db.query(models.Product).filter(
-                models.Product.id == v.product_id,
+            db.add(variants[product_id])
+        db.flush()
+
+    # Validación Quirúrgica de Multitenancy: ¿Estas variantes pertenecen al comercio actual?
+    # Los productos de todas las variantes salen de una sola consulta.
+    pending = {v.product_id for v in variants.values()} - set(products)
+    if pending:
+        products.update({
+            p.id: p for p in db.query(models.Product).filter(
+                models.Product.id.in_(pending),
                 models.Product.owner_id == actual_tenant_id
-            ).first()
-
-        if not product:
-            db.rollback()
-            raise HTTPException(status_code=403, detail="Acceso no autorizado al producto")
+            ).all()
+        })
+    if any(v.product_id not in products for v in variants.values()):
+        db.rollback()
+        raise HTTPException(status_code=403, detail="Acceso no autorizado al producto")
 
-        # Verificación de Stock (Protección contra sobreventa)
-        if v.stock < item.quantity:
-            msg = f"Stock insuficiente para {product.name}. Disponible: {v.stock}"
-            db.rollback()
-            raise HTTPException(status_code=400, detail=msg)
+    # Verificación de Stock (Protección contra sobreventa). Si una variante se
+    # repite en varias líneas se valida la cantidad total, y se reportan juntas
+    # todas las líneas sin stock. Las unidades reservadas por pagos pendientes
+    # (stock_reservations) no están disponibles.
+    requested_qty: dict = {}
+    for item in order.items:
+        requested_qty[item.product_variant_id] = requested_qty.get(item.product_variant_id, 0) + item.quantity
+    stock_errors = []
+    for variant_key, qty in requested_qty.items():
+        v = variants[variant_key]
+        if v.available_stock < qty:
+            stock_errors.append(f"Stock insuficiente para {products[v.product_id].name}. Disponible: {v.available_stock}")
+    if stock_errors:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="; ".join(stock_errors))
 
+    for item in order.items:
+        v = variants[item.product_variant_id]
+        product = products[v.product_id]
         # Cálculo de precio (Plan Básico / Mayorista)
         # Usamos el precio de la variante si existe, sino el del producto base
         price = v.price if v.price > 0 else product.price
         if order.customer_type == 'mayorista' and product.wholesale_price > 0:
             price = product.wholesale_price
-            
+
         subtotal += price * item.quantity
         items_to_create.append({"variant": v, "qty": item.quantity, "price": price, "product_name": product.name})
-    
+
     # 2. Creación de la Orden
     initial_status = "completed" if order.source.lower() == "pos" else "pending"
     commission_rate = getattr(order, 'commission_rate_snapshot', None) or 0.025
@@ -311,57 +362,12 @@ def create_order(db: Session, order: schemas.OrderCreate, customer_id: uuid.UUID
         db.add(db_item)
         it["variant"].stock -= it["qty"] # Descuento atómico garantizado por with_for_update
 
-    # 4. Upsert de Cliente (Inteligencia de Datos Plan Básico)
-    if order.customer_email:
-        email_clean = order.customer_email.lower().strip()
-        client_record = db.query(models.User).filter(
-            models.User.email == email_clean,
-            models.User.owner_id == actual_tenant_id
-        ).first()
+    # 4. Efectos secundarios (CRM, envío, notificación, emails): un evento en
+    #    el outbox, confirmado en el mismo commit. Se procesan fuera de la
+    #    transacción que tiene bloqueadas las variantes — ver order_outbox.py
+    outbox_event = order_outbox.add_order_created(db, db_order, flow)
 
-        if client_record:
-            client_record.total_spent += subtotal
-            client_record.loyalty_points += int(subtotal / 1000)
-            client_record.last_purchase_date = db_order.created_at
-            client_record.last_purchase_summary = f"Venta {order.source} #{str(db_order.id)[:4].upper()}"
-        else:
-            # El email es único a nivel de tabla (cuentas de tenants, staff y
-            # super admin comparten el mismo espacio de emails). Si ya
-            # pertenece a OTRA cuenta fuera de esta tienda, no creamos un
-            # "cliente" duplicado — solo se pierde el tracking de CRM para
-            # esa venta puntual, la orden se crea igual.
-            email_taken_elsewhere = db.query(models.User.id).filter(
-                models.User.email == email_clean
-            ).first()
-            if not email_taken_elsewhere:
-                new_client = models.User(
-                    id=uuid.uuid4(),
-                    email=email_clean,
-                    full_name=order.customer_name or "Cliente Nuevo",
-                    phone=order.customer_phone,
-                    owner_id=actual_tenant_id,
-                    total_spent=subtotal,
-                    loyalty_points=int(subtotal / 1000),
-                    last_purchase_date=db_order.created_at,
-                    last_purchase_summary = f"Primer registro vía {order.source}",
-                    role="cliente",
-                    status="Activo"
-                )
-                db.add(new_client)
-
-    # 5. Lógica de Envío (Sinergia de Módulos)
-    if order.source.lower() != "pos":
-        db_shipment = models.Shipment(
-            id=uuid.uuid4(),
-            order_id=db_order.id,
-            tenant_id=actual_tenant_id,
-            recipient_name=order.customer_name or "Cliente",
-            destination_address="Por coordinar (Venta Web)",
-            status="pending_packing"
-        )
-        db.add(db_shipment)
-
-    # 6. Logs y Finanzas (Tesorería Bayup)
+    # 5. Logs y Finanzas (Tesorería Bayup)
     log_user_id = customer_id if customer_id else actual_tenant_id
     db_log = models.ActivityLog(
         id=uuid.uuid4(),
@@ -381,8 +387,11 @@ def create_order(db: Session, order: schemas.OrderCreate, customer_id: uuid.UUID
         category="Ventas"
     )
     db.add(db_income)
-    
+    if before_commit is not None:
+        before_commit(db_order)
+
     db.commit() # Todo o nada. Si algo falló antes, el stock no se toca.
+    order_outbox.after_commit(db, outbox_event)
     db.refresh(db_order)
     return db_order
 
@@ -41,6 +41,20 @@ else:
         connect_args={"connect_timeout": 10},
     )
 
+# Los handlers síncronos de FastAPI corren en el threadpool de anyio. Se dimensiona
+# al pool de conexiones: más hilos que conexiones sólo acumulan hilos esperando
+# en pool_timeout, menos hilos desaprovechan conexiones disponibles.
+# DB_THREADPOOL_SIZE permite forzarlo (p. ej. con NullPool detrás de PgBouncer).
+def threadpool_size() -> int:
+    override = os.getenv("DB_THREADPOOL_SIZE")
+    if override and override.isdigit() and int(override) > 0:
+        return int(override)
+    pool = engine.pool
+    if hasattr(pool, "size") and hasattr(pool, "_max_overflow"):
+        return max(pool.size() + max(pool._max_overflow, 0), 1)
+    return 40
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -16,14 +16,14 @@ logger = logging.getLogger("bayup")
 __all__ = ["get_db", "current_user", "tenant_id_from", "require_super_admin", "push_notification"]
 
 
-async def current_user(request: Request, db: Session = Depends(get_db)):
+def current_user(request: Request, db: Session = Depends(get_db)):
     """Autenticación via Bearer token o cookie httpOnly."""
     import security
     auth_header = request.headers.get("Authorization", "")
     token = None
     if auth_header.lower().startswith("bearer ") and len(auth_header) > 7:
         token = auth_header[7:].strip() or None
-    return await security.get_current_user(request=request, token=token, db=db)
+    return security.get_current_user(request=request, token=token, db=db)
 
 
 def tenant_id_from(user) -> str:
@@ -53,26 +53,6 @@ def resolve_target(db: Session, caller, target_user_id: str | None):
     return target
 
 
-def create_shipment(db: Session, order, tenant_id) -> None:
-    """Crea un envío vacío ligado al pedido. No lanza excepciones."""
-    import models as _m
-    try:
-        if db.query(_m.Shipment).filter(_m.Shipment.order_id == order.id).first():
-            return
-        db.add(_m.Shipment(
-            order_id=order.id,
-            tenant_id=tenant_id,
-            status="pendiente",
-            recipient_name=order.customer_name or "Cliente",
-            recipient_phone=order.customer_phone or "",
-            destination_address=order.shipping_address or order.customer_city or "",
-            history=[],
-        ))
-        db.commit()
-    except Exception:
-        db.rollback()
-
-
 def trigger_email_confirmation(email: str, name: str, db: Session) -> None:
     """Guarda token de confirmación en DB y encola el email. Falla silenciosamente."""
     import secrets as _s, email_queue as _eq, models as _m
@@ -84,8 +64,8 @@ def trigger_email_confirmation(email: str, name: str, db: Session) -> None:
         token = _s.token_urlsafe(32)
         user.email_confirmation_token = token
         user.email_confirmation_expires = datetime.now(timezone.utc) + timedelta(hours=24)
+        _eq.enqueue("send_email_confirmation", db=db, email=email, name=name, token=token)
         db.commit()
-        _eq.enqueue("send_email_confirmation", email=email, name=name, token=token)
     except Exception as e:
         logger.warning("Email confirmation error: %s", e)
 
@@ -4,16 +4,62 @@ Cola de emails persistente en PostgreSQL.
 Reemplaza los threading.Thread(daemon=True) que se pierden si el servidor
 se reinicia mid-flight. El flujo:
   1. enqueue()  — guarda el job en email_jobs (< 1ms, nunca bloquea la request)
-  2. worker()   — corre en segundo plano cada 5s, procesa pending, reintenta failed
+                  y en PostgreSQL avisa al worker con NOTIFY email_jobs.
+                  Con db= el job entra en la transacción del llamador (sale
+                  sólo si esa transacción hace commit, sin abrir otra sesión);
+                  enqueue_many() inserta varios jobs en un solo INSERT
+  2. worker     — despierta con LISTEN/NOTIFY (o cada POLL_INTERVAL si no hay
+                  LISTEN), reclama hasta EMAIL_BATCH_SIZE jobs, los envía en
+                  paralelo (EMAIL_SEND_CONCURRENCY) por la sesión HTTP con
+                  keep-alive de email_service y actualiza los estados en lote
   3. Si el proceso muere, al reiniciar el worker recoge los pending automáticamente
+
+Modo del worker (EMAIL_WORKER_MODE):
+  - embedded (por defecto): cada proceso web arranca su hilo worker
+  - external: los procesos web sólo encolan; el envío lo hace un proceso
+    aparte, `python email_worker.py`
+
+Envío por lotes del proveedor: con Resend configurado, cada job se arma en
+modo captura (email_service.capture_payloads) y los emails sin adjunto del
+lote salen en requests POST /emails/batch de hasta BATCH_LIMIT (100). Los que
+llevan adjunto (facturas PDF) van uno por uno. Si Resend rechaza un lote
+completo, sus emails se reintentan uno por uno para aislar al inválido.
+
+Digest de avisos de venta: si el tenant tiene users.sale_digest_minutes > 0,
+order_outbox encola cada aviso como DIGEST_FUNC con vencimiento al cierre de
+la ventana (digest_window_end). Todos los avisos de la ventana vencen a la
+vez; el worker los reclama juntos y manda un solo send_sales_digest por dueño.
+
+Retención: los 'sent' más viejos que EMAIL_JOBS_RETENTION_DAYS se borran en
+lotes chicos (archive_sent, cada ARCHIVE_INTERVAL desde el worker). Los
+'failed' se conservan para revisión. Índices parciales: ix_email_jobs_claim
+(sólo jobs abiertos, en orden de id) para el reclamo y ix_email_jobs_sent_at
+para el archivador; la latencia del reclamo no crece con el historial.
+
+El SQL es neutro de dialecto (timestamps calculados en Python): en SQLite
+corre igual, sin FOR UPDATE SKIP LOCKED ni NOTIFY.
 """
+import collections
+import datetime as _dt
 import json
 import logging
+import os
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import bindparam, column, insert, table, text
 
 logger = logging.getLogger("bayup.email_queue")
 
+# Índices parciales (alembic 0021). El reclamo repite el predicado
+# status IN ('pending', 'processing') para que el planner use ix_email_jobs_claim.
+INDEXES_SQL = (
+    "CREATE INDEX IF NOT EXISTS ix_email_jobs_claim ON email_jobs (id) "
+    "WHERE status IN ('pending', 'processing')",
+    "CREATE INDEX IF NOT EXISTS ix_email_jobs_sent_at ON email_jobs (updated_at) WHERE status = 'sent'",
+)
+
 # DDL — se ejecuta en _sync_postgres_schema al arranque (añadido allí)
 CREATE_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS email_jobs (
@@ -26,74 +72,196 @@ CREATE TABLE IF NOT EXISTS email_jobs (
     created_at  TIMESTAMP    DEFAULT NOW(),
     updated_at  TIMESTAMP    DEFAULT NOW()
 );
-CREATE INDEX IF NOT EXISTS ix_email_jobs_status ON email_jobs (status);
-"""
+""" + ";\n".join(INDEXES_SQL) + ";\n"
 
 MAX_ATTEMPTS = 4          # 4 intentos antes de marcar como failed
-RETRY_DELAY  = 60         # segundos entre reintentos
-POLL_INTERVAL = 5         # segundos entre polls del worker
+RETRY_DELAY  = 60         # segundos de espera por intento fallido (1 min, 2 min, ...)
+POLL_INTERVAL = 5         # segundos entre polls del worker si no llega un NOTIFY
+BLOB_SWEEP_INTERVAL = 3600  # segundos entre barridos de blobs huérfanos (blob_store.sweep)
+ARCHIVE_INTERVAL = 3600   # segundos entre pasadas del archivador de 'sent'
+ARCHIVE_BATCH = 1000      # filas borradas por transacción
+STALE_AFTER  = 300        # un 'processing' más viejo que esto se da por perdido
+
+WORKER_MODE = os.getenv("EMAIL_WORKER_MODE", "embedded")  # embedded | external
+SEND_CONCURRENCY = max(1, int(os.getenv("EMAIL_SEND_CONCURRENCY", "4")))
+BATCH_SIZE = max(1, int(os.getenv("EMAIL_BATCH_SIZE", "50")))
+NOTIFY_CHANNEL = "email_jobs"
+RETENTION_DAYS = max(1, int(os.getenv("EMAIL_JOBS_RETENTION_DAYS", "14")))
+
+DIGEST_FUNC = "sale_digest_entry"  # aviso de venta retenido para el digest
+DIGEST_CLAIM_LIMIT = 1000          # avisos de digest reclamados por lote
+
+
+def _now() -> _dt.datetime:
+    return _dt.datetime.utcnow()
+
+
+def _is_postgres(db) -> bool:
+    return db.bind.dialect.name == "postgresql"
+
 
+_EPOCH = _dt.datetime(1970, 1, 1)
 
-def enqueue(func_name: str, **kwargs) -> None:
+
+def digest_window_end(minutes: int, now: _dt.datetime | None = None) -> _dt.datetime:
+    """Cierre de la ventana de digest que contiene `now`. Las ventanas están
+    alineadas a múltiplos de `minutes` desde la época, así todos los avisos de
+    una misma ventana comparten vencimiento."""
+    now = now or _now()
+    window = max(1, int(minutes)) * 60
+    elapsed = int((now - _EPOCH).total_seconds())
+    return _EPOCH + _dt.timedelta(seconds=(elapsed // window + 1) * window)
+
+
+_email_jobs = table(
+    "email_jobs", column("func"), column("kwargs_json"), column("created_at"), column("updated_at"),
+)
+
+
+def _insert_jobs(db, jobs: list) -> None:
+    """Un solo INSERT multi-fila + NOTIFY. No hace commit."""
+    now = _now()
+    rows = []
+    for func_name, kwargs in jobs:
+        kwargs = dict(kwargs)
+        run_at = kwargs.pop("run_at", None)
+        rows.append({
+            "func": func_name, "kwargs_json": json.dumps(kwargs),
+            "created_at": now, "updated_at": run_at or now,
+        })
+    db.execute(insert(_email_jobs).values(rows))
+    if _is_postgres(db):
+        # Se entrega al hacer commit: el worker despierta sin esperar al poll
+        db.execute(text("SELECT pg_notify(:channel, '')"), {"channel": NOTIFY_CHANNEL})
+
+
+def enqueue_many(jobs: list, db=None) -> None:
     """
-    Encola un email de forma no bloqueante.
-    func_name: nombre del método en email_service (ej. 'send_order_confirmation')
-    kwargs:    argumentos del método
+    Encola varios emails en un solo INSERT.
+    jobs: lista de (func_name, kwargs); kwargs puede traer run_at (ver enqueue)
+    db:   sesión del llamador. Los jobs quedan en su transacción y salen sólo
+          si el llamador hace commit; un error de la DB se propaga. Sin db se
+          usa una sesión propia con commit, y los errores sólo se loguean.
     """
+    if not jobs:
+        return
+    if db is not None:
+        _insert_jobs(db, jobs)
+        return
     from database import SessionLocal
-    from sqlalchemy import text
-    db = SessionLocal()
+    own = SessionLocal()
     try:
-        db.execute(
-            text(
-                "INSERT INTO email_jobs (func, kwargs_json) VALUES (:func, :kwargs)"
-            ),
-            {"func": func_name, "kwargs": json.dumps(kwargs)},
-        )
-        db.commit()
+        _insert_jobs(own, jobs)
+        own.commit()
     except Exception as e:
         logger.warning("email_queue.enqueue error: %s", e)
     finally:
-        db.close()
+        own.close()
 
 
-def _process_one(job_id: int, func_name: str, kwargs_json: str) -> None:
-    """Ejecuta un job de email y actualiza su estado en DB."""
-    import email_service as _es
-    from database import SessionLocal
-    from sqlalchemy import text
+def enqueue(func_name: str, db=None, **kwargs) -> None:
+    """
+    Encola un email de forma no bloqueante.
+    func_name: nombre del método en email_service (ej. 'send_order_confirmation')
+    db:        sesión del llamador (ver enqueue_many)
+    run_at:    (kwarg) no enviar antes de esta hora UTC (digest de avisos de venta)
+    kwargs:    argumentos del método
+    """
+    enqueue_many([(func_name, kwargs)], db=db)
 
-    db = SessionLocal()
-    try:
-        func = getattr(_es, func_name, None)
-        if not func:
-            raise ValueError(f"email_service.{func_name} no existe")
-        kwargs = json.loads(kwargs_json)
-        func(**kwargs)
-        db.execute(
-            text("UPDATE email_jobs SET status='sent', updated_at=NOW() WHERE id=:id"),
-            {"id": job_id},
-        )
-        db.commit()
-    except Exception as e:
-        logger.warning("email_queue job %d falló: %s", job_id, e)
-        db.execute(
-            text(
-                "UPDATE email_jobs "
-                "SET attempts = attempts + 1, "
-                "    error = :err, "
-                "    status = CASE WHEN attempts + 1 >= :max THEN 'failed' ELSE 'pending' END, "
-                "    updated_at = NOW() + INTERVAL '1 minute' * (attempts + 1) "
-                "WHERE id = :id"
-            ),
-            {"id": job_id, "err": str(e)[:500], "max": MAX_ATTEMPTS},
-        )
-        db.commit()
-    finally:
-        db.close()
 
+# ── Métricas del proceso ──────────────────────────────────────────────────
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "sent": 0, "retried": 0, "failed": 0, "batches": 0, "provider_requests": 0,
+    "last_batch_size": 0, "last_batch_ms": 0.0, "archived": 0, "last_archive_at": None,
+}
+_recent = collections.deque()  # (monotonic, enviados) de los últimos 60s
+
+
+def _record(sent: int, retried: int, failed: int, requests: int, elapsed_ms: float) -> None:
+    now = time.monotonic()
+    with _metrics_lock:
+        _metrics["sent"] += sent
+        _metrics["retried"] += retried
+        _metrics["failed"] += failed
+        _metrics["batches"] += 1
+        _metrics["provider_requests"] += requests
+        _metrics["last_batch_size"] = sent + retried + failed
+        _metrics["last_batch_ms"] = round(elapsed_ms, 1)
+        _recent.append((now, sent))
+        while _recent and _recent[0][0] < now - 60:
+            _recent.popleft()
+
+
+def stats(db) -> dict:
+    """Profundidad y edad de la cola (toda la DB) + métricas de este proceso.
+    Los jobs abiertos se leen por ix_email_jobs_claim; by_status recorre la
+    tabla, acotada por la retención."""
+    now = _now()
+    rows = db.execute(text("SELECT status, COUNT(*) FROM email_jobs GROUP BY status")).fetchall()
+    open_row = db.execute(
+        text(
+            "SELECT "
+            "  SUM(CASE WHEN status = 'pending' AND updated_at <= :now THEN 1 ELSE 0 END), "
+            "  SUM(CASE WHEN status = 'pending' AND updated_at > :now THEN 1 ELSE 0 END), "
+            "  SUM(CASE WHEN status = 'processing' AND updated_at <= :stale THEN 1 ELSE 0 END), "
+            "  MIN(CASE WHEN status = 'pending' AND updated_at <= :now THEN created_at END) "
+            "FROM email_jobs WHERE status IN ('pending', 'processing')"
+        ),
+        {"now": now, "stale": now - _dt.timedelta(seconds=STALE_AFTER)},
+    ).one()
+    oldest = _as_datetime(open_row[3])
+    failed_24h = db.execute(
+        text("SELECT COUNT(*) FROM email_jobs WHERE status = 'failed' AND updated_at >= :since"),
+        {"since": now - _dt.timedelta(hours=24)},
+    ).scalar()
+    oldest_sent = _as_datetime(db.execute(
+        text("SELECT MIN(updated_at) FROM email_jobs WHERE status = 'sent'")
+    ).scalar())
+    with _metrics_lock:
+        process = dict(_metrics)
+        process["sent_last_minute"] = sum(n for _, n in _recent)
+    return {
+        "by_status": {s: n for s, n in rows},
+        # due: listos para enviar; scheduled: con vencimiento futuro (digest, backoff)
+        "depth": {"due": open_row[0] or 0, "scheduled": open_row[1] or 0, "stale_processing": open_row[2] or 0},
+        "oldest_pending_at": oldest.isoformat() if oldest else None,
+        "lag_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0,
+        "failed_last_24h": failed_24h,
+        "retention_days": RETENTION_DAYS,
+        "oldest_sent_at": oldest_sent.isoformat() if oldest_sent else None,
+        "mode": WORKER_MODE,
+        "concurrency": SEND_CONCURRENCY,
+        "worker_running": _worker_started,
+        "process": process,
+    }
+
+
+# ── Reclamo, envío y cierre en lote ───────────────────────────────────────
+
+def _claim_select(digest: bool) -> str:
+    """SELECT de los ids reclamables, en orden de id. El primer término repite
+    el predicado de ix_email_jobs_claim para que el planner use el índice."""
+    return (
+        "SELECT id FROM email_jobs "
+        "WHERE status IN ('pending', 'processing') AND attempts < :max "
+        "AND func " + ("=" if digest else "<>") + " :digest AND ("
+        "  (status = 'pending' AND updated_at <= :now) "
+        "  OR (status = 'processing' AND updated_at <= :stale)"
+        ") "
+        "ORDER BY id ASC LIMIT :limit"
+    )
 
-def _claim_pending(db) -> list:
+
+def _claim_params(limit: int) -> dict:
+    now = _now()
+    return {"max": MAX_ATTEMPTS, "now": now, "stale": now - _dt.timedelta(seconds=STALE_AFTER),
+            "limit": limit, "digest": DIGEST_FUNC}
+
+
+def _claim_pending(db, limit: int = BATCH_SIZE, digest: bool = False) -> list:
     """
     Reclama jobs pendientes de forma atómica antes de procesarlos.
 
@@ -106,47 +274,310 @@ def _claim_pending(db) -> list:
 
     FOR UPDATE SKIP LOCKED hace que cada proceso se quede con filas distintas:
     la fila queda bloqueada mientras un proceso la tiene, y el otro simplemente
-    la salta en vez de esperar o repetirla.
+    la salta en vez de esperar o repetirla. (SQLite serializa las escrituras y
+    no lo necesita.)
+
+    Con digest=True reclama sólo avisos de venta retenidos (DIGEST_FUNC), y si
+    no, todo lo demás: así una ventana de digest sale completa aunque tenga
+    más avisos que EMAIL_BATCH_SIZE.
     """
-    from sqlalchemy import text
+    lock = " FOR UPDATE SKIP LOCKED" if _is_postgres(db) else ""
     rows = db.execute(
         text(
-            "UPDATE email_jobs SET status = 'processing', updated_at = NOW() "
-            "WHERE id IN ("
-            "  SELECT id FROM email_jobs "
-            "  WHERE attempts < :max AND ("
-            "    (status = 'pending' AND updated_at <= NOW()) "
-            "    OR (status = 'processing' AND updated_at <= NOW() - INTERVAL '5 minutes')"
-            "  ) "
-            "  ORDER BY id ASC LIMIT 10 "
-            "  FOR UPDATE SKIP LOCKED"
-            ") "
-            "RETURNING id, func, kwargs_json"
+            "UPDATE email_jobs SET status = 'processing', updated_at = :now "
+            "WHERE id IN (" + _claim_select(digest) + lock + ") "
+            "RETURNING id, func, kwargs_json, attempts, created_at"
         ),
-        {"max": MAX_ATTEMPTS},
+        _claim_params(limit),
     ).fetchall()
     db.commit()
-    return rows
+    return sorted(rows, key=lambda r: r[0])
 
 
-def _worker_loop() -> None:
-    """Bucle del worker. Procesa hasta 10 emails por ciclo."""
-    from database import SessionLocal
+_REJECTED = "el proveedor rechazó el envío"
 
-    while True:
+
+def _send_one(func_name: str, kwargs_json: str) -> str | None:
+    """Envía un job (corre en el pool de envío, sin tocar la DB). Devuelve el
+    error, o None si salió."""
+    import email_service as _es
+    func = getattr(_es, func_name, None)
+    if not func:
+        return f"email_service.{func_name} no existe"
+    try:
+        ok = func(**json.loads(kwargs_json))
+    except Exception as e:
+        return str(e)[:500] or type(e).__name__
+    # Con proveedor configurado, False es un rechazo (4xx/5xx, timeout): se reintenta
+    if ok is False and _es.is_configured():
+        return _REJECTED
+    return None
+
+
+def _render(func_name: str, kwargs_json: str) -> tuple[list, str | None]:
+    """Arma los payloads de un job sin enviarlos (modo captura). Devuelve
+    (payloads, error)."""
+    import email_service as _es
+    func = getattr(_es, func_name, None)
+    if not func:
+        return [], f"email_service.{func_name} no existe"
+    with _es.capture_payloads() as payloads:
         try:
-            db = SessionLocal()
-            try:
-                rows = _claim_pending(db)
-            finally:
-                db.close()
+            ok = func(**json.loads(kwargs_json))
+        except Exception as e:
+            return [], str(e)[:500] or type(e).__name__
+    if ok is False:
+        return [], _REJECTED
+    return payloads, None
 
-            for row in rows:
-                _process_one(row[0], row[1], row[2])
+
+def _deliver(pool: ThreadPoolExecutor, units: list) -> tuple[list, int]:
+    """Envía las unidades (func, kwargs_json) del lote. Devuelve el error de
+    cada una (None si salió) y cuántos requests se hicieron al proveedor."""
+    import email_service as _es
+    if not _es.is_configured():
+        return list(pool.map(lambda u: _send_one(*u), units)), 0
+    rendered = list(pool.map(lambda u: _render(*u), units))
+    errors = [err for _, err in rendered]
+    batchable, singles = [], []
+    for i, (payloads, err) in enumerate(rendered):
+        for payload in payloads:
+            (singles if payload.get("attachments") else batchable).append((i, payload))
+    chunks = [batchable[k:k + _es.BATCH_LIMIT] for k in range(0, len(batchable), _es.BATCH_LIMIT)]
+    if len(chunks) == 1 and len(chunks[0]) == 1:
+        singles.extend(chunks.pop())
+    chunk_ok = list(pool.map(lambda c: _es.send_batch([p for _, p in c]), chunks))
+    for chunk, ok in zip(chunks, chunk_ok):
+        if not ok:
+            # Resend rechaza el lote entero por un email inválido: uno por uno
+            singles.extend(chunk)
+    results = list(pool.map(lambda s: _es._post_email(s[1]), singles))
+    for (i, _), ok in zip(singles, results):
+        if not ok and errors[i] is None:
+            errors[i] = _REJECTED
+    return errors, len(chunks) + len(singles)
+
+
+def _digest_units(rows: list) -> tuple[list, list, dict]:
+    """Agrupa los avisos de venta retenidos por dueño: una unidad
+    send_sales_digest por email de dueño. Devuelve (unidades, filas de cada
+    unidad, errores de filas ilegibles por id)."""
+    groups: dict = {}
+    bad: dict = {}
+    for row in rows:
+        try:
+            kwargs = json.loads(row[2])
+            groups.setdefault(kwargs["owner_email"], []).append((row, kwargs))
         except Exception as e:
-            logger.warning("email_queue worker error: %s", e)
+            bad[row[0]] = str(e)[:500] or type(e).__name__
+    units, members = [], []
+    for owner_email, entries in groups.items():
+        sales = [kwargs for _, kwargs in entries]
+        units.append(("send_sales_digest", json.dumps({
+            "owner_email": owner_email, "shop_name": sales[-1].get("shop_name") or "Tu tienda", "sales": sales,
+        })))
+        members.append([row for row, _ in entries])
+    return units, members, bad
+
+
+def _as_datetime(value) -> _dt.datetime | None:
+    # SQLite devuelve los TIMESTAMP de SQL textual como str
+    return _dt.datetime.fromisoformat(value) if isinstance(value, str) else value
 
-        time.sleep(POLL_INTERVAL)
+
+def _blob_refs(rows: list) -> dict:
+    """{referencia de blob_store: created_at del job más nuevo que la usa}."""
+    import blob_store
+    refs: dict = {}
+    for row in rows:
+        try:
+            kwargs = json.loads(row[2])
+        except ValueError:
+            continue
+        if not isinstance(kwargs, dict):
+            continue
+        created = _as_datetime(row[4]) or _now()
+        for ref in blob_store.refs_in(kwargs):
+            refs[ref] = max(refs.get(ref, created), created)
+    return refs
+
+
+def _finish(db, rows: list, errors: list) -> tuple[int, int, int]:
+    """Actualiza el estado de todo el lote: un UPDATE para los enviados y un
+    executemany para los fallidos. Después recolecta los blobs de adjuntos de
+    los jobs que quedaron cerrados (sent/failed)."""
+    now = _now()
+    sent = [row[0] for row, err in zip(rows, errors) if err is None]
+    failures = []
+    for row, err in zip(rows, errors):
+        if err is None:
+            continue
+        attempts = (row[3] or 0) + 1
+        logger.warning("email_queue job %d falló: %s", row[0], err)
+        failures.append({
+            "id": row[0], "attempts": attempts, "err": err,
+            "status": "failed" if attempts >= MAX_ATTEMPTS else "pending",
+            "next": now + _dt.timedelta(seconds=RETRY_DELAY * attempts),
+        })
+    if sent:
+        db.execute(
+            text("UPDATE email_jobs SET status = 'sent', updated_at = :now WHERE id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"now": now, "ids": sent},
+        )
+    if failures:
+        db.execute(
+            text(
+                "UPDATE email_jobs SET attempts = :attempts, error = :err, status = :status, "
+                "updated_at = :next WHERE id = :id"
+            ),
+            failures,
+        )
+    db.commit()
+    closed_ids = set(sent) | {f["id"] for f in failures if f["status"] == "failed"}
+    closed = _blob_refs([row for row in rows if row[0] in closed_ids])
+    if closed:
+        import blob_store
+        blob_store.collect(db, closed)
+    retried = sum(1 for f in failures if f["status"] == "pending")
+    return len(sent), retried, len(failures) - retried
+
+
+def run_batch(db, pool: ThreadPoolExecutor, limit: int = BATCH_SIZE) -> int:
+    """Reclama, envía en paralelo y cierra un lote. Devuelve cuántos jobs tomó."""
+    rows = _claim_pending(db, limit)
+    digest_rows = _claim_pending(db, DIGEST_CLAIM_LIMIT, digest=True)
+    if not rows and not digest_rows:
+        return 0
+    start = time.perf_counter()
+    digest, members, bad = _digest_units(digest_rows)
+    unit_errors, requests = _deliver(pool, [(r[1], r[2]) for r in rows] + digest)
+    errors = unit_errors[:len(rows)]
+    by_row = dict(bad)
+    for group, err in zip(members, unit_errors[len(rows):]):
+        for row in group:
+            by_row[row[0]] = err
+    all_rows = rows + digest_rows
+    errors += [by_row[row[0]] for row in digest_rows]
+    sent, retried, failed = _finish(db, all_rows, errors)
+    _record(sent, retried, failed, requests, (time.perf_counter() - start) * 1000)
+    return len(all_rows)
+
+
+# ── Retención ─────────────────────────────────────────────────────────────
+
+def archive_sent(db, older_than_days: int | None = None, batch: int = ARCHIVE_BATCH) -> int:
+    """Borra los 'sent' cuyo envío tiene más de `older_than_days` días, en lotes
+    de `batch` filas con un commit por lote (locks y WAL cortos). Devuelve
+    cuántos borró."""
+    cutoff = _now() - _dt.timedelta(days=older_than_days or RETENTION_DAYS)
+    total = 0
+    while True:
+        deleted = db.execute(
+            text(
+                "DELETE FROM email_jobs WHERE id IN ("
+                "  SELECT id FROM email_jobs WHERE status = 'sent' AND updated_at < :cutoff "
+                "  ORDER BY updated_at LIMIT :batch"
+                ")"
+            ),
+            {"cutoff": cutoff, "batch": batch},
+        ).rowcount
+        db.commit()
+        total += deleted
+        if deleted < batch:
+            break
+    with _metrics_lock:
+        _metrics["archived"] += total
+        _metrics["last_archive_at"] = _now().isoformat()
+    return total
+
+
+# ── Espera: LISTEN/NOTIFY con poll de respaldo ────────────────────────────
+
+def _listen_connection():
+    """Conexión psycopg2 en autocommit con LISTEN email_jobs, o None (SQLite,
+    pooler sin LISTEN, error) — en ese caso el worker sólo hace poll.
+    Con el Transaction Pooler de Supabase (:6543) LISTEN no funciona: definir
+    EMAIL_WORKER_DATABASE_URL con la conexión directa (:5432)."""
+    from database import DATABASE_URL
+    url = os.getenv("EMAIL_WORKER_DATABASE_URL") or DATABASE_URL
+    if not url.startswith(("postgres://", "postgresql")):
+        return None
+    try:
+        import psycopg2
+        import psycopg2.extensions
+        conn = psycopg2.connect(url.replace("postgresql+psycopg2://", "postgresql://"))
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+        logger.info("email_queue: escuchando NOTIFY %s", NOTIFY_CHANNEL)
+        return conn
+    except Exception as e:
+        logger.warning("email_queue: LISTEN no disponible, sólo poll cada %ss: %s", POLL_INTERVAL, e)
+        return None
+
+
+def _wait(conn, timeout: float):
+    """Espera un NOTIFY o `timeout` segundos. Devuelve la conexión, o None si
+    se cayó (el llamador sigue en modo poll e intenta reconectar)."""
+    if conn is None:
+        time.sleep(timeout)
+        return None
+    import select
+    try:
+        select.select([conn], [], [], timeout)
+        conn.poll()
+        conn.notifies.clear()
+        return conn
+    except Exception as e:
+        logger.warning("email_queue: conexión LISTEN perdida: %s", e)
+        try:
+            conn.close()
+        except Exception:
+            pass
+        return None
+
+
+def run_worker(stop: threading.Event | None = None, session_factory=None) -> None:
+    """Bucle del worker: vacía la cola en lotes y espera el próximo NOTIFY."""
+    if session_factory is None:
+        from database import SessionLocal as session_factory
+    stop = stop or threading.Event()
+    pool = ThreadPoolExecutor(max_workers=SEND_CONCURRENCY, thread_name_prefix="email-send")
+    conn = _listen_connection()
+    next_listen_retry = time.monotonic() + 60
+    next_blob_sweep = time.monotonic() + BLOB_SWEEP_INTERVAL
+    next_archive = time.monotonic()
+    try:
+        while not stop.is_set():
+            try:
+                db = session_factory()
+                try:
+                    while run_batch(db, pool) >= BATCH_SIZE and not stop.is_set():
+                        pass
+                    if time.monotonic() >= next_blob_sweep:
+                        import blob_store
+                        next_blob_sweep = time.monotonic() + BLOB_SWEEP_INTERVAL
+                        n = blob_store.sweep(db)
+                        if n:
+                            logger.info("email_queue: %d blobs de adjuntos huérfanos borrados", n)
+                    if time.monotonic() >= next_archive:
+                        next_archive = time.monotonic() + ARCHIVE_INTERVAL
+                        n = archive_sent(db)
+                        if n:
+                            logger.info("email_queue: %d jobs enviados archivados (> %d días)", n, RETENTION_DAYS)
+                finally:
+                    db.close()
+            except Exception as e:
+                logger.warning("email_queue worker error: %s", e)
+            if conn is None and time.monotonic() >= next_listen_retry:
+                # Reintenta abrir LISTEN como mucho una vez por minuto
+                conn = _listen_connection()
+                next_listen_retry = time.monotonic() + 60
+            conn = _wait(conn, POLL_INTERVAL)
+    finally:
+        pool.shutdown(wait=True)
+        if conn is not None:
+            conn.close()
 
 
 _worker_started = False
@@ -160,6 +591,6 @@ def start_worker() -> None:
         if _worker_started:
             return
         _worker_started = True
-    t = threading.Thread(target=_worker_loop, daemon=True, name="email-queue-worker")
+    t = threading.Thread(target=run_worker, daemon=True, name="email-queue-worker")
     t.start()
-    logger.info("email_queue: worker iniciado")
+    logger.info("email_queue: worker iniciado (%d envíos concurrentes)", SEND_CONCURRENCY)
@@ -1,11 +1,15 @@
+import contextlib
 import logging
 import os
 import re
+import threading
 import requests as _requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger("bayup.email")
 
 _RESEND_API_KEY = os.getenv("RESEND_API_KEY", "")
+_API_URL = os.getenv("RESEND_API_URL", "https://api.resend.com").rstrip("/")
 _FROM = os.getenv("RESEND_FROM_EMAIL", "Bayup <noreply@bayup.com.co>")
 _FROM_DOMAIN = _FROM.split("<")[-1].rstrip(">").strip() or "noreply@bayup.com.co"
 _SITE = os.getenv("SITE_URL", "https://bayup.com.co")
@@ -37,23 +41,64 @@ _BASE_STYLE = """
 </div>
 """
 
-def _btn(text: str, url: str) -> str:
-    return f'<a href="{url}" style="display:inline-block;margin-top:20px;padding:14px 28px;background:#004d4d;color:#00f2ff;text-decoration:none;border-radius:10px;font-weight:900;font-size:13px;letter-spacing:1px">{text}</a>'
+# Sesión HTTP compartida: keep-alive con Resend en vez de un handshake TCP+TLS
+# por email. El pool admite tantas conexiones como envíos concurrentes hace el
+# worker de email_queue (EMAIL_SEND_CONCURRENCY).
+_session: _requests.Session | None = None
+_session_lock = threading.Lock()
 
-def _cop(amount: float) -> str:
-    """Formato peso colombiano: $189.900"""
-    return "$" + f"{amount:,.0f}".replace(",", ".")
 
-def _send_raw(to: str, subject: str, html: str, from_name: str | None = None) -> bool:
-    if not _RESEND_API_KEY:
-        logger.warning("Email MOCK (sin RESEND_API_KEY) — To: %s | %s", to, subject)
-        return False
+def _http() -> _requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool = max(1, int(os.getenv("EMAIL_SEND_CONCURRENCY", "4")))
+                s = _requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def is_configured() -> bool:
+    """Sin RESEND_API_KEY los envíos son MOCK (solo se loguean)."""
+    return bool(_RESEND_API_KEY)
+
+
+# Modo captura (worker de email_queue): las funciones send_* arman el payload
+# y _post_email lo guarda en vez de enviarlo, para mandarlo luego por lotes.
+_capture = threading.local()
+
+# Máximo de emails por request en POST /emails/batch de Resend. El endpoint
+# de lote no admite adjuntos: esos payloads se envían uno por uno.
+BATCH_LIMIT = 100
+
+
+@contextlib.contextmanager
+def capture_payloads():
+    """Dentro del bloque, _post_email no envía: agrega el payload a la lista
+    devuelta y responde True. Es por hilo (threading.local)."""
+    captured: list = []
+    _capture.payloads = captured
+    try:
+        yield captured
+    finally:
+        _capture.payloads = None
+
+
+def _post_email(payload: dict, timeout: int = 10) -> bool:
+    captured = getattr(_capture, "payloads", None)
+    if captured is not None:
+        captured.append(payload)
+        return True
     try:
-        r = _requests.post(
-            "https://api.resend.com/emails",
+        r = _http().post(
+            f"{_API_URL}/emails",
             headers={"Authorization": f"Bearer {_RESEND_API_KEY}", "Content-Type": "application/json"},
-            json={"from": _from_header(from_name), "to": [to], "subject": subject, "html": html},
-            timeout=10,
+            json=payload,
+            timeout=timeout,
         )
         if not r.ok:
             logger.error("Email ERROR %s: %s", r.status_code, r.text)
@@ -62,28 +107,56 @@ def _send_raw(to: str, subject: str, html: str, from_name: str | None = None) ->
         logger.error("Email ERROR: %s", e)
         return False
 
-def _send_with_attachment(to: str, subject: str, html: str, filename: str, pdf_base64: str, from_name: str | None = None) -> bool:
-    if not _RESEND_API_KEY:
-        logger.warning("Email MOCK (sin RESEND_API_KEY) — To: %s | %s", to, subject)
-        return False
+
+def send_batch(payloads: list, timeout: int = 30) -> bool:
+    """Envía hasta BATCH_LIMIT emails sin adjuntos en un solo request. Resend
+    valida el lote completo: si uno es inválido, no sale ninguno."""
+    if len(payloads) > BATCH_LIMIT:
+        raise ValueError(f"un lote admite como máximo {BATCH_LIMIT} emails")
     try:
-        r = _requests.post(
-            "https://api.resend.com/emails",
+        r = _http().post(
+            f"{_API_URL}/emails/batch",
             headers={"Authorization": f"Bearer {_RESEND_API_KEY}", "Content-Type": "application/json"},
-            json={
-                "from": _from_header(from_name), "to": [to], "subject": subject, "html": html,
-                "attachments": [{"filename": filename, "content": pdf_base64}],
-            },
-            timeout=15,
+            json=payloads,
+            timeout=timeout,
         )
         if not r.ok:
-            logger.error("Email ERROR %s: %s", r.status_code, r.text)
+            logger.error("Email batch ERROR %s: %s", r.status_code, r.text)
         return r.ok
     except Exception as e:
-        logger.error("Email ERROR: %s", e)
+        logger.error("Email batch ERROR: %s", e)
         return False
 
-def send_invoice_attachment(email: str, name: str, order_id: str, shop_name: str, pdf_base64: str, shop_logo: str | None = None) -> bool:
+def _btn(text: str, url: str) -> str:
+    return f'<a href="{url}" style="display:inline-block;margin-top:20px;padding:14px 28px;background:#004d4d;color:#00f2ff;text-decoration:none;border-radius:10px;font-weight:900;font-size:13px;letter-spacing:1px">{text}</a>'
+
+def _cop(amount: float) -> str:
+    """Formato peso colombiano: $189.900"""
+    return "$" + f"{amount:,.0f}".replace(",", ".")
+
+def _send_raw(to: str, subject: str, html: str, from_name: str | None = None) -> bool:
+    if not _RESEND_API_KEY:
+        logger.warning("Email MOCK (sin RESEND_API_KEY) — To: %s | %s", to, subject)
+        return False
+    return _post_email({"from": _from_header(from_name), "to": [to], "subject": subject, "html": html})
+
+def _send_with_attachment(to: str, subject: str, html: str, filename: str, pdf_base64: str, from_name: str | None = None) -> bool:
+    if not _RESEND_API_KEY:
+        logger.warning("Email MOCK (sin RESEND_API_KEY) — To: %s | %s", to, subject)
+        return False
+    return _post_email({
+        "from": _from_header(from_name), "to": [to], "subject": subject, "html": html,
+        "attachments": [{"filename": filename, "content": pdf_base64}],
+    }, timeout=15)
+
+def send_invoice_attachment(
+    email: str, name: str, order_id: str, shop_name: str, pdf_base64: str | None = None,
+    shop_logo: str | None = None, pdf_ref: str | None = None,
+) -> bool:
+    # pdf_ref: el PDF guardado en blob_store (jobs de email_queue); se lee al enviar
+    if pdf_ref:
+        import blob_store
+        pdf_base64 = blob_store.read_base64(pdf_ref)
     short_id   = str(order_id)[:8].upper()
     first_name = name.split()[0] if name else name
     html = (
@@ -139,19 +212,7 @@ def _send(to: str, subject: str, content: str) -> bool:
     if not _RESEND_API_KEY:
         logger.warning("Email MOCK (sin RESEND_API_KEY) — To: %s | %s", to, subject)
         return False
-    try:
-        r = _requests.post(
-            "https://api.resend.com/emails",
-            headers={"Authorization": f"Bearer {_RESEND_API_KEY}", "Content-Type": "application/json"},
-            json={"from": _FROM, "to": [to], "subject": subject, "html": html},
-            timeout=10,
-        )
-        if not r.ok:
-            logger.error("Email ERROR %s: %s", r.status_code, r.text)
-        return r.ok
-    except Exception as e:
-        logger.error("Email ERROR: %s", e)
-        return False
+    return _post_email({"from": _FROM, "to": [to], "subject": subject, "html": html})
 
 def _simple_email_html(
     icon: str,
@@ -717,5 +778,68 @@ def send_new_sale_notification(
 
     return _send_raw(owner_email, f"🛒 Nueva venta {total_fmt} — {shop_name}", html)
 
+def send_sales_digest(owner_email: str, shop_name: str, sales: list) -> bool:
+    """Resumen de varias ventas en un solo email (modo digest del tenant).
+    `sales`: los kwargs de send_new_sale_notification de cada venta."""
+    if len(sales) == 1:
+        return send_new_sale_notification(**sales[0])
+    grand_total = sum(float(s.get("total") or 0) for s in sales)
+    total_fmt = _cop(grand_total)
+    sale_rows = "".join(
+        f'<tr>'
+        f'<td style="padding:11px 14px;font-family:\'Courier New\',monospace;font-size:12px;color:#6b7280;border-top:1px solid #f3f4f6">#{str(s["order_id"])[:8].upper()}</td>'
+        f'<td style="padding:11px 14px;font-size:13px;color:#111827;font-weight:600;border-top:1px solid #f3f4f6">{s.get("customer_name") or "Cliente"}'
+        f'<div style="font-size:11px;font-weight:400;color:#9ca3af">{s.get("payment_method") or ""}</div></td>'
+        f'<td align="right" style="padding:11px 14px;font-family:\'Courier New\',monospace;font-size:13px;font-weight:600;color:#111827;border-top:1px solid #f3f4f6">{_cop(s.get("total") or 0)}</td>'
+        f'</tr>'
+        for s in sales
+    )
+
+    html = f"""<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1"></head>
+<body style="margin:0;padding:24px 16px;background:#f0f0f0;font-family:Arial,Helvetica,sans-serif">
+<div style="max-width:580px;margin:0 auto;background:#ffffff;border-radius:10px;overflow:hidden;box-shadow:0 2px 8px rgba(0,0,0,0.08)">
+
+  <table width="100%" cellpadding="0" cellspacing="0" border="0" style="background:#1a1a1a;border-top:2px solid #007878">
+    <tr>
+      <td style="padding:28px 32px">
+        <div style="font-size:10px;font-weight:800;letter-spacing:0.14em;text-transform:uppercase;color:#007878">{len(sales)} ventas nuevas</div>
+        <div style="font-size:14px;font-weight:600;color:rgba(255,255,255,0.65);margin-top:4px">{shop_name}</div>
+      </td>
+      <td align="right" style="padding:28px 32px">
+        <span style="font-size:38px;font-weight:900;font-family:'Courier New',monospace;color:#00f2ff;letter-spacing:-1px">{total_fmt}</span>
+      </td>
+    </tr>
+  </table>
+
+  <div style="padding:24px 32px">
+    <table width="100%" cellpadding="0" cellspacing="0" border="0" style="border:1px solid #e5e7eb;border-radius:8px;overflow:hidden;margin-bottom:24px">
+      <thead>
+        <tr style="background:#f9fafb">
+          <th align="left" style="padding:9px 14px;font-size:9.5px;font-weight:800;text-transform:uppercase;letter-spacing:0.1em;color:#9ca3af">Pedido</th>
+          <th align="left" style="padding:9px 14px;font-size:9.5px;font-weight:800;text-transform:uppercase;letter-spacing:0.1em;color:#9ca3af">Cliente</th>
+          <th align="right" style="padding:9px 14px;font-size:9.5px;font-weight:800;text-transform:uppercase;letter-spacing:0.1em;color:#9ca3af">Total</th>
+        </tr>
+      </thead>
+      <tbody>{sale_rows}</tbody>
+    </table>
+
+    <div style="text-align:center">
+      <a href="{_SITE}/dashboard/pedidos-web" style="display:inline-block;background:#0f0f0f;color:#00f2ff;text-decoration:none;font-size:11px;font-weight:800;letter-spacing:0.14em;text-transform:uppercase;padding:14px 36px;border-radius:6px">Ver pedidos en el dashboard &#8594;</a>
+    </div>
+  </div>
+
+  <div style="border-top:1px solid #f3f4f6;padding:16px 32px;text-align:center;font-size:11px;color:#9ca3af;line-height:1.7">
+    Recibes este resumen porque activaste el modo digest de avisos de venta.<br>
+    &#169; 2026 Bayup &#8212; La plataforma de ventas inteligente
+  </div>
+
+</div>
+</body>
+</html>"""
+
+    return _send_raw(owner_email, f"🛒 {len(sales)} ventas por {total_fmt} — {shop_name}", html)
+
 def send_email(to: str, subject: str, html: str) -> bool:
     return _send(to, subject, html)
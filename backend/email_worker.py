@@ -0,0 +1,43 @@
+"""
+Worker dedicado de la cola de emails.
+
+Con EMAIL_WORKER_MODE=external los procesos web sólo encolan en email_jobs y
+este proceso hace los envíos (LISTEN/NOTIFY + pool de envío concurrente, ver
+email_queue.py). Así un deploy con varios workers de uvicorn no arranca un
+poller por proceso.
+
+Uso:
+    cd backend && python email_worker.py
+
+Con el Transaction Pooler de Supabase definir EMAIL_WORKER_DATABASE_URL con la
+conexión directa (puerto 5432) para que LISTEN funcione; sin eso hace poll.
+"""
+import logging
+import signal
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import blob_store  # noqa: E402
+import email_queue  # noqa: E402
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # Lee adjuntos que escribieron los procesos web: sin S3 ni directorio compartido, no arranca
+    blob_store.require_shared_storage()
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    logging.getLogger("bayup.email_queue").info(
+        "email_worker: iniciado (%d envíos concurrentes, lotes de %d)",
+        email_queue.SEND_CONCURRENCY, email_queue.BATCH_SIZE,
+    )
+    # Termina el lote en curso y sale (SIGTERM en un deploy)
+    email_queue.run_worker(stop=stop)
+
+
+if __name__ == "__main__":
+    main()
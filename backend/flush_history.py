@@ -0,0 +1,42 @@
+"""
+Historial de atributos para los listeners de flush que mantienen tablas
+derivadas (tenant_revenue, tenant_ledger).
+
+Cada módulo registra los campos que sigue con track() y en su before_flush
+lee, por objeto, los valores nuevos (values) o el par anterior/nuevo de un
+objeto modificado (old_new) para restar lo viejo y sumar lo nuevo.
+"""
+import datetime as _dt
+
+from sqlalchemy import event, inspect
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    """No-op: registrado con active_history para que el historial del atributo
+    traiga el valor anterior aunque estuviera expirado."""
+
+
+def track(model, fields) -> None:
+    for field in fields:
+        event.listen(getattr(model, field), "set", _keep_old_value, active_history=True)
+
+
+def values(obj, fields) -> list:
+    return [getattr(obj, f) for f in fields]
+
+
+def old_new(obj, fields) -> tuple[list, list] | None:
+    """(valores anteriores, valores nuevos) de `fields`, o None si ninguno cambió."""
+    history = [inspect(obj).attrs[f].history for f in fields]
+    if not any(h.has_changes() for h in history):
+        return None
+    old = [h.deleted[0] if h.deleted else (h.unchanged[0] if h.unchanged else None) for h in history]
+    new = [h.added[0] if h.added else (h.unchanged[0] if h.unchanged else None) for h in history]
+    return old, new
+
+
+def ensure_created_at(obj) -> None:
+    """El default de created_at se aplica en el INSERT, tarde para el
+    before_flush: el día/corte del objeto nuevo se necesita ya."""
+    if obj.created_at is None:
+        obj.created_at = _dt.datetime.utcnow()
@@ -0,0 +1,325 @@
+"""
+Cierre de periodo de liquidaciones de todos los tenants.
+
+Las liquidaciones se creaban de a una desde el super admin, y cada pantalla
+(pendientes web, comisiones POS) volvía a recorrer los pedidos del tenant. El
+cierre de un periodo (todo lo creado hasta period_end) hace en una pasada:
+  - una consulta agrupada por tenant sobre orders: bruto y cantidad web y POS
+    de cada ventana, unida a lo que ya cubren las liquidaciones del tenant;
+  - inserta en lote, por tandas de CLOSE_CHUNK tenants, una liquidación 'web'
+    programada (neto a pagar) y una 'pos_commission' pendiente (comisión a
+    cobrar) por tenant, más una notificación por tenant; cada tanda confirma
+    junto con los contadores del cierre en liquidation_closes.
+
+Idempotente y reanudable: la ventana de un tenant empieza donde termina su
+última liquidación no cancelada (period_end de las de un cierre, paid_date o
+created_at de las manuales), así que un tenant ya cerrado no vuelve a salir en el mismo periodo.
+Si el proceso se corta a mitad, correrlo de nuevo cierra sólo los que faltan;
+un cierre 'done' no se vuelve a calcular.
+
+Las liquidaciones se insertan con Core, sin pasar por el ORM: no están
+pagadas, así que no mueven tenant_ledgers (ver tenant_ledger.coverage).
+
+Corre como job (LIQUIDATION_CLOSE_AUTO=1: cierra a las 00:00 UTC de cada
+lunes y jueves, una vez pasados LIQUIDATION_CLOSE_LAG_MIN, para pagar el
+martes y el viernes) o a mano con scripts/close_liquidations.py. En
+PostgreSQL un advisory lock evita dos cierres a la vez.
+"""
+import datetime as _dt
+import logging
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import and_, case, func, insert, or_
+
+import models
+import tenant_ledger
+from routers.liquidations import BAYUP_RATE, PRIX_RATE
+
+logger = logging.getLogger("bayup.liquidation_close")
+
+CLOSE_AUTO = os.getenv("LIQUIDATION_CLOSE_AUTO", "0") == "1"
+CLOSE_INTERVAL = int(os.getenv("LIQUIDATION_CLOSE_INTERVAL_S", "3600"))
+CLOSE_LAG_MIN = int(os.getenv("LIQUIDATION_CLOSE_LAG_MIN", "60"))
+CLOSE_CHUNK = int(os.getenv("LIQUIDATION_CLOSE_CHUNK", "1000"))
+CLOSE_WEEKDAYS = (0, 3)    # lunes y jueves 00:00 UTC
+PAYMENT_WEEKDAYS = (1, 4)  # martes y viernes, como routers.liquidations._next_payment_dates
+
+
+def _fmt_cop(v) -> str:
+    return f"${int(v):,}".replace(",", ".")
+
+
+# ── Calendario ────────────────────────────────────────────────────────────
+
+def due_period_end(now: _dt.datetime | None = None) -> _dt.datetime:
+    """Último fin de periodo (00:00 de un día de CLOSE_WEEKDAYS) que ya se
+    puede cerrar: pasaron CLOSE_LAG_MIN para que confirmen los pedidos que
+    estaban en vuelo a medianoche."""
+    now = now or _dt.datetime.utcnow()
+    d = (now - _dt.timedelta(minutes=CLOSE_LAG_MIN)).date()
+    while d.weekday() not in CLOSE_WEEKDAYS:
+        d -= _dt.timedelta(days=1)
+    return _dt.datetime.combine(d, _dt.time.min)
+
+
+def payment_date(period_end: _dt.datetime) -> _dt.datetime:
+    """Primer día de pago posterior al fin del periodo."""
+    d = period_end.date() + _dt.timedelta(days=1)
+    while d.weekday() not in PAYMENT_WEEKDAYS:
+        d += _dt.timedelta(days=1)
+    return _dt.datetime.combine(d, _dt.time.min)
+
+
+# ── Cálculo ───────────────────────────────────────────────────────────────
+
+def pending_by_tenant(db, period_end: _dt.datetime) -> list:
+    """Filas (tenant_id, web_start, web_gross, web_count, web_first, pos_start,
+    pos_gross, pos_count, pos_first) de los tenants con onboarding completo y
+    pedidos liquidables en su ventana: creados después de lo que ya cubren sus
+    liquidaciones de ese tipo y hasta period_end. Una consulta."""
+    L, O, U = models.Liquidation, models.Order, models.User
+    # Las de un cierre cubren su periodo; las manuales, hasta el pago o, si
+    # todavía no se pagaron, hasta que se crearon desde los pendientes
+    covered = case((L.origin == "close", L.period_end), else_=func.coalesce(L.paid_date, L.created_at))
+    starts = (
+        db.query(
+            L.tenant_id.label("tenant_id"),
+            func.max(case((L.liq_type == "web", covered))).label("web_start"),
+            func.max(case((L.liq_type == "pos_commission", covered))).label("pos_start"),
+        )
+        .filter(L.status != "cancelled")
+        .group_by(L.tenant_id)
+        .subquery()
+    )
+
+    def _window(kind):
+        start = starts.c[f"{kind}_start"]
+        cond = and_(tenant_ledger.is_kind(kind), or_(start.is_(None), O.created_at > start))
+        return (
+            func.max(start),
+            func.coalesce(func.sum(case((cond, O.total_price), else_=0.0)), 0.0),
+            func.coalesce(func.sum(case((cond, 1), else_=0)), 0),
+            func.min(case((cond, O.created_at))),
+        )
+
+    web, pos = _window("web"), _window("pos")
+    return (
+        db.query(O.tenant_id, *web, *pos)
+        .join(U, U.id == O.tenant_id)
+        .outerjoin(starts, starts.c.tenant_id == O.tenant_id)
+        .filter(
+            U.is_global_staff == False,
+            U.onboarding_completed == True,
+            O.status.in_(tenant_ledger.COMMISSIONABLE),
+            O.created_at <= period_end,
+        )
+        .group_by(O.tenant_id)
+        .having(or_(web[2] > 0, pos[2] > 0))
+        .order_by(O.tenant_id)
+        .all()
+    )
+
+
+def _build(row, period_end, scheduled, now) -> tuple[list, list]:
+    """Liquidaciones y notificación de un tenant."""
+    tid, web_start, web_gross, web_count, web_first, pos_start, pos_gross, pos_count, pos_first = row
+    notes = f"Cierre automático {period_end:%Y-%m-%d}"
+    liqs, parts = [], []
+    if web_count:
+        gross = round(float(web_gross), 2)
+        bayup_fee = round(gross * BAYUP_RATE, 2)
+        prix_fee = round(gross * PRIX_RATE, 2)
+        net = round(gross - bayup_fee - prix_fee, 2)
+        liqs.append({
+            "id": uuid.uuid4(), "tenant_id": tid, "liq_type": "web", "origin": "close",
+            "gross_amount": gross, "bayup_commission": bayup_fee, "prix_fee": prix_fee, "net_amount": net,
+            "order_count": int(web_count), "period_start": web_start or web_first, "period_end": period_end,
+            "status": "scheduled", "scheduled_date": scheduled, "notes": notes, "created_at": now,
+        })
+        parts.append(
+            f"{int(web_count)} pedido{'s' if web_count != 1 else ''} web por {_fmt_cop(gross)}: "
+            f"recibes {_fmt_cop(net)} el {scheduled:%d/%m/%Y}."
+        )
+    if pos_count:
+        gross = round(float(pos_gross), 2)
+        commission = round(gross * BAYUP_RATE, 2)
+        liqs.append({
+            "id": uuid.uuid4(), "tenant_id": tid, "liq_type": "pos_commission", "origin": "close",
+            "gross_amount": gross, "bayup_commission": commission, "prix_fee": 0.0, "net_amount": 0.0,
+            "order_count": int(pos_count), "period_start": pos_start or pos_first, "period_end": period_end,
+            "status": "pending", "scheduled_date": None, "notes": notes, "created_at": now,
+        })
+        parts.append(
+            f"Comisión Bayup de {_fmt_cop(commission)} sobre {int(pos_count)} "
+            f"venta{'s' if pos_count != 1 else ''} en punto físico."
+        )
+    last_day = (period_end - _dt.timedelta(seconds=1)).date()
+    notification = {
+        "id": uuid.uuid4(), "tenant_id": tid, "title": "📅 Cierre de liquidación",
+        "message": f"Cerramos tus ventas hasta el {last_day:%d/%m/%Y}. " + " ".join(parts),
+        "type": "info", "is_read": False, "created_at": now,
+    }
+    return liqs, [notification]
+
+
+def _summary(state, **extra) -> dict:
+    return {
+        "period_end": state.period_end.isoformat(),
+        "status": state.status,
+        "scheduled_date": state.scheduled_date.isoformat() if state.scheduled_date else None,
+        "tenants": state.tenants or 0,
+        "web_liquidations": state.web_liquidations or 0,
+        "pos_liquidations": state.pos_liquidations or 0,
+        "web_net": round(state.web_net or 0.0, 2),
+        "pos_commission": round(state.pos_commission or 0.0, 2),
+        **extra,
+    }
+
+
+def close_period(db, period_end: _dt.datetime, scheduled_date: _dt.datetime | None = None,
+                 notify: bool = True, chunk: int | None = None) -> dict:
+    """Cierra el periodo que termina en period_end para todos los tenants.
+    Devuelve los totales del cierre (acumulados si se retomó) y los tiempos
+    de esta corrida: query_ms (la consulta agrupada), write_ms (inserts y
+    commits) y elapsed_ms."""
+    started = time.perf_counter()
+    chunk = chunk or CLOSE_CHUNK
+    state = db.get(models.LiquidationClose, period_end)
+    if state is not None and state.status == "done":
+        return _summary(state, skipped=True, resumed=False, query_ms=0.0, write_ms=0.0, elapsed_ms=0.0)
+    resumed = state is not None
+    if state is None:
+        state = models.LiquidationClose(
+            period_end=period_end, status="running",
+            scheduled_date=scheduled_date or payment_date(period_end),
+            started_at=_dt.datetime.utcnow(),
+            tenants=0, web_liquidations=0, pos_liquidations=0, web_net=0.0, pos_commission=0.0,
+        )
+        db.add(state)
+        db.commit()
+    scheduled = state.scheduled_date
+
+    rows = pending_by_tenant(db, period_end)
+    query_ms = (time.perf_counter() - started) * 1000
+
+    write_start = time.perf_counter()
+    now = _dt.datetime.utcnow()
+    L, N = models.Liquidation.__table__, models.Notification.__table__
+    for i in range(0, len(rows), chunk):
+        liqs, notifications = [], []
+        for row in rows[i:i + chunk]:
+            tenant_liqs, tenant_notifications = _build(row, period_end, scheduled, now)
+            liqs.extend(tenant_liqs)
+            notifications.extend(tenant_notifications)
+        db.execute(insert(L), liqs)
+        if notify:
+            db.execute(insert(N), notifications)
+        web = [liq for liq in liqs if liq["liq_type"] == "web"]
+        pos = [liq for liq in liqs if liq["liq_type"] == "pos_commission"]
+        state.tenants += len(rows[i:i + chunk])
+        state.web_liquidations += len(web)
+        state.pos_liquidations += len(pos)
+        state.web_net += sum(liq["net_amount"] for liq in web)
+        state.pos_commission += sum(liq["bayup_commission"] for liq in pos)
+        db.commit()
+    write_ms = (time.perf_counter() - write_start) * 1000
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    state.status = "done"
+    state.finished_at = _dt.datetime.utcnow()
+    state.elapsed_ms = (state.elapsed_ms or 0.0) + elapsed_ms
+    db.commit()
+    logger.info(
+        "liquidation_close: periodo %s cerrado — %d tenants en esta corrida (%.0fms consulta, %.0fms escritura)",
+        period_end.isoformat(), len(rows), query_ms, write_ms,
+    )
+    return _summary(state, skipped=False, resumed=resumed, closed_now=len(rows),
+                    query_ms=round(query_ms, 1), write_ms=round(write_ms, 1), elapsed_ms=round(elapsed_ms, 1))
+
+
+def run_due(db, now: _dt.datetime | None = None) -> list[dict]:
+    """Termina los cierres que quedaron a medias y cierra el periodo vencido
+    si todavía no está hecho. Devuelve un resumen por cierre que corrió."""
+    done = []
+    due = due_period_end(now)
+    running = (
+        db.query(models.LiquidationClose.period_end)
+        .filter(models.LiquidationClose.status == "running", models.LiquidationClose.period_end < due)
+        .order_by(models.LiquidationClose.period_end)
+        .all()
+    )
+    for (period_end,) in running:
+        done.append(close_period(db, period_end))
+    state = db.get(models.LiquidationClose, due)
+    if state is None or state.status != "done":
+        done.append(close_period(db, due))
+    return done
+
+
+def stats(db) -> dict:
+    """Últimos cierres, para observabilidad."""
+    rows = db.query(models.LiquidationClose).order_by(models.LiquidationClose.period_end.desc()).limit(10).all()
+    return {
+        "auto": CLOSE_AUTO,
+        "next_due": due_period_end().isoformat(),
+        "closes": [_summary(r, elapsed_ms=r.elapsed_ms) for r in rows],
+    }
+
+
+# ── Ejecución (CLI y job) ─────────────────────────────────────────────────
+
+def run_locked(fn):
+    """Corre fn(db) con una sesión propia. En PostgreSQL sólo un proceso
+    cierra a la vez: el advisory lock vive en una conexión propia porque la
+    sesión la suelta en cada commit. Devuelve None si otro proceso lo tiene."""
+    from database import SessionLocal, engine
+    from sqlalchemy import text
+    lock_conn = None
+    if engine.dialect.name == "postgresql":
+        lock_conn = engine.connect()
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(hashtext('liquidation_close'))")).scalar():
+            lock_conn.close()
+            return None
+    db = SessionLocal()
+    try:
+        return fn(db)
+    finally:
+        db.close()
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext('liquidation_close'))"))
+            lock_conn.close()
+
+
+def _job_loop() -> None:
+    while True:
+        try:
+            for s in run_locked(run_due) or []:
+                logger.info(
+                    "liquidation_close: %s %s — %d tenants, %d web, %d POS en %.0fms",
+                    s["period_end"], s["status"], s["tenants"], s["web_liquidations"],
+                    s["pos_liquidations"], s["elapsed_ms"] or 0.0,
+                )
+        except Exception as e:
+            logger.warning("liquidation_close error: %s", e)
+        time.sleep(CLOSE_INTERVAL)
+
+
+_job_started = False
+_job_lock = threading.Lock()
+
+
+def start_job() -> None:
+    """Arranca el job de cierres en background si LIQUIDATION_CLOSE_AUTO=1.
+    Idempotente — solo corre uno."""
+    global _job_started
+    if not CLOSE_AUTO:
+        return
+    with _job_lock:
+        if _job_started:
+            return
+        _job_started = True
+    threading.Thread(target=_job_loop, daemon=True, name="liquidation-close").start()
+    logger.info("liquidation_close: job iniciado")
@@ -72,6 +72,7 @@ def _sync_postgres_schema() -> None:
             "ALTER TABLE users ADD COLUMN IF NOT EXISTS privacy_policy VARCHAR",
             "ALTER TABLE users ADD COLUMN IF NOT EXISTS return_policy VARCHAR",
             "ALTER TABLE users ADD COLUMN IF NOT EXISTS shipping_policy VARCHAR",
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS sale_digest_minutes INTEGER",
             # payments
             "ALTER TABLE payments ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(128)",
             "ALTER TABLE payments ADD COLUMN IF NOT EXISTS order_id UUID",
@@ -108,7 +109,79 @@ def _sync_postgres_schema() -> None:
                 created_at  TIMESTAMP    DEFAULT NOW(),
                 updated_at  TIMESTAMP    DEFAULT NOW()
             )""",
-            "CREATE INDEX IF NOT EXISTS ix_email_jobs_status ON email_jobs (status)",
+            # índices parciales del reclamo y del archivador — ver alembic 0021
+            "CREATE INDEX IF NOT EXISTS ix_email_jobs_claim ON email_jobs (id) WHERE status IN ('pending', 'processing')",
+            "CREATE INDEX IF NOT EXISTS ix_email_jobs_sent_at ON email_jobs (updated_at) WHERE status = 'sent'",
+            "DROP INDEX IF EXISTS ix_email_jobs_status",
+            # snapshots de KPIs del super admin — ver alembic 0022 y platform_kpis.py
+            """CREATE TABLE IF NOT EXISTS platform_kpi_snapshots (
+                id                BIGSERIAL PRIMARY KEY,
+                taken_at          TIMESTAMP NOT NULL,
+                watermark         TIMESTAMP NOT NULL,
+                day_start         TIMESTAMP NOT NULL,
+                month_start       TIMESTAMP NOT NULL,
+                total_orders      INTEGER DEFAULT 0,
+                total_users       INTEGER DEFAULT 0,
+                total_revenue     DOUBLE PRECISION DEFAULT 0.0,
+                total_commission  DOUBLE PRECISION DEFAULT 0.0,
+                revenue_day       DOUBLE PRECISION DEFAULT 0.0,
+                commission_day    DOUBLE PRECISION DEFAULT 0.0,
+                revenue_month     DOUBLE PRECISION DEFAULT 0.0,
+                commission_month  DOUBLE PRECISION DEFAULT 0.0,
+                refresh_ms        DOUBLE PRECISION
+            )""",
+            "CREATE INDEX IF NOT EXISTS ix_users_created_at ON users (created_at)",
+            # ventas por tenant y día — ver alembic 0023 y tenant_revenue.py. Se
+            # crea y se llena desde orders en la misma transacción
+            """DO $$ BEGIN
+                IF to_regclass('tenant_daily_revenue') IS NULL THEN
+                    CREATE TABLE tenant_daily_revenue (
+                        tenant_id   UUID NOT NULL,
+                        day         DATE NOT NULL,
+                        revenue     DOUBLE PRECISION DEFAULT 0.0,
+                        commission  DOUBLE PRECISION DEFAULT 0.0,
+                        orders      INTEGER DEFAULT 0,
+                        PRIMARY KEY (tenant_id, day)
+                    );
+                    CREATE INDEX ix_tenant_daily_revenue_day ON tenant_daily_revenue (day);
+                    INSERT INTO tenant_daily_revenue (tenant_id, day, revenue, commission, orders)
+                    SELECT tenant_id, created_at::date, COALESCE(SUM(total_price), 0),
+                           COALESCE(SUM(commission_amount), 0), COUNT(*)
+                    FROM orders
+                    WHERE tenant_id IS NOT NULL AND created_at IS NOT NULL
+                    GROUP BY tenant_id, created_at::date;
+                END IF;
+            END $$""",
+            # saldo corriente de liquidaciones — ver alembic 0024 y tenant_ledger.py
+            """CREATE TABLE IF NOT EXISTS tenant_ledgers (
+                tenant_id   UUID PRIMARY KEY,
+                web_cutoff  TIMESTAMP,
+                web_gross   DOUBLE PRECISION DEFAULT 0.0,
+                web_count   INTEGER DEFAULT 0,
+                pos_cutoff  TIMESTAMP,
+                pos_gross   DOUBLE PRECISION DEFAULT 0.0,
+                pos_count   INTEGER DEFAULT 0,
+                paid_net    DOUBLE PRECISION DEFAULT 0.0,
+                paid_gross  DOUBLE PRECISION DEFAULT 0.0,
+                paid_bayup  DOUBLE PRECISION DEFAULT 0.0,
+                paid_count  INTEGER DEFAULT 0,
+                updated_at  TIMESTAMP DEFAULT NOW()
+            )""",
+            # cierres de periodo de liquidaciones — ver alembic 0025 y liquidation_close.py
+            "ALTER TABLE liquidations ADD COLUMN IF NOT EXISTS origin VARCHAR DEFAULT 'manual'",
+            """CREATE TABLE IF NOT EXISTS liquidation_closes (
+                period_end        TIMESTAMP PRIMARY KEY,
+                status            VARCHAR NOT NULL DEFAULT 'running',
+                scheduled_date    TIMESTAMP,
+                started_at        TIMESTAMP DEFAULT NOW(),
+                finished_at       TIMESTAMP,
+                tenants           INTEGER DEFAULT 0,
+                web_liquidations  INTEGER DEFAULT 0,
+                pos_liquidations  INTEGER DEFAULT 0,
+                web_net           DOUBLE PRECISION DEFAULT 0.0,
+                pos_commission    DOUBLE PRECISION DEFAULT 0.0,
+                elapsed_ms        DOUBLE PRECISION
+            )""",
             # analítica del storefront (tráfico / audiencia) — ver alembic 0011
             """CREATE TABLE IF NOT EXISTS analytics_visitors (
                 tenant_id     UUID NOT NULL,
@@ -137,12 +210,13 @@ def _sync_postgres_schema() -> None:
                 path        VARCHAR,
                 created_at  TIMESTAMP DEFAULT NOW()
             )""",
-            "CREATE INDEX IF NOT EXISTS ix_analytics_sessions_tenant_id ON analytics_sessions (tenant_id)",
+            "CREATE INDEX IF NOT EXISTS ix_analytics_sessions_tenant_id_started_at ON analytics_sessions (tenant_id, started_at)",
             "CREATE INDEX IF NOT EXISTS ix_analytics_sessions_visitor_id ON analytics_sessions (visitor_id)",
             "CREATE INDEX IF NOT EXISTS ix_analytics_sessions_started_at ON analytics_sessions (started_at)",
-            "CREATE INDEX IF NOT EXISTS ix_analytics_pageviews_tenant_id ON analytics_pageviews (tenant_id)",
+            "CREATE INDEX IF NOT EXISTS ix_analytics_pageviews_tenant_id_created_at ON analytics_pageviews (tenant_id, created_at)",
             "CREATE INDEX IF NOT EXISTS ix_analytics_pageviews_session_id ON analytics_pageviews (session_id)",
             "CREATE INDEX IF NOT EXISTS ix_analytics_pageviews_created_at ON analytics_pageviews (created_at)",
+            # (tenant_id, created_at): el particionado mensual lo hace alembic 0015
             # búsquedas en el storefront — ver alembic 0012
             """CREATE TABLE IF NOT EXISTS analytics_searches (
                 id             UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -152,17 +226,114 @@ def _sync_postgres_schema() -> None:
                 results_count  INTEGER DEFAULT 0,
                 created_at     TIMESTAMP DEFAULT NOW()
             )""",
-            "CREATE INDEX IF NOT EXISTS ix_analytics_searches_tenant_id ON analytics_searches (tenant_id)",
+            "CREATE INDEX IF NOT EXISTS ix_analytics_searches_tenant_id_created_at ON analytics_searches (tenant_id, created_at)",
             "CREATE INDEX IF NOT EXISTS ix_analytics_searches_created_at ON analytics_searches (created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_analytics_searches_session_id ON analytics_searches (session_id)",
+            # rollups diarios de analítica — ver alembic 0014 y analytics_rollup.py
+            """CREATE TABLE IF NOT EXISTS analytics_daily_rollups (
+                tenant_id          UUID NOT NULL,
+                day                DATE NOT NULL,
+                sessions           INTEGER DEFAULT 0,
+                new_sessions       INTEGER DEFAULT 0,
+                bounced            INTEGER DEFAULT 0,
+                duration_sum       INTEGER DEFAULT 0,
+                duration_count     INTEGER DEFAULT 0,
+                session_pageviews  INTEGER DEFAULT 0,
+                pageviews          INTEGER DEFAULT 0,
+                updated_at         TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (tenant_id, day)
+            )""",
+            """CREATE TABLE IF NOT EXISTS analytics_daily_breakdowns (
+                tenant_id      UUID NOT NULL,
+                day            DATE NOT NULL,
+                dimension      VARCHAR(10) NOT NULL,
+                key            VARCHAR NOT NULL,
+                count          INTEGER DEFAULT 0,
+                first_seen_at  TIMESTAMP,
+                PRIMARY KEY (tenant_id, day, dimension, key)
+            )""",
+            """CREATE TABLE IF NOT EXISTS analytics_daily_visitors (
+                tenant_id   UUID NOT NULL,
+                day         DATE NOT NULL,
+                visitor_id  UUID NOT NULL,
+                PRIMARY KEY (tenant_id, day, visitor_id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+                tenant_id       UUID PRIMARY KEY,
+                rolled_through  DATE NOT NULL,
+                updated_at      TIMESTAMP DEFAULT NOW()
+            )""",
             # índices en FKs usadas por el selectinload de pedidos — ver alembic 0013
             "CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)",
             "CREATE INDEX IF NOT EXISTS ix_order_items_product_variant_id ON order_items (product_variant_id)",
             "CREATE INDEX IF NOT EXISTS ix_orders_customer_id ON orders (customer_id)",
             "CREATE INDEX IF NOT EXISTS ix_product_variants_product_id ON product_variants (product_id)",
+            # outbox de efectos secundarios de pedidos — ver alembic 0017 y order_outbox.py
+            """CREATE TABLE IF NOT EXISTS order_outbox (
+                id            BIGSERIAL PRIMARY KEY,
+                order_id      UUID,
+                tenant_id     UUID,
+                event         VARCHAR(40) DEFAULT 'order_created',
+                payload       JSON,
+                status        VARCHAR(20) DEFAULT 'pending',
+                attempts      INTEGER DEFAULT 0,
+                error         VARCHAR,
+                created_at    TIMESTAMP DEFAULT NOW(),
+                processed_at  TIMESTAMP
+            )""",
+            "CREATE INDEX IF NOT EXISTS ix_order_outbox_order_id ON order_outbox (order_id)",
+            "CREATE INDEX IF NOT EXISTS ix_order_outbox_pending ON order_outbox (id) WHERE status = 'pending'",
+            "ALTER TABLE order_outbox ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP DEFAULT NOW()",
+            # reservas de stock para pagos pendientes — ver alembic 0018 y stock_reservations.py
+            "ALTER TABLE product_variants ADD COLUMN IF NOT EXISTS reserved_stock INTEGER DEFAULT 0",
+            """CREATE TABLE IF NOT EXISTS stock_reservations (
+                id                  UUID PRIMARY KEY,
+                payment_id          UUID REFERENCES payments(id),
+                tenant_id           UUID,
+                product_variant_id  UUID REFERENCES product_variants(id),
+                quantity            INTEGER NOT NULL,
+                status              VARCHAR(20) DEFAULT 'active',
+                expires_at          TIMESTAMP NOT NULL,
+                created_at          TIMESTAMP DEFAULT NOW(),
+                closed_at           TIMESTAMP
+            )""",
+            "CREATE INDEX IF NOT EXISTS ix_stock_reservations_payment_id ON stock_reservations (payment_id)",
+            "CREATE INDEX IF NOT EXISTS ix_stock_reservations_active_expires ON stock_reservations (expires_at) WHERE status = 'active'",
+            # inbox de webhooks de pasarela — ver alembic 0019 y webhook_inbox.py
+            """CREATE TABLE IF NOT EXISTS webhook_inbox (
+                id               BIGSERIAL PRIMARY KEY,
+                provider         VARCHAR(20) NOT NULL,
+                transaction_id   VARCHAR(255) NOT NULL,
+                tx_status        VARCHAR(40) NOT NULL,
+                reference        VARCHAR(255),
+                payload          JSON,
+                status           VARCHAR(20) DEFAULT 'pending',
+                attempts         INTEGER DEFAULT 0,
+                next_attempt_at  TIMESTAMP DEFAULT NOW(),
+                locked_until     TIMESTAMP,
+                last_error       VARCHAR,
+                received_at      TIMESTAMP DEFAULT NOW(),
+                processed_at     TIMESTAMP
+            )""",
+            "CREATE UNIQUE INDEX IF NOT EXISTS ux_webhook_inbox_event ON webhook_inbox (provider, transaction_id, tx_status)",
+            "CREATE INDEX IF NOT EXISTS ix_webhook_inbox_reference ON webhook_inbox (reference)",
+            "CREATE INDEX IF NOT EXISTS ix_webhook_inbox_open ON webhook_inbox (id) WHERE status IN ('pending', 'processing')",
+            # búsqueda de usuario por LOWER(email) en login y auth — ver alembic 0016
+            "CREATE INDEX IF NOT EXISTS ix_users_email_lower ON users (LOWER(email))",
         ]
         with engine.begin() as conn:
+            ledger_missing = conn.execute(_text("SELECT to_regclass('tenant_ledgers') IS NULL")).scalar()
             for stmt in stmts:
                 conn.execute(_text(stmt))
+        if ledger_missing:
+            # Tabla recién creada sin alembic: se llena desde la historia
+            import tenant_ledger
+            from database import SessionLocal
+            db = SessionLocal()
+            try:
+                tenant_ledger.reconcile(db, fix=True)
+            finally:
+                db.close()
         # Garantizar que la cuenta raíz de Bayup siempre sea super admin,
         # por si el registro inicial vía Google OAuth la creó sin ese rol.
         BAYUP_ROOT_EMAILS = ["bayupcol@gmail.com", "admin@bayup.com"]
@@ -194,9 +365,49 @@ async def lifespan(app: FastAPI):
     else:
         # PostgreSQL: garantiza columnas faltantes al arranque independientemente de Alembic
         threading.Thread(target=_sync_postgres_schema, daemon=True).start()
-    # Arranca el worker de emails persistente (procesa email_jobs cada 5s)
-    _eq.start_worker()
+    # Los endpoints son `def` (SQLAlchemy síncrono): FastAPI los ejecuta en el
+    # threadpool de anyio. Se limita al tamaño del pool de la DB para que una
+    # consulta lenta nunca bloquee el event loop ni sature las conexiones.
+    from anyio import to_thread
+    from database import threadpool_size
+    to_thread.current_default_thread_limiter().total_tokens = threadpool_size()
+    # SDK de tiendas: minificado + precomprimido una vez por proceso
+    import static_assets
+    static_assets.warm()
+    # Invalidaciones de caché entre workers (no-op sin REDIS_URL)
+    import cache as _cache
+    _cache.start_invalidation_listener()
+    # Worker de emails persistente (LISTEN/NOTIFY + envío concurrente). Con
+    # EMAIL_WORKER_MODE=external lo corre `python email_worker.py` aparte.
+    if _eq.WORKER_MODE != "external":
+        _eq.start_worker()
+    else:
+        import blob_store
+        blob_store.require_shared_storage()
+    # Efectos secundarios de pedidos (outbox): CRM, envío, notificación, emails
+    import order_outbox
+    order_outbox.start_dispatcher()
+    # Reservas de stock vencidas de pagos que nunca se confirmaron
+    import stock_reservations
+    stock_reservations.start_sweeper()
+    # Webhooks de pasarela: el endpoint sólo encola, estos workers aplican
+    import webhook_inbox
+    webhook_inbox.start_workers()
+    # Analítica del storefront: buffer en memoria volcado en lote
+    import analytics_ingest
+    analytics_ingest.start_flusher()
+    # Cierre diario de analítica en tablas de rollup
+    import analytics_rollup
+    analytics_rollup.start_job()
+    # Snapshots de KPIs de plataforma para /super-admin/stats
+    import platform_kpis
+    platform_kpis.start_refresher()
+    # Cierre de periodo de liquidaciones (sólo con LIQUIDATION_CLOSE_AUTO=1)
+    import liquidation_close
+    liquidation_close.start_job()
     yield
+    # Al apagar se vuelca lo que quede en el buffer
+    analytics_ingest.flush_now()
 
 app = FastAPI(title="Bayup OS Platinum", lifespan=lifespan)
 
@@ -261,6 +472,9 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
     return resp
 
 # --- HEADERS DE SEGURIDAD HTTP ---
+from security import content_security_policy as _content_security_policy
+_DEFAULT_CSP = _content_security_policy()
+
 @app.middleware("http")
 async def security_headers_middleware(request: Request, call_next):
     response = await call_next(request)
@@ -269,12 +483,7 @@ async def security_headers_middleware(request: Request, call_next):
     response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
     response.headers["Strict-Transport-Security"] = "max-age=63072000; includeSubDomains"
     # ALTA-003: Content-Security-Policy para mitigar XSS e inyección de contenido
-    response.headers.setdefault(
-        "Content-Security-Policy",
-        "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
-        "style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; "
-        "connect-src 'self' https:; frame-ancestors 'none';"
-    )
+    response.headers.setdefault("Content-Security-Policy", _DEFAULT_CSP)
     return response
 
 @app.get("/")
@@ -314,6 +523,7 @@ from routers import public as _r_public
 from routers import payments as _r_payments
 from routers import liquidations as _r_liq
 from routers import analytics as _r_analytics
+from routers import assets as _r_assets
 app.include_router(_r_notif.router)
 app.include_router(_r_col.router)
 app.include_router(_r_ship.router)
@@ -333,6 +543,7 @@ app.include_router(_r_public.router)
 app.include_router(_r_payments.router)
 app.include_router(_r_liq.router)
 app.include_router(_r_analytics.router)
+app.include_router(_r_assets.router)
 
 # Compatibilidad: el frontend llama a /onboarding/complete (sin prefijo /admin)
 from fastapi import Depends as _Depends
@@ -341,7 +552,7 @@ from database import get_db as _get_db
 from deps import current_user as _current_user
 
 @app.post("/onboarding/complete")
-async def complete_onboarding(request: Request, payload: _r_admin.OnboardingCompleteRequest | None = None, db: _Session = _Depends(_get_db), user=_Depends(_current_user)):
+def complete_onboarding(request: Request, payload: _r_admin.OnboardingCompleteRequest | None = None, db: _Session = _Depends(_get_db), user=_Depends(_current_user)):
     target = _r_admin._resolve_target(db, user, payload.target_user_id if payload else None)
     target.onboarding_completed = True
     db.commit()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Boolean, ForeignKey, DateTime, JSON, Integer
+from sqlalchemy import Column, String, Float, Boolean, ForeignKey, DateTime, Date, JSON, Integer, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.types import TypeDecorator, CHAR
 from sqlalchemy.dialects.postgresql import UUID
@@ -77,7 +77,10 @@ class User(Base):
     privacy_policy = Column(String, nullable=True)
     return_policy = Column(String, nullable=True)
     shipping_policy = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Digest de avisos de venta: 0/None = un email por venta; N = un resumen
+    # cada N minutos (email_queue.DIGEST_FUNC)
+    sale_digest_minutes = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     bank_accounts = Column(JSON, default=[])
     social_links = Column(JSON, default={})
     whatsapp_lines = Column(JSON, default=[])
@@ -112,6 +115,10 @@ class User(Base):
     products = relationship("Product", back_populates="owner")
     orders = relationship("Order", back_populates="customer", foreign_keys="[Order.customer_id]")
 
+
+# crud.get_user_by_email filtra por LOWER(email): el índice único de email no sirve ahí
+Index("ix_users_email_lower", func.lower(User.email))
+
 class Product(Base):
     __tablename__ = "products"
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
@@ -143,10 +150,15 @@ class ProductVariant(Base):
     sku = Column(String, index=True)
     price = Column(Float, default=0.0) # Sincronizado con schemas
     stock = Column(Integer, default=0)
+    reserved_stock = Column(Integer, default=0)  # unidades apartadas por pagos pendientes — ver stock_reservations.py
     image_url = Column(String)
     attributes = Column(JSON)
     product = relationship("Product", back_populates="variants")
 
+    @property
+    def available_stock(self) -> int:
+        return max(0, (self.stock or 0) - (self.reserved_stock or 0))
+
 class Order(Base):
     __tablename__ = "orders"
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
@@ -196,6 +208,22 @@ class OrderItem(Base):
             return f"{base} — {variant.name}"
         return base
 
+class OrderOutbox(Base):
+    """Efectos secundarios pendientes de un pedido (CRM, envío, notificación,
+    emails), escritos en el mismo commit que el pedido — ver order_outbox.py."""
+    __tablename__ = "order_outbox"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    order_id = Column(GUID(), index=True)
+    tenant_id = Column(GUID(), nullable=True)
+    event = Column(String(40), default="order_created")
+    payload = Column(JSON, default=dict)
+    status = Column(String(20), default="pending")  # pending | done | failed | skipped
+    attempts = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow)  # backoff tras un fallo
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+
 class ProductType(Base):
     __tablename__ = "product_types"
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
@@ -224,6 +252,7 @@ class Liquidation(Base):
     net_amount      = Column(Float, default=0.0)   # Lo que recibe el cliente
     order_count     = Column(Integer, default=0)   # Órdenes incluidas
     liq_type        = Column(String, default="web")  # 'web' | 'pos_commission'
+    origin          = Column(String, default="manual")  # 'manual' (super admin) | 'close' (liquidation_close)
     # Período cubierto
     period_start    = Column(DateTime, nullable=True)
     period_end      = Column(DateTime, nullable=True)
@@ -442,8 +471,9 @@ class AnalyticsSession(Base):
     """Una sesión de navegación (sessionStorage — dura mientras la pestaña
     esté abierta). id = session_id generado por el cliente."""
     __tablename__ = "analytics_sessions"
+    __table_args__ = (Index("ix_analytics_sessions_tenant_id_started_at", "tenant_id", "started_at"),)
     id = Column(GUID(), primary_key=True)
-    tenant_id = Column(GUID(), ForeignKey("users.id"), index=True)
+    tenant_id = Column(GUID(), ForeignKey("users.id"))
     visitor_id = Column(GUID(), index=True)
     is_new_visitor = Column(Boolean, default=True)
     source = Column(String, default="direct")          # direct | search | social | whatsapp | referral
@@ -457,25 +487,139 @@ class AnalyticsSession(Base):
 
 
 class AnalyticsPageview(Base):
-    """Cada vista de página dentro de una sesión — base para 'páginas más vistas'."""
+    """Cada vista de página dentro de una sesión — base para 'páginas más vistas'.
+    En PostgreSQL la tabla está particionada por mes (alembic 0015)."""
     __tablename__ = "analytics_pageviews"
+    __table_args__ = (Index("ix_analytics_pageviews_tenant_id_created_at", "tenant_id", "created_at"),)
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
-    tenant_id = Column(GUID(), ForeignKey("users.id"), index=True)
+    tenant_id = Column(GUID(), ForeignKey("users.id"))
     session_id = Column(GUID(), ForeignKey("analytics_sessions.id"), index=True)
     path = Column(String)
     created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
 
 
 class AnalyticsSearch(Base):
-    """Un término buscado en el buscador del storefront — base para 'top búsquedas'."""
+    """Un término buscado en el buscador del storefront — base para 'top búsquedas'.
+    En PostgreSQL la tabla está particionada por mes (alembic 0015)."""
     __tablename__ = "analytics_searches"
+    __table_args__ = (Index("ix_analytics_searches_tenant_id_created_at", "tenant_id", "created_at"),)
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
-    tenant_id = Column(GUID(), ForeignKey("users.id"), index=True)
-    session_id = Column(GUID(), ForeignKey("analytics_sessions.id"), nullable=True)
+    tenant_id = Column(GUID(), ForeignKey("users.id"))
+    session_id = Column(GUID(), ForeignKey("analytics_sessions.id"), nullable=True, index=True)
     term = Column(String)
     results_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
 
+
+class AnalyticsDailyRollup(Base):
+    """Totales de un día cerrado por tenant (ver analytics_rollup). Se guardan
+    sumas, no promedios, para poder combinar varios días sin perder exactitud."""
+    __tablename__ = "analytics_daily_rollups"
+    tenant_id = Column(GUID(), ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    sessions = Column(Integer, default=0)
+    new_sessions = Column(Integer, default=0)
+    bounced = Column(Integer, default=0)
+    duration_sum = Column(Integer, default=0)
+    duration_count = Column(Integer, default=0)
+    session_pageviews = Column(Integer, default=0)  # suma de pageview_count de las sesiones del día
+    pageviews = Column(Integer, default=0)          # pageviews con created_at en el día
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+class AnalyticsDailyBreakdown(Base):
+    """Conteos por dimensión de un día cerrado: source, device, path, search."""
+    __tablename__ = "analytics_daily_breakdowns"
+    tenant_id = Column(GUID(), ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    dimension = Column(String(10), primary_key=True)
+    key = Column(String, primary_key=True)
+    count = Column(Integer, default=0)
+    first_seen_at = Column(DateTime, nullable=True)  # desempate estable del top-10
+
+
+class AnalyticsDailyVisitor(Base):
+    """visitor_id distintos por día — COUNT(DISTINCT) sobre varios días sin
+    tocar la tabla de sesiones."""
+    __tablename__ = "analytics_daily_visitors"
+    tenant_id = Column(GUID(), ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    visitor_id = Column(GUID(), primary_key=True)
+
+
+class AnalyticsRollupState(Base):
+    """Último día cerrado y agregado por tenant."""
+    __tablename__ = "analytics_rollup_state"
+    tenant_id = Column(GUID(), ForeignKey("users.id"), primary_key=True)
+    rolled_through = Column(Date, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+class TenantDailyRevenue(Base):
+    """Ventas, comisión y pedidos por tenant y día (UTC de orders.created_at).
+    La mantiene tenant_revenue en cada flush que toca pedidos."""
+    __tablename__ = "tenant_daily_revenue"
+    tenant_id = Column(GUID(), ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+    revenue = Column(Float, default=0.0)
+    commission = Column(Float, default=0.0)
+    orders = Column(Integer, default=0)
+
+
+class TenantLedger(Base):
+    """Saldo corriente de liquidaciones de un tenant: pendiente web y POS desde
+    el último pago de cada tipo y totales pagados. Lo mantiene tenant_ledger."""
+    __tablename__ = "tenant_ledgers"
+    tenant_id = Column(GUID(), ForeignKey("users.id"), primary_key=True)
+    web_cutoff = Column(DateTime, nullable=True)  # hasta dónde cubren las liquidaciones web pagadas
+    web_gross = Column(Float, default=0.0)
+    web_count = Column(Integer, default=0)
+    pos_cutoff = Column(DateTime, nullable=True)  # ídem para los cobros POS
+    pos_gross = Column(Float, default=0.0)
+    pos_count = Column(Integer, default=0)
+    paid_net = Column(Float, default=0.0)
+    paid_gross = Column(Float, default=0.0)
+    paid_bayup = Column(Float, default=0.0)
+    paid_count = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class LiquidationClose(Base):
+    """Cierre de periodo de liquidaciones de todos los tenants (ver
+    liquidation_close). status: running | done."""
+    __tablename__ = "liquidation_closes"
+    period_end = Column(DateTime, primary_key=True)
+    status = Column(String, nullable=False, default="running")
+    scheduled_date = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    tenants = Column(Integer, default=0)
+    web_liquidations = Column(Integer, default=0)
+    pos_liquidations = Column(Integer, default=0)
+    web_net = Column(Float, default=0.0)
+    pos_commission = Column(Float, default=0.0)
+    elapsed_ms = Column(Float, nullable=True)
+
+
+class PlatformKpiSnapshot(Base):
+    """Totales de plataforma hasta `watermark` (ver platform_kpis). Los del día
+    y el mes valen para day_start / month_start, los del watermark."""
+    __tablename__ = "platform_kpi_snapshots"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    taken_at = Column(DateTime, nullable=False)
+    watermark = Column(DateTime, nullable=False)
+    day_start = Column(DateTime, nullable=False)
+    month_start = Column(DateTime, nullable=False)
+    total_orders = Column(Integer, default=0)
+    total_users = Column(Integer, default=0)
+    total_revenue = Column(Float, default=0.0)
+    total_commission = Column(Float, default=0.0)
+    revenue_day = Column(Float, default=0.0)
+    commission_day = Column(Float, default=0.0)
+    revenue_month = Column(Float, default=0.0)
+    commission_month = Column(Float, default=0.0)
+    refresh_ms = Column(Float, nullable=True)
+
 class WebTemplate(Base):
     __tablename__ = "web_templates"
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
@@ -546,6 +690,39 @@ class StoreMessage(Base):
 # "stripe"). Queda null hasta que se configure uno. El campo
 # `gateway_response` guarda la respuesta raw para auditoría.
 # ---------------------------------------------------------------------------
+class StockReservation(Base):
+    """Unidades de una variante apartadas por un pago pendiente de la pasarela."""
+    __tablename__ = "stock_reservations"
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    payment_id = Column(GUID(), ForeignKey("payments.id"), index=True)
+    tenant_id = Column(GUID(), nullable=True)
+    product_variant_id = Column(GUID(), ForeignKey("product_variants.id"))
+    quantity = Column(Integer, nullable=False)
+    status = Column(String(20), default="active")  # active | converted | released
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    closed_at = Column(DateTime, nullable=True)
+
+class WebhookInbox(Base):
+    """Eventos de pasarela verificados, pendientes de aplicar — ver webhook_inbox.py."""
+    __tablename__ = "webhook_inbox"
+    __table_args__ = (
+        Index("ux_webhook_inbox_event", "provider", "transaction_id", "tx_status", unique=True),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    provider = Column(String(20), nullable=False)
+    transaction_id = Column(String(255), nullable=False)
+    tx_status = Column(String(40), nullable=False)
+    reference = Column(String(255), index=True)  # agrupa los eventos de un mismo pago
+    payload = Column(JSON)
+    status = Column(String(20), default="pending")  # pending | processing | done | dead
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    received_at = Column(DateTime, default=datetime.datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+
 class Payment(Base):
     __tablename__ = "payments"
 
@@ -610,3 +787,9 @@ class RoadmapItem(Base):
     is_active    = Column(Boolean, default=True)
     created_at   = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at   = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+# Mantenimiento de tenant_ledger / tenant_revenue en los flush de la Session:
+# se registra al importar los modelos para que cualquier proceso que escriba
+# Orders o liquidaciones (API, scripts, workers) mantenga las dos tablas.
+import tenant_ledger, tenant_revenue  # noqa: E402,F401
@@ -0,0 +1,367 @@
+"""
+Outbox transaccional de efectos secundarios de pedidos.
+
+crud.create_order hacía, dentro de la misma transacción que tiene bloqueadas
+las variantes (SELECT ... FOR UPDATE), el upsert del cliente en el CRM, y los
+llamadores además creaban el envío, la notificación y 2-3 emails, cada uno
+con su propio commit. Ahora el pedido sólo escribe una fila en order_outbox
+en su mismo commit, y un dispatcher en segundo plano procesa los eventos en
+lote:
+  - upsert del cliente en el CRM (una consulta para todos los emails del lote)
+  - envío "pending_packing" para pedidos web
+  - notificación al tenant
+  - emails (confirmación, factura web, aviso de venta al dueño; si el tenant
+    activó sale_digest_minutes, el aviso se retiene para el digest)
+
+El evento se escribe en la misma transacción que el pedido: si el pedido
+existe, su evento también. Un lote se confirma de una vez: efectos, marca de
+procesado y los emails de todo el lote (un solo INSERT en email_jobs, en la
+misma transacción). Un evento que falla (o todo el lote, si falla el commit)
+cuenta el intento y espera un backoff exponencial (next_attempt_at) antes de
+volver a reclamarse; a los MAX_ATTEMPTS queda 'failed'.
+
+Sin el dispatcher corriendo (tests, scripts) los eventos se procesan en
+línea con la sesión del pedido, justo después de su commit.
+"""
+import datetime as _dt
+import logging
+import os
+import threading
+import uuid as _uuid
+
+from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+
+import models
+
+logger = logging.getLogger("bayup.order_outbox")
+
+POLL_INTERVAL_MS = int(os.getenv("ORDER_OUTBOX_POLL_MS", "500"))
+BATCH_SIZE = int(os.getenv("ORDER_OUTBOX_BATCH", "100"))
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_S = 5
+BACKOFF_MAX_S = 3600
+
+FLOW_ADMIN = "admin"  # POS / panel del tenant (routers/orders.py)
+FLOW_WEB = "web"      # storefront y webhook de pasarela (public.finalize_web_order)
+
+_wakeup = threading.Event()
+
+
+# ── Escritura (dentro de la transacción del pedido) ───────────────────────
+
+def add_order_created(db, order, flow: str) -> models.OrderOutbox:
+    """Agrega el evento del pedido a la sesión. No hace commit."""
+    event = models.OrderOutbox(
+        order_id=order.id, tenant_id=order.tenant_id,
+        event="order_created", payload={"flow": flow},
+    )
+    db.add(event)
+    return event
+
+
+def after_commit(db, event) -> None:
+    """Tras el commit del pedido: despierta al dispatcher, o procesa el
+    evento en línea si no está corriendo."""
+    if _dispatcher_started:
+        _wakeup.set()
+        return
+    try:
+        dispatch(db, [event])
+    except Exception as e:
+        db.rollback()
+        logger.warning("order_outbox: proceso en línea falló: %s", e)
+
+
+# ── Proceso en lote ───────────────────────────────────────────────────────
+
+def _items_info(order, variants: dict, products: dict) -> list:
+    import crud
+    result = []
+    for item in order.items:
+        variant = variants.get(item.product_variant_id)
+        product = products.get(variant.product_id) if variant else None
+        result.append({
+            "name": crud.item_display_name(variant, product),
+            "qty": item.quantity, "price": float(item.price_at_purchase),
+        })
+    return result
+
+
+def _upsert_customer(db, order, clients: dict, taken: set):
+    """Inteligencia de Datos Plan Básico: acumula compras por email de cliente.
+
+    Devuelve el cliente nuevo (o None). No toca `clients`/`taken`: el
+    llamador los actualiza cuando el savepoint confirmó el insert."""
+    email_clean = order.customer_email.lower().strip()
+    subtotal = order.total_price or 0
+    client_record = clients.get((order.tenant_id, email_clean))
+    if client_record:
+        client_record.total_spent = (client_record.total_spent or 0) + subtotal
+        client_record.loyalty_points = (client_record.loyalty_points or 0) + int(subtotal / 1000)
+        client_record.last_purchase_date = order.created_at
+        client_record.last_purchase_summary = f"Venta {order.source} #{str(order.id)[:4].upper()}"
+        return None
+    # El email es único a nivel de tabla (cuentas de tenants, staff y
+    # super admin comparten el mismo espacio de emails). Si ya pertenece a
+    # OTRA cuenta fuera de esta tienda, no creamos un "cliente" duplicado.
+    if email_clean in taken:
+        return None
+    new_client = models.User(
+        id=_uuid.uuid4(),
+        email=email_clean,
+        full_name=order.customer_name or "Cliente Nuevo",
+        phone=order.customer_phone,
+        owner_id=order.tenant_id,
+        total_spent=subtotal,
+        loyalty_points=int(subtotal / 1000),
+        last_purchase_date=order.created_at,
+        last_purchase_summary=f"Primer registro vía {order.source}",
+        role="cliente",
+        status="Activo",
+    )
+    db.add(new_client)
+    return new_client
+
+
+def _emails_for(order, flow: str, tenant, items: list) -> list:
+    import email_queue as _eq
+    shop_name = (tenant.full_name or tenant.shop_slug or "Tu tienda") if tenant else "Tu tienda"
+    shop_logo = tenant.logo_url if tenant else None
+    oid = str(order.id)
+    total = float(order.total_price or 0)
+    jobs = []
+    if flow == FLOW_WEB:
+        payment_method = order.payment_method or "Online"
+        if order.customer_email:
+            jobs.append(("send_order_confirmation", dict(
+                email=order.customer_email, name=order.customer_name or "Cliente",
+                order_id=oid, items=items, total=total, payment_method=payment_method,
+                customer_city=order.customer_city or "", customer_phone=order.customer_phone or "",
+                shop_name=shop_name, shop_logo=shop_logo,
+            )))
+            jobs.append(("send_web_order_invoice", dict(
+                email=order.customer_email, name=order.customer_name or "Cliente",
+                order_id=oid, shop_name=shop_name,
+                shop_email=(tenant.email or "") if tenant else "",
+                shop_phone=(tenant.phone or "") if tenant else "",
+                customer_phone=order.customer_phone or "", customer_city=order.customer_city or "",
+                items=items, total=total, payment_method=payment_method,
+                created_at_iso=order.created_at.isoformat() if order.created_at else None,
+                shop_logo=shop_logo,
+            )))
+    else:
+        payment_method = order.payment_method or "Efectivo"
+        if order.customer_email:
+            jobs.append(("send_order_confirmation", dict(
+                email=order.customer_email, name=order.customer_name or "Cliente",
+                order_id=oid, items=items, total=total, payment_method=payment_method,
+                customer_city=order.customer_city or "", customer_phone=order.customer_phone or "",
+                shop_name=shop_name, source=order.source or "pos", shop_logo=shop_logo,
+            )))
+    if tenant and tenant.email:
+        notification = dict(
+            owner_email=tenant.email, shop_name=shop_name, order_id=oid,
+            customer_name=order.customer_name or "Cliente",
+            customer_email=order.customer_email or "", customer_phone=order.customer_phone or "",
+            customer_city=order.customer_city or "", items=items, total=total,
+            payment_method=payment_method,
+        )
+        if tenant.sale_digest_minutes:
+            notification["run_at"] = _eq.digest_window_end(tenant.sale_digest_minutes)
+            jobs.append((_eq.DIGEST_FUNC, notification))
+        else:
+            jobs.append(("send_new_sale_notification", notification))
+    return jobs
+
+
+def _backoff(attempts: int) -> _dt.timedelta:
+    return _dt.timedelta(seconds=min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (attempts - 1)))
+
+
+def _fail(event, error, now: _dt.datetime) -> None:
+    event.error = str(error)[:500]
+    event.status = "failed" if event.attempts >= MAX_ATTEMPTS else "pending"
+    event.next_attempt_at = now + _backoff(event.attempts)
+
+
+def _notification_for(order, flow: str) -> models.Notification:
+    total_fmt = f"${order.total_price or 0:,.0f}".replace(",", ".")
+    if flow == FLOW_WEB:
+        title, message = "🛒 Nueva venta en tienda", f"{order.customer_name or 'Cliente'} compró por {total_fmt}"
+    else:
+        title, message = "💰 Nuevo pedido creado", f"Pedido #{str(order.id)[:8].upper()} por {total_fmt}"
+    return models.Notification(tenant_id=order.tenant_id, title=title, message=message, type="success")
+
+
+def dispatch(db, events: list) -> int:
+    """Procesa un lote de eventos ya reclamados. Un commit para todo el lote,
+    emails incluidos. Devuelve la cantidad procesada."""
+    import crud
+    import email_queue as _eq
+    if not events:
+        return 0
+    order_ids = [e.order_id for e in events]
+    orders = {
+        o.id: o for o in db.query(models.Order).options(
+            selectinload(models.Order.items)
+        ).filter(models.Order.id.in_(order_ids))
+    }
+    variants, products = crud.load_variant_rows(
+        db, [item.product_variant_id for o in orders.values() for item in o.items],
+    )
+    tenant_ids = {e.tenant_id for e in events if e.tenant_id}
+    tenants = {
+        t.id: t for t in db.query(models.User).filter(models.User.id.in_(tenant_ids))
+    } if tenant_ids else {}
+
+    emails = {o.customer_email.lower().strip() for o in orders.values() if o.customer_email}
+    clients, taken = {}, set()
+    if emails:
+        for u in db.query(models.User).filter(models.User.email.in_(emails)):
+            taken.add(u.email)
+            if u.owner_id is not None:
+                clients[(u.owner_id, u.email)] = u
+    web_orders = [oid for oid, o in orders.items() if (o.source or "").lower() != "pos"]
+    shipped = {
+        r[0] for r in db.query(models.Shipment.order_id).filter(models.Shipment.order_id.in_(web_orders))
+    } if web_orders else set()
+
+    now = _dt.datetime.utcnow()
+    email_jobs = []
+    for event in events:
+        order = orders.get(event.order_id)
+        event.attempts = (event.attempts or 0) + 1
+        event.processed_at = now
+        if order is None:
+            event.status = "skipped"
+            continue
+        flow = (event.payload or {}).get("flow", FLOW_ADMIN)
+        # Los mapas compartidos del lote y los emails sólo se actualizan si
+        # el savepoint confirmó: un evento que falla no deja rastro en ellos.
+        new_client, ships = None, False
+        try:
+            with db.begin_nested():
+                if order.customer_email:
+                    new_client = _upsert_customer(db, order, clients, taken)
+                # Lógica de Envío (Sinergia de Módulos)
+                ships = order.id in web_orders and order.id not in shipped
+                if ships:
+                    db.add(models.Shipment(
+                        id=_uuid.uuid4(),
+                        order_id=order.id,
+                        tenant_id=order.tenant_id,
+                        recipient_name=order.customer_name or "Cliente",
+                        recipient_phone=order.customer_phone or "",
+                        destination_address="Por coordinar (Venta Web)",
+                        status="pending_packing",
+                        history=[],
+                    ))
+                db.add(_notification_for(order, flow))
+                jobs = _emails_for(order, flow, tenants.get(order.tenant_id), _items_info(order, variants, products))
+        except Exception as e:
+            logger.warning("order_outbox: evento %s falló: %s", event.id, e)
+            _fail(event, e, now)
+            continue
+        if new_client is not None:
+            clients[(new_client.owner_id, new_client.email)] = new_client
+            taken.add(new_client.email)
+        if ships:
+            shipped.add(order.id)
+        email_jobs.extend(jobs)
+        event.status = "done"
+        event.error = None
+    try:
+        _eq.enqueue_many(email_jobs, db=db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        _fail_batch(db, events, e)
+        raise
+    return len(events)
+
+
+def _fail_batch(db, events: list, error) -> None:
+    """El lote entero se revirtió (emails o commit): cuenta el intento de cada
+    evento en otra transacción, para que no se reintente sin límite."""
+    now = _dt.datetime.utcnow()
+    try:
+        for event in events:  # expirados por el rollback: se releen
+            if event.status != "pending":
+                continue
+            event.attempts = (event.attempts or 0) + 1
+            event.processed_at = now
+            _fail(event, error, now)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning("order_outbox: no se pudo registrar el fallo del lote: %s", e)
+
+
+def _claim(db, limit: int) -> list:
+    """Reclama eventos pendientes. En PostgreSQL FOR UPDATE SKIP LOCKED deja
+    que varios procesos despachen en paralelo sin tomar el mismo evento."""
+    O = models.OrderOutbox
+    q = db.query(O).filter(
+        O.status == "pending",
+        or_(O.next_attempt_at.is_(None), O.next_attempt_at <= _dt.datetime.utcnow()),
+    ).order_by(O.id).limit(limit)
+    if db.bind.dialect.name == "postgresql":
+        q = q.with_for_update(skip_locked=True)
+    return q.all()
+
+
+def dispatch_pending(db, limit: int = BATCH_SIZE) -> int:
+    return dispatch(db, _claim(db, limit))
+
+
+def stats(db) -> dict:
+    from sqlalchemy import func
+    rows = db.query(models.OrderOutbox.status, func.count()).group_by(models.OrderOutbox.status).all()
+    oldest = db.query(func.min(models.OrderOutbox.created_at)).filter(
+        models.OrderOutbox.status == "pending",
+    ).scalar()
+    return {
+        "by_status": {s: n for s, n in rows},
+        "oldest_pending_at": oldest.isoformat() if oldest else None,
+        "dispatcher_running": _dispatcher_started,
+    }
+
+
+# ── Dispatcher en segundo plano ───────────────────────────────────────────
+
+def _dispatcher_loop() -> None:
+    from database import SessionLocal
+    while True:
+        _wakeup.wait(POLL_INTERVAL_MS / 1000)
+        _wakeup.clear()
+        try:
+            while True:
+                db = SessionLocal()
+                try:
+                    n = dispatch_pending(db)
+                except Exception:
+                    db.rollback()
+                    raise
+                finally:
+                    db.close()
+                if n < BATCH_SIZE:
+                    break
+        except Exception as e:
+            logger.warning("order_outbox dispatcher error: %s", e)
+
+
+_dispatcher_started = False
+_dispatcher_lock = threading.Lock()
+
+
+def start_dispatcher() -> None:
+    """Arranca el dispatcher en background. Idempotente — solo corre uno."""
+    global _dispatcher_started
+    with _dispatcher_lock:
+        if _dispatcher_started:
+            return
+        _dispatcher_started = True
+    t = threading.Thread(target=_dispatcher_loop, daemon=True, name="order-outbox-dispatcher")
+    t.start()
+    logger.info("order_outbox: dispatcher iniciado")
@@ -0,0 +1,204 @@
+"""
+KPIs de plataforma del home del super admin (/super-admin/stats).
+
+get_stats hacía diez consultas por carga: count() de users y orders y seis
+SUM sobre orders con distintos filtros de created_at, todas recorriendo la
+tabla completa. Ahora:
+  - Un solo SELECT con agregados condicionales (SUM ... FILTER (WHERE ...) en
+    PostgreSQL, SUM(CASE ...) en SQLite) calcula todo en una pasada.
+  - Un job guarda cada PLATFORM_KPI_REFRESH_S un snapshot en
+    platform_kpi_snapshots con los totales hasta un `watermark`. El endpoint
+    lee el último snapshot y suma sólo el delta de pedidos y usuarios creados
+    desde el watermark (índices en orders.created_at y users.created_at).
+  - Empresas y empresas activas se cuentan en vivo: son pocas filas
+    (owner_id IS NULL, por ix_users_owner_id) y cambian de estado.
+
+El watermark va WATERMARK_LAG_S por detrás del reloj: un pedido cuyo
+created_at quedó antes del watermark pero que hizo commit después no se
+pierde, porque el snapshot se toma recién cuando esas transacciones cerraron.
+Los cambios a pedidos ya incluidos en el snapshot (edición o borrado) se ven
+en el siguiente refresco.
+
+Sin el job corriendo (tests, scripts) y sin snapshot, el endpoint calcula
+todo en vivo con la misma consulta única.
+"""
+import datetime as _dt
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import and_, case, func, or_, select, true
+
+import models
+
+logger = logging.getLogger("bayup.platform_kpis")
+
+REFRESH_INTERVAL_S = int(os.getenv("PLATFORM_KPI_REFRESH_S", "300"))
+WATERMARK_LAG_S = 60
+KEEP_SNAPSHOTS = 288  # un día de historial con el intervalo por defecto
+ACTIVE_STATUSES = ("Activo", "active")
+
+
+def _buckets(now: _dt.datetime) -> tuple[_dt.datetime, _dt.datetime]:
+    """Inicio del día y del mes (UTC) que contienen `now`."""
+    return _dt.datetime(now.year, now.month, now.day), _dt.datetime(now.year, now.month, 1)
+
+
+def _sum_if(col, cond, pg: bool):
+    agg = func.sum(col).filter(cond) if pg else func.sum(case((cond, col), else_=0))
+    return func.coalesce(agg, 0)
+
+
+def _count_if(cond, pg: bool):
+    return func.count().filter(cond) if pg else func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
+
+def aggregate(db, day_start, month_start, since=None, until=None) -> dict:
+    """Una consulta: agregados de pedidos y conteos de usuarios. `since`
+    limita a lo creado desde ese instante (delta); `until`, a lo creado antes
+    (snapshot, incluye filas sin created_at)."""
+    O, U = models.Order, models.User
+    pg = db.bind.dialect.name == "postgresql"
+    orders = select(
+        func.count().label("orders"),
+        func.coalesce(func.sum(O.total_price), 0).label("revenue"),
+        func.coalesce(func.sum(O.commission_amount), 0).label("commission"),
+        _sum_if(O.total_price, O.created_at >= day_start, pg).label("revenue_day"),
+        _sum_if(O.commission_amount, O.created_at >= day_start, pg).label("commission_day"),
+        _sum_if(O.total_price, O.created_at >= month_start, pg).label("revenue_month"),
+        _sum_if(O.commission_amount, O.created_at >= month_start, pg).label("commission_month"),
+    )
+    company = and_(U.owner_id.is_(None), U.role == "admin_tienda")
+    if since is not None:
+        orders = orders.where(O.created_at >= since)
+        users = select(
+            _count_if(U.created_at >= since, pg).label("users"),
+            _count_if(company, pg).label("companies"),
+            _count_if(and_(company, U.status.in_(ACTIVE_STATUSES)), pg).label("active_companies"),
+        ).where(or_(U.owner_id.is_(None), U.created_at >= since))
+    else:
+        created = or_(U.created_at < until, U.created_at.is_(None)) if until is not None else true()
+        if until is not None:
+            orders = orders.where(or_(O.created_at < until, O.created_at.is_(None)))
+        users = select(
+            _count_if(created, pg).label("users"),
+            _count_if(company, pg).label("companies"),
+            _count_if(and_(company, U.status.in_(ACTIVE_STATUSES)), pg).label("active_companies"),
+        )
+    o, u = orders.subquery(), users.subquery()
+    row = db.execute(select(o, u).select_from(o.join(u, true()))).one()
+    return {k: (float(v) if k not in ("orders", "users", "companies", "active_companies") else int(v or 0))
+            for k, v in row._mapping.items()}
+
+
+def refresh(db, now: _dt.datetime | None = None) -> models.PlatformKpiSnapshot:
+    """Calcula y guarda un snapshot hasta now - WATERMARK_LAG_S. Hace commit."""
+    now = now or _dt.datetime.utcnow()
+    watermark = now - _dt.timedelta(seconds=WATERMARK_LAG_S)
+    day_start, month_start = _buckets(watermark)
+    start = time.perf_counter()
+    agg = aggregate(db, day_start, month_start, until=watermark)
+    snap = models.PlatformKpiSnapshot(
+        taken_at=now, watermark=watermark, day_start=day_start, month_start=month_start,
+        total_orders=agg["orders"], total_users=agg["users"],
+        total_revenue=agg["revenue"], total_commission=agg["commission"],
+        revenue_day=agg["revenue_day"], commission_day=agg["commission_day"],
+        revenue_month=agg["revenue_month"], commission_month=agg["commission_month"],
+        refresh_ms=round((time.perf_counter() - start) * 1000, 1),
+    )
+    db.add(snap)
+    db.flush()
+    db.query(models.PlatformKpiSnapshot).filter(
+        models.PlatformKpiSnapshot.id <= snap.id - KEEP_SNAPSHOTS,
+    ).delete(synchronize_session=False)
+    db.commit()
+    return snap
+
+
+def latest(db):
+    return db.query(models.PlatformKpiSnapshot).order_by(models.PlatformKpiSnapshot.id.desc()).first()
+
+
+def get_kpis(db, now: _dt.datetime | None = None) -> dict:
+    """KPIs del home del super admin: último snapshot + delta desde su
+    watermark, o todo en vivo si no hay snapshot."""
+    now = now or _dt.datetime.utcnow()
+    day_start, month_start = _buckets(now)
+    snap = latest(db)
+    if snap is None:
+        agg = aggregate(db, day_start, month_start)
+        base = {"orders": 0, "users": 0, "revenue": 0.0, "commission": 0.0,
+                "revenue_day": 0.0, "commission_day": 0.0, "revenue_month": 0.0, "commission_month": 0.0}
+    else:
+        agg = aggregate(db, day_start, month_start, since=snap.watermark)
+        # Los acumulados del día/mes del snapshot sólo valen si seguimos en ese día/mes
+        same_day = snap.day_start == day_start
+        same_month = snap.month_start == month_start
+        base = {
+            "orders": snap.total_orders, "users": snap.total_users,
+            "revenue": snap.total_revenue, "commission": snap.total_commission,
+            "revenue_day": snap.revenue_day if same_day else 0.0,
+            "commission_day": snap.commission_day if same_day else 0.0,
+            "revenue_month": snap.revenue_month if same_month else 0.0,
+            "commission_month": snap.commission_month if same_month else 0.0,
+        }
+    return {
+        "total_companies": agg["companies"], "active_companies": agg["active_companies"],
+        "total_users": base["users"] + agg["users"], "total_orders": base["orders"] + agg["orders"],
+        "total_revenue": base["revenue"] + agg["revenue"],
+        "total_commission": base["commission"] + agg["commission"],
+        "commission_today": base["commission_day"] + agg["commission_day"],
+        "commission_month": base["commission_month"] + agg["commission_month"],
+        "revenue_today": base["revenue_day"] + agg["revenue_day"],
+        "revenue_month": base["revenue_month"] + agg["revenue_month"],
+        "kpi_snapshot_at": snap.watermark.isoformat() if snap else None,
+    }
+
+
+def stats(db) -> dict:
+    """Estado del último snapshot para /super-admin/observability."""
+    snap = latest(db)
+    if snap is None:
+        return {"snapshot": None, "refresh_interval_s": REFRESH_INTERVAL_S, "refresher_started": _refresher_started}
+    return {
+        "snapshot": {
+            "id": snap.id, "taken_at": snap.taken_at.isoformat(), "watermark": snap.watermark.isoformat(),
+            "age_s": round((_dt.datetime.utcnow() - snap.taken_at).total_seconds(), 1),
+            "refresh_ms": snap.refresh_ms,
+        },
+        "refresh_interval_s": REFRESH_INTERVAL_S,
+        "refresher_started": _refresher_started,
+    }
+
+
+# ── Refresco en segundo plano ─────────────────────────────────────────────
+
+def _refresher_loop() -> None:
+    from database import SessionLocal
+    while True:
+        db = SessionLocal()
+        try:
+            snap = refresh(db)
+            logger.debug("platform_kpis: snapshot %s en %.1fms", snap.id, snap.refresh_ms)
+        except Exception as e:
+            db.rollback()
+            logger.warning("platform_kpis refresher error: %s", e)
+        finally:
+            db.close()
+        time.sleep(REFRESH_INTERVAL_S)
+
+
+_refresher_started = False
+_refresher_lock = threading.Lock()
+
+
+def start_refresher() -> None:
+    """Arranca el refresco de snapshots en background. Idempotente."""
+    global _refresher_started
+    with _refresher_lock:
+        if _refresher_started:
+            return
+        _refresher_started = True
+    threading.Thread(target=_refresher_loop, daemon=True, name="platform-kpi-refresher").start()
+    logger.info("platform_kpis: refresher iniciado")
@@ -1,7 +1,7 @@
 import os
 import uuid as _uuid
 
-from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi import APIRouter, Body, Depends, File, HTTPException, Query, Request, UploadFile
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
@@ -24,7 +24,7 @@ PROFILE_EDITABLE_FIELDS = {
     "email", "phone", "address", "customer_city", "country", "hours",
     "website", "nit", "tax_regime", "legal_rep", "social_links",
     "terms_conditions", "privacy_policy", "return_policy", "shipping_policy",
-    "bank_accounts",
+    "bank_accounts", "sale_digest_minutes",
 }
 
 
@@ -102,7 +102,7 @@ def _resolve_target(db: Session, caller, target_user_id: str | None):
 # ── Clientes ──────────────────────────────────────────────────────────────
 
 @router.get("/users")
-async def get_customers(
+def get_customers(
     request: Request,
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=200, ge=1),
@@ -136,7 +136,7 @@ async def get_customers(
 
 
 @router.delete("/users/{user_id}")
-async def delete_customer(user_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def delete_customer(user_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     _require_admin_role(user)
     tid = tenant_id_from(user)
     try:
@@ -152,10 +152,9 @@ async def delete_customer(user_id: str, request: Request, db: Session = Depends(
 
 
 @router.post("/users")
-async def create_customer(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def create_customer(request: Request, body: dict = Body(...), db: Session = Depends(get_db), user=Depends(current_user)):
     _require_admin_role(user)
     tid = tenant_id_from(user)
-    body = await request.json()
     email = (body.get("email") or "").strip().lower()
     full_name = (body.get("full_name") or "").strip()
     if not full_name:
@@ -189,7 +188,7 @@ async def create_customer(request: Request, db: Session = Depends(get_db), user=
 
 
 @router.put("/users/{user_id}")
-async def update_customer(user_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def update_customer(user_id: str, request: Request, body: dict = Body(...), db: Session = Depends(get_db), user=Depends(current_user)):
     _require_admin_role(user)
     tid = tenant_id_from(user)
     try:
@@ -199,7 +198,6 @@ async def update_customer(user_id: str, request: Request, db: Session = Depends(
     c = db.query(models.User).filter(models.User.id == uid, models.User.owner_id == tid).first()
     if not c:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
-    body = await request.json()
     if "full_name" in body and body["full_name"]:
         c.full_name = body["full_name"].strip()
     if "email" in body and body["email"]:
@@ -237,7 +235,7 @@ class StaffUpdateRequest(BaseModel):
 
 
 @router.get("/staff")
-async def get_staff(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_staff(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     owner = db.query(models.User).filter(models.User.id == tid).first()
     staff = db.query(models.User).filter(models.User.owner_id == tid, models.User.role != "cliente").all()
@@ -249,7 +247,7 @@ async def get_staff(request: Request, db: Session = Depends(get_db), user=Depend
 
 
 @router.post("/staff")
-async def create_staff(payload: StaffCreateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def create_staff(payload: StaffCreateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     _require_admin_role(user)
     tid = tenant_id_from(user)
     allowed = {r for r, _ in _BASE_ROLE_DEFS}
@@ -277,7 +275,7 @@ async def create_staff(payload: StaffCreateRequest, request: Request, db: Sessio
 
 
 @router.post("/update-user")
-async def update_staff(payload: StaffUpdateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def update_staff(payload: StaffUpdateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     _require_admin_role(user)
     tid = tenant_id_from(user)
     target = db.query(models.User).filter(models.User.email == payload.email, models.User.owner_id == tid).first()
@@ -298,7 +296,7 @@ async def update_staff(payload: StaffUpdateRequest, request: Request, db: Sessio
 
 
 @router.delete("/staff/{staff_id}")
-async def delete_staff(staff_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def delete_staff(staff_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     _require_admin_role(user)
     tid = tenant_id_from(user)
     try:
@@ -316,7 +314,7 @@ async def delete_staff(staff_id: str, request: Request, db: Session = Depends(ge
 
 
 @router.get("/logs")
-async def get_logs(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_logs(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     _require_admin_role(user)
     tid = tenant_id_from(user)
     logs = db.query(models.ActivityLog).filter(
@@ -342,7 +340,7 @@ class RoleUpdateRequest(BaseModel):
 
 
 @router.get("/roles")
-async def get_roles(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_roles(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     roles = db.query(models.CustomRole).filter(models.CustomRole.owner_id == tid).all()
     if not roles:
@@ -354,7 +352,7 @@ async def get_roles(request: Request, db: Session = Depends(get_db), user=Depend
 
 
 @router.put("/roles/{role_name}")
-async def update_role(role_name: str, payload: RoleUpdateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def update_role(role_name: str, payload: RoleUpdateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     _require_admin_role(user)
     tid = tenant_id_from(user)
     role = db.query(models.CustomRole).filter(models.CustomRole.owner_id == tid, models.CustomRole.name == role_name).first()
@@ -391,11 +389,12 @@ class UpdateProfileRequest(BaseModel):
     return_policy: str | None = None
     shipping_policy: str | None = None
     bank_accounts: list | None = None
+    sale_digest_minutes: int | None = Field(None, ge=0, le=1440)
     target_user_id: str | None = None
 
 
 @router.put("/update-profile")
-async def update_profile(payload: UpdateProfileRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def update_profile(payload: UpdateProfileRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     caller = user
     target = _resolve_target(db, caller, payload.target_user_id)
     update_data = payload.model_dump(exclude_unset=True, exclude={"target_user_id"})
@@ -408,6 +407,7 @@ async def update_profile(payload: UpdateProfileRequest, request: Request, db: Se
         existing_email = crud.get_user_by_email(db, email=update_data["email"])
         if existing_email and existing_email.id != target.id:
             raise HTTPException(status_code=400, detail="Ese correo ya está en uso por otra cuenta")
+    previous_slug = target.shop_slug
     JSON_FIELDS = {"bank_accounts", "social_links", "whatsapp_lines", "permissions"}
     for key, value in update_data.items():
         if key in PROFILE_EDITABLE_FIELDS:
@@ -418,9 +418,10 @@ async def update_profile(payload: UpdateProfileRequest, request: Request, db: Se
     db.commit()
 
     # Limpiar caché pública de la tienda para que el cambio se vea de inmediato
-    if target.shop_slug:
-        import cache as _cache
-        _cache.shop_cache.pop(target.shop_slug, None)
+    import cache as _cache
+    _cache.invalidate_shop(previous_slug)
+    if target.shop_slug != previous_slug:
+        _cache.invalidate_shop(target.shop_slug)
 
     result: dict = {"ok": True}
     if email_changed and target.id == caller.id:
@@ -446,12 +447,12 @@ class OnboardingCompleteRequest(BaseModel):
 
 
 @router.post("/upload-image")
-async def upload_image(request: Request, file: UploadFile = File(...), db: Session = Depends(get_db), user=Depends(current_user)):
+def upload_image(request: Request, file: UploadFile = File(...), db: Session = Depends(get_db), user=Depends(current_user)):
     import s3_service
     allowed_types = ("image/", "video/")
     if not file.content_type or not any(file.content_type.startswith(t) for t in allowed_types):
         raise HTTPException(status_code=400, detail="El archivo debe ser una imagen o video")
-    contents = await file.read()
+    contents = file.file.read()
     is_video = file.content_type.startswith("video/")
     max_size = 50 * 1024 * 1024 if is_video else 5 * 1024 * 1024
     if len(contents) > max_size:
@@ -473,7 +474,7 @@ async def upload_image(request: Request, file: UploadFile = File(...), db: Sessi
 
 
 @router.get("/payments")
-async def get_payments(
+def get_payments(
     request: Request,
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=200, ge=1),
@@ -493,7 +494,7 @@ async def get_payments(
 
 
 @router.get("/payments/{payment_id}")
-async def get_payment(payment_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_payment(payment_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     try:
         pid = _uuid.UUID(payment_id)
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import RedirectResponse
+
+import static_assets
+
+router = APIRouter(tags=["assets"])
+
+_IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+@router.get("/static/{filename}")
+def serve_static_asset(filename: str, request: Request):
+    asset = static_assets.get_asset(filename)
+    if asset is None:
+        # Hash viejo (HTML cacheado de un deploy anterior): redirige a la versión vigente
+        name = filename.rsplit("-", 1)[0]
+        current = static_assets.current_filename(name) if filename.endswith(".js") else None
+        if current:
+            return RedirectResponse(f"/static/{current}", status_code=302, headers={"Cache-Control": "no-cache"})
+        return Response(status_code=404)
+
+    headers = {
+        "ETag": asset["etag"],
+        "Cache-Control": _IMMUTABLE,
+        "Vary": "Accept-Encoding",
+        "Access-Control-Allow-Origin": "*",
+    }
+    if request.headers.get("if-none-match") == asset["etag"]:
+        return Response(status_code=304, headers=headers)
+    accepted = static_assets.accepted_encodings(request.headers.get("accept-encoding"))
+    for encoding in ("br", "gzip"):
+        if encoding in accepted and encoding in asset["variants"]:
+            headers["Content-Encoding"] = encoding
+            return Response(content=asset["variants"][encoding], media_type="application/javascript; charset=utf-8", headers=headers)
+    return Response(content=asset["body"], media_type="application/javascript; charset=utf-8", headers=headers)
@@ -135,7 +135,7 @@ def register(request: Request, payload: RegisterRequest, db: Session = Depends(g
 
 @router.post("/auth/refresh")
 @limiter.limit("10/minute")
-async def refresh_token_endpoint(request: Request, db: Session = Depends(get_db)):
+def refresh_token_endpoint(request: Request, db: Session = Depends(get_db)):
     import security as sec_mod
     refresh_tok = request.cookies.get("bayup_refresh_token")
     if not refresh_tok:
@@ -163,7 +163,7 @@ async def refresh_token_endpoint(request: Request, db: Session = Depends(get_db)
 
 
 @router.post("/auth/logout")
-async def logout_endpoint(request: Request):
+def logout_endpoint(request: Request):
     response = JSONResponse(content={"ok": True})
     response.delete_cookie("bayup_access_token", path="/")
     response.delete_cookie("bayup_refresh_token", path="/")
@@ -172,7 +172,7 @@ async def logout_endpoint(request: Request):
 
 @router.get("/auth/confirm-email")
 @limiter.limit("10/minute")
-async def confirm_email_endpoint(token: str = Query(...), request: Request = None, db: Session = Depends(get_db)):
+def confirm_email_endpoint(token: str = Query(...), request: Request = None, db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.email_confirmation_token == token).first()
     if not user:
         raise HTTPException(status_code=400, detail="Enlace de confirmación inválido.")
@@ -191,7 +191,7 @@ async def confirm_email_endpoint(token: str = Query(...), request: Request = Non
 
 @router.post("/auth/resend-confirmation")
 @limiter.limit("3/minute")
-async def resend_email_confirmation(payload: ResendConfirmationRequest, request: Request, db: Session = Depends(get_db)):
+def resend_email_confirmation(payload: ResendConfirmationRequest, request: Request, db: Session = Depends(get_db)):
     try:
         user = db.query(models.User).filter(models.User.email == payload.email).first()
         if user and not user.email_confirmed:
@@ -211,8 +211,8 @@ def forgot_password(request: Request, payload: ForgotPasswordRequest, db: Sessio
         token = _secrets.token_urlsafe(32)
         user.password_reset_token = token
         user.password_reset_expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        _eq.enqueue("send_password_reset", db=db, email=user.email, token=token)
         db.commit()
-        _eq.enqueue("send_password_reset", email=user.email, token=token)
     return {"ok": True, "message": "Si el correo existe, recibirás un enlace en los próximos minutos."}
 
 
@@ -238,7 +238,7 @@ def reset_password(request: Request, payload: ResetPasswordRequest, db: Session
 
 @router.post("/auth/google")
 @limiter.limit("10/minute")
-async def auth_google(request: Request, payload: GoogleAuthRequest, db: Session = Depends(get_db)):
+def auth_google(request: Request, payload: GoogleAuthRequest, db: Session = Depends(get_db)):
     import os, crud, security as sec_mod
     import requests as _requests
     supabase_url = os.getenv("SUPABASE_URL")
@@ -267,10 +267,10 @@ async def auth_google(request: Request, payload: GoogleAuthRequest, db: Session
         full_name = meta.get("full_name") or meta.get("name") or email.split("@")[0]
         user_in = UserCreate(email=email, password=_secrets.token_hex(32), full_name=full_name)
         user = crud.create_user(db, user=user_in)
+        import email_queue as _eq
+        _eq.enqueue("send_welcome_email", db=db, email=user.email, name=full_name, confirmed=True)
         db.commit()
         db.refresh(user)
-        import email_queue as _eq
-        _eq.enqueue("send_welcome_email", email=user.email, name=full_name, confirmed=True)
     if not getattr(user, "email_confirmed", False):
         user.email_confirmed = True
         db.commit()
@@ -307,7 +307,7 @@ async def auth_google(request: Request, payload: GoogleAuthRequest, db: Session
 
 
 @router.get("/auth/me")
-async def read_users_me(user=Depends(current_user)):
+def read_users_me(user=Depends(current_user)):
     return {
         "id": str(user.id),
         "email": user.email,
@@ -337,4 +337,5 @@ async def read_users_me(user=Depends(current_user)):
         "privacy_policy":   getattr(user, "privacy_policy", "") or "",
         "return_policy":    getattr(user, "return_policy", "") or "",
         "shipping_policy":  getattr(user, "shipping_policy", "") or "",
+        "sale_digest_minutes": getattr(user, "sale_digest_minutes", None) or 0,
     }
@@ -16,7 +16,7 @@ class CollectionPayload(BaseModel):
 
 
 @router.get("")
-async def get_collections(
+def get_collections(
     request: Request,
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=200, ge=1),
@@ -30,7 +30,7 @@ async def get_collections(
 
 
 @router.post("")
-async def create_collection(
+def create_collection(
     payload: CollectionPayload,
     request: Request,
     db: Session = Depends(get_db),
@@ -42,7 +42,7 @@ async def create_collection(
 
 
 @router.put("/{collection_id}")
-async def update_collection(
+def update_collection(
     collection_id: str,
     payload: CollectionPayload,
     request: Request,
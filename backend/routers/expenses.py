@@ -39,13 +39,13 @@ def _ser(e) -> dict:
 
 @router.get("/expenses")
 @router.get("/finances/expenses")
-async def get_expenses(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_expenses(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     return [_ser(e) for e in db.query(models.Expense).filter(models.Expense.tenant_id == tid).all()]
 
 
 @router.post("/expenses")
-async def create_expense(payload: ExpenseCreateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def create_expense(payload: ExpenseCreateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     due_date = datetime.fromisoformat(payload.due_date) if payload.due_date else None
     exp = models.Expense(
         id=_uuid.uuid4(),
@@ -6,9 +6,11 @@ import datetime as dt
 import uuid as _uuid
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import Session
 
 import models
+import tenant_ledger
 from database import get_db
 from deps import current_user, tenant_id_from, require_super_admin, push_notification
 
@@ -33,7 +35,7 @@ def _next_payment_dates():
 # ── Tenant: historial de cobros de comisión POS ───────────────────────────
 
 @router.get("/admin/pos-commissions")
-async def get_pos_commission_history(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_pos_commission_history(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     records = (
         db.query(models.Liquidation)
@@ -63,57 +65,75 @@ async def get_pos_commission_history(request: Request, db: Session = Depends(get
 
 # ── Super admin: listar comisiones POS pendientes por tenant ──────────────
 
-@router.get("/super-admin/pos-commissions/pending")
-async def sa_pos_commissions_pending(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
-    require_super_admin(user)
-    tenants = db.query(models.User).filter(
-        models.User.is_global_staff == False,
-        models.User.onboarding_completed == True,
-    ).all()
-    result = []
-    for t in tenants:
-        last_collected = (
-            db.query(models.Liquidation)
-            .filter(
-                models.Liquidation.tenant_id == t.id,
-                models.Liquidation.liq_type == "pos_commission",
-                models.Liquidation.status == "paid",
-            )
-            .order_by(models.Liquidation.paid_date.desc())
-            .first()
+def pending_pos_commissions(db) -> list[dict]:
+    """Comisión POS pendiente de cada tenant con onboarding completo: ventas
+    POS posteriores a lo que cubren sus cobros pagados (ver
+    tenant_ledger.coverage). Una sola consulta (el corte por tenant es un MAX
+    agrupado unido a los pedidos); los tenants sin ventas pendientes no
+    aparecen. last_collected es la fecha del último cobro."""
+    L, O, U = models.Liquidation, models.Order, models.User
+    cutoffs = (
+        db.query(
+            L.tenant_id.label("tenant_id"),
+            func.max(tenant_ledger.coverage()).label("cutoff"),
+            func.max(L.paid_date).label("paid_date"),
+        )
+        .filter(L.liq_type == "pos_commission", L.status == "paid", L.paid_date.isnot(None))
+        .group_by(L.tenant_id)
+        .subquery()
+    )
+    pending = (
+        db.query(
+            O.tenant_id.label("tenant_id"),
+            func.coalesce(func.sum(O.total_price), 0.0).label("gross"),
+            func.count().label("n"),
         )
-        cutoff_pos = last_collected.paid_date if last_collected else None
-        q = db.query(models.Order).filter(
-            models.Order.tenant_id == t.id,
-            models.Order.source == "pos",
-            models.Order.status.in_(["confirmed", "delivered", "completed", "pending"]),
+        .outerjoin(cutoffs, cutoffs.c.tenant_id == O.tenant_id)
+        .filter(
+            O.source == "pos",
+            O.status.in_(tenant_ledger.COMMISSIONABLE),
+            or_(cutoffs.c.cutoff.is_(None), O.created_at > cutoffs.c.cutoff),
+        )
+        .group_by(O.tenant_id)
+        .subquery()
+    )
+    rows = (
+        db.query(
+            U.id, U.full_name, U.email, U.shop_slug, U.bank_accounts,
+            pending.c.gross, pending.c.n, cutoffs.c.paid_date,
         )
-        if cutoff_pos:
-            q = q.filter(models.Order.created_at > cutoff_pos)
-        pos_orders = q.all()
-        if not pos_orders:
-            continue
-        gross_pos = sum(o.total_price for o in pos_orders)
-        commission = round(gross_pos * BAYUP_RATE, 2)
+        .join(pending, pending.c.tenant_id == U.id)
+        .outerjoin(cutoffs, cutoffs.c.tenant_id == U.id)
+        .filter(U.is_global_staff == False, U.onboarding_completed == True)
+        .all()
+    )
+    result = []
+    for tid, name, email, slug, bank_accounts, gross, n, last_paid in rows:
         result.append({
-            "tenant_id":      str(t.id),
-            "tenant_name":    t.full_name or t.email,
-            "tenant_email":   t.email,
-            "shop_slug":      t.shop_slug,
-            "pos_gross":      round(gross_pos, 2),
-            "commission":     commission,
-            "pos_count":      len(pos_orders),
-            "bank_accounts":  t.bank_accounts or [],
-            "last_collected": last_collected.paid_date.isoformat() if last_collected else None,
+            "tenant_id":      str(tid),
+            "tenant_name":    name or email,
+            "tenant_email":   email,
+            "shop_slug":      slug,
+            "pos_gross":      round(gross, 2),
+            "commission":     round(gross * BAYUP_RATE, 2),
+            "pos_count":      n,
+            "bank_accounts":  bank_accounts or [],
+            "last_collected": last_paid.isoformat() if last_paid else None,
         })
     result.sort(key=lambda x: x["commission"], reverse=True)
     return result
 
 
+@router.get("/super-admin/pos-commissions/pending")
+def sa_pos_commissions_pending(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+    require_super_admin(user)
+    return pending_pos_commissions(db)
+
+
 # ── Super admin: registrar cobro de comisión POS ──────────────────────────
 
 @router.post("/super-admin/pos-commissions/collect")
-async def sa_collect_pos_commission(payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def sa_collect_pos_commission(payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     tenant_id_str = payload.get("tenant_id")
     if not tenant_id_str:
@@ -126,23 +146,46 @@ async def sa_collect_pos_commission(payload: dict, request: Request, db: Session
     gross_pos  = float(payload.get("pos_gross", 0))
     commission = round(gross_pos * BAYUP_RATE, 2)
     pos_count  = int(payload.get("pos_count", 0))
+    paid_date  = dt.datetime.now(dt.timezone.utc)
 
-    rec = models.Liquidation(
-        tenant_id          = tid,
-        liq_type           = "pos_commission",
-        gross_amount       = gross_pos,
-        bayup_commission   = commission,
-        prix_fee           = 0.0,
-        net_amount         = 0.0,
-        order_count        = pos_count,
-        status             = "paid",
-        paid_date          = dt.datetime.now(dt.timezone.utc),
-        transfer_reference = payload.get("reference", ""),
-        notes              = payload.get("notes", ""),
+    # El cobro salda las comisiones POS que dejó abiertas el cierre de periodo
+    # (pending_pos_commissions ya incluye sus ventas); sólo lo vendido después
+    # de su period_end va en una liquidación manual nueva.
+    open_closes = (
+        db.query(models.Liquidation)
+        .filter(
+            models.Liquidation.tenant_id == tid,
+            models.Liquidation.liq_type == "pos_commission",
+            models.Liquidation.origin == "close",
+            models.Liquidation.status == "pending",
+        )
+        .with_for_update()
+        .all()
     )
-    db.add(rec)
+    for liq in open_closes:
+        liq.status             = "paid"
+        liq.paid_date          = paid_date
+        liq.transfer_reference = payload.get("reference", "")
+    rest_gross = round(gross_pos - sum(liq.gross_amount or 0.0 for liq in open_closes), 2) if open_closes else gross_pos
+    rest_count = pos_count - sum(liq.order_count or 0 for liq in open_closes)
+
+    rec = None
+    if rest_gross > 0 or not open_closes:
+        rec = models.Liquidation(
+            tenant_id          = tid,
+            liq_type           = "pos_commission",
+            gross_amount       = rest_gross,
+            bayup_commission   = round(rest_gross * BAYUP_RATE, 2),
+            prix_fee           = 0.0,
+            net_amount         = 0.0,
+            order_count        = max(rest_count, 0),
+            status             = "paid",
+            paid_date          = paid_date,
+            transfer_reference = payload.get("reference", ""),
+            notes              = payload.get("notes", ""),
+        )
+        db.add(rec)
     db.commit()
-    db.refresh(rec)
 
     fmt_cop = lambda v: f"${int(v):,}".replace(",", ".")
     push_notification(
@@ -157,68 +200,49 @@ async def sa_collect_pos_commission(payload: dict, request: Request, db: Session
         type_   = "warning",
     )
     return {
-        "id":         str(rec.id),
+        "id":         str(rec.id) if rec else None,
+        "settled":    [str(liq.id) for liq in open_closes],
         "commission": commission,
         "status":     "paid",
-        "paid_date":  rec.paid_date.isoformat(),
+        "paid_date":  paid_date.isoformat(),
     }
 
 
 # ── Tenant: resumen de liquidaciones ─────────────────────────────────────
 
 @router.get("/admin/liquidations/summary")
-async def get_liquidation_summary(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_liquidation_summary(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
 
-    last_paid_web = (
-        db.query(models.Liquidation)
-        .filter(models.Liquidation.tenant_id == tid, models.Liquidation.status == "paid", models.Liquidation.liq_type == "web")
-        .order_by(models.Liquidation.paid_date.desc()).first()
-    )
-    last_paid_pos = (
-        db.query(models.Liquidation)
-        .filter(models.Liquidation.tenant_id == tid, models.Liquidation.status == "paid", models.Liquidation.liq_type == "pos_commission")
-        .order_by(models.Liquidation.paid_date.desc()).first()
-    )
-    cutoff_web = last_paid_web.paid_date if last_paid_web else None
-    cutoff_pos = last_paid_pos.paid_date if last_paid_pos else None
-
-    q_web = db.query(models.Order).filter(
-        models.Order.tenant_id == tid,
-        models.Order.status.in_(["confirmed", "delivered", "completed", "pending"]),
-        models.Order.source != "pos",
-    )
-    if cutoff_web:
-        q_web = q_web.filter(models.Order.created_at > cutoff_web)
-    web_orders = q_web.all()
-
-    q_pos = db.query(models.Order).filter(
-        models.Order.tenant_id == tid,
-        models.Order.status.in_(["confirmed", "delivered", "completed", "pending"]),
-        models.Order.source == "pos",
-    )
-    if cutoff_pos:
-        q_pos = q_pos.filter(models.Order.created_at > cutoff_pos)
-    pos_orders = q_pos.all()
-
-    pending_orders = web_orders + pos_orders
-
-    gross_web     = sum(o.total_price for o in web_orders)
+    # Pendientes e historial salen del ledger (una fila); de orders sólo se
+    # leen los 50 pedidos pendientes más recientes que se listan abajo
+    ledger = tenant_ledger.get(db, tid)
+    gross_web     = round(ledger["web_gross"], 2)
     bayup_fee_web = round(gross_web * BAYUP_RATE, 2)
     net_web       = round(gross_web - bayup_fee_web, 2)
-    gross_pos     = sum(o.total_price for o in pos_orders)
+    gross_pos     = round(ledger["pos_gross"], 2)
     pos_commission = round(gross_pos * BAYUP_RATE, 2)
     net_transfer  = round(net_web - pos_commission, 2)
 
+    pending_filters = []
+    for kind in ("web", "pos"):
+        cutoff = ledger[f"{kind}_cutoff"]
+        cond = tenant_ledger.is_kind(kind)
+        pending_filters.append(and_(cond, models.Order.created_at > cutoff) if cutoff else cond)
+    pending_orders = (
+        db.query(models.Order)
+        .filter(models.Order.tenant_id == tid, or_(*pending_filters))
+        .order_by(models.Order.created_at.desc())
+        .limit(50)
+        .all()
+    )
+
     next_dates = _next_payment_dates()
     scheduled = (
         db.query(models.Liquidation)
         .filter(models.Liquidation.tenant_id == tid, models.Liquidation.status == "scheduled")
         .order_by(models.Liquidation.scheduled_date.asc()).first()
     )
-    all_paid = db.query(models.Liquidation).filter(
-        models.Liquidation.tenant_id == tid, models.Liquidation.status == "paid"
-    ).all()
 
     return {
         "pending": {
@@ -226,13 +250,13 @@ async def get_liquidation_summary(request: Request, db: Session = Depends(get_db
             "bayup_fee":      round(bayup_fee_web + pos_commission, 2),
             "prix_fee":       0.0,
             "net":            net_transfer,
-            "order_count":    len(pending_orders),
+            "order_count":    ledger["web_count"] + ledger["pos_count"],
             "web_gross":      gross_web,
             "web_net":        net_web,
-            "web_count":      len(web_orders),
+            "web_count":      ledger["web_count"],
             "pos_gross":      gross_pos,
             "pos_commission": pos_commission,
-            "pos_count":      len(pos_orders),
+            "pos_count":      ledger["pos_count"],
         },
         "next_payment_dates": [str(d) for d in next_dates],
         "scheduled_liquidation": {
@@ -242,10 +266,10 @@ async def get_liquidation_summary(request: Request, db: Session = Depends(get_db
             "status":         scheduled.status,
         } if scheduled else None,
         "history": {
-            "total_paid_net":     round(sum(l.net_amount for l in all_paid), 2),
-            "total_paid_gross":   round(sum(l.gross_amount for l in all_paid), 2),
-            "total_bayup_earned": round(sum(l.bayup_commission for l in all_paid), 2),
-            "payment_count":      len(all_paid),
+            "total_paid_net":     round(ledger["paid_net"], 2),
+            "total_paid_gross":   round(ledger["paid_gross"], 2),
+            "total_bayup_earned": round(ledger["paid_bayup"], 2),
+            "payment_count":      ledger["paid_count"],
         },
         "pending_orders": [
             {
@@ -258,7 +282,7 @@ async def get_liquidation_summary(request: Request, db: Session = Depends(get_db
                 "created_at":    o.created_at.isoformat(),
                 "status":        o.status,
             }
-            for o in pending_orders[:50]
+            for o in pending_orders
         ],
     }
 
@@ -266,7 +290,7 @@ async def get_liquidation_summary(request: Request, db: Session = Depends(get_db
 # ── Tenant: historial de liquidaciones ───────────────────────────────────
 
 @router.get("/admin/liquidations")
-async def list_my_liquidations(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def list_my_liquidations(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     lqs = (
         db.query(models.Liquidation)
@@ -299,7 +323,7 @@ async def list_my_liquidations(request: Request, db: Session = Depends(get_db),
 # ── Super admin: listar liquidaciones web ────────────────────────────────
 
 @router.get("/super-admin/liquidations")
-async def sa_list_liquidations(
+def sa_list_liquidations(
     request: Request,
     status: str | None = Query(None),
     db: Session = Depends(get_db),
@@ -337,32 +361,20 @@ async def sa_list_liquidations(
 # ── Super admin: balances pendientes por tenant ───────────────────────────
 
 @router.get("/super-admin/liquidations/pending-balances")
-async def sa_pending_balances(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def sa_pending_balances(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
-    tenants = db.query(models.User).filter(
-        models.User.is_global_staff == False,
-        models.User.onboarding_completed == True,
-    ).all()
+    # Pendiente web de cada tenant desde tenant_ledgers: el mismo corte
+    # (tenant_ledger.coverage) que el resumen del tenant y el cierre. Una consulta.
+    T, U = models.TenantLedger, models.User
+    rows = (
+        db.query(U, T.web_gross, T.web_count)
+        .join(T, T.tenant_id == U.id)
+        .filter(U.is_global_staff == False, U.onboarding_completed == True, T.web_count > 0)
+        .all()
+    )
     result = []
-    for t in tenants:
-        last_paid_web = (
-            db.query(models.Liquidation)
-            .filter(models.Liquidation.tenant_id == t.id, models.Liquidation.status == "paid", models.Liquidation.liq_type == "web")
-            .order_by(models.Liquidation.paid_date.desc()).first()
-        )
-        cutoff = last_paid_web.paid_date if last_paid_web else None
-        q = db.query(models.Order).filter(
-            models.Order.tenant_id == t.id,
-            models.Order.status.in_(["confirmed", "delivered", "completed", "pending"]),
-            models.Order.source != "pos",
-        )
-        if cutoff:
-            q = q.filter(models.Order.created_at > cutoff)
-        orders = q.all()
-        if not orders:
-            continue
-        gross = sum(o.total_price for o in orders)
-        net   = round(gross * (1 - BAYUP_RATE - PRIX_RATE), 2)
+    for t, gross, count in rows:
+        net = round(gross * (1 - BAYUP_RATE - PRIX_RATE), 2)
         result.append({
             "tenant_id":    str(t.id),
             "tenant_name":  t.full_name or t.email,
@@ -372,7 +384,7 @@ async def sa_pending_balances(request: Request, db: Session = Depends(get_db), u
             "bayup_fee":    round(gross * BAYUP_RATE, 2),
             "prix_fee":     round(gross * PRIX_RATE, 2),
             "net":          net,
-            "order_count":  len(orders),
+            "order_count":  count,
             "bank_accounts":t.bank_accounts or [],
         })
     result.sort(key=lambda x: x["net"], reverse=True)
@@ -382,7 +394,7 @@ async def sa_pending_balances(request: Request, db: Session = Depends(get_db), u
 # ── Super admin: crear liquidación web ───────────────────────────────────
 
 @router.post("/super-admin/liquidations")
-async def sa_create_liquidation(payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def sa_create_liquidation(payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     tenant_id_str = payload.get("tenant_id")
     if not tenant_id_str:
@@ -422,7 +434,7 @@ async def sa_create_liquidation(payload: dict, request: Request, db: Session = D
 # ── Super admin: marcar liquidación como pagada ───────────────────────────
 
 @router.put("/super-admin/liquidations/{liq_id}/pay")
-async def sa_mark_paid(liq_id: str, payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def sa_mark_paid(liq_id: str, payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     try:
         lid = _uuid.UUID(liq_id)
@@ -431,6 +443,8 @@ async def sa_mark_paid(liq_id: str, payload: dict, request: Request, db: Session
     liq = db.query(models.Liquidation).filter(models.Liquidation.id == lid).first()
     if not liq:
         raise HTTPException(status_code=404, detail="Liquidación no encontrada")
+    if liq.status == "paid":
+        raise HTTPException(status_code=400, detail="La liquidación ya está pagada")
     liq.status             = "paid"
     liq.paid_date          = dt.datetime.now(dt.timezone.utc)
     liq.transfer_reference = payload.get("transfer_reference", "")
@@ -442,7 +456,7 @@ async def sa_mark_paid(liq_id: str, payload: dict, request: Request, db: Session
 # ── Super admin: eliminar liquidación ────────────────────────────────────
 
 @router.delete("/super-admin/liquidations/{liq_id}")
-async def sa_delete_liquidation(liq_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def sa_delete_liquidation(liq_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     try:
         lid = _uuid.UUID(liq_id)
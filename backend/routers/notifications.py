@@ -9,7 +9,7 @@ router = APIRouter(prefix="/notifications", tags=["notifications"])
 
 
 @router.get("")
-async def get_notifications(
+def get_notifications(
     request: Request,
     db: Session = Depends(get_db),
     user=Depends(current_user),
@@ -32,7 +32,7 @@ async def get_notifications(
 
 
 @router.put("/read-all")
-async def mark_all_read(
+def mark_all_read(
     request: Request,
     db: Session = Depends(get_db),
     user=Depends(current_user),
@@ -46,7 +46,7 @@ async def mark_all_read(
 
 
 @router.put("/{notification_id}/read")
-async def mark_one_read(
+def mark_one_read(
     notification_id: str,
     request: Request,
     db: Session = Depends(get_db),
@@ -1,13 +1,16 @@
+import base64
+import binascii
 import uuid as _uuid
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
+import blob_store
 import crud, schemas, models
 import email_queue as _eq
 from database import get_db
-from deps import current_user, tenant_id_from, push_notification, create_shipment
+from deps import current_user, tenant_id_from, push_notification
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
@@ -40,20 +43,8 @@ class OrderUpdateRequest(BaseModel):
     status: str
 
 
-def _items_info(db: Session, db_order) -> list:
-    result = []
-    for item in db_order.items:
-        variant = db.query(models.ProductVariant).filter(models.ProductVariant.id == item.product_variant_id).first()
-        product = db.query(models.Product).filter(models.Product.id == variant.product_id).first() if variant else None
-        name = (product.name if product else "Producto") + (f" — {variant.name}" if variant and variant.name else "")
-        result.append({"name": name, "qty": item.quantity, "price": float(item.price_at_purchase)})
-    return result
-
-
-
-
 @router.get("")
-async def get_orders(
+def get_orders(
     request: Request,
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=200, ge=1),
@@ -65,7 +56,7 @@ async def get_orders(
 
 
 @router.post("")
-async def create_order(
+def create_order(
     payload: OrderCreateRequest,
     request: Request,
     db: Session = Depends(get_db),
@@ -73,55 +64,13 @@ async def create_order(
 ):
     tenant_id = tenant_id_from(user)
     order_in  = schemas.OrderCreate(tenant_id=tenant_id, **payload.model_dump())
-    db_order  = crud.create_order(db, order=order_in, customer_id=user.id, tenant_id=tenant_id)
-    total_fmt = f"${db_order.total_price:,.0f}".replace(",", ".")
-
-    if (payload.source or "pos") != "pos":
-        create_shipment(db, db_order, tenant_id)
-
-    tenant_user = db.query(models.User).filter(models.User.id == tenant_id).first()
-    shop_name   = (tenant_user.full_name or tenant_user.shop_slug or "Tu tienda") if tenant_user else "Tu tienda"
-    info        = _items_info(db, db_order)
-
-    if payload.customer_email:
-        _eq.enqueue("send_order_confirmation",
-            email=payload.customer_email,
-            name=payload.customer_name or "Cliente",
-            order_id=str(db_order.id),
-            items=info,
-            total=float(db_order.total_price),
-            payment_method=payload.payment_method or "Efectivo",
-            customer_city=payload.customer_city or "",
-            customer_phone=payload.customer_phone or "",
-            shop_name=shop_name,
-            source=payload.source or "pos",
-            shop_logo=(tenant_user.logo_url if tenant_user else None),
-        )
-
-    if tenant_user and tenant_user.email:
-        _eq.enqueue("send_new_sale_notification",
-            owner_email=tenant_user.email,
-            shop_name=shop_name,
-            order_id=str(db_order.id),
-            customer_name=payload.customer_name or "Cliente",
-            customer_email=payload.customer_email or "",
-            customer_phone=payload.customer_phone or "",
-            customer_city=payload.customer_city or "",
-            items=info,
-            total=float(db_order.total_price),
-            payment_method=payload.payment_method or "Efectivo",
-        )
-
-    push_notification(db, tenant_id,
-        "💰 Nuevo pedido creado",
-        f"Pedido #{str(db_order.id)[:8].upper()} por {total_fmt}",
-        "success",
-    )
+    # Envío, notificación, emails y CRM salen por el outbox (order_outbox.py)
+    db_order  = crud.create_order(db, order=order_in, customer_id=user.id, tenant_id=tenant_id, flow="admin")
     return schemas.Order.model_validate(db_order).model_dump(mode="json")
 
 
 @router.put("/{order_id}")
-async def update_order(
+def update_order(
     order_id: str,
     payload: OrderUpdateRequest,
     request: Request,
@@ -159,7 +108,7 @@ async def update_order(
         if is_web and db_order.customer_email and payload.status in ("processing", "completed", "cancelled"):
             tenant_u = db.query(models.User).filter(models.User.id == tenant_id).first()
             shop = (tenant_u.full_name or tenant_u.shop_slug or "Tu tienda") if tenant_u else "Tu tienda"
-            _eq.enqueue("send_order_status_update",
+            _eq.enqueue("send_order_status_update", db=db,
                 email=db_order.customer_email,
                 name=db_order.customer_name or "Cliente",
                 order_id=str(db_order.id),
@@ -167,12 +116,13 @@ async def update_order(
                 shop_name=shop,
                 shop_logo=(tenant_u.logo_url if tenant_u else None),
             )
+            db.commit()
 
     return {"id": str(db_order.id), "status": db_order.status}
 
 
 @router.post("/{order_id}/attach-invoice")
-async def attach_invoice(
+def attach_invoice(
     order_id: str,
     payload: dict,
     request: Request,
@@ -197,15 +147,22 @@ async def attach_invoice(
     if not customer_email or not pdf_base64:
         raise HTTPException(status_code=400, detail="customer_email y pdf_base64 requeridos")
 
+    try:
+        pdf_bytes = base64.b64decode(pdf_base64.split(",")[-1], validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="pdf_base64 inválido")
+
     tenant_user = db.query(models.User).filter(models.User.id == tenant_id).first()
     shop_name   = (tenant_user.full_name or tenant_user.shop_slug or "Tu tienda") if tenant_user else "Tu tienda"
 
-    _eq.enqueue("send_invoice_attachment",
+    # El PDF va a blob_store; el job sólo guarda la referencia
+    _eq.enqueue("send_invoice_attachment", db=db,
         email=customer_email,
         name=order.customer_name or "Cliente",
         order_id=str(order.id),
         shop_name=shop_name,
-        pdf_base64=pdf_base64,
+        pdf_ref=blob_store.put(pdf_bytes),
         shop_logo=(tenant_user.logo_url if tenant_user else None),
     )
+    db.commit()
     return {"ok": True}
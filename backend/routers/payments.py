@@ -1,20 +1,29 @@
+import gzip
+import hashlib
 import html as _html
 import logging
 import os
 import re
 import uuid as _uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import HTMLResponse
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
+import cache as _cache
 import models
 import payment_service
 import schemas
+import static_assets
+import stock_reservations
+import webhook_inbox
 from database import get_db
 from rate_limit import limiter
-from routers.public import resolve_variant_items, finalize_web_order
+from security import content_security_policy
+from routers.public import _etag_matches, resolve_variant_lines, finalize_web_order
 
 router = APIRouter(tags=["payments"])
 logger = logging.getLogger("bayup")
@@ -89,7 +98,7 @@ def _inject_sdk(html_content: str, slug: str, page_key: str, phone: str, api_url
 
 @router.post("/public/checkout")
 @limiter.limit("10/minute")
-async def public_checkout(payload: CheckoutRequest, request: Request, db: Session = Depends(get_db)):
+def public_checkout(payload: CheckoutRequest, request: Request, db: Session = Depends(get_db)):
     """Checkout público con pasarela Wompi. Crea un Payment "pending"; la orden
     real solo se crea cuando el webhook de Wompi confirma el pago (nunca se
     confía en el navegador para marcar un pago como aprobado)."""
@@ -110,14 +119,11 @@ async def public_checkout(payload: CheckoutRequest, request: Request, db: Sessio
             return _payment_response(existing)
 
     # CRIT-002: resuelve variantes y precios reales desde la DB — nunca confía en el cliente
-    validated_items = resolve_variant_items(db, tenant_uuid, payload.items)
+    validated_lines = resolve_variant_lines(db, tenant_uuid, payload.items)
 
     items_dict = []
     total = 0.0
-    for v_item in validated_items:
-        variant = db.query(models.ProductVariant).filter(models.ProductVariant.id == v_item.product_variant_id).first()
-        product = db.query(models.Product).filter(models.Product.id == variant.product_id).first() if variant else None
-        name = (product.name if product else "Producto") + (f" — {variant.name}" if variant and variant.name else "")
+    for v_item, name in validated_lines:
         items_dict.append({
             "product_variant_id": str(v_item.product_variant_id),
             "name": name,
@@ -145,11 +151,17 @@ async def public_checkout(payload: CheckoutRequest, request: Request, db: Sessio
         idempotency_key=payload.idempotency_key,
     )
     db.add(payment)
+    # Pago por pasarela: aparta el stock hasta que el webhook confirme o venza
+    # la reserva (stock_reservations). Se confirma en el mismo commit del pago.
+    gateway_flow = payment_service.WOMPI_CONFIGURED and total > 0
+    if gateway_flow:
+        db.flush()
+        stock_reservations.reserve(db, payment, [v_item for v_item, _ in validated_lines])
     db.commit()
     db.refresh(payment)
 
     # Wompi: si hay credenciales configuradas, genera la sesión firmada del widget
-    if payment_service.WOMPI_CONFIGURED and total > 0:
+    if gateway_flow:
         try:
             wompi_session = payment_service.create_payment_session(
                 amount=total, user=tenant, currency=payload.currency,
@@ -169,13 +181,16 @@ async def public_checkout(payload: CheckoutRequest, request: Request, db: Sessio
             return response
         except Exception as e:
             logger.warning("Wompi: no se pudo crear la sesión de pago: %s", e)
+            db.rollback()
+            stock_reservations.release(db, payment.id)
+            db.commit()
 
     return _payment_response(payment)
 
 
 @router.get("/public/payment/{payment_id}")
 @limiter.limit("30/minute")
-async def get_payment_status(
+def get_payment_status(
     payment_id: str,
     request: Request,
     slug: str = Query(None),
@@ -211,12 +226,13 @@ _WOMPI_FAILED_STATUSES = {"DECLINED", "VOIDED", "ERROR"}
 
 
 @router.post("/public/payments/webhook")
-async def payment_webhook(request: Request, db: Session = Depends(get_db)):
+def payment_webhook(request: Request, event: dict = Body(...), db: Session = Depends(get_db)):
     """Webhook de Wompi. Es la ÚNICA fuente de verdad para confirmar un pago —
     el navegador del comprador nunca puede marcar un pago como aprobado.
-    NO se loguea el payload completo: puede contener datos bancarios."""
-    event = await request.json()
+    NO se loguea el payload completo: puede contener datos bancarios.
 
+    Sólo verifica la firma y guarda el evento en webhook_inbox: responde 200
+    enseguida y los workers lo aplican (apply_wompi_event) fuera del request."""
     if not payment_service.verify_webhook_event(event):
         logger.warning("Wompi webhook: firma inválida, evento descartado")
         raise HTTPException(status_code=401, detail="Firma inválida")
@@ -228,10 +244,27 @@ async def payment_webhook(request: Request, db: Session = Depends(get_db)):
     if not reference or not wompi_status:
         return {"received": True}
 
-    # with_for_update(): bloquea la fila hasta el commit de este request. Sin
-    # esto, dos entregas concurrentes del mismo evento (reintento de Wompi)
-    # podrían leer ambas status=="pending" antes de que la primera confirme,
-    # y las dos crear una orden — doble cobro/pedido duplicado.
+    row = webhook_inbox.store(
+        db, "wompi", str(wompi_id or reference), str(wompi_status), str(reference), event,
+    )
+    # None: reentrega de un evento ya recibido (índice único del inbox)
+    if row is not None:
+        webhook_inbox.after_commit(db, row)
+    return {"received": True}
+
+
+def apply_wompi_event(db: Session, event: dict) -> None:
+    """Aplica un evento de Wompi ya verificado (lo llama webhook_inbox). Una
+    excepción deja el evento pendiente para reintentarlo con backoff."""
+    transaction = (event.get("data") or {}).get("transaction") or {}
+    reference = transaction.get("reference")
+    wompi_status = transaction.get("status")
+    wompi_id = transaction.get("id")
+
+    # with_for_update(): bloquea la fila hasta el commit. Sin esto, dos
+    # entregas concurrentes del mismo evento (reintento de Wompi) podrían
+    # leer ambas status=="pending" antes de que la primera confirme, y las
+    # dos crear una orden — doble cobro/pedido duplicado.
     payment = (
         db.query(models.Payment)
         .filter(
@@ -243,11 +276,12 @@ async def payment_webhook(request: Request, db: Session = Depends(get_db)):
     )
     if not payment:
         logger.warning("Wompi webhook: referencia %s no corresponde a ningún pago", reference)
-        return {"received": True}
+        return
 
     # Idempotencia: un pago ya procesado (aprobado o fallido) no se vuelve a tocar
     if payment.status != "pending":
-        return {"received": True}
+        db.commit()
+        return
 
     payment.gateway_response = event
     # OJO: gateway_payment_id se sobreescribe con el id de transacción de Wompi
@@ -259,38 +293,66 @@ async def payment_webhook(request: Request, db: Session = Depends(get_db)):
     payment.gateway_payment_id = str(wompi_id) if wompi_id else reference
 
     if wompi_status in _WOMPI_APPROVED_STATUSES:
+        # Aprobación y pedido van en una sola transacción (el commit de
+        # create_order). Si crear el pedido falla, la excepción sube a
+        # webhook_inbox: el rollback deja el pago en "pending" con su reserva
+        # y el evento se reintenta con backoff (o queda "dead").
         payment.status = "approved"
-        db.commit()
-        try:
-            validated_items = [_order_item_from_payment(item) for item in (payment.items or [])]
-            db_order = finalize_web_order(
-                db, payment.tenant_id, validated_items,
-                customer_name=payment.customer_name, customer_email=payment.customer_email,
-                customer_phone=payment.customer_phone, customer_city=None, shipping_address=None,
-                payment_method="wompi", source="web",
-            )
+        validated_items = [_order_item_from_payment(item) for item in (payment.items or [])]
+        # Las unidades reservadas pasan al pedido: create_order descuenta el
+        # stock real en la misma transacción que libera el contador.
+        stock_reservations.convert(db, payment.id)
+
+        def _link_order(db_order):
             payment.order_id = db_order.id
-            db.commit()
-        except Exception as e:
-            logger.error("Wompi webhook: pago %s aprobado pero falló crear la orden: %s", payment.id, e)
+
+        finalize_web_order(
+            db, payment.tenant_id, validated_items,
+            customer_name=payment.customer_name, customer_email=payment.customer_email,
+            customer_phone=payment.customer_phone, customer_city=None, shipping_address=None,
+            payment_method="wompi", source="web", before_commit=_link_order,
+        )
     elif wompi_status in _WOMPI_FAILED_STATUSES:
         payment.status = "failed"
+        stock_reservations.release(db, payment.id)
         db.commit()
     else:
         db.commit()
 
-    return {"received": True}
-
 
 @router.get("/html-shop/{slug}", response_class=HTMLResponse)
 @router.get("/html-shop/{slug}/{page_key}", response_class=HTMLResponse)
 @limiter.limit("30/minute")
-async def serve_html_shop(request: Request, slug: str, page_key: str = "home", db: Session = Depends(get_db)):
+def serve_html_shop(request: Request, slug: str, page_key: str = "home", db: Session = Depends(get_db)):
+    # Hit: la página ya renderizada (con SDK inyectado y comprimida) sale de la caché
+    # sin tocar la DB. Se invalida al editar plantillas, publicar páginas o
+    # cambiar el perfil/estado del tenant (cache.invalidate_shop).
+    # La clave es la página resuelta: una ruta que no existe sirve "home" y
+    # comparte su entrada, así que rutas arbitrarias no llenan la caché ni
+    # recomprimen la página.
+    try:
+        pages = _cache.render_cache.get_or_load(f"{slug}::pages", lambda: _shop_page_keys(db, slug))
+        resolved = page_key if page_key in pages["keys"] else "home"
+        rendered = _cache.render_cache.get_or_load(f"{slug}:{resolved}", lambda: _render_shop_page(db, slug, resolved))
+    except _ShopPageMissing as e:
+        return HTMLResponse(e.message, status_code=404)
+    return _rendered_response(request, rendered)
+
+
+class _ShopPageMissing(Exception):
+    """La página no se puede renderizar; el 404 no se cachea."""
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+def _load_shop_template(db: Session, slug: str):
+    """(tenant, página publicada, plantilla HTML) de la tienda, o _ShopPageMissing."""
     tenant = db.query(models.User).filter(
         models.User.shop_slug == slug, models.User.status == "Activo",
     ).first()
     if not tenant:
-        return HTMLResponse("<h1>Tienda no encontrada</h1>", status_code=404)
+        raise _ShopPageMissing("<h1>Tienda no encontrada</h1>")
 
     shop_page = db.query(models.ShopPage).filter(
         models.ShopPage.tenant_id == tenant.id,
@@ -310,15 +372,74 @@ async def serve_html_shop(request: Request, slug: str, page_key: str = "home", d
             pass
 
     if not html_template or not html_template.html_pages:
-        return HTMLResponse("<h1>Esta tienda no tiene una plantilla HTML configurada.</h1>", status_code=404)
+        raise _ShopPageMissing("<h1>Esta tienda no tiene una plantilla HTML configurada.</h1>")
+    return tenant, shop_page, html_template
+
+
+def _shop_page_keys(db: Session, slug: str) -> dict:
+    """Páginas con contenido de la plantilla publicada (dict cacheable)."""
+    _, _, html_template = _load_shop_template(db, slug)
+    return {"keys": sorted(k for k, v in html_template.html_pages.items() if v)}
+
 
+def _render_shop_page(db: Session, slug: str, page_key: str):
+    """Renderiza la página (SDK inyectado + variantes comprimidas) y devuelve el dict cacheable."""
+    tenant, shop_page, html_template = _load_shop_template(db, slug)
     pages = html_template.html_pages or {}
     html_content = pages.get(page_key) or pages.get("home") or ""
     if not html_content:
-        return HTMLResponse("<h1>Página no encontrada</h1>", status_code=404)
+        raise _ShopPageMissing("<h1>Página no encontrada</h1>")
 
     backend_url = os.getenv("BACKEND_URL", "https://api-bayup.onrender.com")
-    import cache as _c
     html_out = _inject_sdk(html_content, slug=slug, page_key=page_key,
-                           phone=tenant.phone or "", api_url=backend_url, sdk=_c.BAYUP_SDK)
-    return HTMLResponse(content=html_out, status_code=200)
+                           phone=tenant.phone or "", api_url=backend_url,
+                           sdk=static_assets.sdk_script_tag(backend_url))
+    versions = [v for v in (html_template.updated_at, shop_page.updated_at) if v]
+    return _build_rendered(html_out, max(versions) if versions else None)
+
+
+def _build_rendered(html_out: str, last_modified) -> dict:
+    body = html_out.encode("utf-8")
+    variants = {"gzip": gzip.compress(body, compresslevel=9)}
+    try:
+        import brotli  # opcional: si no está instalado se sirve gzip
+        variants["br"] = brotli.compress(body, quality=11)
+    except ImportError:
+        pass
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return {
+        "body": body,
+        "variants": variants,
+        "etag": '"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+        "last_modified": format_datetime(last_modified or datetime.now(timezone.utc), usegmt=True),
+    }
+
+
+def _html_shop_csp() -> str:
+    """CSP por defecto del middleware + el origen del backend en script-src,
+    desde donde se carga /static/bayup-<hash>.js."""
+    backend_url = os.getenv("BACKEND_URL", "https://api-bayup.onrender.com").rstrip("/")
+    return content_security_policy(backend_url)
+
+
+def _rendered_response(request: Request, rendered: dict) -> Response:
+    headers = {
+        "ETag": rendered["etag"],
+        "Last-Modified": rendered["last_modified"],
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "public, no-cache",
+        "Content-Security-Policy": _html_shop_csp(),
+    }
+    inm = request.headers.get("if-none-match")
+    if _etag_matches(inm, rendered["etag"]):
+        return Response(status_code=304, headers=headers)
+    if not inm and request.headers.get("if-modified-since") == rendered["last_modified"]:
+        return Response(status_code=304, headers=headers)
+
+    accepted = static_assets.accepted_encodings(request.headers.get("accept-encoding"))
+    for encoding in ("br", "gzip"):
+        if encoding in accepted and encoding in rendered["variants"]:
+            headers["Content-Encoding"] = encoding
+            return Response(content=rendered["variants"][encoding], media_type="text/html; charset=utf-8", headers=headers)
+    return Response(content=rendered["body"], media_type="text/html; charset=utf-8", headers=headers)
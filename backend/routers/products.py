@@ -6,6 +6,7 @@ from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Reques
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
+import cache as _cache
 import crud, schemas
 from database import get_db
 from deps import current_user, tenant_id_from, require_super_admin
@@ -54,7 +55,7 @@ def _resolve_target(db, caller, target_user_id):
 
 
 @router.get("")
-async def get_products(
+def get_products(
     request: Request,
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=200, ge=1),
@@ -66,7 +67,7 @@ async def get_products(
 
 
 @router.get("/{product_id}")
-async def get_product(
+def get_product(
     product_id: str,
     request: Request,
     db: Session = Depends(get_db),
@@ -83,7 +84,7 @@ async def get_product(
 
 
 @router.post("")
-async def create_product(
+def create_product(
     payload: ProductPayload,
     request: Request,
     db: Session = Depends(get_db),
@@ -94,11 +95,12 @@ async def create_product(
     effective = _resolve_target(db, user, target_user_id)
     product_in = schemas.ProductCreate(**data)
     db_product = crud.create_product(db, product=product_in, owner_id=tenant_id_from(effective))
+    _cache.invalidate_catalog(db_product.owner_id)
     return schemas.Product.model_validate(db_product).model_dump(mode="json")
 
 
 @router.post("/bulk-upload")
-async def bulk_upload(
+def bulk_upload(
     request: Request,
     file: UploadFile = File(...),
     target_user_id: str | None = Form(None),
@@ -107,7 +109,7 @@ async def bulk_upload(
 ):
     if file.content_type not in ALLOWED_EXCEL_MIME:
         raise HTTPException(status_code=400, detail="Solo se aceptan archivos .xlsx o .xls")
-    raw = await file.read(5 * 1024 * 1024 + 1)
+    raw = file.file.read(5 * 1024 * 1024 + 1)
     if len(raw) > 5 * 1024 * 1024:
         raise HTTPException(status_code=413, detail="El archivo supera el límite de 5 MB")
 
@@ -160,11 +162,13 @@ async def bulk_upload(
         except Exception as e:
             errors.append(f"Fila {row_num}: {e}")
 
+    if created:
+        _cache.invalidate_catalog(tid)
     return {"created": created, "errors": errors}
 
 
 @router.put("/{product_id}")
-async def update_product(
+def update_product(
     product_id: str,
     payload: ProductPayload,
     request: Request,
@@ -179,11 +183,12 @@ async def update_product(
     if not db_product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     updated = crud.update_product(db, db_product, schemas.ProductCreate(**payload.model_dump()))
+    _cache.invalidate_catalog(updated.owner_id)
     return schemas.Product.model_validate(updated).model_dump(mode="json")
 
 
 @router.delete("/{product_id}")
-async def delete_product(
+def delete_product(
     product_id: str,
     request: Request,
     db: Session = Depends(get_db),
@@ -196,4 +201,5 @@ async def delete_product(
     deleted = crud.delete_product(db, product_id=pid, owner_id=tenant_id_from(user))
     if not deleted:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
+    _cache.invalidate_catalog(tenant_id_from(user))
     return {"ok": True}
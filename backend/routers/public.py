@@ -1,3 +1,5 @@
+import hashlib
+import json
 import uuid as _uuid
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
@@ -7,7 +9,6 @@ from sqlalchemy.orm import Session
 import cache as _cache
 import crud, models, schemas
 from database import get_db
-from deps import create_shipment, push_notification
 from rate_limit import limiter
 
 router = APIRouter(tags=["public"])
@@ -40,16 +41,19 @@ class PublicOrderCreateRequest(BaseModel):
 
 @router.get("/public/shop/{slug}")
 @limiter.limit("30/minute")
-async def get_public_shop(request: Request, response: Response, slug: str, db: Session = Depends(get_db)):
-    cached = _cache.cache_get(_cache.shop_cache, slug)
-    if cached is not None:
-        response.headers["Cache-Control"] = "public, max-age=60, stale-while-revalidate=300"
-        return cached
+def get_public_shop(request: Request, response: Response, slug: str, db: Session = Depends(get_db)):
+    # single-flight: un miss en un slug caliente hace una sola consulta
+    data = _cache.shop_cache.get_or_load(slug, lambda: _load_public_shop(db, slug), ttl=60)
+    response.headers["Cache-Control"] = "public, max-age=60, stale-while-revalidate=300"
+    return data
+
+
+def _load_public_shop(db: Session, slug: str) -> dict:
     store = crud.get_user_by_slug(db, slug=slug)
     if not store or store.status == "Suspendido":
         raise HTTPException(status_code=404, detail="Tienda no encontrada")
     collections = crud.get_collections_by_owner(db, owner_id=store.id)
-    data = {
+    return {
         "id": str(store.id),
         "owner_id": str(store.id),
         "full_name": store.full_name,
@@ -66,54 +70,96 @@ async def get_public_shop(request: Request, response: Response, slug: str, db: S
         "return_policy": getattr(store, "return_policy", None),
         "shipping_policy": getattr(store, "shipping_policy", None),
     }
-    _cache.cache_set(_cache.shop_cache, slug, data, 60)
-    response.headers["Cache-Control"] = "public, max-age=60, stale-while-revalidate=300"
-    return data
 
 
 @router.get("/public/stores/{store_id}/products")
 @limiter.limit("30/minute")
-async def get_public_store_products(request: Request, response: Response, store_id: str, db: Session = Depends(get_db)):
+def get_public_store_products(request: Request, response: Response, store_id: str, db: Session = Depends(get_db)):
     try:
         store_uuid = _uuid.UUID(store_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="store_id inválido")
-    products = crud.get_all_products(db, tenant_id=store_uuid, limit=500)
-    response.headers["Cache-Control"] = "public, max-age=30, stale-while-revalidate=120"
-    return [
-        {
-            "id": str(p.id),
-            "name": p.name,
-            "price": p.price,
-            "description": p.description,
-            "image_url": p.image_url or [],
-            "category": p.category,
-            "sku": p.sku,
-            "status": p.status,
-        }
-        for p in products if p.status == "active"
-    ]
 
-
-def resolve_variant_items(db: Session, tenant_uuid, raw_items: list) -> list:
+    def _load():
+        products = crud.get_all_products(db, tenant_id=store_uuid, limit=500)
+        return _catalog_entry([
+            {
+                "id": str(p.id),
+                "name": p.name,
+                "price": p.price,
+                "description": p.description,
+                "image_url": p.image_url or [],
+                "category": p.category,
+                "sku": p.sku,
+                "status": p.status,
+            }
+            for p in products if p.status == "active"
+        ])
+
+    entry = _cache.catalog_cache.get_or_load(f"{store_uuid}:store", _load)
+    return _catalog_response(request, entry, "public, max-age=30, stale-while-revalidate=120")
+
+
+# ── Catálogo público cacheado ─────────────────────────────────────────────
+# Se guarda el JSON ya serializado + su ETag: un hit no hidrata ORM ni vuelve
+# a codificar. Las claves empiezan por "<tenant_id>:" para que
+# cache.invalidate_catalog() las descarte al crear/editar/borrar productos.
+
+def _catalog_entry(payload) -> tuple[bytes, str]:
+    body = json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in candidates
+
+
+def _catalog_response(request: Request, entry: tuple[bytes, str], cache_control: str) -> Response:
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def active_tenant_id(db: Session, slug: str) -> str | None:
+    """slug → tenant_id de una tienda activa, cacheado (cache.slug_cache)."""
+    def _load():
+        tid = db.query(models.User.id).filter(
+            models.User.shop_slug == slug, models.User.status == "Activo",
+        ).scalar()
+        return str(tid) if tid else None
+    return _cache.slug_cache.get_or_load(slug, _load)
+
+
+def resolve_variant_lines(db: Session, tenant_uuid, raw_items: list) -> list:
     """Valida ítems de checkout público contra la DB (CRIT-002: nunca confiar en
     el precio del cliente). Acepta objetos con .product_variant_id/.quantity o
     dicts equivalentes. Crea una variante "Base" si el id recibido es en
-    realidad un product_id (producto sin variantes)."""
-    validated_items: list = []
+    realidad un product_id (producto sin variantes). Variantes y productos se
+    cargan en dos consultas para todo el carrito (crud.load_variant_rows).
+    Devuelve pares (OrderItemBase, nombre para mostrar)."""
+    parsed = []
     for item in raw_items:
         raw_id = item.product_variant_id if hasattr(item, "product_variant_id") else item["product_variant_id"]
         quantity = item.quantity if hasattr(item, "quantity") else item["quantity"]
         try:
-            var_uuid = _uuid.UUID(str(raw_id))
+            parsed.append((_uuid.UUID(str(raw_id)), quantity))
         except ValueError:
             raise HTTPException(status_code=400, detail="product_variant_id inválido")
-        variant = db.query(models.ProductVariant).filter(models.ProductVariant.id == var_uuid).first()
+
+    variants, products = crud.load_variant_rows(db, [i for i, _ in parsed], tenant_uuid)
+    lines: list = []
+    created = False
+    for var_uuid, quantity in parsed:
+        variant = variants.get(var_uuid)
         if not variant:
-            product = db.query(models.Product).filter(
-                models.Product.id == var_uuid,
-                models.Product.owner_id == tenant_uuid,
-            ).first()
+            product = products.get(var_uuid)
             if not product:
                 raise HTTPException(status_code=400, detail="Variante de producto no encontrada")
             variant = models.ProductVariant(
@@ -125,33 +171,39 @@ def resolve_variant_items(db: Session, tenant_uuid, raw_items: list) -> list:
                 price=product.price or 0,
             )
             db.add(variant)
-            db.flush()
-        product = db.query(models.Product).filter(
-            models.Product.id == variant.product_id,
-            models.Product.owner_id == tenant_uuid,
-        ).first()
+            # Si el mismo producto se repite en el carrito, reutiliza la variante
+            variants[var_uuid] = variant
+            created = True
+        product = products.get(variant.product_id)
         if not product:
             raise HTTPException(status_code=400, detail="Variante no pertenece a esta tienda")
         db_price = variant.price if variant.price and variant.price > 0 else product.price
-        validated_items.append(schemas.OrderItemBase(
+        lines.append((schemas.OrderItemBase(
             product_variant_id=variant.id,
             quantity=quantity,
             price_at_purchase=db_price,
-        ))
-    return validated_items
+        ), crud.item_display_name(variant, product)))
+    if created:
+        db.flush()
+    return lines
+
+
+def resolve_variant_items(db: Session, tenant_uuid, raw_items: list) -> list:
+    """Como resolve_variant_lines, sin los nombres."""
+    return [item for item, _ in resolve_variant_lines(db, tenant_uuid, raw_items)]
 
 
 def finalize_web_order(
     db: Session, tenant_uuid, validated_items: list,
     customer_name: str, customer_email: str | None, customer_phone: str | None,
     customer_city: str | None, shipping_address: str | None,
-    payment_method: str, source: str,
+    payment_method: str, source: str, before_commit=None,
 ) -> models.Order:
-    """Crea la orden ya validada, encola emails, genera envío y notifica al
-    tenant. Compartido entre el checkout directo (/public/orders) y la
-    confirmación de pago vía webhook de la pasarela (Wompi)."""
-    import email_queue as _eq
-
+    """Crea la orden ya validada. Compartido entre el checkout directo
+    (/public/orders) y la confirmación de pago vía webhook de la pasarela
+    (Wompi). Emails, envío y notificación al tenant salen por el outbox del
+    pedido (order_outbox.py), confirmado en el mismo commit. before_commit
+    (ver crud.create_order) permite sumar cambios del llamador a ese commit."""
     order_in = schemas.OrderCreate(
         tenant_id=tenant_uuid,
         total_price=0,
@@ -164,54 +216,8 @@ def finalize_web_order(
         source=source,
         items=validated_items,
     )
-    db_order = crud.create_order(db, order=order_in, customer_id=None, tenant_id=tenant_uuid)
-
-    items_info = []
-    for _item in db_order.items:
-        _variant = db.query(models.ProductVariant).filter(models.ProductVariant.id == _item.product_variant_id).first()
-        _product = db.query(models.Product).filter(models.Product.id == _variant.product_id).first() if _variant else None
-        _iname = (_product.name if _product else "Producto") + (f" — {_variant.name}" if _variant and _variant.name else "")
-        items_info.append({"name": _iname, "qty": _item.quantity, "price": float(_item.price_at_purchase)})
-
-    tenant_user = db.query(models.User).filter(models.User.id == tenant_uuid).first()
-    shop_name = (tenant_user.full_name or tenant_user.shop_slug or "Tu tienda") if tenant_user else "Tu tienda"
-
-    shop_logo = (tenant_user.logo_url if tenant_user else None)
-
-    if customer_email:
-        _eq.enqueue("send_order_confirmation",
-            email=customer_email, name=customer_name or "Cliente",
-            order_id=str(db_order.id), items=items_info, total=float(db_order.total_price),
-            payment_method=payment_method or "Online",
-            customer_city=customer_city or "", customer_phone=customer_phone or "",
-            shop_name=shop_name, shop_logo=shop_logo,
-        )
-        _eq.enqueue("send_web_order_invoice",
-            email=customer_email, name=customer_name or "Cliente",
-            order_id=str(db_order.id), shop_name=shop_name,
-            shop_email=(tenant_user.email or "") if tenant_user else "",
-            shop_phone=(tenant_user.phone or "") if tenant_user else "",
-            customer_phone=customer_phone or "", customer_city=customer_city or "",
-            items=items_info, total=float(db_order.total_price),
-            payment_method=payment_method or "Online",
-            created_at_iso=db_order.created_at.isoformat() if db_order.created_at else None,
-            shop_logo=shop_logo,
-        )
-
-    if tenant_user and tenant_user.email:
-        _eq.enqueue("send_new_sale_notification",
-            owner_email=tenant_user.email, shop_name=shop_name, order_id=str(db_order.id),
-            customer_name=customer_name or "Cliente",
-            customer_email=customer_email or "", customer_phone=customer_phone or "",
-            customer_city=customer_city or "", items=items_info,
-            total=float(db_order.total_price), payment_method=payment_method or "Online",
-        )
-
-    total_fmt = f"${db_order.total_price:,.0f}".replace(",", ".")
-    create_shipment(db, db_order, tenant_uuid)
-    push_notification(db, tenant_uuid, "🛒 Nueva venta en tienda",
-                      f"{customer_name or 'Cliente'} compró por {total_fmt}", "success")
-
+    db_order = crud.create_order(db, order=order_in, customer_id=None, tenant_id=tenant_uuid, flow="web",
+                                 before_commit=before_commit)
     return db_order
 
 
@@ -237,7 +243,7 @@ def create_public_order(request: Request, payload: PublicOrderCreateRequest, db:
 
 @router.get("/public/orders/{order_id}")
 @limiter.limit("30/minute")
-async def public_order_tracking(order_id: str, request: Request, db: Session = Depends(get_db)):
+def public_order_tracking(order_id: str, request: Request, db: Session = Depends(get_db)):
     """Tracking público de un pedido web, sin autenticación (usado por /pedido/[id])."""
     try:
         oid = _uuid.UUID(order_id)
@@ -248,12 +254,15 @@ async def public_order_tracking(order_id: str, request: Request, db: Session = D
         raise HTTPException(status_code=404, detail="Pedido no encontrado")
     tenant = db.query(models.User).filter(models.User.id == order.tenant_id).first()
     shop_name = (tenant.full_name or tenant.shop_slug or "Tienda") if tenant else "Tienda"
+    variants, products = crud.load_variant_rows(db, [item.product_variant_id for item in order.items])
     items = []
     for item in order.items:
-        variant = db.query(models.ProductVariant).filter(models.ProductVariant.id == item.product_variant_id).first()
-        product = db.query(models.Product).filter(models.Product.id == variant.product_id).first() if variant else None
-        iname = (product.name if product else "Producto") + (f" — {variant.name}" if variant and variant.name else "")
-        items.append({"name": iname, "qty": item.quantity, "price": float(item.price_at_purchase)})
+        variant = variants.get(item.product_variant_id)
+        product = products.get(variant.product_id) if variant else None
+        items.append({
+            "name": crud.item_display_name(variant, product),
+            "qty": item.quantity, "price": float(item.price_at_purchase),
+        })
     return {
         "id":              str(order.id),
         "short_id":        str(order.id)[:8].upper(),
@@ -272,7 +281,7 @@ async def public_order_tracking(order_id: str, request: Request, db: Session = D
 
 @router.get("/public/shop-info/{slug}")
 @limiter.limit("60/minute")
-async def get_public_shop_info(request: Request, slug: str, db: Session = Depends(get_db)):
+def get_public_shop_info(request: Request, slug: str, db: Session = Depends(get_db)):
     tenant = db.query(models.User).filter(
         models.User.shop_slug == slug, models.User.status == "Activo",
     ).first()
@@ -291,32 +300,36 @@ async def get_public_shop_info(request: Request, slug: str, db: Session = Depend
 
 @router.get("/public/shop/{slug}/products")
 @limiter.limit("60/minute")
-async def get_public_shop_products(
+def get_public_shop_products(
     request: Request,
     slug: str,
     limit: int = Query(default=100, ge=1, le=500),
     skip: int = Query(default=0, ge=0),
     db: Session = Depends(get_db),
 ):
-    tenant = db.query(models.User).filter(
-        models.User.shop_slug == slug, models.User.status == "Activo",
-    ).first()
-    if not tenant:
+    tenant_id = active_tenant_id(db, slug)
+    if not tenant_id:
         raise HTTPException(status_code=404, detail="Tienda no encontrada")
-    products = (
-        db.query(models.Product)
-        .filter(models.Product.owner_id == tenant.id, models.Product.status == "active")
-        .offset(skip).limit(limit).all()
-    )
-    return [
-        {
-            "id": str(p.id),
-            "name": p.name,
-            "price": p.price,
-            "description": p.description,
-            "image_url": p.image_url or [],
-            "category": p.category,
-            "sku": p.sku,
-        }
-        for p in products
-    ]
+
+    def _load():
+        products = (
+            db.query(models.Product)
+            .filter(models.Product.owner_id == _uuid.UUID(tenant_id), models.Product.status == "active")
+            .offset(skip).limit(limit).all()
+        )
+        return _catalog_entry([
+            {
+                "id": str(p.id),
+                "name": p.name,
+                "price": p.price,
+                "description": p.description,
+                "image_url": p.image_url or [],
+                "category": p.category,
+                "sku": p.sku,
+            }
+            for p in products
+        ])
+
+    entry = _cache.catalog_cache.get_or_load(f"{tenant_id}:shop:{skip}:{limit}", _load)
+    # no-cache: el navegador siempre revalida, pero con If-None-Match recibe un 304 sin cuerpo
+    return _catalog_response(request, entry, "public, no-cache")
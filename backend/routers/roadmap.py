@@ -58,14 +58,14 @@ def get_roadmap_public(db: Session = Depends(get_db)):
 
 
 @router.get("/super-admin/roadmap")
-async def get_roadmap_admin(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_roadmap_admin(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     items = db.query(models.RoadmapItem).order_by(models.RoadmapItem.sort_order).all()
     return [_serialize(i, admin=True) for i in items]
 
 
 @router.post("/super-admin/roadmap")
-async def create_roadmap_item(request: Request, body: RoadmapItemIn, db: Session = Depends(get_db), user=Depends(current_user)):
+def create_roadmap_item(request: Request, body: RoadmapItemIn, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     data = {k: (v if v != "" else None) for k, v in body.model_dump().items()}
     item = models.RoadmapItem(id=_uuid.uuid4(), **data)
@@ -76,7 +76,7 @@ async def create_roadmap_item(request: Request, body: RoadmapItemIn, db: Session
 
 
 @router.put("/super-admin/roadmap/{item_id}")
-async def update_roadmap_item(item_id: str, request: Request, body: RoadmapItemIn, db: Session = Depends(get_db), user=Depends(current_user)):
+def update_roadmap_item(item_id: str, request: Request, body: RoadmapItemIn, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     item = db.query(models.RoadmapItem).filter(models.RoadmapItem.id == item_id).first()
     if not item:
@@ -88,7 +88,7 @@ async def update_roadmap_item(item_id: str, request: Request, body: RoadmapItemI
 
 
 @router.delete("/super-admin/roadmap/{item_id}")
-async def delete_roadmap_item(item_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def delete_roadmap_item(item_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     item = db.query(models.RoadmapItem).filter(models.RoadmapItem.id == item_id).first()
     if not item:
@@ -99,7 +99,7 @@ async def delete_roadmap_item(item_id: str, request: Request, db: Session = Depe
 
 
 @router.get("/super-admin/roadmap/{item_id}/voters")
-async def get_roadmap_voters(item_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_roadmap_voters(item_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     votes = db.query(models.RoadmapVote).filter(
         models.RoadmapVote.item_id == item_id
@@ -120,11 +120,11 @@ async def get_roadmap_voters(item_id: str, request: Request, db: Session = Depen
 
 @router.post("/public/roadmap/{item_id}/vote")
 @limiter.limit("5/minute")
-async def vote_roadmap_item(item_id: str, request: Request, body: RoadmapVoteIn, db: Session = Depends(get_db)):
+def vote_roadmap_item(item_id: str, request: Request, body: RoadmapVoteIn, db: Session = Depends(get_db)):
     user_id = None
     try:
         from deps import current_user as _cu
-        u = await _cu(request=request, db=db)
+        u = _cu(request=request, db=db)
         user_id = u.id
     except Exception:
         pass
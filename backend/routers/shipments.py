@@ -32,7 +32,7 @@ class ShipmentUpdatePayload(BaseModel):
 
 
 @router.get("")
-async def get_shipments(
+def get_shipments(
     request: Request,
     db: Session = Depends(get_db),
     user=Depends(current_user),
@@ -73,7 +73,7 @@ async def get_shipments(
 
 
 @router.put("/{shipment_id}")
-async def update_shipment(
+def update_shipment(
     shipment_id: str,
     payload: ShipmentUpdatePayload,
     request: Request,
@@ -130,13 +130,13 @@ async def update_shipment(
             shop_name = (tenant_u.full_name or tenant_u.shop_slug or "Tu tienda") if tenant_u else "Tu tienda"
             shop_logo = tenant_u.logo_url if tenant_u else None
             if payload.status == "entregado":
-                _eq.enqueue("send_order_status_update",
+                _eq.enqueue("send_order_status_update", db=db,
                     email=order.customer_email, name=order.customer_name or "Cliente",
                     order_id=str(order.id), new_status="completed",
                     shop_name=shop_name, shop_logo=shop_logo,
                 )
             elif payload.status in _NOTIFIABLE_SHIPMENT_STATUSES:
-                _eq.enqueue("send_shipment_status_update",
+                _eq.enqueue("send_shipment_status_update", db=db,
                     email=order.customer_email, name=order.customer_name or "Cliente",
                     order_id=str(order.id), new_status=payload.status,
                     shop_name=shop_name, shop_logo=shop_logo,
@@ -42,7 +42,7 @@ def _get_option(db: Session, option_id: str, tenant_id):
 
 
 @router.get("")
-async def get_options(response: Response, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_options(response: Response, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     # Cambia poco (el comerciante lo edita rara vez) — cache corto de navegador
     # evita repetir la consulta en cada visita a Checkout/Configuración de envíos.
     response.headers["Cache-Control"] = "private, max-age=60"
@@ -52,7 +52,7 @@ async def get_options(response: Response, request: Request, db: Session = Depend
 
 
 @router.post("")
-async def create_option(payload: ShippingOptionRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def create_option(payload: ShippingOptionRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     opt = models.ShippingOption(name=payload.name, cost=payload.cost, min_order_total=payload.min_order_total, owner_id=tenant_id_from(user))
     db.add(opt)
     db.commit()
@@ -60,12 +60,12 @@ async def create_option(payload: ShippingOptionRequest, request: Request, db: Se
 
 
 @router.get("/{option_id}")
-async def get_option(option_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_option(option_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     return _ser(_get_option(db, option_id, tenant_id_from(user)))
 
 
 @router.put("/{option_id}")
-async def update_option(option_id: str, payload: ShippingOptionRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def update_option(option_id: str, payload: ShippingOptionRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     opt = _get_option(db, option_id, tenant_id_from(user))
     opt.name = payload.name
     opt.cost = payload.cost
@@ -75,7 +75,7 @@ async def update_option(option_id: str, payload: ShippingOptionRequest, request:
 
 
 @router.delete("/{option_id}")
-async def delete_option(option_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def delete_option(option_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     opt = _get_option(db, option_id, tenant_id_from(user))
     db.delete(opt)
     db.commit()
@@ -4,6 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+import cache as _cache
 import models
 from database import get_db
 from deps import current_user, tenant_id_from, require_super_admin, resolve_target
@@ -11,6 +12,11 @@ from deps import current_user, tenant_id_from, require_super_admin, resolve_targ
 router = APIRouter(tags=["shop_pages"])
 
 
+def _invalidate_rendered(db: Session, tenant_id) -> None:
+    slug = db.query(models.User.shop_slug).filter(models.User.id == tenant_id).scalar()
+    _cache.invalidate_shop(slug)
+
+
 def _serialize(p) -> dict:
     return {
         "id": str(p.id),
@@ -37,7 +43,7 @@ class ShopPagePublishRequest(BaseModel):
 
 
 @router.get("/shop-pages/{page_key}")
-async def get_shop_page(page_key: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_shop_page(page_key: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     page = db.query(models.ShopPage).filter(
         models.ShopPage.tenant_id == tid,
@@ -49,7 +55,7 @@ async def get_shop_page(page_key: str, request: Request, db: Session = Depends(g
 
 
 @router.post("/shop-pages")
-async def save_shop_page(payload: ShopPageSaveRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def save_shop_page(payload: ShopPageSaveRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     effective = resolve_target(db, user, payload.target_user_id)
     tid = tenant_id_from(effective)
     page = db.query(models.ShopPage).filter(
@@ -81,11 +87,12 @@ async def save_shop_page(payload: ShopPageSaveRequest, request: Request, db: Ses
 
     db.commit()
     db.refresh(page)
+    _invalidate_rendered(db, tid)
     return _serialize(page)
 
 
 @router.post("/shop-pages/publish")
-async def publish_shop_page(payload: ShopPagePublishRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def publish_shop_page(payload: ShopPagePublishRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     effective = resolve_target(db, user, payload.target_user_id)
     tid = tenant_id_from(effective)
     page = db.query(models.ShopPage).filter(
@@ -105,11 +112,12 @@ async def publish_shop_page(payload: ShopPagePublishRequest, request: Request, d
         db.add(page)
     db.commit()
     db.refresh(page)
+    _invalidate_rendered(db, tid)
     return _serialize(page)
 
 
 @router.get("/public/stores/{store_id}/pages/{page_key}")
-async def get_public_shop_page(request: Request, response: Response, store_id: str, page_key: str, db: Session = Depends(get_db)):
+def get_public_shop_page(request: Request, response: Response, store_id: str, page_key: str, db: Session = Depends(get_db)):
     try:
         store_uuid = _uuid.UUID(store_id)
     except ValueError:
@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 
 import cache as _cache
 import models
+import static_assets
 from database import get_db
 from deps import current_user, require_super_admin
 
@@ -50,12 +51,13 @@ def _get_company(db: Session, company_id: str):
 
 
 def _pop_shop_cache(slug: str | None):
-    if slug:
-        _cache.shop_cache.pop(slug, None)
+    _cache.invalidate_shop(slug)
 
 
 def _clear_templates_cache():
     _cache.templates_cache.clear()
+    # Una plantilla puede estar publicada por muchas tiendas: se descartan todos los renders
+    _cache.render_cache.clear()
 
 
 def _cache_get(key: str):
@@ -101,41 +103,16 @@ def _serialize_plan(p) -> dict:
 # ── Stats ─────────────────────────────────────────────────────────────────
 
 @router.get("/stats")
-async def get_stats(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_stats(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
-    companies_q = db.query(models.User).filter(
-        models.User.role == "admin_tienda",
-        models.User.owner_id.is_(None),
-    )
-    total_companies = companies_q.count()
-    active_companies = companies_q.filter(models.User.status.in_(["Activo", "active"])).count()
-    total_users = db.query(models.User).count()
-    total_orders = db.query(models.Order).count()
-    total_revenue = db.query(func.coalesce(func.sum(models.Order.total_price), 0.0)).scalar() or 0.0
-    total_commission = db.query(func.coalesce(func.sum(models.Order.commission_amount), 0.0)).scalar() or 0.0
-
-    now = datetime.now(timezone.utc)
-    today_start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
-    month_start = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
-
-    commission_today = db.query(func.coalesce(func.sum(models.Order.commission_amount), 0.0)).filter(models.Order.created_at >= today_start).scalar() or 0.0
-    commission_month = db.query(func.coalesce(func.sum(models.Order.commission_amount), 0.0)).filter(models.Order.created_at >= month_start).scalar() or 0.0
-    revenue_today = db.query(func.coalesce(func.sum(models.Order.total_price), 0.0)).filter(models.Order.created_at >= today_start).scalar() or 0.0
-    revenue_month = db.query(func.coalesce(func.sum(models.Order.total_price), 0.0)).filter(models.Order.created_at >= month_start).scalar() or 0.0
-
-    return {
-        "total_companies": total_companies, "active_companies": active_companies,
-        "total_users": total_users, "total_orders": total_orders,
-        "total_revenue": total_revenue, "total_commission": total_commission,
-        "commission_today": commission_today, "commission_month": commission_month,
-        "revenue_today": revenue_today, "revenue_month": revenue_month,
-    }
+    import platform_kpis
+    return platform_kpis.get_kpis(db)
 
 
 # ── Companies ─────────────────────────────────────────────────────────────
 
 @router.get("/companies")
-async def get_companies(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_companies(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     order_stats = (
         db.query(
@@ -180,7 +157,7 @@ async def get_companies(request: Request, db: Session = Depends(get_db), user=De
 
 
 @router.post("/impersonate/{company_id}")
-async def impersonate_company(company_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def impersonate_company(company_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     """Genera un token de acceso para una empresa específica (solo super admin)."""
     require_super_admin(user)
     import security as sec_mod
@@ -221,7 +198,7 @@ async def impersonate_company(company_id: str, request: Request, db: Session = D
 
 
 @router.put("/companies/{company_id}/suspend")
-async def toggle_suspend_company(company_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def toggle_suspend_company(company_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     company = _get_company(db, company_id)
     company.status = "Activo" if company.status == "Suspendido" else "Suspendido"
@@ -231,7 +208,7 @@ async def toggle_suspend_company(company_id: str, request: Request, db: Session
 
 
 @router.delete("/companies/{company_id}/pages")
-async def delete_company_pages(company_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def delete_company_pages(company_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     company = _get_company(db, company_id)
     uid = company.id
@@ -243,10 +220,11 @@ async def delete_company_pages(company_id: str, request: Request, db: Session =
 
 
 @router.delete("/companies/{company_id}")
-async def delete_company_permanently(company_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def delete_company_permanently(company_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     company = _get_company(db, company_id)
     target_uuid = company.id
+    target_slug = company.shop_slug
     try:
         sub_users = db.query(models.User.id, models.User.email).filter(models.User.owner_id == target_uuid).all()
         sub_user_ids = [u.id for u in sub_users]
@@ -271,6 +249,9 @@ async def delete_company_permanently(company_id: str, request: Request, db: Sess
         )
         db.query(models.PayrollEmployee).filter(models.PayrollEmployee.tenant_id == target_uuid).delete(synchronize_session=False)
         db.query(models.Order).filter(models.Order.tenant_id == target_uuid).delete(synchronize_session=False)
+        # El borrado masivo no pasa por los listeners de tenant_revenue / tenant_ledger
+        db.query(models.TenantDailyRevenue).filter(models.TenantDailyRevenue.tenant_id == target_uuid).delete(synchronize_session=False)
+        db.query(models.TenantLedger).filter(models.TenantLedger.tenant_id == target_uuid).delete(synchronize_session=False)
         db.query(models.Product).filter(models.Product.owner_id == target_uuid).delete(synchronize_session=False)
         db.query(models.AIAssistant).filter(models.AIAssistant.owner_id == target_uuid).delete(synchronize_session=False)
         db.query(models.Shipment).filter(models.Shipment.tenant_id == target_uuid).delete(synchronize_session=False)
@@ -295,6 +276,10 @@ async def delete_company_permanently(company_id: str, request: Request, db: Sess
         db.query(models.User).filter(models.User.owner_id == target_uuid).delete(synchronize_session=False)
         db.query(models.User).filter(models.User.id == target_uuid).delete(synchronize_session=False)
         db.commit()
+        _cache.invalidate_catalog(target_uuid)
+        _pop_shop_cache(target_slug)
+        # Los borrados masivos no disparan los eventos del ORM
+        _cache.invalidate_principal(*emails_to_purge)
 
         if emails_to_purge:
             from sqlalchemy import text as _text
@@ -313,7 +298,7 @@ async def delete_company_permanently(company_id: str, request: Request, db: Sess
 # ── Registrations ─────────────────────────────────────────────────────────
 
 @router.get("/registrations")
-async def get_registrations(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_registrations(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     rows = db.query(models.User).filter(
         models.User.role == "admin_tienda",
@@ -334,7 +319,7 @@ class RegistrationNotesRequest(BaseModel):
 
 
 @router.put("/registrations/{user_id}/notes")
-async def update_registration_notes(user_id: str, payload: RegistrationNotesRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def update_registration_notes(user_id: str, payload: RegistrationNotesRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     uid = _get_uuid(user_id, "user_id")
     target = db.query(models.User).filter(models.User.id == uid).first()
@@ -346,7 +331,7 @@ async def update_registration_notes(user_id: str, payload: RegistrationNotesRequ
 
 
 @router.put("/registrations/{user_id}/approve")
-async def approve_registration(user_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def approve_registration(user_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     uid = _get_uuid(user_id, "user_id")
     target = db.query(models.User).filter(models.User.id == uid).first()
@@ -359,138 +344,129 @@ async def approve_registration(user_id: str, request: Request, db: Session = Dep
 
 # ── Treasury ──────────────────────────────────────────────────────────────
 
+def _tenant_info(db, tenant_ids) -> dict:
+    """{tenant_id: (nombre, categoría, plan)} de las tiendas raíz indicadas,
+    con el plan en el mismo JOIN."""
+    if not tenant_ids:
+        return {}
+    rows = (
+        db.query(models.User.id, models.User.full_name, models.User.category, models.Plan.name)
+        .outerjoin(models.Plan, models.Plan.id == models.User.plan_id)
+        .filter(
+            models.User.id.in_(list(tenant_ids)),
+            models.User.role == "admin_tienda",
+            models.User.owner_id.is_(None),
+        )
+        .all()
+    )
+    return {r[0]: (r[1], r[2], r[3]) for r in rows}
+
+
 @router.get("/treasury")
-async def get_treasury(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_treasury(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
-    cutoff = datetime.now(timezone.utc) - timedelta(days=365)
-    # Solo se traen las columnas usadas en las agregaciones de abajo — evita
-    # hidratar el ORM completo (con relaciones) de hasta 365 dias de pedidos
-    # de todos los tenants.
-    orders = (
-        db.query(
-            models.Order.id, models.Order.created_at, models.Order.total_price,
-            models.Order.commission_amount, models.Order.tenant_id,
-        )
+    import tenant_revenue
+    cutoff = datetime.utcnow() - timedelta(days=365)
+    # Meses y tiendas salen de tenant_daily_revenue (días × tenants), no de
+    # los pedidos del año; orders sólo se lee en el borde del día de corte.
+    by_month = tenant_revenue.totals(db, cutoff, by="month")
+    monthly = []
+    for (y, m) in _last_n_months(12):
+        rev, com, n = by_month.get((y, m), (0.0, 0.0, 0))
+        monthly.append({"month": _MONTH_LABELS[m - 1], "rev": rev, "com": com, "orders": n})
+
+    per_tenant = tenant_revenue.totals(db, cutoff)
+    per_tenant.pop(None, None)  # el ranking es de tiendas; los meses sí cuentan pedidos sin tenant
+    total_rev_all = sum(e[0] for e in per_tenant.values()) or 1.0
+    top = sorted(per_tenant.items(), key=lambda kv: kv[1][0], reverse=True)[:10]
+
+    recent = (
+        db.query(models.Order.id, models.Order.total_price, models.Order.created_at, models.Order.tenant_id)
         .filter(models.Order.created_at >= cutoff)
         .order_by(models.Order.created_at.desc())
+        .limit(10)
         .all()
     )
-    tenants = {t.id: t for t in db.query(models.User).filter(models.User.role == "admin_tienda", models.User.owner_id.is_(None)).all()}
-
-    months = _last_n_months(12)
-    buckets = {ym: {"rev": 0.0, "com": 0.0, "orders": 0} for ym in months}
-    for o in orders:
-        if not o.created_at:
-            continue
-        ym = (o.created_at.year, o.created_at.month)
-        if ym in buckets:
-            buckets[ym]["rev"] += o.total_price or 0.0
-            buckets[ym]["com"] += o.commission_amount or 0.0
-            buckets[ym]["orders"] += 1
-    monthly = [
-        {"month": _MONTH_LABELS[m - 1], "rev": buckets[(y, m)]["rev"], "com": buckets[(y, m)]["com"], "orders": buckets[(y, m)]["orders"]}
-        for (y, m) in months
-    ]
+    info = _tenant_info(db, {tid for tid, _ in top} | {o.tenant_id for o in recent if o.tenant_id})
 
-    per_tenant: dict = {}
-    for o in orders:
-        if not o.tenant_id:
-            continue
-        entry = per_tenant.setdefault(o.tenant_id, {"rev": 0.0, "orders": 0})
-        entry["rev"] += o.total_price or 0.0
-        entry["orders"] += 1
-    total_rev_all = sum(e["rev"] for e in per_tenant.values()) or 1.0
     companies_ranking = []
-    for tid, e in per_tenant.items():
-        t = tenants.get(tid)
+    for tid, (rev, _com, n) in top:
+        name, _category, plan = info.get(tid, ("Tienda eliminada", None, None))
         companies_ranking.append({
-            "name": t.full_name if t else "Tienda eliminada",
-            "rev": e["rev"], "orders": e["orders"],
-            "plan": t.plan.name if (t and t.plan) else "Básico",
-            "pct": round((e["rev"] / total_rev_all) * 100),
-        })
-    companies_ranking.sort(key=lambda c: c["rev"], reverse=True)
-
-    transactions = []
-    for o in orders[:10]:
-        t = tenants.get(o.tenant_id)
-        transactions.append({
-            "id": f"TXN-{str(o.id)[:8].upper()}",
-            "company": t.full_name if t else "Tienda eliminada",
-            "amount": o.total_price or 0.0,
-            "date": o.created_at.isoformat() if o.created_at else None,
+            "name": name, "rev": rev, "orders": n, "plan": plan or "Básico",
+            "pct": round((rev / total_rev_all) * 100),
         })
 
-    return {"monthly": monthly, "companies": companies_ranking[:10], "transactions": transactions}
+    transactions = [{
+        "id": f"TXN-{str(o.id)[:8].upper()}",
+        "company": info[o.tenant_id][0] if o.tenant_id in info else "Tienda eliminada",
+        "amount": o.total_price or 0.0,
+        "date": o.created_at.isoformat() if o.created_at else None,
+    } for o in recent]
+
+    return {"monthly": monthly, "companies": companies_ranking, "transactions": transactions}
 
 
 # ── Reports ───────────────────────────────────────────────────────────────
 
 @router.get("/reports")
-async def get_reports(request: Request, period: str = "mes", db: Session = Depends(get_db), user=Depends(current_user)):
+def get_reports(request: Request, period: str = "mes", db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
-    now = datetime.now(timezone.utc)
+    import tenant_revenue
+    now = datetime.utcnow()
     span_days = {"dia": 1, "semana": 7, "mes": 30, "año": 365}.get(period, 30)
     start = now - timedelta(days=span_days)
     prev_start = now - timedelta(days=span_days * 2)
 
-    # Igual que en /treasury: solo se traen las columnas que realmente se
-    # usan en las agregaciones de este endpoint, no el ORM completo.
-    order_cols = (
-        models.Order.id, models.Order.created_at, models.Order.total_price,
-        models.Order.commission_amount, models.Order.tenant_id, models.Order.customer_email,
-    )
-    orders = db.query(*order_cols).filter(models.Order.created_at >= start).all()
-    prev_orders = db.query(models.Order.total_price).filter(models.Order.created_at >= prev_start, models.Order.created_at < start).all()
-    tenants = {t.id: t for t in db.query(models.User).filter(models.User.role == "admin_tienda", models.User.owner_id.is_(None)).all()}
-
-    rev = sum(o.total_price or 0.0 for o in orders)
-    com = sum(o.commission_amount or 0.0 for o in orders)
-    prev_rev = sum(o.total_price or 0.0 for o in prev_orders)
+    # Totales por tienda desde tenant_daily_revenue; lo demás, agregado en SQL
+    per_tenant = tenant_revenue.totals(db, start)
+    prev_rev = sum(e[0] for e in tenant_revenue.totals(db, prev_start, start).values())
+    rev = sum(e[0] for e in per_tenant.values())
+    com = sum(e[1] for e in per_tenant.values())
+    order_count = sum(e[2] for e in per_tenant.values())
     delta = round(((rev - prev_rev) / prev_rev) * 100) if prev_rev else 0
 
     new_companies = db.query(models.User).filter(
         models.User.role == "admin_tienda", models.User.owner_id.is_(None), models.User.created_at >= start,
     ).count()
-    new_users = len({o.customer_email for o in orders if o.customer_email})
-
-    per_tenant: dict = {}
-    for o in orders:
-        if not o.tenant_id:
-            continue
-        per_tenant[o.tenant_id] = per_tenant.get(o.tenant_id, 0.0) + (o.total_price or 0.0)
-    total_rev = sum(per_tenant.values()) or 1.0
+    new_users = db.query(func.count(func.distinct(models.Order.customer_email))).filter(
+        models.Order.created_at >= start, models.Order.customer_email.isnot(None), models.Order.customer_email != "",
+    ).scalar() or 0
+
+    # KPIs y sectores cuentan los pedidos sin tenant (sector "Otros"); el
+    # top de tiendas y su porcentaje, sólo los de tiendas
+    info = _tenant_info(db, [tid for tid in per_tenant if tid is not None])
+    total_rev = sum(e[0] for tid, e in per_tenant.items() if tid is not None) or 1.0
     top = []
-    for tid, tenant_rev in per_tenant.items():
-        t = tenants.get(tid)
-        top.append({"name": t.full_name if t else "Tienda eliminada", "rev": tenant_rev, "pct": round((tenant_rev / total_rev) * 100), "plan": t.plan.name if (t and t.plan) else "Básico"})
+    per_sector: dict = {}
+    for tid, (tenant_rev, _com, _n) in per_tenant.items():
+        name, category, plan = info.get(tid, ("Tienda eliminada", None, None))
+        if tid is not None:
+            top.append({"name": name, "rev": tenant_rev, "pct": round((tenant_rev / total_rev) * 100), "plan": plan or "Básico"})
+        sector = category or "Otros"
+        per_sector[sector] = per_sector.get(sector, 0.0) + tenant_rev
     top.sort(key=lambda c: c["rev"], reverse=True)
     top = top[:6]
-
-    per_sector: dict = {}
-    for o in orders:
-        t = tenants.get(o.tenant_id)
-        sector = t.category if t and t.category else "Otros"
-        per_sector[sector] = per_sector.get(sector, 0.0) + (o.total_price or 0.0)
     sectors = [
         {"label": label, "pct": round((sector_rev / total_rev) * 100), "color": _SECTOR_COLORS[i % len(_SECTOR_COLORS)]}
         for i, (label, sector_rev) in enumerate(sorted(per_sector.items(), key=lambda x: x[1], reverse=True))
     ]
 
+    hour = func.extract("hour", models.Order.created_at)
     hour_counts = [0] * 24
-    for o in orders:
-        if o.created_at:
-            hour_counts[o.created_at.hour] += 1
+    for h, c in db.query(hour, func.count()).filter(models.Order.created_at >= start).group_by(hour).all():
+        if h is not None:
+            hour_counts[int(h)] = c
     max_hour = max(hour_counts) or 1
     activity = [{"h": h, "v": round(c / max_hour, 3)} for h, c in enumerate(hour_counts)]
 
-    return {"kpis": {"rev": rev, "com": com, "orders": len(orders), "users": new_users, "companies": new_companies, "delta": delta}, "top": top, "sectors": sectors, "activity": activity}
+    return {"kpis": {"rev": rev, "com": com, "orders": order_count, "users": new_users, "companies": new_companies, "delta": delta}, "top": top, "sectors": sectors, "activity": activity}
 
 
 # ── Users ─────────────────────────────────────────────────────────────────
 
 @router.get("/users")
-async def get_users(
+def get_users(
     request: Request,
     skip: int = Query(default=0, ge=0),
     limit: int = Query(default=100, ge=1, le=200),
@@ -527,14 +503,14 @@ async def get_users(
 # ── Web Templates ─────────────────────────────────────────────────────────
 
 @router.get("/web-templates")
-async def get_web_templates_admin(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_web_templates_admin(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     templates = db.query(models.WebTemplate).order_by(models.WebTemplate.created_at.desc()).all()
     return [_serialize_template(t) for t in templates]
 
 
 @router.post("/web-templates")
-async def create_web_template(payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def create_web_template(payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     name = (payload.get("name") or "").strip()
     if not name:
@@ -561,7 +537,7 @@ async def create_web_template(payload: dict, request: Request, db: Session = Dep
 
 
 @router.get("/web-templates/{template_id}")
-async def get_web_template(template_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_web_template(template_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     uid = _get_uuid(template_id, "template_id")
     template = db.query(models.WebTemplate).filter(models.WebTemplate.id == uid).first()
@@ -571,7 +547,7 @@ async def get_web_template(template_id: str, request: Request, db: Session = Dep
 
 
 @router.put("/web-templates/{template_id}")
-async def update_web_template(template_id: str, payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def update_web_template(template_id: str, payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     uid = _get_uuid(template_id, "template_id")
     template = db.query(models.WebTemplate).filter(models.WebTemplate.id == uid).first()
@@ -608,7 +584,7 @@ async def update_web_template(template_id: str, payload: dict, request: Request,
 
 
 @router.post("/web-templates/{template_id}/preview-token")
-async def generate_preview_token(template_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def generate_preview_token(template_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     uid = _get_uuid(template_id, "template_id")
     template = db.query(models.WebTemplate).filter(models.WebTemplate.id == uid).first()
@@ -619,7 +595,7 @@ async def generate_preview_token(template_id: str, request: Request, db: Session
 
 
 @router.get("/web-templates/{template_id}/live-preview/{page_key}", response_class=HTMLResponse)
-async def live_preview_template(
+def live_preview_template(
     template_id: str,
     page_key: str,
     request: Request,
@@ -634,7 +610,7 @@ async def live_preview_template(
         require_super_admin(user)
     else:
         from deps import current_user as _cu
-        user = await _cu(request=request, db=db)
+        user = _cu(request=request, db=db)
         require_super_admin(user)
 
     uid = _get_uuid(template_id, "template_id")
@@ -646,11 +622,7 @@ async def live_preview_template(
     if not html:
         raise HTTPException(status_code=404, detail=f"Página '{page_key}' no encontrada")
     base_url = str(request.base_url).rstrip("/")
-    tok = preview_token or ""
-    preview_sdk = _cache.BAYUP_PREVIEW_SDK \
-        .replace("__TPLID__", template_id) \
-        .replace("__TOK__", tok) \
-        .replace("__BASE__", base_url)
+    preview_sdk = static_assets.preview_script_tag(base_url, template_id, token=preview_token or "")
     if "</head>" in html:
         html = html.replace("</head>", preview_sdk + "</head>", 1)
     else:
@@ -671,7 +643,7 @@ async def live_preview_template(
 
 
 @router.put("/web-templates/{template_id}/toggle")
-async def toggle_web_template(template_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def toggle_web_template(template_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     uid = _get_uuid(template_id, "template_id")
     template = db.query(models.WebTemplate).filter(models.WebTemplate.id == uid).first()
@@ -684,7 +656,7 @@ async def toggle_web_template(template_id: str, request: Request, db: Session =
 
 
 @router.delete("/web-templates/{template_id}")
-async def delete_web_template(template_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def delete_web_template(template_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     uid = _get_uuid(template_id, "template_id")
     template = db.query(models.WebTemplate).filter(models.WebTemplate.id == uid).first()
@@ -697,7 +669,7 @@ async def delete_web_template(template_id: str, request: Request, db: Session =
 
 
 @router.get("/web-templates/{template_id}/preview/{page_key}", response_class=HTMLResponse)
-async def preview_template_html(template_id: str, page_key: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def preview_template_html(template_id: str, page_key: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     uid = _get_uuid(template_id, "template_id")
     template = db.query(models.WebTemplate).filter(models.WebTemplate.id == uid).first()
@@ -713,7 +685,7 @@ async def preview_template_html(template_id: str, page_key: str, request: Reques
 # ── Plans ─────────────────────────────────────────────────────────────────
 
 @router.get("/plans")
-async def get_plans(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_plans(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     plans = db.query(models.Plan).order_by(models.Plan.monthly_fee.asc()).all()
     return [_serialize_plan(p) for p in plans]
@@ -729,7 +701,7 @@ class PlanUpdateRequest(BaseModel):
 
 
 @router.put("/plans/{plan_id}")
-async def update_plan(plan_id: str, payload: PlanUpdateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def update_plan(plan_id: str, payload: PlanUpdateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     uid = _get_uuid(plan_id, "plan_id")
     plan = db.query(models.Plan).filter(models.Plan.id == uid).first()
@@ -742,3 +714,60 @@ async def update_plan(plan_id: str, payload: PlanUpdateRequest, request: Request
         setattr(plan, key, value)
     db.commit()
     return _serialize_plan(plan)
+
+
+# ── Observability ─────────────────────────────────────────────────────────
+
+@router.get("/observability/cache")
+def get_cache_stats(request: Request, user=Depends(current_user)):
+    require_super_admin(user)
+    return {"caches": _cache.cache_stats()}
+
+
+@router.get("/observability/order-outbox")
+def get_order_outbox_stats(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+    require_super_admin(user)
+    import order_outbox
+    return order_outbox.stats(db)
+
+
+@router.get("/observability/stock-reservations")
+def get_stock_reservation_stats(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+    require_super_admin(user)
+    import stock_reservations
+    return stock_reservations.stats(db)
+
+
+@router.get("/observability/webhook-inbox")
+def get_webhook_inbox_stats(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+    require_super_admin(user)
+    import webhook_inbox
+    return webhook_inbox.stats(db)
+
+
+@router.get("/observability/email-queue")
+def get_email_queue_stats(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+    require_super_admin(user)
+    import email_queue
+    return email_queue.stats(db)
+
+
+@router.get("/observability/analytics-ingest")
+def get_analytics_ingest_stats(request: Request, user=Depends(current_user)):
+    require_super_admin(user)
+    import analytics_ingest
+    return analytics_ingest.stats()
+
+
+@router.get("/observability/platform-kpis")
+def get_platform_kpi_stats(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+    require_super_admin(user)
+    import platform_kpis
+    return platform_kpis.stats(db)
+
+
+@router.get("/observability/liquidation-closes")
+def get_liquidation_close_stats(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+    require_super_admin(user)
+    import liquidation_close
+    return liquidation_close.stats(db)
@@ -35,7 +35,7 @@ def _find_ticket(db: Session, short_id: str):
 # ── Super-admin ───────────────────────────────────────────────────────────
 
 @router.get("/super-admin/support/tickets")
-async def get_super_admin_tickets(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_super_admin_tickets(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     tickets = db.query(models.SupportTicket).order_by(models.SupportTicket.created_at.desc()).all()
     tenants = {t.id: t for t in db.query(models.User).all()}
@@ -43,7 +43,7 @@ async def get_super_admin_tickets(request: Request, db: Session = Depends(get_db
 
 
 @router.post("/super-admin/support/tickets/{ticket_id}/reply")
-async def reply_super_admin_ticket(ticket_id: str, payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def reply_super_admin_ticket(ticket_id: str, payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     ticket = _find_ticket(db, ticket_id)
     if not ticket:
@@ -63,7 +63,7 @@ async def reply_super_admin_ticket(ticket_id: str, payload: dict, request: Reque
 
 
 @router.post("/super-admin/support/tickets/{ticket_id}/resolve")
-async def resolve_super_admin_ticket(ticket_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def resolve_super_admin_ticket(ticket_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     require_super_admin(user)
     ticket = _find_ticket(db, ticket_id)
     if not ticket:
@@ -77,7 +77,7 @@ async def resolve_super_admin_ticket(ticket_id: str, request: Request, db: Sessi
 # ── Tenant ────────────────────────────────────────────────────────────────
 
 @router.post("/support/tickets")
-async def create_ticket(payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def create_ticket(payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     title = (payload.get("title") or "").strip()
     if not title:
@@ -102,7 +102,7 @@ async def create_ticket(payload: dict, request: Request, db: Session = Depends(g
 
 
 @router.get("/support/tickets")
-async def get_my_tickets(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_my_tickets(request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     tickets = db.query(models.SupportTicket).filter(
         models.SupportTicket.tenant_id == tid
@@ -112,7 +112,7 @@ async def get_my_tickets(request: Request, db: Session = Depends(get_db), user=D
 
 
 @router.post("/support/tickets/{ticket_id}/reply")
-async def reply_my_ticket(ticket_id: str, payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def reply_my_ticket(ticket_id: str, payload: dict, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     ticket = _find_ticket(db, ticket_id)
     if not ticket or ticket.tenant_id != tid:
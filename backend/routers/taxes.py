@@ -42,7 +42,7 @@ def _get_rate(db: Session, tax_id: str, tenant_id):
 
 
 @router.get("")
-async def get_rates(response: Response, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_rates(response: Response, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     # Cambia poco (el comerciante lo edita rara vez) — cache corto de navegador
     # evita repetir la consulta en cada visita a Checkout/Configuración de impuestos.
     response.headers["Cache-Control"] = "private, max-age=60"
@@ -50,7 +50,7 @@ async def get_rates(response: Response, request: Request, db: Session = Depends(
 
 
 @router.post("")
-async def create_rate(payload: TaxRateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def create_rate(payload: TaxRateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     if payload.is_default:
         db.query(models.TaxRate).filter(models.TaxRate.owner_id == tid).update({models.TaxRate.is_default: False})
@@ -61,12 +61,12 @@ async def create_rate(payload: TaxRateRequest, request: Request, db: Session = D
 
 
 @router.get("/{tax_id}")
-async def get_rate(tax_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_rate(tax_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     return _ser(_get_rate(db, tax_id, tenant_id_from(user)))
 
 
 @router.put("/{tax_id}")
-async def update_rate(tax_id: str, payload: TaxRateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def update_rate(tax_id: str, payload: TaxRateRequest, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     tid = tenant_id_from(user)
     rate = _get_rate(db, tax_id, tid)
     if payload.is_default:
@@ -82,7 +82,7 @@ async def update_rate(tax_id: str, payload: TaxRateRequest, request: Request, db
 
 
 @router.delete("/{tax_id}")
-async def delete_rate(tax_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def delete_rate(tax_id: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     rate = _get_rate(db, tax_id, tenant_id_from(user))
     db.delete(rate)
     db.commit()
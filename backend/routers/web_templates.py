@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 
 import cache as _cache
 import models
+import static_assets
 from database import get_db
 from deps import current_user
 
@@ -32,7 +33,7 @@ def _serialize_template(t, include_html: bool = False) -> dict:
 
 
 @router.get("/web-templates")
-async def get_web_templates(request: Request, response: Response, db: Session = Depends(get_db), user=Depends(current_user)):
+def get_web_templates(request: Request, response: Response, db: Session = Depends(get_db), user=Depends(current_user)):
     cached = _cache.cache_get(_cache.templates_cache, "list")
     if cached is not None:
         response.headers["Cache-Control"] = "private, max-age=300"
@@ -45,7 +46,7 @@ async def get_web_templates(request: Request, response: Response, db: Session =
 
 
 @router.get("/web-templates/{template_id}/preview/{page_key}", response_class=HTMLResponse)
-async def public_preview_template(template_id: str, page_key: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
+def public_preview_template(template_id: str, page_key: str, request: Request, db: Session = Depends(get_db), user=Depends(current_user)):
     try:
         uid = _uuid.UUID(template_id)
     except ValueError:
@@ -61,14 +62,7 @@ async def public_preview_template(template_id: str, page_key: str, request: Requ
     if not html:
         raise HTTPException(status_code=404, detail=f"Página '{page_key}' no encontrada")
     base_url = str(request.base_url).rstrip("/")
-    preview_sdk = _cache.BAYUP_PREVIEW_SDK \
-        .replace("__TPLID__", template_id) \
-        .replace("__TOK__", "") \
-        .replace("__BASE__", base_url) \
-        .replace("/super-admin/web-templates/", "/web-templates/") \
-        .replace("/live-preview/", "/preview/") \
-        .replace("+'?token='+encodeURIComponent(TOK)", "") \
-        .replace("if(extra)u+='&'+extra", "if(extra)u+=(u.indexOf('?')>=0?'&':'?')+extra")
+    preview_sdk = static_assets.preview_script_tag(base_url, template_id, mode="public")
     if "</head>" in html:
         html = html.replace("</head>", preview_sdk + "</head>", 1)
     else:
@@ -90,6 +90,8 @@ class ProductVariantCreate(ProductVariantBase):
 class ProductVariant(ProductVariantBase):
     id: uuid.UUID
     product_id: uuid.UUID
+    reserved_stock: Optional[int] = 0  # apartado por pagos pendientes
+    available_stock: int = 0           # stock - reserved_stock
     model_config = ConfigDict(from_attributes=True)
 
 class ProductBase(BaseModel):
@@ -0,0 +1,169 @@
+"""
+Benchmark: resumen de analítica de 90 días, agregado en Python vs en SQL.
+
+Siembra un tenant con BENCH_PAGEVIEWS pageviews (por defecto 500k) repartidas
+en 90 días y mide latencia y pico de memoria (tracemalloc) de:
+  - legacy: .all() de sesiones/pageviews/búsquedas + bucles en Python
+  - sql:    analytics_rollup.aggregate_raw (COUNT/SUM/GROUP BY/LIMIT en la DB)
+Ambos caminos deben producir el mismo resumen; el script lo verifica.
+
+Por defecto usa un SQLite temporal. Para medir contra PostgreSQL:
+    BENCH_DATABASE_URL=postgresql://... python scripts/bench_analytics_summary.py
+
+Uso:
+    SECRET_KEY=x BENCH_PAGEVIEWS=500000 python scripts/bench_analytics_summary.py
+"""
+import datetime as _dt
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import analytics_rollup
+import models
+
+PAGEVIEWS = int(os.getenv("BENCH_PAGEVIEWS", "500000"))
+PAGES_PER_SESSION = 4
+SEARCHES = PAGEVIEWS // 20
+DAYS = 90
+RUNS = int(os.getenv("BENCH_RUNS", "3"))
+_CHUNK = 10000
+
+
+def _engine():
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        path = os.path.join(tempfile.mkdtemp(prefix="bayup-bench-"), "analytics.db")
+        url = f"sqlite:///{path}"
+    return create_engine(url)
+
+
+def _seed(db, tenant_id) -> None:
+    rnd = random.Random(7)
+    now = _dt.datetime.utcnow()
+    sources = ["direct", "search", "social", "referral", None]
+    devices = ["mobile", "desktop", "tablet"]
+    paths = [f"/shop/x?view=product&id={i}" for i in range(400)] + ["/shop/x", None]
+    terms = [f"termino-{i}" for i in range(300)]
+    visitors = [uuid.uuid4() for _ in range(PAGEVIEWS // 10)]
+
+    sessions, pageviews = [], []
+    for _ in range(PAGEVIEWS // PAGES_PER_SESSION):
+        started = now - _dt.timedelta(seconds=rnd.randint(0, DAYS * 86400 - 60))
+        sid = uuid.uuid4()
+        n = rnd.randint(1, PAGES_PER_SESSION * 2 - 1)
+        sessions.append({
+            "id": sid, "tenant_id": tenant_id, "visitor_id": rnd.choice(visitors),
+            "is_new_visitor": rnd.random() < 0.3, "source": rnd.choice(sources),
+            "device_type": rnd.choice(devices), "entry_path": "/shop/x", "pageview_count": n,
+            "duration_seconds": rnd.randint(5, 900) if rnd.random() < 0.8 else None,
+            "started_at": started, "updated_at": started,
+        })
+        for i in range(n):
+            pageviews.append({
+                "tenant_id": tenant_id, "session_id": sid, "path": rnd.choice(paths),
+                "created_at": started + _dt.timedelta(seconds=i * 20),
+            })
+    pageviews = pageviews[:PAGEVIEWS]
+    searches = [{
+        "tenant_id": tenant_id, "session_id": None, "term": rnd.choice(terms),
+        "results_count": rnd.randint(0, 20),
+        "created_at": now - _dt.timedelta(seconds=rnd.randint(0, DAYS * 86400 - 60)),
+    } for _ in range(SEARCHES)]
+
+    for model, rows in ((models.AnalyticsSession, sessions), (models.AnalyticsPageview, pageviews),
+                        (models.AnalyticsSearch, searches)):
+        for i in range(0, len(rows), _CHUNK):
+            db.bulk_insert_mappings(model, rows[i:i + _CHUNK])
+        db.commit()
+    print(f"sembrado: {len(sessions)} sesiones, {len(pageviews)} pageviews, {len(searches)} búsquedas")
+
+
+def _legacy(db, tenant_id, since) -> dict:
+    """Implementación anterior: filas ORM completas y conteo en Python."""
+    agg = analytics_rollup.empty_aggregate()
+    for s in db.query(models.AnalyticsSession).filter(
+        models.AnalyticsSession.tenant_id == tenant_id, models.AnalyticsSession.started_at >= since,
+    ).all():
+        agg["sessions"] += 1
+        agg["new_sessions"] += 1 if s.is_new_visitor else 0
+        agg["bounced"] += 1 if (s.pageview_count or 0) <= 1 else 0
+        if s.duration_seconds is not None:
+            agg["duration_sum"] += s.duration_seconds
+            agg["duration_count"] += 1
+        agg["session_pageviews"] += s.pageview_count or 0
+        analytics_rollup._bump(agg["source"], s.source or "direct", 1, s.started_at)
+        analytics_rollup._bump(agg["device"], s.device_type or "desktop", 1, s.started_at)
+        day = s.started_at.strftime("%Y-%m-%d")
+        agg["by_day"][day] = agg["by_day"].get(day, 0) + 1
+    for pv in db.query(models.AnalyticsPageview).filter(
+        models.AnalyticsPageview.tenant_id == tenant_id, models.AnalyticsPageview.created_at >= since,
+    ).all():
+        agg["pageviews"] += 1
+        analytics_rollup._bump(agg["path"], pv.path or "/", 1, pv.created_at)
+    for sr in db.query(models.AnalyticsSearch).filter(
+        models.AnalyticsSearch.tenant_id == tenant_id, models.AnalyticsSearch.created_at >= since,
+    ).all():
+        if sr.term:
+            analytics_rollup._bump(agg["search"], sr.term, 1, sr.created_at)
+    return agg
+
+
+def _view(agg: dict) -> dict:
+    """Lo que ve el dashboard: totales + rankings top 10."""
+    def ranked(bucket, top=None):
+        items = sorted(bucket.items(), key=lambda kv: (-kv[1][0], kv[1][1] or _dt.datetime.max))
+        return [(k, c) for k, (c, _) in items[:top]]
+    return {
+        **{k: agg[k] for k in ("sessions", "new_sessions", "bounced", "duration_sum",
+                               "duration_count", "session_pageviews", "pageviews")},
+        "source": ranked(agg["source"]), "device": ranked(agg["device"]),
+        "path": ranked(agg["path"], 10), "search": ranked(agg["search"], 10),
+        "by_day": sorted(agg["by_day"].items()),
+    }
+
+
+def _measure(label: str, Session, fn) -> dict:
+    times, peak, result = [], 0, None
+    for _ in range(RUNS):
+        db = Session()
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(db)
+        times.append((time.perf_counter() - start) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        db.close()
+    print(f"{label:<8} mejor={min(times):9.1f}ms  peor={max(times):9.1f}ms  pico_mem={peak / 1024 / 1024:8.1f}MB")
+    return result
+
+
+def main():
+    engine = _engine()
+    models.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    tenant_id = uuid.uuid4()
+    db = Session()
+    db.add(models.User(id=tenant_id, email=f"bench-{tenant_id.hex[:8]}@bayup.test", hashed_password="x",
+                       full_name="Bench", shop_slug=f"bench-{tenant_id.hex[:8]}", role="admin_tienda"))
+    db.commit()
+    _seed(db, tenant_id)
+    db.close()
+
+    since = _dt.datetime.utcnow() - _dt.timedelta(days=DAYS)
+    legacy = _measure("legacy", Session, lambda s: _legacy(s, tenant_id, since))
+    sql = _measure("sql", Session, lambda s: analytics_rollup.aggregate_raw(
+        s, tenant_id, since, None, top=analytics_rollup.SUMMARY_TOP))
+    print("resultados idénticos:", _view(legacy) == _view(sql))
+
+
+if __name__ == "__main__":
+    main()
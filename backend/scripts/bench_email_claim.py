@@ -0,0 +1,154 @@
+"""
+Benchmark: latencia del reclamo de email_jobs con historial creciente.
+
+Para cada escalón de historial (0, 1%, 10% y 100% de BENCH_HISTORY, por
+defecto 1M filas 'sent') recrea email_jobs con el historial primero (ids
+bajos, como en producción) y BENCH_PENDING pendientes después. Mide el
+reclamo de un lote de 50 (UPDATE ... WHERE id IN (SELECT ... LIMIT 50) RETURNING) con:
+  - legacy:  índice ix_email_jobs_status y la consulta anterior
+  - partial: ix_email_jobs_claim / ix_email_jobs_sent_at y
+             email_queue._claim_select (la consulta actual)
+Entre mediciones los jobs reclamados vuelven a 'pending' (fuera del tiempo).
+Con el índice parcial la latencia debería quedar plana al crecer el historial.
+
+Por defecto usa un SQLite temporal. Para medir contra PostgreSQL:
+    BENCH_DATABASE_URL=postgresql://... python scripts/bench_email_claim.py
+
+Uso:
+    SECRET_KEY=x BENCH_HISTORY=1000000 python scripts/bench_email_claim.py
+"""
+import datetime as _dt
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+import email_queue
+
+HISTORY = int(os.getenv("BENCH_HISTORY", "1000000"))
+PENDING = int(os.getenv("BENCH_PENDING", "2000"))
+RUNS = int(os.getenv("BENCH_RUNS", "20"))
+LIMIT = 50
+_CHUNK = 50000
+
+_SQLITE_DDL = """
+CREATE TABLE email_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    func VARCHAR(120) NOT NULL,
+    kwargs_json TEXT NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+_PG_DDL = email_queue.CREATE_TABLE_SQL.split(";")[0]
+
+# Reclamo previo a los índices parciales (sin el predicado de status IN)
+_LEGACY_SELECT = (
+    "SELECT id FROM email_jobs "
+    "WHERE attempts < :max AND func <> :digest AND ("
+    "  (status = 'pending' AND updated_at <= :now) "
+    "  OR (status = 'processing' AND updated_at <= :stale)"
+    ") "
+    "ORDER BY id ASC LIMIT :limit"
+)
+_LEGACY_INDEXES = ("CREATE INDEX IF NOT EXISTS ix_email_jobs_status ON email_jobs (status)",)
+_DROP = (
+    "DROP INDEX IF EXISTS ix_email_jobs_status",
+    "DROP INDEX IF EXISTS ix_email_jobs_claim",
+    "DROP INDEX IF EXISTS ix_email_jobs_sent_at",
+)
+
+
+def _add_rows(conn, n: int, status: str, when: _dt.datetime) -> None:
+    row = {"status": status, "t": when, "k": '{"to": "historial@bench.test", "subject": "x", "html": "<p>x</p>"}'}
+    for start in range(0, n, _CHUNK):
+        conn.execute(
+            text(
+                "INSERT INTO email_jobs (func, kwargs_json, status, created_at, updated_at) "
+                "VALUES ('send_email', :k, :status, :t, :t)"
+            ),
+            [row] * min(_CHUNK, n - start),
+        )
+
+
+def _use_indexes(engine, ddl: tuple) -> None:
+    with engine.begin() as conn:
+        for stmt in _DROP + ddl:
+            conn.execute(text(stmt))
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ANALYZE email_jobs"))
+        else:
+            conn.execute(text("ANALYZE"))
+
+
+def _measure(engine, select_sql: str) -> list[float]:
+    lock = " FOR UPDATE SKIP LOCKED" if engine.dialect.name == "postgresql" else ""
+    times = []
+    for _ in range(RUNS):
+        with engine.begin() as conn:
+            start = time.perf_counter()
+            ids = [r[0] for r in conn.execute(
+                text(
+                    "UPDATE email_jobs SET status = 'processing', updated_at = :now "
+                    "WHERE id IN (" + select_sql + lock + ") RETURNING id"
+                ),
+                email_queue._claim_params(LIMIT),
+            )]
+            times.append((time.perf_counter() - start) * 1000)
+        assert len(ids) == LIMIT, f"se reclamaron {len(ids)} jobs"
+        with engine.begin() as conn:
+            # Vuelven a pendientes con vencimiento pasado para la siguiente corrida
+            conn.execute(
+                text("UPDATE email_jobs SET status = 'pending', updated_at = :t WHERE status = 'processing'"),
+                {"t": email_queue._now() - _dt.timedelta(minutes=1)},
+            )
+    return sorted(times)
+
+
+def _p99(times: list) -> float:
+    return times[min(len(times) - 1, int(len(times) * 0.99))]
+
+
+def main():
+    url = os.getenv("BENCH_DATABASE_URL", "")
+    tmp = None
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite:///{tmp.name}"
+    engine = create_engine(url)
+    steps = sorted({0, HISTORY // 100, HISTORY // 10, HISTORY})
+    print(f"--- BENCH RECLAMO email_jobs: {PENDING} pendientes, lote de {LIMIT}, {RUNS} corridas, "
+          f"{engine.dialect.name} ---")
+    print(f"{'historial':>10s} {'legacy p50':>11s} {'legacy p99':>11s} {'partial p50':>12s} {'partial p99':>12s}")
+    results = {}
+    for step in steps:
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS email_jobs"))
+            conn.execute(text(_SQLITE_DDL if url.startswith("sqlite") else _PG_DDL))
+            _add_rows(conn, step, "sent", _dt.datetime(2026, 1, 1))
+            _add_rows(conn, PENDING, "pending", email_queue._now() - _dt.timedelta(minutes=1))
+        _use_indexes(engine, _LEGACY_INDEXES)
+        legacy = _measure(engine, _LEGACY_SELECT)
+        _use_indexes(engine, email_queue.INDEXES_SQL)
+        partial = _measure(engine, email_queue._claim_select(False))
+        results[step] = statistics.median(partial)
+        print(f"{step:>10d} {statistics.median(legacy):>9.2f}ms {_p99(legacy):>9.2f}ms "
+              f"{statistics.median(partial):>10.2f}ms {_p99(partial):>10.2f}ms")
+
+    engine.dispose()
+    if tmp is not None:
+        os.unlink(tmp.name)
+    growth = results[steps[-1]] / max(results[steps[0]], 0.01)
+    print(f"partial p50 con {steps[-1]} filas / sin historial = {growth:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark: costo por pedido de encolar sus emails.
+
+Un pedido web encola 3 emails (confirmación, factura, aviso al dueño). Mide
+BENCH_ORDERS pedidos con cada camino:
+  - legacy: commit del pedido y después 3 × enqueue() sin db, cada uno con su
+            propia sesión, conexión y commit
+  - txn:    enqueue_many(jobs, db=db) en la transacción del pedido: un INSERT
+            multi-fila y el mismo commit
+El "pedido" es una Notification insertada en la sesión, para aislar el costo
+de la cola. Reporta ms/pedido, conexiones tomadas del pool y commits por pedido.
+
+Por defecto usa un SQLite temporal. Para medir contra PostgreSQL:
+    BENCH_DATABASE_URL=postgresql://... python scripts/bench_email_enqueue.py
+Con BENCH_NULLPOOL=1 el engine usa NullPool, como database.py detrás del
+pooler de Supabase (:6543): cada sesión abre una conexión nueva.
+
+Uso:
+    SECRET_KEY=x BENCH_ORDERS=500 python scripts/bench_email_enqueue.py
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+import database
+import email_queue
+import models
+
+ORDERS = int(os.getenv("BENCH_ORDERS", "500"))
+NULLPOOL = os.getenv("BENCH_NULLPOOL", "") == "1"
+
+_SQLITE_DDL = """
+CREATE TABLE IF NOT EXISTS email_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    func VARCHAR(120) NOT NULL,
+    kwargs_json TEXT NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+_counts = {"checkouts": 0, "commits": 0}
+
+
+def _instrument(engine) -> None:
+    @event.listens_for(engine, "checkout")
+    def _checkout(*args):
+        _counts["checkouts"] += 1
+
+    @event.listens_for(engine, "commit")
+    def _commit(conn):
+        _counts["commits"] += 1
+
+
+def _jobs(n: int) -> list:
+    oid = str(uuid.uuid4())
+    base = {"order_id": oid, "total": 1000.0 * n, "items": [{"name": "Camisa", "qty": 1, "price": 1000.0}]}
+    return [
+        ("send_order_confirmation", {**base, "email": f"cliente{n}@bench.test", "name": "Cliente"}),
+        ("send_web_order_invoice", {**base, "email": f"cliente{n}@bench.test", "name": "Cliente"}),
+        ("send_new_sale_notification", {**base, "owner_email": "dueno@bench.test", "shop_name": "Bench"}),
+    ]
+
+
+def _order(db, tenant_id, n: int):
+    db.add(models.Notification(tenant_id=tenant_id, title="Nueva venta", message=f"Pedido {n}", type="success"))
+
+
+def _run(Session, tenant_id, mode: str) -> list[float]:
+    times = []
+    for n in range(ORDERS):
+        start = time.perf_counter()
+        db = Session()
+        try:
+            _order(db, tenant_id, n)
+            if mode == "txn":
+                email_queue.enqueue_many(_jobs(n), db=db)
+                db.commit()
+            else:
+                db.commit()
+                for func_name, kwargs in _jobs(n):
+                    email_queue.enqueue(func_name, **kwargs)
+        finally:
+            db.close()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main():
+    url = os.getenv("BENCH_DATABASE_URL", "")
+    tmp = None
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite:///{tmp.name}"
+    kwargs = {"poolclass": NullPool} if NULLPOOL else {}
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+    engine = create_engine(url, **kwargs)
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(_SQLITE_DDL if url.startswith("sqlite") else email_queue.CREATE_TABLE_SQL))
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    # enqueue() sin db abre database.SessionLocal: que apunte al engine del bench
+    database.SessionLocal = Session
+    _instrument(engine)
+
+    db = Session()
+    tenant = models.User(
+        id=uuid.uuid4(), email=f"bench-{uuid.uuid4().hex[:8]}@bayup.test", hashed_password="x",
+        full_name="Bench", role="admin_tienda", status="Activo",
+    )
+    db.add(tenant)
+    db.commit()
+    tenant_id = tenant.id
+    db.close()
+
+    print(f"--- BENCH ENCOLADO DE EMAILS: {ORDERS} pedidos × 3 emails, "
+          f"{'NullPool' if NULLPOOL else 'pool'} sobre {engine.dialect.name} ---")
+    results = {}
+    for mode in ("legacy", "txn"):
+        _counts.update(checkouts=0, commits=0)
+        times = sorted(_run(Session, tenant_id, mode))
+        results[mode] = statistics.mean(times)
+        print(f"{mode:7s} media={statistics.mean(times):6.2f}ms p50={statistics.median(times):6.2f}ms "
+              f"p99={times[min(len(times) - 1, int(len(times) * 0.99))]:6.2f}ms "
+              f"conexiones/pedido={_counts['checkouts'] / ORDERS:.1f} commits/pedido={_counts['commits'] / ORDERS:.1f}")
+
+    with engine.connect() as conn:
+        total = conn.execute(text("SELECT COUNT(*) FROM email_jobs")).scalar()
+    print(f"jobs en email_jobs={total} (esperado {ORDERS * 6})")
+    print(f"speedup={results['legacy'] / results['txn']:.1f}x")
+    engine.dispose()
+    if tmp is not None:
+        os.unlink(tmp.name)
+    if total != ORDERS * 6:
+        print("[FAIL] faltan jobs")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
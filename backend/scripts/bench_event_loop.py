@@ -0,0 +1,78 @@
+"""
+Benchmark de carga: latencia de /public/shop/{slug} mientras /super-admin/treasury corre.
+
+Mide p50/p99 de la tienda pública en dos fases — sola y con peticiones de
+tesorería concurrentes — contra un servidor ya levantado. Si algún handler
+bloquea el event loop, el p99 de la segunda fase se dispara.
+
+Uso:
+    BENCH_BASE_URL=http://localhost:8000 BENCH_SLUG=mi-tienda \\
+    BENCH_ADMIN_TOKEN=<jwt super admin> python scripts/bench_event_loop.py
+"""
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_URL = os.getenv("BENCH_BASE_URL", "http://localhost:8000").rstrip("/")
+SLUG = os.getenv("BENCH_SLUG", "demo")
+ADMIN_TOKEN = os.getenv("BENCH_ADMIN_TOKEN", "")
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "400"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "20"))
+TREASURY_WORKERS = int(os.getenv("BENCH_TREASURY_WORKERS", "4"))
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _hit_shop(session: requests.Session) -> float:
+    start = time.perf_counter()
+    session.get(f"{BASE_URL}/public/shop/{SLUG}", timeout=30)
+    return (time.perf_counter() - start) * 1000
+
+
+def _run_phase(label: str) -> None:
+    session = requests.Session()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        samples = list(pool.map(lambda _: _hit_shop(session), range(REQUESTS)))
+    print(
+        f"{label:<28} p50={statistics.median(samples):7.1f}ms "
+        f"p99={_percentile(samples, 99):7.1f}ms max={max(samples):7.1f}ms"
+    )
+
+
+def _treasury_loop(stop: threading.Event) -> None:
+    session = requests.Session()
+    headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+    while not stop.is_set():
+        try:
+            session.get(f"{BASE_URL}/super-admin/treasury", headers=headers, timeout=120)
+        except requests.RequestException:
+            time.sleep(0.5)
+
+
+def main():
+    print(f"--- BENCH EVENT LOOP: {BASE_URL} slug={SLUG} ---")
+    _run_phase("shop (sola)")
+    if not ADMIN_TOKEN:
+        print("[INFO] Sin BENCH_ADMIN_TOKEN: se omite la fase con /super-admin/treasury")
+        return
+    stop = threading.Event()
+    threads = [threading.Thread(target=_treasury_loop, args=(stop,), daemon=True) for _ in range(TREASURY_WORKERS)]
+    for t in threads:
+        t.start()
+    time.sleep(1)
+    try:
+        _run_phase("shop + treasury concurrente")
+    finally:
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
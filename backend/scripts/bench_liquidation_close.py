@@ -0,0 +1,220 @@
+"""
+Benchmark: cierre de periodo de liquidaciones con muchos tenants.
+
+Crea BENCH_TENANTS tenants (por defecto 10000) con BENCH_ORDERS pedidos cada
+uno (4 de cada 5 web, el resto POS); la mitad ya tiene una liquidación web
+pagada a mitad de su historial. Compara:
+  - legacy:  el flujo web anterior por tenant (último pago, pedidos cargados en
+             el ORM y sumados en Python, liquidación y notificación con un
+             commit cada una), sobre BENCH_LEGACY_TENANTS tenants de una copia
+             de los datos y extrapolado al total (sólo con SQLite);
+  - close:   liquidation_close.close_period sobre todos los tenants;
+  - rerun:   el mismo cierre otra vez (debe saltarse: 0 filas nuevas);
+  - resume:  un cierre marcado 'running' sin filas escritas, que recorre
+             todo y no crea nada nuevo.
+Reporta ms, consultas emitidas y filas creadas, y verifica que los montos
+del cierre coincidan con los del flujo legacy.
+
+Por defecto usa un SQLite temporal. Para medir contra PostgreSQL:
+    BENCH_DATABASE_URL=postgresql://... python scripts/bench_liquidation_close.py
+
+Uso:
+    SECRET_KEY=x BENCH_TENANTS=10000 python scripts/bench_liquidation_close.py
+"""
+import datetime as _dt
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, func, insert
+from sqlalchemy.orm import sessionmaker
+
+import liquidation_close
+import models
+from routers import liquidations
+
+TENANTS = int(os.getenv("BENCH_TENANTS", "10000"))
+ORDERS = int(os.getenv("BENCH_ORDERS", "20"))
+LEGACY_TENANTS = int(os.getenv("BENCH_LEGACY_TENANTS", "500"))
+_CHUNK = 5000
+PERIOD_END = _dt.datetime(2026, 3, 2)  # lunes
+
+_queries = {"n": 0}
+
+
+def _legacy(db, tenant_ids) -> dict:
+    """Flujo anterior por tenant: lo que hacían pending-balances +
+    sa_create_liquidation + push_notification, uno por uno."""
+    out = {}
+    for tid in tenant_ids:
+        last_paid = (
+            db.query(models.Liquidation)
+            .filter(models.Liquidation.tenant_id == tid, models.Liquidation.status == "paid",
+                    models.Liquidation.liq_type == "web")
+            .order_by(models.Liquidation.paid_date.desc()).first()
+        )
+        q = db.query(models.Order).filter(
+            models.Order.tenant_id == tid,
+            models.Order.status.in_(["confirmed", "delivered", "completed", "pending"]),
+            models.Order.source != "pos",
+            models.Order.created_at <= PERIOD_END,
+        )
+        if last_paid:
+            q = q.filter(models.Order.created_at > last_paid.paid_date)
+        orders = q.all()
+        if not orders:
+            continue
+        gross = sum(o.total_price for o in orders)
+        bayup_fee = round(gross * liquidations.BAYUP_RATE, 2)
+        net = round(gross - bayup_fee, 2)
+        db.add(models.Liquidation(
+            tenant_id=tid, liq_type="web", gross_amount=gross, bayup_commission=bayup_fee, net_amount=net,
+            order_count=len(orders), period_end=PERIOD_END, status="scheduled",
+        ))
+        db.commit()
+        db.add(models.Notification(tenant_id=tid, title="Liquidación programada", message="-", type="info"))
+        db.commit()
+        out[tid] = net
+    return out
+
+
+def _insert(conn, table, rows: list) -> None:
+    for start in range(0, len(rows), _CHUNK):
+        conn.execute(insert(table), rows[start:start + _CHUNK])
+
+
+def _seed_rows() -> tuple[list, list, list]:
+    base = _dt.datetime(2026, 2, 1)
+    users, liqs, orders = [], [], []
+    for n in range(TENANTS):
+        tid = uuid.uuid4()
+        users.append({
+            "id": tid, "email": f"tienda{n}@bench.test", "hashed_password": "x", "full_name": f"Tienda {n}",
+            "shop_slug": f"tienda-{n}", "role": "admin_tienda", "status": "Activo",
+            "is_global_staff": False, "onboarding_completed": True, "bank_accounts": [],
+        })
+        if n % 2 == 0:
+            liqs.append({
+                "id": uuid.uuid4(), "tenant_id": tid, "liq_type": "web", "status": "paid",
+                "gross_amount": 1.0, "paid_date": base + _dt.timedelta(hours=ORDERS // 2, minutes=30),
+            })
+        for k in range(ORDERS):
+            orders.append({
+                "id": uuid.uuid4(), "tenant_id": tid, "total_price": 1000.0 + k, "commission_amount": 25.0,
+                "source": "pos" if k % 5 == 0 else "web", "status": "completed",
+                "created_at": base + _dt.timedelta(hours=k, minutes=n % 60),
+            })
+    return users, liqs, orders
+
+
+def _engine(url: str | None, rows: tuple):
+    """Engine con los datos de prueba; url=None = SQLite temporal."""
+    tmp = None
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite:///{tmp.name}"
+    engine = create_engine(url)
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table, data in zip((models.User, models.Liquidation, models.Order), rows):
+            _insert(conn, table.__table__, data)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_query(*args):
+        _queries["n"] += 1
+
+    return engine, tmp
+
+
+def _timed(Session, fn):
+    db = Session()
+    try:
+        _queries["n"] = 0
+        start = time.perf_counter()
+        result = fn(db)
+        return result, (time.perf_counter() - start) * 1000, _queries["n"]
+    finally:
+        db.close()
+
+
+def _count(Session, model) -> int:
+    db = Session()
+    try:
+        return db.query(func.count()).select_from(model).scalar()
+    finally:
+        db.close()
+
+
+def main():
+    rows = _seed_rows()
+    ids = [u["id"] for u in rows[0]]
+    url = os.getenv("BENCH_DATABASE_URL", "")
+    print(f"--- BENCH CIERRE DE LIQUIDACIONES: {TENANTS} tenants × {ORDERS} pedidos, "
+          f"{url.split(':')[0] if url else 'sqlite'} ---")
+
+    # Legacy sobre una muestra, en una base aparte con los mismos datos
+    sample = ids[:LEGACY_TENANTS]
+    if url:
+        legacy = None
+        print("legacy  omitido con BENCH_DATABASE_URL (necesita una base aparte)")
+    else:
+        legacy_engine, legacy_tmp = _engine(None, rows)
+        legacy, legacy_ms, legacy_queries = _timed(sessionmaker(bind=legacy_engine), lambda db: _legacy(db, sample))
+        legacy_engine.dispose()
+        os.unlink(legacy_tmp.name)
+        scale = TENANTS / max(len(sample), 1)
+        print(f"legacy  {len(sample)} tenants: {legacy_ms:9.1f}ms consultas={legacy_queries} "
+              f"→ estimado {TENANTS} tenants: {legacy_ms * scale / 1000:7.1f}s consultas≈{int(legacy_queries * scale)}")
+
+    engine, tmp = _engine(url, rows)
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    liqs_before = _count(Session, models.Liquidation)
+    result, ms, queries = _timed(Session, lambda db: liquidation_close.close_period(db, PERIOD_END))
+    created = _count(Session, models.Liquidation) - liqs_before
+    print(f"close   {TENANTS} tenants: {ms:9.1f}ms consultas={queries} liquidaciones={created} "
+          f"notificaciones={_count(Session, models.Notification)} "
+          f"(consulta {result['query_ms']:.0f}ms, escritura {result['write_ms']:.0f}ms)")
+
+    result, ms, queries = _timed(Session, lambda db: liquidation_close.close_period(db, PERIOD_END))
+    rerun_created = _count(Session, models.Liquidation) - liqs_before - created
+    print(f"rerun   {ms:9.1f}ms consultas={queries} liquidaciones nuevas={rerun_created} skipped={result['skipped']}")
+
+    def _resume(db):
+        db.get(models.LiquidationClose, PERIOD_END).status = "running"
+        db.commit()
+        return liquidation_close.close_period(db, PERIOD_END)
+
+    result, ms, queries = _timed(Session, _resume)
+    resume_created = _count(Session, models.Liquidation) - liqs_before - created
+    print(f"resume  {ms:9.1f}ms consultas={queries} liquidaciones nuevas={resume_created} "
+          f"tenants cerrados={result['closed_now']}")
+
+    db = Session()
+    try:
+        closed = dict(
+            db.query(models.Liquidation.tenant_id, models.Liquidation.net_amount)
+            .filter(models.Liquidation.liq_type == "web", models.Liquidation.period_end == PERIOD_END,
+                    models.Liquidation.tenant_id.in_(sample))
+            .all()
+        )
+    finally:
+        db.close()
+    engine.dispose()
+    if tmp is not None:
+        os.unlink(tmp.name)
+
+    same = legacy is None or (closed.keys() == legacy.keys() and all(abs(closed[t] - legacy[t]) < 0.01 for t in legacy))
+    if legacy is not None:
+        print(f"montos iguales a legacy en la muestra={same}")
+    if not same or rerun_created or resume_created:
+        print("[FAIL] el cierre difiere del flujo legacy o no es idempotente")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
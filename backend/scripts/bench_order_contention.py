@@ -0,0 +1,160 @@
+"""
+Benchmark de contención: checkouts paralelos sobre un SKU caliente.
+
+Lanza BENCH_WORKERS hilos que crean pedidos con crud.create_order hasta
+agotar el stock del SKU caliente. Cada pedido lleva el SKU caliente más
+BENCH_COLD_PER_ORDER variantes frías en orden aleatorio: con un bloqueo por
+ítem en el orden del carrito eso provoca deadlocks; con el bloqueo en una
+sola consulta ordenada por id no debería haber ninguno.
+
+Reporta pedidos/s, espera en el SELECT ... FOR UPDATE (p50/p99/max),
+deadlocks u otros errores, y verifica que no hubo sobreventa:
+stock final = stock inicial - unidades vendidas, y nunca negativo.
+
+Requiere PostgreSQL (SQLite no tiene FOR UPDATE y serializa las escrituras):
+    SECRET_KEY=x BENCH_DATABASE_URL=postgresql://... python scripts/bench_order_contention.py
+"""
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import models
+import schemas
+
+DATABASE_URL = os.getenv("BENCH_DATABASE_URL", "")
+WORKERS = int(os.getenv("BENCH_WORKERS", "16"))
+HOT_STOCK = int(os.getenv("BENCH_HOT_STOCK", "500"))
+COLD_VARIANTS = int(os.getenv("BENCH_COLD_VARIANTS", "40"))
+COLD_PER_ORDER = int(os.getenv("BENCH_COLD_PER_ORDER", "4"))
+
+_lock_waits: list[float] = []
+_lock_waits_mutex = threading.Lock()
+_local = threading.local()
+_stats_mutex = threading.Lock()
+
+
+def _bump(stats: dict, key: str) -> None:
+    with _stats_mutex:
+        stats[key] += 1
+
+
+def _instrument(engine) -> None:
+    """Mide cuánto tarda cada SELECT ... FOR UPDATE (≈ espera por el lock)."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, params, context, executemany):
+        _local.start = time.perf_counter() if "FOR UPDATE" in statement else None
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, params, context, executemany):
+        start = getattr(_local, "start", None)
+        if start is not None:
+            with _lock_waits_mutex:
+                _lock_waits.append((time.perf_counter() - start) * 1000)
+
+
+def _seed(Session):
+    db = Session()
+    tenant = models.User(
+        id=uuid.uuid4(), email=f"bench-{uuid.uuid4().hex[:8]}@bayup.test", hashed_password="x",
+        full_name="Bench", role="admin_tienda", status="Activo",
+    )
+    db.add(tenant)
+    db.flush()
+
+    def variant(name, stock):
+        product = models.Product(id=uuid.uuid4(), owner_id=tenant.id, name=name, price=1000, status="active")
+        db.add(product)
+        db.flush()
+        v = models.ProductVariant(id=uuid.uuid4(), product_id=product.id, name="Única", price=1000, stock=stock)
+        db.add(v)
+        return v.id
+
+    hot = variant("SKU caliente", HOT_STOCK)
+    cold = [variant(f"SKU frío {i}", 10 ** 9) for i in range(COLD_VARIANTS)]
+    db.commit()
+    db.close()
+    return tenant.id, hot, cold
+
+
+def _worker(Session, tenant_id, hot, cold, stats, stop):
+    rnd = random.Random()
+    while not stop.is_set():
+        ids = [hot] + rnd.sample(cold, min(COLD_PER_ORDER, len(cold)))
+        rnd.shuffle(ids)
+        order = schemas.OrderCreate(
+            tenant_id=tenant_id, total_price=0, customer_name="Bench", source="pos",
+            items=[schemas.OrderItemBase(product_variant_id=i, quantity=1, price_at_purchase=0) for i in ids],
+        )
+        db = Session()
+        try:
+            crud.create_order(db, order=order, customer_id=None, tenant_id=tenant_id)
+            _bump(stats, "ok")
+        except HTTPException as e:
+            if e.status_code == 400:
+                _bump(stats, "sin_stock")
+                stop.set()
+            else:
+                _bump(stats, "otros")
+        except Exception as e:
+            db.rollback()
+            key = "deadlocks" if "deadlock" in str(e).lower() else "otros"
+            _bump(stats, key)
+        finally:
+            db.close()
+
+
+def main():
+    if not DATABASE_URL.startswith("postgresql"):
+        print("[ERROR] Definí BENCH_DATABASE_URL con una base PostgreSQL de pruebas")
+        sys.exit(1)
+    engine = create_engine(DATABASE_URL, pool_size=WORKERS, max_overflow=0)
+    models.Base.metadata.create_all(engine)
+    _instrument(engine)
+    Session = sessionmaker(bind=engine)
+    tenant_id, hot, cold = _seed(Session)
+
+    stats = {"ok": 0, "sin_stock": 0, "deadlocks": 0, "otros": 0}
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=_worker, args=(Session, tenant_id, hot, cold, stats, stop), daemon=True)
+        for _ in range(WORKERS)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    db = Session()
+    final_stock = db.query(models.ProductVariant.stock).filter(models.ProductVariant.id == hot).scalar()
+    sold = db.query(models.OrderItem).filter(models.OrderItem.product_variant_id == hot).count()
+    db.close()
+
+    waits = sorted(_lock_waits) or [0.0]
+    print(f"--- BENCH CONTENCIÓN: {WORKERS} hilos, stock caliente={HOT_STOCK}, {COLD_PER_ORDER} frías/pedido ---")
+    print(f"pedidos ok={stats['ok']} sin_stock={stats['sin_stock']} deadlocks={stats['deadlocks']} otros={stats['otros']}")
+    print(f"throughput={stats['ok'] / elapsed:7.1f} pedidos/s en {elapsed:.1f}s")
+    print(f"espera FOR UPDATE p50={statistics.median(waits):.1f}ms "
+          f"p99={waits[min(len(waits) - 1, int(len(waits) * 0.99))]:.1f}ms max={waits[-1]:.1f}ms")
+    oversell = sold - HOT_STOCK
+    print(f"vendidas={sold} stock_final={final_stock} sobreventa={max(0, oversell)}")
+    if final_stock < 0 or oversell > 0 or final_stock != HOT_STOCK - sold:
+        print("[FAIL] inventario inconsistente")
+        sys.exit(1)
+    print("[OK] sin sobreventa")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark: /super-admin/pos-commissions/pending con muchos tenants.
+
+Crea BENCH_TENANTS tenants (por defecto 2000) con BENCH_POS_ORDERS pedidos POS
+cada uno; la mitad tiene un cobro pagado a mitad de su historial. Compara:
+  - legacy: el bucle anterior (por tenant: último cobro + todos sus pedidos
+            POS cargados en el ORM y sumados en Python)
+  - grouped: routers.liquidations.pending_pos_commissions (una consulta)
+Reporta ms por llamada, consultas emitidas y verifica que ambos devuelvan
+lo mismo.
+
+Por defecto usa un SQLite temporal. Para medir contra PostgreSQL:
+    BENCH_DATABASE_URL=postgresql://... python scripts/bench_pos_commissions.py
+
+Uso:
+    SECRET_KEY=x BENCH_TENANTS=2000 python scripts/bench_pos_commissions.py
+"""
+import datetime as _dt
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+import models
+from routers import liquidations
+
+TENANTS = int(os.getenv("BENCH_TENANTS", "2000"))
+POS_ORDERS = int(os.getenv("BENCH_POS_ORDERS", "20"))
+RUNS = int(os.getenv("BENCH_RUNS", "5"))
+_CHUNK = 5000
+
+_queries = {"n": 0}
+
+
+def _legacy(db) -> list[dict]:
+    """Copia del endpoint anterior, para comparar."""
+    tenants = db.query(models.User).filter(
+        models.User.is_global_staff == False,
+        models.User.onboarding_completed == True,
+    ).all()
+    result = []
+    for t in tenants:
+        last_collected = (
+            db.query(models.Liquidation)
+            .filter(
+                models.Liquidation.tenant_id == t.id,
+                models.Liquidation.liq_type == "pos_commission",
+                models.Liquidation.status == "paid",
+            )
+            .order_by(models.Liquidation.paid_date.desc())
+            .first()
+        )
+        cutoff_pos = last_collected.paid_date if last_collected else None
+        q = db.query(models.Order).filter(
+            models.Order.tenant_id == t.id,
+            models.Order.source == "pos",
+            models.Order.status.in_(["confirmed", "delivered", "completed", "pending"]),
+        )
+        if cutoff_pos:
+            q = q.filter(models.Order.created_at > cutoff_pos)
+        pos_orders = q.all()
+        if not pos_orders:
+            continue
+        gross_pos = sum(o.total_price for o in pos_orders)
+        result.append({
+            "tenant_id":      str(t.id),
+            "tenant_name":    t.full_name or t.email,
+            "tenant_email":   t.email,
+            "shop_slug":      t.shop_slug,
+            "pos_gross":      round(gross_pos, 2),
+            "commission":     round(gross_pos * liquidations.BAYUP_RATE, 2),
+            "pos_count":      len(pos_orders),
+            "bank_accounts":  t.bank_accounts or [],
+            "last_collected": last_collected.paid_date.isoformat() if last_collected else None,
+        })
+    result.sort(key=lambda x: x["commission"], reverse=True)
+    return result
+
+
+def _insert(conn, table, rows: list) -> None:
+    for start in range(0, len(rows), _CHUNK):
+        conn.execute(insert(table), rows[start:start + _CHUNK])
+
+
+def _seed(engine) -> None:
+    base = _dt.datetime(2026, 1, 1)
+    users, liqs, orders = [], [], []
+    for n in range(TENANTS):
+        tid = uuid.uuid4()
+        users.append({
+            "id": tid, "email": f"tienda{n}@bench.test", "hashed_password": "x", "full_name": f"Tienda {n}",
+            "shop_slug": f"tienda-{n}", "role": "admin_tienda", "status": "Activo",
+            "is_global_staff": False, "onboarding_completed": True, "bank_accounts": [],
+        })
+        if n % 2 == 0:
+            liqs.append({
+                "id": uuid.uuid4(), "tenant_id": tid, "liq_type": "pos_commission", "status": "paid",
+                "gross_amount": 1.0, "paid_date": base + _dt.timedelta(hours=POS_ORDERS // 2),
+            })
+        for k in range(POS_ORDERS):
+            orders.append({
+                "id": uuid.uuid4(), "tenant_id": tid, "total_price": 1000.0 + k, "commission_amount": 25.0,
+                "source": "pos" if k % 5 else "web", "status": "completed",
+                "created_at": base + _dt.timedelta(hours=k, minutes=n % 60),
+            })
+    with engine.begin() as conn:
+        _insert(conn, models.User.__table__, users)
+        _insert(conn, models.Liquidation.__table__, liqs)
+        _insert(conn, models.Order.__table__, orders)
+
+
+def _measure(Session, fn) -> tuple[list[float], int, list]:
+    times, result = [], None
+    _queries["n"] = 0
+    for _ in range(RUNS):
+        db = Session()
+        try:
+            start = time.perf_counter()
+            result = fn(db)
+            times.append((time.perf_counter() - start) * 1000)
+        finally:
+            db.close()
+    return sorted(times), _queries["n"] // RUNS, result
+
+
+def main():
+    url = os.getenv("BENCH_DATABASE_URL", "")
+    tmp = None
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite:///{tmp.name}"
+    engine = create_engine(url)
+    models.Base.metadata.create_all(engine)
+    _seed(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*args):
+        _queries["n"] += 1
+
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    print(f"--- BENCH POS PENDIENTES: {TENANTS} tenants × {POS_ORDERS} pedidos, {RUNS} corridas, "
+          f"{engine.dialect.name} ---")
+    results = {}
+    for name, fn in (("legacy", _legacy), ("grouped", liquidations.pending_pos_commissions)):
+        times, queries, results[name] = _measure(Session, fn)
+        print(f"{name:8s} p50={statistics.median(times):8.1f}ms max={times[-1]:8.1f}ms consultas/llamada={queries}")
+    engine.dispose()
+    if tmp is not None:
+        os.unlink(tmp.name)
+
+    key = lambda r: r["tenant_id"]
+    same = sorted(results["legacy"], key=key) == sorted(results["grouped"], key=key)
+    print(f"tenants con pendiente={len(results['grouped'])} resultados iguales={same}")
+    if not same:
+        print("[FAIL] los resultados difieren")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
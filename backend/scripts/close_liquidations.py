@@ -0,0 +1,61 @@
+"""
+Cierra un periodo de liquidaciones para todos los tenants (liquidation_close).
+
+Crea en lote la liquidación web programada, la comisión POS pendiente y la
+notificación de cada tenant con ventas en el periodo. Es idempotente: un
+periodo ya cerrado no se repite y uno que quedó a medias se retoma con los
+tenants que faltan.
+
+Ejecutar desde la carpeta backend/:
+  python scripts/close_liquidations.py                         # último periodo vencido
+  python scripts/close_liquidations.py --period-end 2026-08-17 # hasta ese día 00:00 UTC
+  python scripts/close_liquidations.py --due                   # retoma y cierra lo vencido (como el job)
+"""
+import argparse
+import datetime as _dt
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import liquidation_close
+
+
+def _day(value: str) -> _dt.datetime:
+    return _dt.datetime.combine(_dt.date.fromisoformat(value), _dt.time.min)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cierra un periodo de liquidaciones de todos los tenants")
+    parser.add_argument("--period-end", type=_day, help="fin del periodo (YYYY-MM-DD): pedidos hasta ese día 00:00 UTC")
+    parser.add_argument("--scheduled-date", type=_day, help="fecha de pago de las liquidaciones web")
+    parser.add_argument("--due", action="store_true", help="retoma cierres a medias y cierra el periodo vencido")
+    parser.add_argument("--no-notify", action="store_true", help="no crea notificaciones")
+    parser.add_argument("--chunk", type=int, default=liquidation_close.CLOSE_CHUNK, help="tenants por tanda")
+    args = parser.parse_args()
+
+    period_end = args.period_end or liquidation_close.due_period_end()
+
+    def _close(db):
+        if args.due:
+            return liquidation_close.run_due(db)
+        return [liquidation_close.close_period(
+            db, period_end, scheduled_date=args.scheduled_date, notify=not args.no_notify, chunk=args.chunk,
+        )]
+
+    results = liquidation_close.run_locked(_close)
+    if results is None:
+        print("[SKIP] otro proceso está cerrando liquidaciones")
+        sys.exit(1)
+
+    for s in results:
+        state = "ya cerrado" if s.get("skipped") else ("retomado" if s.get("resumed") else "cerrado")
+        print(f"Periodo hasta {s['period_end']} ({state}), pago {s['scheduled_date']}")
+        print(f"  tenants={s['tenants']} web={s['web_liquidations']} (neto {s['web_net']:.2f}) "
+              f"pos={s['pos_liquidations']} (comisión {s['pos_commission']:.2f})")
+        print(f"  esta corrida: {s.get('closed_now', 0)} tenants, consulta {s['query_ms']:.0f}ms, "
+              f"escritura {s['write_ms']:.0f}ms, total {s['elapsed_ms'] or 0:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
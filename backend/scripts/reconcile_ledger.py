@@ -0,0 +1,53 @@
+"""
+Concilia tenant_ledgers con la historia de orders y liquidations.
+
+Recalcula el saldo de cada tenant (pendiente web/POS desde el último pago y
+totales pagados) con consultas agrupadas y lista las diferencias con el
+ledger. Con --fix reescribe los tenants con diferencias, uno por transacción
+y con su fila bloqueada (seguro con la app corriendo).
+
+Sale con código 1 si encontró diferencias y no se pidió --fix, para poder
+usarlo como chequeo periódico.
+
+Ejecutar desde la carpeta backend/:
+  python scripts/reconcile_ledger.py                 # sólo reporta
+  python scripts/reconcile_ledger.py --fix           # reporta y corrige
+  python scripts/reconcile_ledger.py --tenant <uuid> # un tenant
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tenant_ledger
+from database import SessionLocal
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concilia tenant_ledgers con orders y liquidations")
+    parser.add_argument("--fix", action="store_true", help="reescribe los tenants con diferencias")
+    parser.add_argument("--tenant", action="append", type=uuid.UUID, help="limita a este tenant (repetible)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        drift = tenant_ledger.reconcile(db, fix=args.fix, tenant_ids=args.tenant)
+        elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        db.close()
+
+    for d in sorted(drift, key=lambda d: (str(d["tenant_id"]), d["field"])):
+        print(f"[DRIFT] {d['tenant_id']} {d['field']}: ledger={d['ledger']} esperado={d['expected']}")
+    tenants = len({d["tenant_id"] for d in drift})
+    action = "corregidos" if args.fix else "sin corregir"
+    print(f"{len(drift)} diferencias en {tenants} tenants ({action}) en {elapsed:.0f}ms")
+    if drift and not args.fix:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,12 @@
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 
+import cache as _cache
 import crud, models, schemas
 from database import get_db
 
@@ -25,12 +27,26 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60  # CRIT-004: reducido a 60 min
 REFRESH_TOKEN_EXPIRE_DAYS = 30
+ACTIVE_STATUSES = ("Activo", "active")
 
 # --- Security Schemes ---
 # auto_error=False: no lanza 401 automáticamente si falta el header Authorization,
 # permitiendo que get_current_user evalúe la cookie httpOnly como alternativa (CRIT-004).
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
 
+# --- Content-Security-Policy ---
+# ALTA-003: una sola definición para el middleware de main y las páginas que
+# necesitan cargar scripts de otro origen (p. ej. /html-shop con el SDK).
+
+def content_security_policy(*script_origins: str) -> str:
+    """CSP de las respuestas; script_origins se agregan a script-src."""
+    script_src = " ".join(("'self' 'unsafe-inline' 'unsafe-eval'",) + script_origins)
+    return (
+        f"default-src 'self'; script-src {script_src}; "
+        "style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; "
+        "connect-src 'self' https:; frame-ancestors 'none';"
+    )
+
 # --- Password Hashing ---
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
@@ -69,7 +85,7 @@ def create_refresh_token(subject: str) -> str:
     return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
 
 # --- Current User Dependency ---
-async def get_current_user(
+def get_current_user(
     request: Request,
     token: str | None = Depends(oauth2_scheme),
     db: Session = Depends(get_db),
@@ -101,10 +117,70 @@ async def get_current_user(
     if email is None:
         raise credentials_exception
 
+    # Principal cacheado: en un hit no hay ninguna query. El User se arma desde
+    # el principal y se adjunta a la sesión sin SELECT; sólo si el handler lee
+    # una columna que el principal no trae se carga la fila (por PK).
+    key = email.lower().strip()
+    principal = _cache.principal_cache.get(key)
+    if principal is not None:
+        if principal["status"] not in ACTIVE_STATUSES:
+            raise HTTPException(status_code=403, detail="Cuenta suspendida")
+        return _user_from_principal(db, principal)
     user = crud.get_user_by_email(db, email=email)
     if user is None:
         raise credentials_exception
-    if user.status not in ("Activo", "active"):
+    _cache.principal_cache.set(key, principal_of(user))
+    if user.status not in ACTIVE_STATUSES:
         raise HTTPException(status_code=403, detail="Cuenta suspendida")
     return user
 
+
+_PRINCIPAL_COLUMNS = ("id", "email", "status", "role", "owner_id", "is_global_staff", "plan_id")
+
+
+def principal_of(user: models.User) -> dict:
+    """Lo mínimo para autorizar sin cargar el usuario completo (sólo columnas
+    ya cargadas: no dispara lazy loads)."""
+    return {c: getattr(user, c) for c in _PRINCIPAL_COLUMNS}
+
+
+def _user_from_principal(db: Session, principal: dict) -> models.User:
+    """User persistente en `db` con las columnas del principal; el resto quedan
+    expiradas y se cargan al primer acceso. Los cambios se guardan como con
+    cualquier User de la sesión."""
+    user = models.User(**{c: principal[c] for c in _PRINCIPAL_COLUMNS})
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+# --- Invalidación del principal ---
+# Cualquier cambio de un User por el ORM (estado, rol, owner, plan, email) o
+# su borrado invalida el principal al confirmar la transacción. Los borrados
+# masivos con query().delete() no pasan por aquí: quien los hace invalida a mano.
+
+_PRINCIPAL_FIELDS = ("email", "status", "role", "owner_id", "is_global_staff", "plan_id")
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_changes(session, flush_context):
+    emails = session.info.setdefault("principal_invalidate", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, models.User):
+            continue
+        state = inspect(obj)
+        if obj in session.deleted or any(state.attrs[f].history.has_changes() for f in _PRINCIPAL_FIELDS):
+            emails.add(obj.email)
+            emails.update(state.attrs.email.history.deleted or ())
+
+
+@event.listens_for(Session, "after_commit")
+def _flush_principal_invalidations(session):
+    emails = session.info.pop("principal_invalidate", None)
+    if emails:
+        _cache.invalidate_principal(*emails)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_principal_invalidations(session):
+    session.info.pop("principal_invalidate", None)
+
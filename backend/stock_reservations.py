@@ -0,0 +1,196 @@
+"""
+Reservas de stock con vencimiento para pagos pendientes de la pasarela.
+
+public_checkout creaba el Payment "pending" sin tocar el stock, y el stock
+sólo se descontaba cuando el webhook de Wompi llamaba a finalize_web_order:
+con un producto muy vendido, varios compradores pagaban unidades que ya no
+existían y el pedido fallaba tarde, dentro del webhook.
+
+Ahora el checkout reserva las unidades del carrito:
+  - product_variants.reserved_stock es un contador. Reservar es un UPDATE
+    condicional (stock - reserved_stock >= cantidad) por variante, sin
+    SELECT ... FOR UPDATE ni locks que duren más que la transacción del checkout.
+  - stock_reservations guarda una fila por variante y pago, con expires_at.
+  - Pago aprobado: convert() libera el contador en la misma transacción en que
+    crud.create_order descuenta el stock real.
+  - Pago fallido o vencido: release() devuelve las unidades. El sweeper las
+    libera pasado STOCK_RESERVATION_TTL_MIN aunque el webhook no llegue nunca.
+
+Cada reserva se cierra con UPDATE ... WHERE status = 'active': si el webhook y
+el sweeper compiten por la misma reserva, sólo uno devuelve las unidades.
+
+Stock disponible para vender = stock - reserved_stock (crud.create_order y
+ProductVariant.available_stock).
+"""
+import datetime as _dt
+import logging
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import case, func, update
+
+import models
+
+logger = logging.getLogger("bayup.stock_reservations")
+
+RESERVATION_TTL_MIN = int(os.getenv("STOCK_RESERVATION_TTL_MIN", "30"))
+SWEEP_INTERVAL_S = int(os.getenv("STOCK_RESERVATION_SWEEP_S", "60"))
+SWEEP_BATCH = 500
+
+ACTIVE = "active"
+CONVERTED = "converted"
+RELEASED = "released"
+
+
+def reserve(db, payment, items: list) -> list:
+    """Reserva las cantidades de `items` (OrderItemBase) para `payment`. No hace
+    commit: la reserva se confirma junto con el pago. Si alguna variante no
+    alcanza, hace rollback y responde 400 con todas las líneas sin stock."""
+    qty: dict = {}
+    for item in items:
+        qty[item.product_variant_id] = qty.get(item.product_variant_id, 0) + item.quantity
+    expires_at = _dt.datetime.utcnow() + _dt.timedelta(minutes=RESERVATION_TTL_MIN)
+    V = models.ProductVariant
+    reserved = func.coalesce(V.reserved_stock, 0)
+    short = []
+    # En orden de id, como crud.create_order: dos checkouts no se cruzan
+    for variant_id in sorted(qty):
+        n = qty[variant_id]
+        res = db.execute(
+            update(V)
+            .where(V.id == variant_id, V.stock - reserved >= n)
+            .values(reserved_stock=reserved + n)
+            .execution_options(synchronize_session=False)
+        )
+        if res.rowcount == 0:
+            short.append(variant_id)
+    if short:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="; ".join(_short_messages(db, short)))
+
+    rows = [
+        models.StockReservation(
+            payment_id=payment.id, tenant_id=payment.tenant_id,
+            product_variant_id=variant_id, quantity=n, expires_at=expires_at,
+        )
+        for variant_id, n in qty.items()
+    ]
+    db.add_all(rows)
+    return rows
+
+
+def _short_messages(db, variant_ids: list) -> list:
+    rows = db.query(models.ProductVariant, models.Product.name).join(
+        models.Product, models.Product.id == models.ProductVariant.product_id,
+    ).filter(models.ProductVariant.id.in_(variant_ids)).all()
+    return [f"Stock insuficiente para {name}. Disponible: {v.available_stock}" for v, name in rows]
+
+
+def _close(db, reservations: list, status: str) -> int:
+    """Cierra reservas activas y devuelve sus unidades al contador. Sólo
+    descuenta las que este llamador efectivamente pasó de 'active' a `status`."""
+    V = models.ProductVariant
+    R = models.StockReservation
+    reserved = func.coalesce(V.reserved_stock, 0)
+    closed = 0
+    for r in sorted(reservations, key=lambda r: r.product_variant_id):
+        res = db.execute(
+            update(R).where(R.id == r.id, R.status == ACTIVE)
+            .values(status=status, closed_at=_dt.datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if res.rowcount == 0:
+            continue
+        db.execute(
+            update(V).where(V.id == r.product_variant_id)
+            .values(reserved_stock=case((reserved >= r.quantity, reserved - r.quantity), else_=0))
+            .execution_options(synchronize_session=False)
+        )
+        closed += 1
+    return closed
+
+
+def _active_for(db, payment_id) -> list:
+    return db.query(models.StockReservation).filter(
+        models.StockReservation.payment_id == payment_id,
+        models.StockReservation.status == ACTIVE,
+    ).all()
+
+
+def convert(db, payment_id) -> int:
+    """Pago aprobado: libera el contador de reservas. Llamar en la misma
+    transacción que crea el pedido (que descuenta el stock real). No hace commit."""
+    return _close(db, _active_for(db, payment_id), CONVERTED)
+
+
+def release(db, payment_id) -> int:
+    """Pago fallido: devuelve las unidades reservadas. No hace commit."""
+    return _close(db, _active_for(db, payment_id), RELEASED)
+
+
+def sweep_expired(db, now: _dt.datetime | None = None) -> int:
+    """Libera las reservas vencidas, en lotes con commit por lote."""
+    now = now or _dt.datetime.utcnow()
+    total = 0
+    while True:
+        q = db.query(models.StockReservation).filter(
+            models.StockReservation.status == ACTIVE,
+            models.StockReservation.expires_at < now,
+        ).order_by(models.StockReservation.expires_at).limit(SWEEP_BATCH)
+        if db.bind.dialect.name == "postgresql":
+            q = q.with_for_update(skip_locked=True)
+        batch = q.all()
+        if not batch:
+            return total
+        total += _close(db, batch, RELEASED)
+        db.commit()
+        if len(batch) < SWEEP_BATCH:
+            return total
+
+
+def stats(db) -> dict:
+    R = models.StockReservation
+    rows = db.query(R.status, func.count(), func.coalesce(func.sum(R.quantity), 0)).group_by(R.status).all()
+    expired = db.query(func.count()).select_from(R).filter(
+        R.status == ACTIVE, R.expires_at < _dt.datetime.utcnow(),
+    ).scalar()
+    return {
+        "by_status": {s: {"reservations": n, "units": int(u)} for s, n, u in rows},
+        "expired_active": expired,
+        "sweeper_running": _sweeper_started,
+    }
+
+
+# ── Sweeper en segundo plano ──────────────────────────────────────────────
+
+def _sweeper_loop() -> None:
+    from database import SessionLocal
+    while True:
+        db = SessionLocal()
+        try:
+            n = sweep_expired(db)
+            if n:
+                logger.info("stock_reservations: %d reservas vencidas liberadas", n)
+        except Exception as e:
+            db.rollback()
+            logger.warning("stock_reservations sweeper error: %s", e)
+        finally:
+            db.close()
+        time.sleep(SWEEP_INTERVAL_S)
+
+
+_sweeper_started = False
+_sweeper_lock = threading.Lock()
+
+
+def start_sweeper() -> None:
+    """Arranca el sweeper en background. Idempotente — solo corre uno."""
+    global _sweeper_started
+    with _sweeper_lock:
+        if _sweeper_started:
+            return
+        _sweeper_started = True
+    threading.Thread(target=_sweeper_loop, daemon=True, name="stock-reservation-sweeper").start()
+    logger.info("stock_reservations: sweeper iniciado")
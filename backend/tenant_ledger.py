@@ -0,0 +1,321 @@
+"""
+Saldo corriente de liquidaciones por tenant (tenant_ledgers).
+
+/admin/liquidations/summary cargaba en cada llamada todos los pedidos
+posteriores al último pago (web y POS) y todas las liquidaciones pagadas del
+tenant para sumarlos en Python. Ahora lee una fila:
+  - web_gross / web_count: pedidos web liquidables (status en COMMISSIONABLE,
+    source distinto de 'pos') creados después de web_cutoff, hasta dónde
+    cubren las liquidaciones 'web' pagadas: el period_end de las de un cierre
+    y el paid_date de las manuales (ver coverage()).
+  - pos_gross / pos_count: lo mismo para source 'pos' y pos_cutoff (última
+    'pos_commission' pagada).
+  - paid_*: totales históricos de las liquidaciones pagadas (de cualquier tipo).
+
+Se mantiene en cada flush del ORM que crea, modifica o borra un Order o una
+Liquidation, en la misma transacción:
+  - Pedidos: UPDATE aditivo condicionado a created_at > corte. La condición
+    la evalúa la DB sobre la fila bloqueada, así un pedido concurrente con un
+    pago no suma a un saldo que el pago ya cerró.
+  - Pagos: al cambiar las liquidaciones pagadas de un tenant se recalcula el
+    corte (MAX(coverage())) y el pendiente desde orders, con la fila del
+    ledger bloqueada antes de leer (sólo lo creado después del corte).
+
+Los borrados o updates masivos con query().delete()/update() no pasan por el
+ORM: quien los hace corrige el ledger. scripts/reconcile_ledger.py recalcula
+todo desde orders y liquidations, reporta las diferencias y con --fix las
+corrige.
+"""
+import datetime as _dt
+import logging
+
+from sqlalchemy import and_, bindparam, case, event, func, or_, select, update
+from sqlalchemy.orm import Session
+
+import flush_history
+import models
+
+logger = logging.getLogger("bayup.tenant_ledger")
+
+COMMISSIONABLE = ("confirmed", "delivered", "completed", "pending")
+LIQ_TYPES = {"web": "web", "pos": "pos_commission"}
+FIELDS = (
+    "web_cutoff", "web_gross", "web_count", "pos_cutoff", "pos_gross", "pos_count",
+    "paid_net", "paid_gross", "paid_bayup", "paid_count",
+)
+_ORDER_TRACKED = ("tenant_id", "created_at", "total_price", "status", "source")
+_LIQ_TRACKED = (
+    "tenant_id", "status", "liq_type", "origin", "paid_date", "period_end",
+    "net_amount", "gross_amount", "bayup_commission",
+)
+_INFO_KEY = "tenant_ledger_changes"
+_TOLERANCE = 0.005
+
+
+def order_kind(source, status) -> str | None:
+    """'web', 'pos' o None si el pedido no entra en liquidaciones."""
+    if status not in COMMISSIONABLE or source is None:
+        return None
+    return "pos" if source == "pos" else "web"
+
+
+def is_kind(kind: str):
+    """Condición SQL equivalente a order_kind(...) == kind."""
+    O = models.Order
+    source = O.source == "pos" if kind == "pos" else and_(O.source.isnot(None), O.source != "pos")
+    return and_(source, O.status.in_(COMMISSIONABLE))
+
+
+def coverage():
+    """Hasta dónde cubre una liquidación pagada. Las de un cierre
+    (origin='close', ver liquidation_close) cubren hasta el fin de su periodo:
+    los pedidos creados entre el cierre y el pago quedan para la siguiente.
+    Las manuales, hasta la fecha de pago (su period_end es sólo informativo,
+    una fecha sin hora)."""
+    L = models.Liquidation
+    return case((L.origin == "close", L.period_end), else_=L.paid_date)
+
+
+# ── Mantenimiento en escrituras ───────────────────────────────────────────
+
+flush_history.track(models.Order, _ORDER_TRACKED)
+flush_history.track(models.Liquidation, _LIQ_TRACKED)
+
+
+def _changes(session) -> dict:
+    return session.info.setdefault(_INFO_KEY, {"orders": [], "paid": {}, "cutoffs": set()})
+
+
+def _order_entry(changes: dict, values, sign: int) -> None:
+    tenant_id, created_at, total, status, source = values
+    kind = order_kind(source, status)
+    if tenant_id is None or kind is None:
+        return
+    changes["orders"].append({
+        "t": tenant_id, "kind": kind, "created_at": created_at,
+        "amount": sign * (total or 0.0), "n": sign,
+    })
+
+
+def _liquidation_entry(changes: dict, values, sign: int) -> None:
+    tenant_id, status, liq_type, _origin, _paid_date, _period_end, net, gross, bayup = values
+    if tenant_id is None or status != "paid":
+        return
+    paid = changes["paid"].setdefault(tenant_id, [0.0, 0.0, 0.0, 0])
+    paid[0] += sign * (net or 0.0)
+    paid[1] += sign * (gross or 0.0)
+    paid[2] += sign * (bayup or 0.0)
+    paid[3] += sign
+    for kind, name in LIQ_TYPES.items():
+        if liq_type == name:
+            changes["cutoffs"].add((tenant_id, kind))
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_ledger_changes(session, flush_context, instances):
+    for obj in session.new:
+        if isinstance(obj, models.Order):
+            flush_history.ensure_created_at(obj)
+            _order_entry(_changes(session), flush_history.values(obj, _ORDER_TRACKED), 1)
+        elif isinstance(obj, models.Liquidation):
+            if obj.liq_type is None:
+                obj.liq_type = "web"  # default de la columna, necesario ya para el corte
+            _liquidation_entry(_changes(session), flush_history.values(obj, _LIQ_TRACKED), 1)
+    for obj in session.dirty:
+        if isinstance(obj, models.Order):
+            entry, fields = _order_entry, _ORDER_TRACKED
+        elif isinstance(obj, models.Liquidation):
+            entry, fields = _liquidation_entry, _LIQ_TRACKED
+        else:
+            continue
+        diff = flush_history.old_new(obj, fields)
+        if diff is not None:
+            entry(_changes(session), diff[0], -1)
+            entry(_changes(session), diff[1], 1)
+    for obj in session.deleted:
+        if isinstance(obj, models.Order):
+            _order_entry(_changes(session), flush_history.values(obj, _ORDER_TRACKED), -1)
+        elif isinstance(obj, models.Liquidation):
+            _liquidation_entry(_changes(session), flush_history.values(obj, _LIQ_TRACKED), -1)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_ledger_changes(session, flush_context):
+    changes = session.info.pop(_INFO_KEY, None)
+    if changes:
+        apply_changes(session.connection(), changes)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_ledger_changes(session, previous_transaction):
+    session.info.pop(_INFO_KEY, None)
+
+
+def _ensure_rows(conn, tenant_ids) -> None:
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    zeros = {f: (None if f.endswith("_cutoff") else 0) for f in FIELDS}
+    rows = [{"tenant_id": tid, **zeros} for tid in sorted(tenant_ids)]
+    conn.execute(insert(models.TenantLedger.__table__).values(rows).on_conflict_do_nothing())
+
+
+def apply_changes(conn, changes: dict) -> None:
+    """Aplica los cambios juntados en un flush (ver _collect_ledger_changes).
+    Las filas se tocan en orden de tenant para no bloquearse en cruz."""
+    T = models.TenantLedger.__table__
+    tenants = {e["t"] for e in changes["orders"]} | set(changes["paid"]) | {t for t, _ in changes["cutoffs"]}
+    if not tenants:
+        return
+    _ensure_rows(conn, tenants)
+    now = _dt.datetime.utcnow()
+    for kind in ("web", "pos"):
+        entries = sorted((e for e in changes["orders"] if e["kind"] == kind), key=lambda e: e["t"])
+        if not entries:
+            continue
+        cutoff, gross, count = T.c[f"{kind}_cutoff"], T.c[f"{kind}_gross"], T.c[f"{kind}_count"]
+        stmt = (
+            update(T)
+            .where(T.c.tenant_id == bindparam("t"))
+            .where(or_(cutoff.is_(None), bindparam("created_at", type_=T.c.updated_at.type) > cutoff))
+            .values({gross: gross + bindparam("amount"), count: count + bindparam("n"), T.c.updated_at: now})
+        )
+        conn.execute(stmt, [{"t": e["t"], "created_at": e["created_at"], "amount": e["amount"], "n": e["n"]}
+                            for e in entries])
+    if changes["paid"]:
+        stmt = update(T).where(T.c.tenant_id == bindparam("t")).values({
+            T.c.paid_net: T.c.paid_net + bindparam("net"),
+            T.c.paid_gross: T.c.paid_gross + bindparam("gross"),
+            T.c.paid_bayup: T.c.paid_bayup + bindparam("bayup"),
+            T.c.paid_count: T.c.paid_count + bindparam("n"),
+            T.c.updated_at: now,
+        })
+        conn.execute(stmt, [{"t": t, "net": p[0], "gross": p[1], "bayup": p[2], "n": p[3]}
+                            for t, p in sorted(changes["paid"].items())])
+    for tenant_id, kind in sorted(changes["cutoffs"]):
+        refresh_kind(conn, tenant_id, kind)
+
+
+def refresh_kind(conn, tenant_id, kind: str) -> None:
+    """Recalcula el corte y el pendiente de un tipo ('web' / 'pos') desde
+    liquidations y orders. Bloquea antes la fila del ledger: un pedido que la
+    tenía tomada ya confirmó cuando se leen las sumas."""
+    T, L, O = models.TenantLedger.__table__, models.Liquidation, models.Order
+    conn.execute(select(T.c.tenant_id).where(T.c.tenant_id == tenant_id).with_for_update())
+    cutoff = conn.execute(
+        select(func.max(coverage())).where(
+            L.tenant_id == tenant_id, L.liq_type == LIQ_TYPES[kind], L.status == "paid",
+        )
+    ).scalar()
+    q = select(func.coalesce(func.sum(O.total_price), 0.0), func.count()).where(O.tenant_id == tenant_id, is_kind(kind))
+    if cutoff is not None:
+        q = q.where(O.created_at > cutoff)
+    gross, count = conn.execute(q).one()
+    conn.execute(update(T).where(T.c.tenant_id == tenant_id).values({
+        f"{kind}_cutoff": cutoff, f"{kind}_gross": float(gross), f"{kind}_count": count,
+        "updated_at": _dt.datetime.utcnow(),
+    }))
+
+
+# ── Lectura ───────────────────────────────────────────────────────────────
+
+def get(db, tenant_id) -> dict:
+    """Valores del ledger del tenant (ceros si todavía no tiene fila)."""
+    row = db.query(models.TenantLedger).filter(models.TenantLedger.tenant_id == tenant_id).first()
+    if row is None:
+        return {f: (None if f.endswith("_cutoff") else 0) for f in FIELDS}
+    return {f: getattr(row, f) or (None if f.endswith("_cutoff") else 0) for f in FIELDS}
+
+
+# ── Reconstrucción y conciliación ─────────────────────────────────────────
+
+def compute(db, tenant_ids=None) -> dict:
+    """{tenant_id: {campo: valor}} recalculado desde orders y liquidations con
+    dos consultas agrupadas. tenant_ids=None = todos los tenants con datos."""
+    L, O = models.Liquidation, models.Order
+    paid = (
+        db.query(
+            L.tenant_id.label("tenant_id"),
+            func.max(case((L.liq_type == "web", coverage()))).label("web_cutoff"),
+            func.max(case((L.liq_type == "pos_commission", coverage()))).label("pos_cutoff"),
+            func.coalesce(func.sum(L.net_amount), 0.0).label("paid_net"),
+            func.coalesce(func.sum(L.gross_amount), 0.0).label("paid_gross"),
+            func.coalesce(func.sum(L.bayup_commission), 0.0).label("paid_bayup"),
+            func.count().label("paid_count"),
+        )
+        .filter(L.status == "paid", L.tenant_id.isnot(None))
+        .group_by(L.tenant_id)
+    )
+    if tenant_ids is not None:
+        paid = paid.filter(L.tenant_id.in_(list(tenant_ids)))
+    paid = paid.subquery()
+
+    def _pending(kind):
+        cutoff = paid.c[f"{kind}_cutoff"]
+        cond = and_(is_kind(kind), or_(cutoff.is_(None), O.created_at > cutoff))
+        return (
+            func.coalesce(func.sum(case((cond, O.total_price), else_=0.0)), 0.0),
+            func.coalesce(func.sum(case((cond, 1), else_=0)), 0),
+        )
+
+    web_gross, web_count = _pending("web")
+    pos_gross, pos_count = _pending("pos")
+    pending = (
+        db.query(O.tenant_id, web_gross, web_count, pos_gross, pos_count)
+        .outerjoin(paid, paid.c.tenant_id == O.tenant_id)
+        .filter(O.tenant_id.isnot(None), O.status.in_(COMMISSIONABLE))
+        .group_by(O.tenant_id)
+    )
+    if tenant_ids is not None:
+        pending = pending.filter(O.tenant_id.in_(list(tenant_ids)))
+
+    out: dict = {}
+    blank = {f: (None if f.endswith("_cutoff") else 0) for f in FIELDS}
+    for tid, wg, wc, pg, pc in pending.all():
+        out[tid] = {**blank, "web_gross": float(wg), "web_count": int(wc), "pos_gross": float(pg), "pos_count": int(pc)}
+    for r in db.query(paid).all():
+        entry = out.setdefault(r.tenant_id, dict(blank))
+        for f in ("web_cutoff", "pos_cutoff", "paid_net", "paid_gross", "paid_bayup", "paid_count"):
+            entry[f] = getattr(r, f)
+    return out
+
+
+def _differs(a, b) -> bool:
+    if isinstance(a, float) or isinstance(b, float):
+        return abs((a or 0.0) - (b or 0.0)) > _TOLERANCE
+    return a != b
+
+
+def reconcile(db, fix: bool = False, tenant_ids=None) -> list[dict]:
+    """Compara el ledger con lo recalculado desde la historia. Devuelve las
+    diferencias [{tenant_id, field, ledger, expected}]. Con fix=True reescribe
+    cada tenant con diferencias: bloquea su fila, recalcula y confirma, así un
+    pedido en curso no se pierde ni se cuenta dos veces."""
+    expected = compute(db, tenant_ids)
+    q = db.query(models.TenantLedger)
+    if tenant_ids is not None:
+        q = q.filter(models.TenantLedger.tenant_id.in_(list(tenant_ids)))
+    stored = {r.tenant_id: {f: getattr(r, f) for f in FIELDS} for r in q}
+    blank = {f: (None if f.endswith("_cutoff") else 0) for f in FIELDS}
+    drift = []
+    for tid in set(expected) | set(stored):
+        want, have = expected.get(tid, blank), stored.get(tid, blank)
+        for f in FIELDS:
+            if _differs(have[f], want[f]):
+                drift.append({"tenant_id": tid, "field": f, "ledger": have[f], "expected": want[f]})
+    if fix:
+        for tid in sorted({d["tenant_id"] for d in drift}):
+            _rebuild_tenant(db, tid)
+    return drift
+
+
+def _rebuild_tenant(db, tenant_id) -> None:
+    conn = db.connection()
+    _ensure_rows(conn, [tenant_id])
+    T = models.TenantLedger.__table__
+    conn.execute(select(T.c.tenant_id).where(T.c.tenant_id == tenant_id).with_for_update())
+    values = compute(db, [tenant_id]).get(tenant_id) or {f: (None if f.endswith("_cutoff") else 0) for f in FIELDS}
+    conn.execute(update(T).where(T.c.tenant_id == tenant_id).values({**values, "updated_at": _dt.datetime.utcnow()}))
+    db.commit()
+    logger.info("tenant_ledger: tenant %s reconstruido", tenant_id)
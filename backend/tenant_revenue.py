@@ -0,0 +1,169 @@
+"""
+Ventas y comisión por tenant y día (tenant_daily_revenue).
+
+/super-admin/treasury traía un año de pedidos de todos los tenants a Python
+para repartirlos por mes y por tienda, y /super-admin/reports hacía lo mismo
+con el periodo elegido. Ahora leen esta tabla, que crece con días × tenants y
+no con pedidos:
+  - Se mantiene en cada flush del ORM que crea, modifica (tenant_id,
+    created_at, total_price, commission_amount) o borra un Order: los deltas
+    se aplican con un upsert aditivo (revenue = revenue + delta) en la misma
+    transacción, así dos pedidos concurrentes del mismo día no se pisan.
+  - totals() suma los días completos desde la tabla y sólo los bordes
+    parciales del rango desde orders, con GROUP BY en la DB. Los pedidos sin
+    tenant (tenant_id NULL) no caben en la tabla (es parte de la PK): se leen
+    de orders, por el índice de tenant_id, bajo la clave None.
+
+Los borrados o updates masivos con query().delete()/update() no pasan por el
+ORM: quien los hace corrige la tabla a mano (ver delete_company).
+"""
+import datetime as _dt
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+import flush_history
+import models
+
+_TRACKED = ("tenant_id", "created_at", "total_price", "commission_amount")
+_INFO_KEY = "tenant_revenue_deltas"
+
+
+# ── Mantenimiento en escrituras de pedidos ────────────────────────────────
+
+def _bump(deltas: dict, tenant_id, created_at, revenue, commission, n: int) -> None:
+    # Pedidos sin tenant o sin fecha no entran al rollup (tampoco al backfill)
+    if tenant_id is None or created_at is None:
+        return
+    entry = deltas.setdefault((tenant_id, created_at.date()), [0.0, 0.0, 0])
+    entry[0] += n * (revenue or 0.0)
+    entry[1] += n * (commission or 0.0)
+    entry[2] += n
+
+
+flush_history.track(models.Order, _TRACKED)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_revenue_deltas(session, flush_context, instances):
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, models.Order):
+            flush_history.ensure_created_at(obj)
+            _bump(deltas, *flush_history.values(obj, _TRACKED), 1)
+    for obj in session.dirty:
+        if not isinstance(obj, models.Order):
+            continue
+        diff = flush_history.old_new(obj, _TRACKED)
+        if diff is not None:
+            _bump(deltas, *diff[0], -1)
+            _bump(deltas, *diff[1], 1)
+    for obj in session.deleted:
+        if isinstance(obj, models.Order):
+            _bump(deltas, *flush_history.values(obj, _TRACKED), -1)
+    if deltas:
+        pending = session.info.setdefault(_INFO_KEY, {})
+        for key, (rev, com, n) in deltas.items():
+            entry = pending.setdefault(key, [0.0, 0.0, 0])
+            entry[0] += rev
+            entry[1] += com
+            entry[2] += n
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_revenue_deltas(session, flush_context):
+    deltas = session.info.pop(_INFO_KEY, None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_revenue_deltas(session, previous_transaction):
+    session.info.pop(_INFO_KEY, None)
+
+
+def apply_deltas(conn, deltas: dict) -> None:
+    """Upsert aditivo de {(tenant_id, día): [revenue, commission, orders]}.
+    En orden de clave: dos transacciones no se bloquean en orden cruzado."""
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = models.TenantDailyRevenue.__table__
+    rows = [
+        {"tenant_id": tenant_id, "day": day, "revenue": rev, "commission": com, "orders": n}
+        for (tenant_id, day), (rev, com, n) in sorted(deltas.items())
+    ]
+    stmt = insert(table).values(rows)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.tenant_id, table.c.day],
+        set_={
+            "revenue": table.c.revenue + stmt.excluded.revenue,
+            "commission": table.c.commission + stmt.excluded.commission,
+            "orders": table.c.orders + stmt.excluded.orders,
+        },
+    ))
+
+
+# ── Lectura ───────────────────────────────────────────────────────────────
+
+def _day_start(d: _dt.date) -> _dt.datetime:
+    return _dt.datetime.combine(d, _dt.time.min)
+
+
+def _split(start: _dt.datetime, end: _dt.datetime | None):
+    """Días completos de [start, end) que se leen del rollup (primero, último;
+    último=None = sin tope) y rangos parciales que se leen de orders."""
+    first = start.date() if start == _day_start(start.date()) else start.date() + _dt.timedelta(days=1)
+    if end is None:
+        return first, None, [(start, _day_start(first))]
+    last = end.date() - _dt.timedelta(days=1)
+    if first > last:
+        return None, None, [(start, end)]
+    return first, last, [(start, _day_start(first)), (_day_start(end.date()), end)]
+
+
+def _month_keys(col):
+    return func.extract("year", col), func.extract("month", col)
+
+
+def totals(db, start: _dt.datetime, end: _dt.datetime | None = None, by: str = "tenant") -> dict:
+    """{tenant_id: [revenue, commission, orders]} (by="tenant") o
+    {(año, mes): [...]} (by="month") de los pedidos creados en [start, end).
+    end=None = hasta ahora, incluido el día en curso desde el rollup. Los
+    pedidos sin tenant cuentan: en by="tenant" van bajo la clave None."""
+    R, O = models.TenantDailyRevenue, models.Order
+    first, last, raw = _split(start, end)
+    out: dict = {}
+
+    def _add(rows):
+        for *key, rev, com, n in rows:
+            k = key[0] if by == "tenant" else (int(key[0]), int(key[1]))
+            entry = out.setdefault(k, [0.0, 0.0, 0])
+            entry[0] += float(rev or 0.0)
+            entry[1] += float(com or 0.0)
+            entry[2] += int(n or 0)
+
+    order_keys = (O.tenant_id,) if by == "tenant" else _month_keys(O.created_at)
+
+    def _orders(*conds):
+        return db.query(
+            *order_keys, func.sum(O.total_price), func.sum(O.commission_amount), func.count(),
+        ).filter(*conds).group_by(*order_keys).all()
+
+    if first is not None:
+        keys = (R.tenant_id,) if by == "tenant" else _month_keys(R.day)
+        q = db.query(*keys, func.sum(R.revenue), func.sum(R.commission), func.sum(R.orders)).filter(R.day >= first)
+        if last is not None:
+            q = q.filter(R.day <= last)
+        _add(q.group_by(*keys).all())
+        # Los días completos de los pedidos sin tenant, que el rollup no tiene
+        conds = [O.tenant_id.is_(None), O.created_at >= _day_start(first)]
+        if last is not None:
+            conds.append(O.created_at < _day_start(last + _dt.timedelta(days=1)))
+        _add(_orders(*conds))
+    for a, b in raw:
+        if a >= b:
+            continue
+        _add(_orders(O.created_at >= a, O.created_at < b))
+    return out
@@ -38,6 +38,9 @@ def create_tables():
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """))
+        import email_queue
+        for ddl in email_queue.INDEXES_SQL:
+            conn.execute(text(ddl))
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -53,8 +56,7 @@ def clean_db_after_test():
         conn.execute(_text("DELETE FROM email_jobs"))
     # Limpiar cachés en memoria para que no contaminen el siguiente test
     import cache as _cache_mod
-    _cache_mod.shop_cache.clear()
-    _cache_mod.templates_cache.clear()
+    _cache_mod.reset_all()
 
 
 @pytest.fixture
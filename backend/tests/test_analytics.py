@@ -226,3 +226,210 @@ def test_summary_incluye_top_searches(client, db_session, tenant_user, tenant_to
     data = r.json()
     assert data["top_searches"][0] == {"term": "camiseta", "count": 2}
     assert {"term": "gorra", "count": 1} in data["top_searches"]
+
+
+# ── analytics_ingest: volcado en lote ───────────────────────────────────────
+
+def _pv(tenant_id, visitor, session, new=False, path="/shop/x"):
+    import datetime
+    return {
+        "kind": "pageview", "tenant_id": tenant_id, "visitor_id": visitor, "session_id": session,
+        "path": path, "is_new_session": new, "source": "direct", "referrer_domain": None,
+        "device": "desktop", "ts": datetime.datetime.utcnow(),
+    }
+
+
+def test_ingest_lote_agrega_contadores_y_visitantes(db_session, tenant_user):
+    import analytics_ingest
+    v = uuid.uuid4()
+    s1, s2, huerfana = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    batch = [
+        _pv(tenant_user.id, v, s1, new=True),
+        _pv(tenant_user.id, v, s1, new=True),  # doble disparo: no duplica la sesión
+        _pv(tenant_user.id, v, s1),
+        _pv(tenant_user.id, v, s2, new=True),  # mismo visitante, segunda sesión del lote
+        _pv(tenant_user.id, v, huerfana),      # sesión desconocida: se descarta
+    ]
+    analytics_ingest.flush_events(batch, db_session)
+
+    assert db_session.query(models.AnalyticsVisitor).count() == 1
+    ses1 = db_session.query(models.AnalyticsSession).filter(models.AnalyticsSession.id == s1).one()
+    ses2 = db_session.query(models.AnalyticsSession).filter(models.AnalyticsSession.id == s2).one()
+    assert ses1.pageview_count == 3
+    assert ses1.is_new_visitor is True
+    assert ses2.is_new_visitor is False
+    assert db_session.query(models.AnalyticsPageview).count() == 4
+
+
+def test_ingest_evento_invalido_no_descarta_el_lote(monkeypatch, db_session, tenant_user):
+    import collections
+    import analytics_ingest
+    v, s1 = uuid.uuid4(), uuid.uuid4()
+    roto = _pv(tenant_user.id, v, s1)
+    del roto["path"]
+    batch = [_pv(tenant_user.id, v, s1, new=True), _pv(tenant_user.id, v, s1), roto, _pv(tenant_user.id, v, s1)]
+    monkeypatch.setattr(analytics_ingest, "_buffer", collections.deque(batch))
+    before = analytics_ingest.stats()["dropped"]
+
+    assert analytics_ingest.flush_now() == 3
+    assert analytics_ingest.stats()["dropped"] == before + 1
+    db_session.expire_all()
+    assert db_session.query(models.AnalyticsPageview).count() == 3
+    assert db_session.get(models.AnalyticsSession, s1).pageview_count == 3
+
+
+def test_ingest_error_de_conexion_no_cuenta_lo_ya_escrito(monkeypatch, db_session, tenant_user):
+    import collections
+    import analytics_ingest
+    v, s1 = uuid.uuid4(), uuid.uuid4()
+    roto = _pv(tenant_user.id, v, s1)
+    del roto["path"]
+    batch = [_pv(tenant_user.id, v, s1, new=True), _pv(tenant_user.id, v, s1), roto, _pv(tenant_user.id, v, s1)]
+    monkeypatch.setattr(analytics_ingest, "_buffer", collections.deque(batch))
+    original = analytics_ingest.flush_events
+
+    def _se_cae_con_la_segunda_mitad(events, db):
+        if events[0] is roto:
+            raise ConnectionError("conexión perdida")
+        return original(events, db)
+    monkeypatch.setattr(analytics_ingest, "flush_events", _se_cae_con_la_segunda_mitad)
+    before = analytics_ingest.stats()
+
+    # Lote completo: falla por la fila rota; primera mitad confirma; la segunda pierde la conexión
+    assert analytics_ingest.flush_now() == 2
+    after = analytics_ingest.stats()
+    assert after["dropped"] == before["dropped"] + 2
+    assert after["flushed"] == before["flushed"] + 2
+    db_session.expire_all()
+    assert db_session.query(models.AnalyticsPageview).count() == 2
+
+
+def test_ingest_buffer_lleno_descarta_y_cuenta(monkeypatch, db_session, tenant_user):
+    import analytics_ingest
+    monkeypatch.setattr(analytics_ingest, "_flusher_started", True)
+    monkeypatch.setattr(analytics_ingest, "MAX_BUFFER", 2)
+    monkeypatch.setattr(analytics_ingest, "_buffer", __import__("collections").deque())
+    before = analytics_ingest.stats()["dropped"]
+    results = [
+        analytics_ingest.session_end(db_session, session_id=uuid.uuid4(), duration_seconds=1)
+        for _ in range(3)
+    ]
+    assert results == [True, True, False]
+    assert analytics_ingest.stats()["dropped"] == before + 1
+    assert analytics_ingest.stats()["buffer_size"] == 2
+
+
+# ── analytics_rollup: días cerrados ─────────────────────────────────────────
+
+def _seed_historial(db_session, tenant_id):
+    import datetime
+    hoy = datetime.datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    visitante = uuid.uuid4()
+    db_session.add(models.AnalyticsVisitor(tenant_id=tenant_id, visitor_id=visitante))
+    for dias, pvs, fuente in ((10, 1, "search"), (5, 3, "direct"), (5, 2, "social"), (0, 1, "direct")):
+        ts = hoy - datetime.timedelta(days=dias)
+        sesion = models.AnalyticsSession(
+            id=uuid.uuid4(), tenant_id=tenant_id, visitor_id=visitante, is_new_visitor=(dias == 10),
+            source=fuente, device_type="mobile", entry_path="/shop/x",
+            pageview_count=pvs, duration_seconds=30, started_at=ts,
+        )
+        db_session.add(sesion)
+        for i in range(pvs):
+            db_session.add(models.AnalyticsPageview(
+                tenant_id=tenant_id, session_id=sesion.id, path=f"/shop/x?p={i}", created_at=ts,
+            ))
+        db_session.add(models.AnalyticsSearch(tenant_id=tenant_id, term="gorra", results_count=1, created_at=ts))
+    db_session.commit()
+
+
+def test_rollup_resumen_igual_al_crudo(client, db_session, tenant_user, tenant_token):
+    import analytics_rollup
+    _seed_historial(db_session, tenant_user.id)
+    headers = {"Authorization": f"Bearer {tenant_token}"}
+    antes = client.get("/web-analytics/summary?period=30d", headers=headers).json()
+
+    assert analytics_rollup.run_once(db_session) > 0
+    assert db_session.query(models.AnalyticsDailyRollup).count() == 2
+    assert analytics_rollup.run_once(db_session) == 0  # nada pendiente
+
+    despues = client.get("/web-analytics/summary?period=30d", headers=headers).json()
+    assert despues == antes
+    assert despues["total_sessions"] == 4
+    assert despues["unique_visitors"] == 1
+
+
+def test_summary_top_pages_limite_y_desempate(client, db_session, tenant_user, tenant_token):
+    import datetime
+    base = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    sid = uuid.uuid4()
+    db_session.add(models.AnalyticsSession(
+        id=sid, tenant_id=tenant_user.id, visitor_id=uuid.uuid4(), pageview_count=14, started_at=base,
+    ))
+    # /p0 tiene 3 vistas; /p1../p12 una cada una, /p12 la más antigua
+    for i, path in enumerate(["/p0", "/p0", "/p0"] + [f"/p{n}" for n in range(1, 12)]):
+        db_session.add(models.AnalyticsPageview(
+            tenant_id=tenant_user.id, session_id=sid, path=path, created_at=base + datetime.timedelta(seconds=i),
+        ))
+    db_session.add(models.AnalyticsPageview(tenant_id=tenant_user.id, session_id=sid, path="/p12", created_at=base))
+    db_session.commit()
+
+    data = client.get("/web-analytics/summary", headers={"Authorization": f"Bearer {tenant_token}"}).json()
+    assert data["total_pageviews"] == 15
+    assert [p["path"] for p in data["top_pages"]] == ["/p0", "/p12"] + [f"/p{n}" for n in range(1, 9)]
+
+
+# ── analytics_retention ─────────────────────────────────────────────────────
+
+def test_retencion_borra_crudo_viejo_solo_si_esta_agregado(db_session, tenant_user):
+    import datetime
+    import analytics_retention
+    now = datetime.datetime.utcnow()
+    viejo = now - datetime.timedelta(days=analytics_retention.RETENTION_DAYS + 30)
+    otro = models.User(email="retencion@test.com", hashed_password="x", full_name="Otra",
+                       shop_slug="otra-retencion", role="admin_tienda", status="Activo")
+    db_session.add(otro)
+    db_session.commit()
+    for tenant in (tenant_user, otro):
+        sid = uuid.uuid4()
+        db_session.add(models.AnalyticsSession(id=sid, tenant_id=tenant.id, visitor_id=uuid.uuid4(), started_at=viejo))
+        db_session.add(models.AnalyticsPageview(tenant_id=tenant.id, session_id=sid, path="/", created_at=viejo))
+        db_session.add(models.AnalyticsSearch(tenant_id=tenant.id, term="gorra", created_at=viejo))
+    db_session.add(models.AnalyticsSession(id=uuid.uuid4(), tenant_id=tenant_user.id, visitor_id=uuid.uuid4(), started_at=now))
+    # tenant_user ya agregó todo; el otro tenant tiene el job atrasado antes de esas filas
+    db_session.add(models.AnalyticsRollupState(tenant_id=tenant_user.id, rolled_through=now.date()))
+    db_session.add(models.AnalyticsRollupState(tenant_id=otro.id, rolled_through=(viejo - datetime.timedelta(days=3)).date()))
+    db_session.commit()
+
+    result = analytics_retention.run_once(db_session, now=now)
+
+    assert result["analytics_sessions"] == {"rows": 1}
+    assert result["analytics_pageviews"] == {"rows": 1}
+    assert result["analytics_searches"] == {"rows": 1}
+    restantes = db_session.query(models.AnalyticsSession.tenant_id).all()
+    assert sorted(str(r[0]) for r in restantes) == sorted([str(tenant_user.id), str(otro.id)])
+    assert db_session.query(models.AnalyticsPageview).filter(models.AnalyticsPageview.tenant_id == otro.id).count() == 1
+
+
+def test_retencion_conserva_sesiones_con_hijos_posteriores_al_corte(db_session, tenant_user):
+    import datetime
+    import analytics_retention
+    now = datetime.datetime.utcnow()
+    corte = analytics_retention.retention_cutoff(now)
+    sid = uuid.uuid4()
+    db_session.add(models.AnalyticsSession(id=sid, tenant_id=tenant_user.id, visitor_id=uuid.uuid4(),
+                                           started_at=corte - datetime.timedelta(minutes=5)))
+    db_session.add(models.AnalyticsPageview(tenant_id=tenant_user.id, session_id=sid, path="/",
+                                            created_at=corte - datetime.timedelta(minutes=5)))
+    db_session.add(models.AnalyticsSearch(tenant_id=tenant_user.id, session_id=sid, term="gorra",
+                                          created_at=corte + datetime.timedelta(minutes=5)))
+    db_session.add(models.AnalyticsRollupState(tenant_id=tenant_user.id, rolled_through=now.date()))
+    db_session.commit()
+
+    result = analytics_retention.run_once(db_session, now=now)
+    assert result["analytics_pageviews"] == {"rows": 1}
+    assert result["analytics_sessions"] == {"rows": 0}
+    assert db_session.get(models.AnalyticsSession, sid) is not None
+
+    # Cuando vencen sus hijos, la sesión se va con ellos
+    result = analytics_retention.run_once(db_session, now=now + datetime.timedelta(days=1))
+    assert result["analytics_searches"] == {"rows": 1} and result["analytics_sessions"] == {"rows": 1}
@@ -0,0 +1,32 @@
+"""Tests del SDK como asset estático versionado — /static/bayup-<hash>.js."""
+import static_assets
+
+
+def test_sdk_inmutable_y_comprimido(client):
+    url = static_assets.asset_url("bayup")
+    r = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert "immutable" in r.headers["cache-control"]
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["content-type"].startswith("application/javascript")
+    assert "bayupSlug" in r.text
+    r2 = client.get(url, headers={"If-None-Match": r.headers["etag"]})
+    assert r2.status_code == 304
+
+
+def test_hash_viejo_redirige_a_vigente(client):
+    r = client.get("/static/bayup-000000000000.js", follow_redirects=False)
+    assert r.status_code == 302
+    assert r.headers["location"] == f"/static/{static_assets.current_filename('bayup')}"
+
+
+def test_asset_inexistente(client):
+    assert client.get("/static/otro.css").status_code == 404
+
+
+def test_preview_script_tag_lleva_config_en_data_attributes():
+    tag = static_assets.preview_script_tag("https://api.test", "tpl-1", token="t<k", mode="public")
+    assert 'data-tplid="tpl-1"' in tag
+    assert 'data-tok="t&lt;k"' in tag
+    assert 'data-mode="public"' in tag
+    assert f'src="https://api.test/static/{static_assets.current_filename("bayup-preview")}"' in tag
@@ -180,3 +180,48 @@ def test_reset_password_token_expirado(client, db_session):
         "new_password": "nueva1234",
     })
     assert r.status_code == 400
+
+
+# ── Principal cacheado ────────────────────────────────────────────────────
+
+def test_principal_cacheado_evita_busqueda_por_email(client, tenant_token, monkeypatch):
+    import crud
+    llamadas = []
+    original = crud.get_user_by_email
+    monkeypatch.setattr(crud, "get_user_by_email", lambda db, email: llamadas.append(email) or original(db, email))
+    headers = {"Authorization": f"Bearer {tenant_token}"}
+    assert client.get("/auth/me", headers=headers).status_code == 200
+    assert client.get("/auth/me", headers=headers).status_code == 200
+    assert llamadas == ["tenant@test.com"]
+
+
+def test_principal_cacheado_no_consulta_usuarios(client, db_session, tenant_user, tenant_token):
+    from sqlalchemy import event
+    from starlette.requests import Request
+    import security
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {tenant_token}"}).status_code == 200
+    db_session.expunge_all()  # sin el User en el identity map
+    selects = []
+    engine = db_session.get_bind()
+
+    def _count(conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            selects.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        user = security.get_current_user(Request({"type": "http", "headers": []}), tenant_token, db_session)
+        assert (user.id, user.role, user.email) == (tenant_user.id, "admin_tienda", "tenant@test.com")
+        assert selects == []
+        assert user.full_name == tenant_user.full_name  # columna fuera del principal: carga por PK
+        assert len(selects) == 1
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+
+
+def test_principal_se_invalida_al_cambiar_estado(client, db_session, tenant_user, tenant_token):
+    headers = {"Authorization": f"Bearer {tenant_token}"}
+    assert client.get("/auth/me", headers=headers).status_code == 200
+    tenant_user.status = "Suspendido"
+    db_session.commit()
+    assert client.get("/auth/me", headers=headers).status_code == 403
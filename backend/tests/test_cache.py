@@ -0,0 +1,150 @@
+"""Tests de la caché LRU+TTL — expiración, evicción, invalidación y single-flight."""
+import threading
+import time
+
+import cache
+
+
+def test_get_set_y_contadores():
+    c = cache.TTLCache("t-basic", max_size=10)
+    assert c.get("a") is None
+    c.set("a", {"x": 1}, ttl=60)
+    assert c.get("a") == {"x": 1}
+    s = c.stats()
+    assert s["hits"] == 1 and s["misses"] == 1 and s["size"] == 1
+
+
+def test_expira_por_ttl(monkeypatch):
+    c = cache.TTLCache("t-ttl")
+    c.set("a", 1, ttl=10)
+    now = time.time()
+    monkeypatch.setattr(cache.time, "time", lambda: now + 11)
+    assert c.get("a") is None
+    assert c.stats()["expirations"] == 1
+
+
+def test_evicta_lru():
+    c = cache.TTLCache("t-lru", max_size=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")  # "a" pasa a ser la más reciente
+    c.set("c", 3)
+    assert "b" not in c
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.stats()["evictions"] == 1
+
+
+def test_invalidate_prefix_y_pop():
+    c = cache.TTLCache("t-prefix")
+    c.set("slug:1", 1)
+    c.set("slug:2", 2)
+    c.set("otro", 3)
+    c.invalidate_prefix("slug:")
+    assert len(c) == 1
+    assert c.pop("otro") == 3
+    assert c.pop("otro", "nada") == "nada"
+
+
+def test_get_or_load_single_flight():
+    c = cache.TTLCache("t-sf")
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return "valor"
+
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(c.get_or_load("hot", loader, ttl=60))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["valor"] * 8
+    assert len(calls) == 1
+
+
+def test_get_or_load_no_cachea_none():
+    c = cache.TTLCache("t-none")
+    assert c.get_or_load("k", lambda: None) is None
+    assert "k" not in c
+
+
+# ── Tier compartido ───────────────────────────────────────────────────────
+
+class _FakeRedis:
+    """Lo mínimo de redis.Redis que usa cache.py."""
+    def __init__(self):
+        self.data, self.published = {}, []
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+
+    def delete(self, key):
+        self.data.pop(key.decode() if isinstance(key, bytes) else key, None)
+
+    def scan_iter(self, match, count=None):
+        prefix = match.rstrip("*")
+        return [k for k in list(self.data) if k.startswith(prefix)]
+
+    def publish(self, channel, message):
+        self.published.append(message)
+
+
+def _con_redis(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(cache, "_shared_client", fake)
+    monkeypatch.setattr(cache, "_shared_checked", True)
+    return fake
+
+
+def test_tier_compartido_json_ida_y_vuelta(monkeypatch):
+    import datetime
+    import json
+    import uuid
+    fake = _con_redis(monkeypatch)
+    valor = {"id": uuid.uuid4(), "body": b"\x1f\x8b gz", "at": datetime.datetime(2026, 1, 2, 3, 4, 5),
+             "entry": (b"{}", '"etag"')}
+    escritor, lector = cache.TTLCache("t-shared"), cache.TTLCache("t-shared")
+    escritor.set("k", valor, ttl=60)
+    raw = fake.data["bayup:cache:t-shared:k"]
+    assert json.loads(raw)["value"]["id"] == {"__bayup__": "uuid", "v": str(valor["id"])}
+
+    leido = lector.get("k")  # otro worker: sin copia local, sale de Redis
+    assert leido == {**valor, "entry": [b"{}", '"etag"']}
+    assert lector.stats()["shared_hits"] == 1
+
+
+def test_tier_compartido_invalida_y_no_deserializa_pickle(monkeypatch):
+    import pickle
+    fake = _con_redis(monkeypatch)
+    c = cache.TTLCache("t-shared-inv")
+    c.set("slug:1", 1)
+    c.set("slug:2", 2)
+    c.set("otro", 3)
+    c.invalidate("otro")
+    assert "bayup:cache:t-shared-inv:otro" not in fake.data
+    c.invalidate_prefix("slug:")
+    assert fake.data == {}
+    assert fake.published[-1].endswith("|t-shared-inv|prefix|slug:")
+
+    fake.data["bayup:cache:t-shared-inv:viejo"] = pickle.dumps((1, time.time() + 60))
+    assert c.get("viejo") is None
+
+
+def test_cache_stats_endpoint(client, admin_token, tenant_token):
+    r = client.get("/super-admin/observability/cache", headers={"Authorization": f"Bearer {admin_token}"})
+    assert r.status_code == 200
+    names = {c["name"] for c in r.json()["caches"]}
+    assert {"shop", "templates"} <= names
+    r = client.get("/super-admin/observability/cache", headers={"Authorization": f"Bearer {tenant_token}"})
+    assert r.status_code == 403
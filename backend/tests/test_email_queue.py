@@ -0,0 +1,299 @@
+"""Tests de email_queue — envío por lotes (POST /emails/batch) y concurrente
+por la sesión con keep-alive de email_service contra un stub HTTP local del
+proveedor, digest de avisos de venta, cierre de estados en lote y reintentos."""
+import base64
+import datetime as _dt
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import text
+
+import blob_store
+import email_queue
+import email_service
+
+
+@pytest.fixture
+def resend_stub(monkeypatch):
+    """Servidor HTTP/1.1 local que imita POST /emails y POST /emails/batch de
+    Resend. Registra destinatarios, asuntos, requests por ruta y el puerto del
+    cliente (una conexión TCP por puerto). Un lote con algún destinatario
+    "falla..." se rechaza entero, como hace Resend."""
+    seen = {"to": [], "subjects": [], "attachments": [], "ports": set(), "/emails": 0, "/emails/batch": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            emails = body if self.path == "/emails/batch" else [body]
+            rejected = any(e["to"][0].startswith("falla") for e in emails)
+            with lock:
+                seen[self.path] += 1
+                seen["ports"].add(self.client_address[1])
+                if not rejected:
+                    seen["to"].extend(e["to"][0] for e in emails)
+                    seen["subjects"].extend(e["subject"] for e in emails)
+                    seen["attachments"].extend(a["content"] for e in emails for a in e.get("attachments", []))
+            status = 500 if rejected else 200
+            payload = json.dumps({"id": "stub"}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(email_service, "_RESEND_API_KEY", "re_test")
+    monkeypatch.setattr(email_service, "_API_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(email_service, "_session", None)
+    yield seen
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def blob_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_DIR", tmp_path / "blobs")
+    monkeypatch.delenv("S3_BUCKET_NAME", raising=False)
+    return tmp_path / "blobs"
+
+
+def _encolar(db, to: str, func: str = "send_email", kwargs: dict | None = None, run_at=None) -> None:
+    now = email_queue._now()
+    db.execute(
+        text("INSERT INTO email_jobs (func, kwargs_json, created_at, updated_at) VALUES (:f, :k, :now, :run_at)"),
+        {"f": func, "k": json.dumps(kwargs or {"to": to, "subject": "Hola", "html": "<p>x</p>"}),
+         "now": now, "run_at": run_at or now},
+    )
+    db.commit()
+
+
+def _aviso(owner: str, n: int, total: float) -> dict:
+    return dict(
+        owner_email=owner, shop_name="Tienda", order_id=f"{n:08d}-pedido", customer_name=f"Cliente {n}",
+        customer_email="", customer_phone="", customer_city="",
+        items=[{"name": "Camisa", "qty": 1, "price": total}], total=total, payment_method="Wompi",
+    )
+
+
+def _estados(db) -> dict:
+    return dict(db.execute(text("SELECT status, COUNT(*) FROM email_jobs GROUP BY status")).fetchall())
+
+
+def test_lote_concurrente_reutiliza_conexiones(db_session, resend_stub):
+    for i in range(12):
+        _encolar(db_session, f"cliente{i}@test.com")
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        assert email_queue.run_batch(db_session, pool, limit=50) == 12
+        assert email_queue.run_batch(db_session, pool, limit=50) == 0
+
+    assert sorted(resend_stub["to"]) == sorted(f"cliente{i}@test.com" for i in range(12))
+    # Los 12 salen en un solo request de lote
+    assert resend_stub["/emails/batch"] == 1 and resend_stub["/emails"] == 0
+    assert len(resend_stub["ports"]) <= 3
+    assert _estados(db_session) == {"sent": 12}
+    assert email_queue.stats(db_session)["process"]["provider_requests"] >= 1
+
+
+def test_lote_respeta_limite_y_adjuntos_van_sueltos(db_session, resend_stub, monkeypatch):
+    monkeypatch.setattr(email_service, "BATCH_LIMIT", 5)
+    for i in range(11):
+        _encolar(db_session, f"cliente{i}@test.com")
+    _encolar(db_session, "", "send_invoice_attachment", dict(
+        email="factura@test.com", name="Ana", order_id="abc12345", shop_name="Tienda", pdf_base64="JVBERi0=",
+    ))
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        assert email_queue.run_batch(db_session, pool) == 12
+
+    # 11 sin adjunto en lotes de 5 (5 + 5 + 1); la factura con PDF va sola
+    assert resend_stub["/emails/batch"] == 3
+    assert resend_stub["/emails"] == 1
+    assert "factura@test.com" in resend_stub["to"]
+    assert _estados(db_session) == {"sent": 12}
+
+
+def test_rechazo_del_proveedor_se_reintenta(db_session, resend_stub):
+    _encolar(db_session, "ok@test.com")
+    _encolar(db_session, "falla@test.com")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        email_queue.run_batch(db_session, pool)
+        # El fallido queda pendiente con backoff: no se reclama de inmediato
+        assert email_queue.run_batch(db_session, pool) == 0
+
+    # El lote se rechazó entero; el reintento uno por uno aísla al inválido
+    assert resend_stub["to"] == ["ok@test.com"]
+    row = db_session.execute(text(
+        "SELECT status, attempts, error FROM email_jobs WHERE kwargs_json LIKE '%falla@%'"
+    )).one()
+    assert row[0] == "pending" and row[1] == 1 and "rechaz" in row[2]
+    stats = email_queue.stats(db_session)
+    assert stats["by_status"] == {"pending": 1, "sent": 1}
+    assert stats["process"]["retried"] >= 1
+
+
+def test_job_de_funcion_inexistente_falla_al_agotar_intentos(db_session, monkeypatch):
+    monkeypatch.setattr(email_queue, "RETRY_DELAY", 0)
+    db_session.execute(
+        text("INSERT INTO email_jobs (func, kwargs_json, created_at, updated_at) VALUES ('no_existe', '{}', :now, :now)"),
+        {"now": email_queue._now()},
+    )
+    db_session.commit()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        for _ in range(email_queue.MAX_ATTEMPTS):
+            assert email_queue.run_batch(db_session, pool) == 1
+        assert email_queue.run_batch(db_session, pool) == 0
+    assert _estados(db_session) == {"failed": 1}
+
+
+def test_digest_agrupa_avisos_de_venta_por_dueno(db_session, resend_stub):
+    vencido = email_queue._now() - _dt.timedelta(seconds=1)
+    for n, total in enumerate((10000, 20000, 30000)):
+        _encolar(db_session, "", email_queue.DIGEST_FUNC, _aviso("dueno@test.com", n, total), run_at=vencido)
+    _encolar(db_session, "", email_queue.DIGEST_FUNC, _aviso("otro@test.com", 9, 5000), run_at=vencido)
+    # Aviso de una ventana que aún no cierra: se queda retenido
+    _encolar(db_session, "", email_queue.DIGEST_FUNC, _aviso("dueno@test.com", 7, 1000),
+             run_at=email_queue.digest_window_end(15))
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert email_queue.run_batch(db_session, pool) == 4
+        assert email_queue.run_batch(db_session, pool) == 0
+
+    # Un resumen para el dueño con 3 ventas y un aviso normal para el que tuvo 1,
+    # ambos en el mismo request de lote
+    assert resend_stub["/emails/batch"] == 1
+    assert sorted(resend_stub["to"]) == ["dueno@test.com", "otro@test.com"]
+    assert any("3 ventas por $60.000" in s for s in resend_stub["subjects"])
+    assert any(s.startswith("🛒 Nueva venta $5.000") for s in resend_stub["subjects"])
+    assert _estados(db_session) == {"pending": 1, "sent": 4}
+
+
+def test_digest_window_end_alinea_ventanas():
+    t = _dt.datetime(2026, 8, 14, 10, 7, 30)
+    assert email_queue.digest_window_end(15, t) == _dt.datetime(2026, 8, 14, 10, 15)
+    assert email_queue.digest_window_end(15, _dt.datetime(2026, 8, 14, 10, 14, 59)) == _dt.datetime(2026, 8, 14, 10, 15)
+    assert email_queue.digest_window_end(60, t) == _dt.datetime(2026, 8, 14, 11, 0)
+
+
+def test_enqueue_many_entra_en_la_transaccion_del_llamador(db_session):
+    email_queue.enqueue_many([
+        ("send_email", {"to": "a@test.com", "subject": "A", "html": "<p>a</p>"}),
+        ("send_email", {"to": "b@test.com", "subject": "B", "html": "<p>b</p>"}),
+    ], db=db_session)
+    db_session.rollback()
+    # Sin commit del llamador no queda ningún job
+    assert _estados(db_session) == {}
+
+    vence = email_queue._now() + _dt.timedelta(minutes=5)
+    email_queue.enqueue_many([
+        ("send_email", {"to": "a@test.com", "subject": "A", "html": "<p>a</p>"}),
+        (email_queue.DIGEST_FUNC, {**_aviso("dueno@test.com", 1, 1000), "run_at": vence}),
+    ], db=db_session)
+    db_session.commit()
+    rows = db_session.execute(text("SELECT func, kwargs_json, updated_at FROM email_jobs ORDER BY id")).fetchall()
+    assert [r[0] for r in rows] == ["send_email", email_queue.DIGEST_FUNC]
+    # run_at se usa como vencimiento y no viaja en los kwargs del email
+    assert "run_at" not in json.loads(rows[1][1])
+    assert str(rows[1][2]).startswith(vence.isoformat(sep=" ")[:19])
+
+
+def _factura(pdf_ref: str) -> dict:
+    return dict(email="factura@test.com", name="Ana", order_id="abc12345", shop_name="Tienda", pdf_ref=pdf_ref)
+
+
+def test_adjunto_por_referencia_se_lee_al_enviar_y_se_recolecta(db_session, resend_stub, blob_dir):
+    pdf = b"%PDF-1.4 " + bytes(range(256)) * 2000
+    ref = blob_store.put(pdf)
+    # Mismo contenido, misma clave: un solo blob
+    assert blob_store.put(pdf) == ref
+    assert len(list(blob_dir.glob("??/*"))) == 1
+    _encolar(db_session, "", "send_invoice_attachment", _factura(ref))
+    assert len(db_session.execute(text("SELECT kwargs_json FROM email_jobs")).scalar()) < 300
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        assert email_queue.run_batch(db_session, pool) == 1
+
+    assert resend_stub["attachments"] == [base64.b64encode(pdf).decode()]
+    assert _estados(db_session) == {"sent": 1}
+    # Job cerrado y sin otros jobs abiertos que lo usen: el blob se borra
+    assert list(blob_dir.glob("??/*")) == []
+
+
+def test_blob_compartido_con_job_abierto_no_se_borra(db_session, blob_dir):
+    ref = blob_store.put(b"%PDF compartido")
+    huerfano = blob_store.put(b"%PDF huerfano")
+    _encolar(db_session, "", "send_invoice_attachment", _factura(ref))
+    despues = email_queue._now() + _dt.timedelta(seconds=blob_store.GC_GRACE_S + 60)
+
+    assert blob_store.collect(db_session, {ref: despues}) == 0
+    # El barrido sólo borra blobs viejos sin job abierto
+    assert blob_store.sweep(db_session) == 0
+    assert blob_store.sweep(db_session, now=despues) == 1
+    assert [p.name for p in blob_dir.glob("??/*")] == [ref.rsplit(":", 1)[1]]
+    assert huerfano.rsplit(":", 1)[1] not in [p.name for p in blob_dir.glob("??/*")]
+
+
+def test_worker_externo_exige_almacenamiento_compartido(monkeypatch):
+    monkeypatch.delenv("S3_BUCKET_NAME", raising=False)
+    monkeypatch.delenv("EMAIL_BLOB_DIR", raising=False)
+    with pytest.raises(RuntimeError, match="EMAIL_BLOB_DIR"):
+        blob_store.require_shared_storage()
+    monkeypatch.setenv("EMAIL_BLOB_DIR", "/mnt/compartido/blobs")
+    blob_store.require_shared_storage()
+    monkeypatch.delenv("EMAIL_BLOB_DIR")
+    monkeypatch.setenv("S3_BUCKET_NAME", "bayup")
+    monkeypatch.setenv("SUPABASE_S3_ENDPOINT", "https://s3.example.com")
+    blob_store.require_shared_storage()
+
+
+def _historial(db, n: int, dias: int, status: str = "sent") -> None:
+    cuando = email_queue._now() - _dt.timedelta(days=dias)
+    db.execute(
+        text(
+            "INSERT INTO email_jobs (func, kwargs_json, status, created_at, updated_at) "
+            "VALUES ('send_email', '{}', :status, :t, :t)"
+        ),
+        [{"status": status, "t": cuando}] * n,
+    )
+    db.commit()
+
+
+def test_archivador_borra_enviados_viejos_en_lotes(db_session):
+    _historial(db_session, 25, dias=30)
+    _historial(db_session, 3, dias=30, status="failed")
+    _historial(db_session, 4, dias=1)
+    _encolar(db_session, "pendiente@test.com")
+
+    assert email_queue.archive_sent(db_session, older_than_days=14, batch=10) == 25
+    # Los fallidos y los enviados recientes se conservan
+    assert _estados(db_session) == {"failed": 3, "sent": 4, "pending": 1}
+    assert email_queue.stats(db_session)["process"]["archived"] >= 25
+
+
+def test_stats_separa_vencidos_programados_y_colgados(db_session):
+    _encolar(db_session, "ya@test.com")
+    _encolar(db_session, "", email_queue.DIGEST_FUNC, _aviso("dueno@test.com", 1, 1000),
+             run_at=email_queue._now() + _dt.timedelta(minutes=10))
+    _historial(db_session, 1, dias=1, status="processing")
+    _historial(db_session, 2, dias=0, status="failed")
+
+    stats = email_queue.stats(db_session)
+    assert stats["depth"] == {"due": 1, "scheduled": 1, "stale_processing": 1}
+    assert stats["failed_last_24h"] == 2
+    assert stats["lag_seconds"] >= 0
+
+
+def test_reclamo_usa_indice_parcial(db_session):
+    for digest in (False, True):
+        plan = " ".join(str(r[-1]) for r in db_session.execute(
+            text("EXPLAIN QUERY PLAN " + email_queue._claim_select(digest)), email_queue._claim_params(50),
+        ))
+        assert "ix_email_jobs_claim" in plan
@@ -63,6 +63,137 @@ def test_list_liquidations_con_datos(client, tienda_liq, tenant_liq_token, db_se
     assert data[0]["status"] == "paid"
 
 
+def _pedido(db, tienda, total, source="web", status="completed", cuando=None):
+    import datetime as dt
+    o = models.Order(tenant_id=tienda.id, total_price=total, source=source, status=status,
+                     customer_name="Ana", created_at=cuando or dt.datetime.utcnow())
+    db.add(o)
+    db.commit()
+    return o
+
+
+def test_liquidation_summary_desde_ledger(client, admin_token, tienda_liq, tenant_liq_token, db_session):
+    import datetime as dt
+    import tenant_ledger
+    hace_una_hora = dt.datetime.utcnow() - dt.timedelta(hours=1)
+    _pedido(db_session, tienda_liq, 100000.0, cuando=hace_una_hora)
+    cancelar = _pedido(db_session, tienda_liq, 40000.0, status="pending", cuando=hace_una_hora)
+    _pedido(db_session, tienda_liq, 20000.0, source="pos", cuando=hace_una_hora)
+    _pedido(db_session, tienda_liq, 999.0, status="cancelled")
+    cancelar.status = "cancelled"
+    db_session.commit()
+
+    headers = {"Authorization": f"Bearer {tenant_liq_token}"}
+    data = client.get("/admin/liquidations/summary", headers=headers).json()
+    assert data["pending"]["web_gross"] == 100000.0 and data["pending"]["web_count"] == 1
+    assert data["pending"]["pos_gross"] == 20000.0 and data["pending"]["pos_commission"] == 500.0
+    assert data["pending"]["net"] == round(100000.0 * 0.975 - 500.0, 2)
+    assert data["pending"]["order_count"] == 2 and len(data["pending_orders"]) == 2
+    assert data["history"]["payment_count"] == 0
+
+    # Pagar una liquidación web cierra el pendiente web; lo posterior vuelve a sumar
+    liq = models.Liquidation(tenant_id=tienda_liq.id, liq_type="web", gross_amount=100000.0,
+                             bayup_commission=2500.0, net_amount=97500.0, status="scheduled")
+    db_session.add(liq)
+    db_session.commit()
+    r = client.put(f"/super-admin/liquidations/{liq.id}/pay", json={"transfer_reference": "T1"},
+                   headers={"Authorization": f"Bearer {admin_token}"})
+    assert r.status_code == 200
+    _pedido(db_session, tienda_liq, 7000.0, cuando=dt.datetime.utcnow() + dt.timedelta(seconds=5))
+    client.post("/super-admin/pos-commissions/collect", json={"tenant_id": str(tienda_liq.id), "pos_gross": 20000},
+                headers={"Authorization": f"Bearer {admin_token}"})
+
+    db_session.expire_all()
+    data = client.get("/admin/liquidations/summary", headers=headers).json()
+    assert data["pending"]["web_gross"] == 7000.0 and data["pending"]["web_count"] == 1
+    assert data["pending"]["pos_gross"] == 0.0 and data["pending"]["pos_count"] == 0
+    assert [o["total_price"] for o in data["pending_orders"]] == [7000.0]
+    assert data["history"] == {"total_paid_net": 97500.0, "total_paid_gross": 120000.0,
+                               "total_bayup_earned": 3000.0, "payment_count": 2}
+    assert tenant_ledger.reconcile(db_session) == []
+
+
+def test_reconcile_ledger_detecta_y_corrige(db_session, tienda_liq):
+    import tenant_ledger
+    _pedido(db_session, tienda_liq, 5000.0)
+    # Un update masivo no pasa por el ORM: el ledger queda desfasado
+    db_session.query(models.Order).update({models.Order.total_price: 6000.0}, synchronize_session=False)
+    db_session.commit()
+
+    drift = tenant_ledger.reconcile(db_session)
+    assert drift == [{"tenant_id": tienda_liq.id, "field": "web_gross", "ledger": 5000.0, "expected": 6000.0}]
+    tenant_ledger.reconcile(db_session, fix=True)
+    assert tenant_ledger.reconcile(db_session) == []
+    assert tenant_ledger.get(db_session, tienda_liq.id)["web_gross"] == 6000.0
+
+
+def test_cierre_de_periodo_en_lote_e_idempotente(db_session, tienda_liq):
+    import datetime as dt
+    import liquidation_close
+    cierre = dt.datetime(2026, 8, 17)  # lunes
+    assert liquidation_close.due_period_end(cierre + dt.timedelta(hours=2)) == cierre
+    assert liquidation_close.due_period_end(cierre + dt.timedelta(minutes=30)) == dt.datetime(2026, 8, 13)
+    assert liquidation_close.payment_date(cierre) == dt.datetime(2026, 8, 18)
+
+    otra = models.User(email="otra@liq.com", hashed_password="x", role="admin_tienda", onboarding_completed=True)
+    staff = models.User(email="staff@liq.com", hashed_password="x", is_global_staff=True, onboarding_completed=True)
+    db_session.add_all([otra, staff])
+    db_session.commit()
+    _pedido(db_session, tienda_liq, 100000.0, cuando=cierre - dt.timedelta(days=3))
+    _pedido(db_session, tienda_liq, 20000.0, source="pos", cuando=cierre - dt.timedelta(days=1))
+    _pedido(db_session, tienda_liq, 5000.0, cuando=cierre + dt.timedelta(hours=1))  # del periodo siguiente
+    _pedido(db_session, otra, 40000.0, source="pos", cuando=cierre - dt.timedelta(days=2))
+    _pedido(db_session, staff, 70000.0, cuando=cierre - dt.timedelta(days=2))
+
+    r = liquidation_close.close_period(db_session, cierre)
+    assert (r["tenants"], r["web_liquidations"], r["pos_liquidations"]) == (2, 1, 2)
+    assert r["web_net"] == 97500.0 and r["pos_commission"] == 1500.0
+    web = db_session.query(models.Liquidation).filter(models.Liquidation.liq_type == "web").one()
+    assert (web.tenant_id, web.status, web.gross_amount, web.order_count) == (tienda_liq.id, "scheduled", 100000.0, 1)
+    assert web.period_end == cierre and web.scheduled_date == dt.datetime(2026, 8, 18)
+    pos = db_session.query(models.Liquidation).filter(models.Liquidation.liq_type == "pos_commission").all()
+    assert sorted((p.bayup_commission, p.status) for p in pos) == [(500.0, "pending"), (1000.0, "pending")]
+    avisos = db_session.query(models.Notification).all()
+    assert sorted(n.tenant_id for n in avisos) == sorted([tienda_liq.id, otra.id])
+
+    # Repetir no crea nada; retomar un cierre marcado a medias tampoco
+    assert liquidation_close.close_period(db_session, cierre)["skipped"] is True
+    db_session.get(models.LiquidationClose, cierre).status = "running"
+    db_session.commit()
+    r = liquidation_close.close_period(db_session, cierre)
+    assert r["resumed"] is True and r["closed_now"] == 0 and r["tenants"] == 2
+    assert db_session.query(models.Liquidation).count() == 3
+
+    # El periodo siguiente arranca donde terminó el anterior
+    r = liquidation_close.close_period(db_session, cierre + dt.timedelta(days=3))
+    assert (r["tenants"], r["web_liquidations"], r["web_net"]) == (1, 1, 4875.0)
+
+
+def test_liquidacion_pagada_de_un_cierre_cubre_hasta_fin_de_periodo(client, admin_token, tienda_liq, db_session):
+    import datetime as dt
+    import liquidation_close
+    import tenant_ledger
+    ahora = dt.datetime.utcnow()
+    cierre = ahora - dt.timedelta(hours=1)
+    _pedido(db_session, tienda_liq, 100000.0, cuando=cierre - dt.timedelta(hours=1))
+    _pedido(db_session, tienda_liq, 8000.0, cuando=cierre + dt.timedelta(minutes=30))
+    liquidation_close.close_period(db_session, cierre)
+    liq = db_session.query(models.Liquidation).one()
+    r = client.put(f"/super-admin/liquidations/{liq.id}/pay", json={"transfer_reference": "T1"},
+                   headers={"Authorization": f"Bearer {admin_token}"})
+    assert r.status_code == 200
+
+    # El pedido entre el fin del periodo y el pago sigue pendiente
+    db_session.expire_all()
+    ledger = tenant_ledger.get(db_session, tienda_liq.id)
+    assert ledger["web_cutoff"] == cierre
+    assert (ledger["web_gross"], ledger["web_count"]) == (8000.0, 1)
+    assert tenant_ledger.reconcile(db_session) == []
+    saldos = client.get("/super-admin/liquidations/pending-balances",
+                        headers={"Authorization": f"Bearer {admin_token}"}).json()
+    assert [(b["gross"], b["order_count"]) for b in saldos] == [(8000.0, 1)]
+
+
 def test_list_liquidations_sin_auth(client):
     r = client.get("/admin/liquidations")
     assert r.status_code == 401
@@ -225,6 +356,55 @@ def test_sa_pos_commissions_pending(client, admin_token):
     assert isinstance(r.json(), list)
 
 
+def test_sa_pos_commissions_pending_una_consulta(client, admin_token, tienda_liq, db_session):
+    import datetime as dt
+    import re
+    from sqlalchemy import event
+    import security
+    otra = models.User(email="otra@liq.com", hashed_password=security.get_password_hash("x"), full_name=None,
+                       role="admin_tienda", status="Activo", onboarding_completed=True)
+    sin_onboarding = models.User(email="nueva@liq.com", hashed_password="x", role="admin_tienda",
+                                 onboarding_completed=False)
+    db_session.add_all([otra, sin_onboarding])
+    db_session.flush()
+    corte = dt.datetime(2026, 6, 1, 12, 0)
+    db_session.add(models.Liquidation(tenant_id=tienda_liq.id, liq_type="pos_commission", status="paid",
+                                      gross_amount=1, paid_date=corte - dt.timedelta(days=30)))
+    db_session.add(models.Liquidation(tenant_id=tienda_liq.id, liq_type="pos_commission", status="paid",
+                                      gross_amount=1, paid_date=corte))
+    for tenant, total, source, status, cuando in (
+        (tienda_liq, 10000.0, "pos", "completed", corte - dt.timedelta(days=1)),  # ya cobrada
+        (tienda_liq, 20000.0, "pos", "completed", corte + dt.timedelta(days=1)),
+        (tienda_liq, 30000.0, "pos", "pending", corte + dt.timedelta(days=2)),
+        (tienda_liq, 40000.0, "web", "completed", corte + dt.timedelta(days=2)),
+        (tienda_liq, 50000.0, "pos", "cancelled", corte + dt.timedelta(days=2)),
+        (otra, 8000.0, "pos", "delivered", corte - dt.timedelta(days=90)),
+        (sin_onboarding, 9000.0, "pos", "completed", corte),
+    ):
+        db_session.add(models.Order(tenant_id=tenant.id, total_price=total, source=source, status=status,
+                                    created_at=cuando))
+    db_session.commit()
+
+    consultas = []
+    listener = lambda conn, cur, stmt, *a: consultas.append(stmt)
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        r = client.get("/super-admin/pos-commissions/pending", headers={"Authorization": f"Bearer {admin_token}"})
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert r.status_code == 200
+    data = r.json()
+    assert [d["tenant_email"] for d in data] == ["tienda@liq.com", "otra@liq.com"]
+    assert data[0]["pos_gross"] == 50000.0 and data[0]["pos_count"] == 2
+    assert data[0]["commission"] == 1250.0
+    assert data[0]["last_collected"].startswith("2026-06-01T12:00")
+    assert data[0]["tenant_name"] == "Tienda Liq" and data[0]["shop_slug"] == "tienda-liq"
+    assert data[1]["tenant_name"] == "otra@liq.com" and data[1]["last_collected"] is None
+    assert data[1]["pos_count"] == 1 and data[1]["bank_accounts"] == []
+    assert len([q for q in consultas if re.search(r"\borders\b", q)]) == 1
+
+
 def test_sa_collect_pos_commission(client, admin_token, tienda_liq):
     r = client.post("/super-admin/pos-commissions/collect", json={
         "tenant_id": str(tienda_liq.id),
@@ -238,8 +418,72 @@ def test_sa_collect_pos_commission(client, admin_token, tienda_liq):
     assert data["status"] == "paid"
 
 
+def test_cobro_pos_salda_la_comision_abierta_del_cierre(client, admin_token, tienda_liq, db_session):
+    import datetime as dt
+    import liquidation_close
+    import tenant_ledger
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    ahora = dt.datetime.utcnow()
+    cierre = ahora - dt.timedelta(hours=1)
+    _pedido(db_session, tienda_liq, 20000.0, source="pos", cuando=cierre - dt.timedelta(hours=1))
+    _pedido(db_session, tienda_liq, 4000.0, source="pos", cuando=cierre + dt.timedelta(minutes=30))
+    liquidation_close.close_period(db_session, cierre)
+    abierta = db_session.query(models.Liquidation).one()
+    assert (abierta.origin, abierta.status) == ("close", "pending")
+
+    pendiente = client.get("/super-admin/pos-commissions/pending", headers=headers).json()[0]
+    assert (pendiente["pos_gross"], pendiente["pos_count"]) == (24000.0, 2)
+    r = client.post("/super-admin/pos-commissions/collect", json={
+        "tenant_id": str(tienda_liq.id), "pos_gross": pendiente["pos_gross"],
+        "pos_count": pendiente["pos_count"], "reference": "POS-1",
+    }, headers=headers)
+    assert r.status_code == 200 and r.json()["settled"] == [str(abierta.id)]
+
+    # La del cierre queda pagada y la manual sólo lleva lo posterior al periodo
+    db_session.expire_all()
+    liqs = {l.origin: l for l in db_session.query(models.Liquidation)}
+    assert (liqs["close"].status, liqs["close"].transfer_reference) == ("paid", "POS-1")
+    assert (liqs["manual"].gross_amount, liqs["manual"].order_count) == (4000.0, 1)
+    ledger = tenant_ledger.get(db_session, tienda_liq.id)
+    assert (ledger["paid_gross"], ledger["paid_count"], ledger["pos_gross"]) == (24000.0, 2, 0.0)
+    assert client.get("/super-admin/pos-commissions/pending", headers=headers).json() == []
+    assert client.put(f"/super-admin/liquidations/{abierta.id}/pay", json={}, headers=headers).status_code == 400
+    assert tenant_ledger.reconcile(db_session) == []
+
+
 def test_sa_collect_pos_sin_tenant_id(client, admin_token):
     r = client.post("/super-admin/pos-commissions/collect", json={
         "pos_gross": 100000,
     }, headers={"Authorization": f"Bearer {admin_token}"})
     assert r.status_code == 400
+
+
+def test_liquidacion_manual_con_period_end_cubre_hasta_el_pago(client, admin_token, tienda_liq, db_session):
+    import datetime as dt
+    import tenant_ledger
+    from routers import liquidations
+    hoy = dt.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    _pedido(db_session, tienda_liq, 100.0, cuando=hoy + dt.timedelta(minutes=1))
+    _pedido(db_session, tienda_liq, 300.0, source="pos", cuando=hoy + dt.timedelta(minutes=1))
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    r = client.post("/super-admin/liquidations", json={
+        "tenant_id": str(tienda_liq.id), "gross_amount": 100.0, "period_end": hoy.date().isoformat(),
+    }, headers=headers)
+    assert client.put(f"/super-admin/liquidations/{r.json()['id']}/pay", json={}, headers=headers).status_code == 200
+    # Cobro POS manual con period_end: last_collected es la fecha real del cobro
+    cobro = models.Liquidation(tenant_id=tienda_liq.id, liq_type="pos_commission", status="paid",
+                               gross_amount=1.0, period_end=hoy - dt.timedelta(days=5),
+                               paid_date=hoy + dt.timedelta(minutes=2))
+    db_session.add(cobro)
+    db_session.commit()
+
+    db_session.expire_all()
+    ledger = tenant_ledger.get(db_session, tienda_liq.id)
+    assert (ledger["web_gross"], ledger["web_count"]) == (0, 0)
+    assert ledger["web_cutoff"] > hoy
+    assert tenant_ledger.reconcile(db_session) == []
+    assert liquidations.pending_pos_commissions(db_session) == []
+    _pedido(db_session, tienda_liq, 50.0, source="pos", cuando=hoy + dt.timedelta(minutes=3))
+    pendiente = liquidations.pending_pos_commissions(db_session)
+    assert pendiente[0]["pos_gross"] == 50.0
+    assert pendiente[0]["last_collected"] == (hoy + dt.timedelta(minutes=2)).isoformat()
@@ -58,6 +58,238 @@ def test_crear_orden_sin_stock(client, db_session, tenant_user, tenant_token):
     assert r.status_code == 400
 
 
+def test_crear_orden_reporta_todas_las_lineas_sin_stock(client, db_session, tenant_user, tenant_token):
+    _, v1 = _create_product(db_session, tenant_user.id, stock=1)
+    _, v2 = _create_product(db_session, tenant_user.id, stock=0)
+    _, v3 = _create_product(db_session, tenant_user.id, stock=5)
+    payload = {
+        "total_price": 0,
+        "customer_name": "Ana",
+        "items": [
+            {"product_variant_id": str(v1.id), "quantity": 1, "price_at_purchase": 0},
+            {"product_variant_id": str(v1.id), "quantity": 1, "price_at_purchase": 0},  # 2 en total > 1
+            {"product_variant_id": str(v2.id), "quantity": 1, "price_at_purchase": 0},
+            {"product_variant_id": str(v3.id), "quantity": 1, "price_at_purchase": 0},
+        ],
+    }
+    r = client.post("/orders", json=payload, headers={"Authorization": f"Bearer {tenant_token}"})
+    assert r.status_code == 400
+    assert r.json()["detail"].count("Stock insuficiente") == 2
+    db_session.refresh(v3)
+    assert v3.stock == 5
+
+
+def test_crear_orden_bloquea_variantes_en_una_consulta(client, db_session, tenant_user, tenant_token, monkeypatch):
+    from sqlalchemy import event
+    import order_outbox
+    # Sólo interesa la transacción del pedido, no el despacho del outbox
+    monkeypatch.setattr(order_outbox, "after_commit", lambda db, event: None)
+    variants = [_create_product(db_session, tenant_user.id)[1] for _ in range(5)]
+    selects = []
+    engine = db_session.get_bind()
+
+    def _count(conn, cursor, statement, *args):
+        if "product_variants" in statement and statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        r = client.post("/orders", json={
+            "total_price": 0,
+            "customer_name": "Lote",
+            "source": "pos",
+            "items": [{"product_variant_id": str(v.id), "quantity": 1, "price_at_purchase": 0} for v in variants],
+        }, headers={"Authorization": f"Bearer {tenant_token}"})
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+    assert r.status_code == 200
+    assert r.json()["total_price"] == 250000
+    assert len([s for s in selects if "FROM product_variants" in s and " IN " in s]) == 1
+
+
+# ── Outbox de efectos secundarios ─────────────────────────────────────────
+
+def _capture_emails(monkeypatch):
+    import email_queue
+    sent = []
+    monkeypatch.setattr(email_queue, "enqueue", lambda func, **kw: sent.append((func, kw)))
+    monkeypatch.setattr(email_queue, "enqueue_many", lambda jobs, db=None: sent.extend(jobs))
+    return sent
+
+
+def test_crear_orden_despacha_outbox(client, db_session, tenant_user, tenant_token, monkeypatch):
+    sent = _capture_emails(monkeypatch)
+    product, variant = _create_product(db_session, tenant_user.id)
+    r = client.post("/orders", json={
+        "total_price": 0,
+        "customer_name": "Laura",
+        "customer_email": "laura@test.com",
+        "source": "pos",
+        "items": [{"product_variant_id": str(variant.id), "quantity": 1, "price_at_purchase": 0}],
+    }, headers={"Authorization": f"Bearer {tenant_token}"})
+    assert r.status_code == 200
+
+    event = db_session.query(models.OrderOutbox).one()
+    assert str(event.order_id) == r.json()["id"]
+    assert event.status == "done" and event.attempts == 1
+    assert db_session.query(models.Notification).filter_by(tenant_id=tenant_user.id).count() == 1
+    client_row = db_session.query(models.User).filter_by(email="laura@test.com").one()
+    assert client_row.owner_id == tenant_user.id and client_row.total_spent == 50000
+    # POS: sin envío automático
+    assert db_session.query(models.Shipment).count() == 0
+    assert "send_order_confirmation" in [f for f, _ in sent]
+
+
+def test_pedido_web_crea_envio_via_outbox(db_session, tenant_user, monkeypatch):
+    import crud
+    import schemas
+    sent = _capture_emails(monkeypatch)
+    product, variant = _create_product(db_session, tenant_user.id)
+    order = schemas.OrderCreate(
+        tenant_id=tenant_user.id, total_price=0, customer_name="Web", customer_email="web@test.com",
+        source="web", items=[schemas.OrderItemBase(product_variant_id=variant.id, quantity=2, price_at_purchase=0)],
+    )
+    db_order = crud.create_order(db_session, order=order, customer_id=None, tenant_id=tenant_user.id, flow="web")
+
+    shipment = db_session.query(models.Shipment).filter_by(order_id=db_order.id).one()
+    assert shipment.status == "pending_packing"
+    assert [f for f, _ in sent][:2] == ["send_order_confirmation", "send_web_order_invoice"]
+
+
+def test_tenant_con_digest_retiene_aviso_de_venta(db_session, tenant_user, monkeypatch):
+    import crud
+    import email_queue
+    import schemas
+    sent = _capture_emails(monkeypatch)
+    tenant_user.sale_digest_minutes = 15
+    db_session.commit()
+    product, variant = _create_product(db_session, tenant_user.id)
+    order = schemas.OrderCreate(
+        tenant_id=tenant_user.id, total_price=0, customer_name="Web", customer_email="web@test.com",
+        source="web", items=[schemas.OrderItemBase(product_variant_id=variant.id, quantity=1, price_at_purchase=0)],
+    )
+    crud.create_order(db_session, order=order, customer_id=None, tenant_id=tenant_user.id, flow="web")
+
+    funcs = [f for f, _ in sent]
+    assert "send_new_sale_notification" not in funcs
+    _, kwargs = sent[funcs.index(email_queue.DIGEST_FUNC)]
+    assert kwargs["owner_email"] == tenant_user.email
+    assert kwargs["run_at"] > email_queue._now()
+
+
+def test_outbox_queda_pendiente_con_dispatcher(db_session, tenant_user, monkeypatch):
+    import crud
+    import schemas
+    import order_outbox
+    _capture_emails(monkeypatch)
+    monkeypatch.setattr(order_outbox, "_dispatcher_started", True)
+    product, variant = _create_product(db_session, tenant_user.id)
+    order = schemas.OrderCreate(
+        tenant_id=tenant_user.id, total_price=0, customer_name="Cola", source="pos",
+        items=[schemas.OrderItemBase(product_variant_id=variant.id, quantity=1, price_at_purchase=0)],
+    )
+    crud.create_order(db_session, order=order, customer_id=None, tenant_id=tenant_user.id)
+
+    assert db_session.query(models.OrderOutbox).one().status == "pending"
+    assert db_session.query(models.Notification).count() == 0
+    assert order_outbox.dispatch_pending(db_session) == 1
+    assert db_session.query(models.OrderOutbox).one().status == "done"
+    assert db_session.query(models.Notification).count() == 1
+
+
+def test_outbox_evento_fallido_no_contamina_el_lote(db_session, tenant_user, monkeypatch):
+    import crud
+    import schemas
+    import order_outbox
+    sent = _capture_emails(monkeypatch)
+    monkeypatch.setattr(order_outbox, "_dispatcher_started", True)
+    product, variant = _create_product(db_session, tenant_user.id)
+    orders = [
+        crud.create_order(db_session, order=schemas.OrderCreate(
+            tenant_id=tenant_user.id, total_price=0, customer_name="Rep", customer_email="rep@test.com",
+            source="web", items=[schemas.OrderItemBase(product_variant_id=variant.id, quantity=1, price_at_purchase=0)],
+        ), customer_id=None, tenant_id=tenant_user.id, flow="web")
+        for _ in range(2)
+    ]
+    original, calls = order_outbox._notification_for, []
+
+    def _falla_la_primera(order, flow):
+        calls.append(order.id)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        return original(order, flow)
+    monkeypatch.setattr(order_outbox, "_notification_for", _falla_la_primera)
+
+    assert order_outbox.dispatch_pending(db_session) == 2
+    events = {e.order_id: e for e in db_session.query(models.OrderOutbox)}
+    failed, ok = events[calls[0]], events[calls[1]]
+    assert failed.status == "pending" and "boom" in failed.error
+    assert ok.status == "done"
+    # El cliente y el envío del evento fallido se revirtieron; el segundo los crea.
+    client_row = db_session.query(models.User).filter_by(email="rep@test.com").one()
+    assert client_row.total_spent == 50000
+    assert db_session.query(models.Shipment).filter_by(order_id=calls[0]).count() == 0
+    assert db_session.query(models.Shipment).filter_by(order_id=calls[1]).count() == 1
+    assert [kw["order_id"] for f, kw in sent if f == "send_order_confirmation"] == [str(calls[1])]
+    assert {o.id for o in orders} == set(calls)
+
+
+def test_outbox_evento_fallido_espera_backoff(db_session, tenant_user, monkeypatch):
+    import datetime as dt
+    import crud
+    import schemas
+    import order_outbox
+    _capture_emails(monkeypatch)
+    monkeypatch.setattr(order_outbox, "_dispatcher_started", True)
+    product, variant = _create_product(db_session, tenant_user.id)
+    crud.create_order(db_session, order=schemas.OrderCreate(
+        tenant_id=tenant_user.id, total_price=0, customer_name="Cola", source="pos",
+        items=[schemas.OrderItemBase(product_variant_id=variant.id, quantity=1, price_at_purchase=0)],
+    ), customer_id=None, tenant_id=tenant_user.id)
+    original = order_outbox._notification_for
+
+    def _falla(order, flow):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(order_outbox, "_notification_for", _falla)
+
+    assert order_outbox.dispatch_pending(db_session) == 1
+    event = db_session.query(models.OrderOutbox).one()
+    assert (event.status, event.attempts) == ("pending", 1)
+    assert event.next_attempt_at > dt.datetime.utcnow()
+    # Todavía en backoff: no se vuelve a reclamar
+    assert order_outbox.dispatch_pending(db_session) == 0
+
+    monkeypatch.setattr(order_outbox, "_notification_for", original)
+    event.next_attempt_at = dt.datetime.utcnow() - dt.timedelta(seconds=1)
+    db_session.commit()
+    assert order_outbox.dispatch_pending(db_session) == 1
+    assert (event.status, event.attempts) == ("done", 2)
+
+
+def test_outbox_fallo_del_commit_cuenta_el_intento(db_session, tenant_user, monkeypatch):
+    import crud
+    import email_queue
+    import schemas
+    import order_outbox
+    monkeypatch.setattr(order_outbox, "_dispatcher_started", True)
+    product, variant = _create_product(db_session, tenant_user.id)
+    crud.create_order(db_session, order=schemas.OrderCreate(
+        tenant_id=tenant_user.id, total_price=0, customer_name="Cola", source="pos",
+        items=[schemas.OrderItemBase(product_variant_id=variant.id, quantity=1, price_at_purchase=0)],
+    ), customer_id=None, tenant_id=tenant_user.id)
+
+    def _falla(jobs, db=None):
+        raise RuntimeError("cola caída")
+    monkeypatch.setattr(email_queue, "enqueue_many", _falla)
+
+    with pytest.raises(RuntimeError):
+        order_outbox.dispatch_pending(db_session)
+    event = db_session.query(models.OrderOutbox).one()
+    assert (event.status, event.attempts) == ("pending", 1) and "cola caída" in event.error
+    # El efecto del lote revertido no quedó escrito
+    assert db_session.query(models.Notification).count() == 0
+
+
 def test_actualizar_estado_orden(client, db_session, tenant_user, tenant_token):
     product, variant = _create_product(db_session, tenant_user.id)
     order = models.Order(
@@ -88,6 +320,30 @@ def test_actualizar_estado_orden(client, db_session, tenant_user, tenant_token):
     assert r.json()["status"] == "processing"
 
 
+def test_adjuntar_factura_guarda_pdf_fuera_de_la_cola(client, db_session, tenant_user, tenant_token, monkeypatch, tmp_path):
+    import base64
+    import blob_store
+    monkeypatch.setattr(blob_store, "BLOB_DIR", tmp_path)
+    monkeypatch.delenv("S3_BUCKET_NAME", raising=False)
+    sent = _capture_emails(monkeypatch)
+    order = models.Order(tenant_id=tenant_user.id, customer_name="Ana", customer_email="ana@test.com",
+                         total_price=1000, status="completed", source="pos")
+    db_session.add(order)
+    db_session.commit()
+    pdf = b"%PDF-1.4 factura" * 1000
+    headers = {"Authorization": f"Bearer {tenant_token}"}
+
+    r = client.post(f"/orders/{order.id}/attach-invoice", json={"pdf_base64": base64.b64encode(pdf).decode()}, headers=headers)
+    assert r.status_code == 200
+    [(func, kwargs)] = sent
+    assert func == "send_invoice_attachment" and "pdf_base64" not in kwargs
+    with blob_store.open_stream(kwargs["pdf_ref"]) as f:
+        assert f.read() == pdf
+
+    r = client.post(f"/orders/{order.id}/attach-invoice", json={"pdf_base64": "no es base64!"}, headers=headers)
+    assert r.status_code == 400
+
+
 def test_orden_ajena_no_accesible(client, db_session, tenant_user, tenant_token):
     otro_tenant = models.User(
         email="otro@test.com",
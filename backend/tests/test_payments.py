@@ -588,3 +588,291 @@ def test_webhook_referencia_de_un_tenant_no_afecta_pago_de_otro_tenant(client, d
     assert payment_a.status == "approved"
     assert payment_b.status == "pending"  # el pago de B no fue tocado
     assert payment_b.order_id is None
+
+
+# ── 8. Reservas de stock de pagos pendientes ───────────────────────────────
+
+@pytest.fixture
+def wompi(monkeypatch):
+    monkeypatch.setattr(payment_service, "WOMPI_CONFIGURED", True)
+    monkeypatch.setattr(payment_service, "WOMPI_PUBLIC_KEY", "pub_test_xxx")
+    monkeypatch.setattr(payment_service, "WOMPI_INTEGRITY_SECRET", "integrity-secret-test")
+
+
+def _checkout_wompi(client, tienda, variant_id, qty, tag):
+    return client.post("/public/checkout", json={
+        "tenant_id": str(tienda.id),
+        "customer_name": "Reserva",
+        "customer_email": "reserva@test.com",
+        "customer_phone": "3001234567",
+        "items": [{"product_variant_id": variant_id, "quantity": qty}],
+        "currency": "COP",
+    }, headers=_fwd_headers(tag))
+
+
+def test_checkout_reserva_stock_y_webhook_lo_convierte(client, db_session, tienda_a, producto_a, wompi, monkeypatch):
+    p, v = producto_a
+    vid = str(v.id)
+    r = _checkout_wompi(client, tienda_a, vid, 15, "reserva-convierte")
+    assert r.status_code == 200
+    db_session.refresh(v)
+    assert (v.stock, v.reserved_stock, v.available_stock) == (20, 15, 5)
+
+    # Otro comprador no puede apartar lo ya reservado, ni un pedido directo venderlo
+    r2 = _checkout_wompi(client, tienda_a, vid, 10, "reserva-convierte-2")
+    assert r2.status_code == 400
+    assert "Disponible: 5" in r2.json()["detail"]
+    r3 = client.post("/public/orders", json={
+        "tenant_id": str(tienda_a.id), "total_price": 0, "customer_name": "Directo", "source": "web",
+        "items": [{"product_variant_id": vid, "quantity": 10, "price_at_purchase": 0}],
+    })
+    assert r3.status_code == 400
+
+    event = _wompi_signed_event(monkeypatch, "secreto-webhook", {
+        "id": "tx-res-1", "status": "APPROVED", "reference": r.json()["reference"],
+    })
+    assert client.post("/public/payments/webhook", json=event).status_code == 200
+    db_session.expire_all()
+    v = db_session.get(models.ProductVariant, uuid.UUID(vid))
+    assert (v.stock, v.reserved_stock) == (5, 0)
+    assert db_session.query(models.StockReservation).one().status == "converted"
+    assert db_session.query(models.Order).filter_by(tenant_id=tienda_a.id).count() == 1
+
+
+def test_webhook_rechazado_libera_reserva(client, db_session, tienda_a, producto_a, wompi, monkeypatch):
+    p, v = producto_a
+    vid = str(v.id)
+    r = _checkout_wompi(client, tienda_a, vid, 20, "reserva-libera")
+    event = _wompi_signed_event(monkeypatch, "secreto-webhook", {
+        "id": "tx-res-2", "status": "DECLINED", "reference": r.json()["reference"],
+    })
+    assert client.post("/public/payments/webhook", json=event).status_code == 200
+    db_session.expire_all()
+    v = db_session.get(models.ProductVariant, uuid.UUID(vid))
+    assert (v.stock, v.reserved_stock) == (20, 0)
+    assert db_session.query(models.StockReservation).one().status == "released"
+
+
+def test_sweeper_libera_reservas_vencidas(client, db_session, tienda_a, producto_a, wompi):
+    import datetime
+    import stock_reservations
+    p, v = producto_a
+    vid = uuid.UUID(str(v.id))
+    assert _checkout_wompi(client, tienda_a, str(vid), 8, "reserva-vence-1").status_code == 200
+    assert _checkout_wompi(client, tienda_a, str(vid), 4, "reserva-vence-2").status_code == 200
+    vieja = db_session.query(models.StockReservation).filter_by(quantity=8).one()
+    vieja.expires_at = datetime.datetime.utcnow() - datetime.timedelta(minutes=1)
+    db_session.commit()
+
+    assert stock_reservations.sweep_expired(db_session) == 1
+    assert stock_reservations.sweep_expired(db_session) == 0
+    db_session.expire_all()
+    assert db_session.get(models.ProductVariant, vid).reserved_stock == 4
+
+
+# ── 9. Inbox de webhooks — ack inmediato y proceso asíncrono ────────────────
+
+def _pago_wompi(client, db_session, tienda, variant, reference, tag):
+    checkout = client.post("/public/checkout", json={
+        "tenant_id": str(tienda.id),
+        "customer_name": "Cliente Inbox",
+        "customer_email": "inbox@test.com",
+        "customer_phone": "3001234567",
+        "items": [{"product_variant_id": str(variant.id), "quantity": 1}],
+        "currency": "COP",
+    }, headers=_fwd_headers(tag))
+    payment = db_session.get(models.Payment, uuid.UUID(checkout.json()["payment_id"]))
+    payment.gateway = "wompi"
+    payment.gateway_payment_id = reference
+    db_session.commit()
+    return payment
+
+
+def test_webhook_encola_y_responde_sin_procesar(client, db_session, tienda_a, producto_a, monkeypatch):
+    import webhook_inbox
+    p, v = producto_a
+    payment = _pago_wompi(client, db_session, tienda_a, v, "REF-INBOX-1", "inbox-async")
+    monkeypatch.setattr(webhook_inbox, "_workers_started", True)
+    event = _wompi_signed_event(monkeypatch, "secreto-webhook", {
+        "id": "tx-inbox-1", "status": "APPROVED", "reference": "REF-INBOX-1",
+    })
+    assert client.post("/public/payments/webhook", json=event).status_code == 200
+    assert client.post("/public/payments/webhook", json=event).status_code == 200  # reentrega
+
+    row = db_session.query(models.WebhookInbox).one()
+    assert row.status == "pending"
+    db_session.refresh(payment)
+    assert payment.status == "pending"
+    assert webhook_inbox.stats(db_session)["by_status"] == {"pending": 1}
+
+    assert webhook_inbox.process_pending(db_session) == 1
+    db_session.refresh(row)
+    db_session.refresh(payment)
+    assert row.status == "done" and row.processed_at is not None
+    assert payment.status == "approved" and payment.order_id is not None
+
+
+def test_inbox_reintenta_con_backoff_y_respeta_orden_por_pago(client, db_session, monkeypatch):
+    import datetime
+    import webhook_inbox
+    aplicados = []
+    fallar = {"n": 1}
+
+    def _handler(db, payload):
+        if fallar["n"]:
+            fallar["n"] -= 1
+            raise RuntimeError("DB lenta")
+        aplicados.append(payload["orden"])
+
+    monkeypatch.setattr(webhook_inbox, "_workers_started", True)
+    monkeypatch.setattr(webhook_inbox, "_handler", lambda provider: _handler)
+    for i, status in enumerate(["PENDING", "APPROVED"]):
+        webhook_inbox.store(db_session, "wompi", "tx-orden", status, "REF-ORDEN", {"orden": i})
+    webhook_inbox.store(db_session, "wompi", "tx-otro", "APPROVED", "REF-OTRO", {"orden": 9})
+
+    # El primer evento de REF-ORDEN falla: queda con backoff y bloquea al siguiente del mismo pago
+    assert webhook_inbox.process_pending(db_session) == 2
+    primero = db_session.query(models.WebhookInbox).filter_by(tx_status="PENDING").one()
+    assert (primero.status, primero.attempts) == ("pending", 1)
+    assert primero.next_attempt_at > datetime.datetime.utcnow()
+    assert aplicados == [9]
+    assert webhook_inbox.process_pending(db_session) == 0
+
+    primero.next_attempt_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db_session.commit()
+    assert webhook_inbox.process_pending(db_session) == 1
+    assert webhook_inbox.process_pending(db_session) == 1
+    assert aplicados == [9, 0, 1]
+    assert webhook_inbox.stats(db_session)["lag_seconds"] == 0
+
+
+def test_webhook_aprobado_reintenta_si_falla_crear_la_orden(client, db_session, tienda_a, producto_a, wompi,
+                                                           monkeypatch):
+    import datetime
+    import webhook_inbox
+    from routers import payments
+    p, v = producto_a
+    payment = _pago_wompi(client, db_session, tienda_a, v, "REF-INBOX-FALLA", "inbox-falla")
+    monkeypatch.setattr(webhook_inbox, "_workers_started", True)
+    real = payments.finalize_web_order
+    fallar = {"n": 1}
+
+    def _finalize(*args, **kwargs):
+        if fallar["n"]:
+            fallar["n"] -= 1
+            raise RuntimeError("DB lenta")
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(payments, "finalize_web_order", _finalize)
+    event = _wompi_signed_event(monkeypatch, "secreto-webhook", {
+        "id": "tx-inbox-falla", "status": "APPROVED", "reference": "REF-INBOX-FALLA",
+    })
+    assert client.post("/public/payments/webhook", json=event).status_code == 200
+
+    # El fallo revierte todo: pago pendiente, reserva intacta, evento con backoff
+    assert webhook_inbox.process_pending(db_session) == 1
+    row = db_session.query(models.WebhookInbox).one()
+    db_session.refresh(payment)
+    db_session.refresh(v)
+    assert (row.status, row.attempts) == ("pending", 1)
+    assert payment.status == "pending" and payment.order_id is None
+    assert v.reserved_stock == 1
+
+    row.next_attempt_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db_session.commit()
+    assert webhook_inbox.process_pending(db_session) == 1
+    db_session.expire_all()
+    payment = db_session.get(models.Payment, payment.id)
+    assert db_session.query(models.WebhookInbox).one().status == "done"
+    assert payment.status == "approved" and payment.order_id is not None
+    assert db_session.get(models.ProductVariant, v.id).reserved_stock == 0
+    assert db_session.query(models.Order).filter_by(tenant_id=tienda_a.id).count() == 1
+
+
+# ── 10. GET /html-shop/{slug} — render cacheado ───────────────────────────────
+
+def _publicar_plantilla_html(db_session, tenant, html="<html><head></head><body><h1>Hola</h1></body></html>"):
+    tpl = models.WebTemplate(name="HTML", template_type="html", html_pages={"home": html})
+    db_session.add(tpl)
+    db_session.commit()
+    page = models.ShopPage(tenant_id=tenant.id, page_key="home", template_id=str(tpl.id), is_published=True)
+    db_session.add(page)
+    db_session.commit()
+    return tpl
+
+
+def test_html_shop_render_gzip_y_etag(client, tienda_a, db_session):
+    _publicar_plantilla_html(db_session, tienda_a)
+    r = client.get("/html-shop/tienda-a", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in r.headers["vary"]
+    assert "last-modified" in r.headers
+    assert 'data-bayup-slug="tienda-a"' in r.text  # httpx descomprime
+    assert '<script id="bayup-sdk" src="' in r.text
+    assert "CART_KEY" not in r.text  # el SDK ya no va inline
+    r2 = client.get("/html-shop/tienda-a", headers={"If-None-Match": r.headers["etag"]})
+    assert r2.status_code == 304
+
+
+def test_html_shop_respeta_q_cero_en_accept_encoding(client, tienda_a, db_session):
+    import gzip
+    _publicar_plantilla_html(db_session, tienda_a)
+    r = client.get("/html-shop/tienda-a", headers={"Accept-Encoding": "br;q=0, gzip;q=0"})
+    assert "content-encoding" not in r.headers
+    assert "<h1>Hola</h1>" in r.text
+    r = client.get("/html-shop/tienda-a", headers={"Accept-Encoding": "br;q=0, gzip;q=0.5"})
+    assert r.headers["content-encoding"] == "gzip"
+    # httpx descomprime la respuesta: la variante gzip se verifica en la caché
+    import cache
+    rendered = cache.render_cache.get("tienda-a:home")
+    assert gzip.decompress(rendered["variants"]["gzip"]) == rendered["body"] == r.content
+    etag = r.headers["etag"]
+    assert client.get("/html-shop/tienda-a", headers={"If-None-Match": f'W/{etag}, "otro"'}).status_code == 304
+
+
+def test_html_shop_invalida_al_editar_plantilla(client, tienda_a, db_session, admin_token):
+    tpl = _publicar_plantilla_html(db_session, tienda_a)
+    etag = client.get("/html-shop/tienda-a").headers["etag"]
+    r = client.put(f"/super-admin/web-templates/{tpl.id}",
+                   json={"html_pages": {"home": "<html><body>Nueva</body></html>"}},
+                   headers={"Authorization": f"Bearer {admin_token}"})
+    assert r.status_code == 200
+    r = client.get("/html-shop/tienda-a", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert "Nueva" in r.text
+
+
+def test_html_shop_rutas_desconocidas_comparten_la_entrada_de_home(client, tienda_a, db_session, monkeypatch):
+    from routers import payments as payments_router
+    import cache
+    _publicar_plantilla_html(db_session, tienda_a)
+    renders = []
+    original = payments_router._build_rendered
+    monkeypatch.setattr(payments_router, "_build_rendered",
+                        lambda *a, **kw: renders.append(1) or original(*a, **kw))
+    home = client.get("/html-shop/tienda-a")
+    for path in ("no-existe", "otra", "x1", "x2"):
+        r = client.get(f"/html-shop/tienda-a/{path}")
+        assert r.status_code == 200
+        assert r.headers["etag"] == home.headers["etag"]
+    assert len(renders) == 1
+    assert "tienda-a:no-existe" not in cache.render_cache
+    assert "tienda-a:home" in cache.render_cache
+
+
+def test_html_shop_csp_agrega_el_backend_a_la_politica_base(client, tienda_a, db_session, monkeypatch):
+    from security import content_security_policy
+    monkeypatch.setenv("BACKEND_URL", "https://api.example.com/")
+    _publicar_plantilla_html(db_session, tienda_a)
+    assert client.get("/").headers["content-security-policy"] == content_security_policy()
+    csp = client.get("/html-shop/tienda-a").headers["content-security-policy"]
+    assert csp == content_security_policy("https://api.example.com")
+    assert "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://api.example.com;" in csp
+
+
+def test_html_shop_sin_plantilla_no_se_cachea(client, tienda_a, db_session):
+    r = client.get("/html-shop/tienda-a")
+    assert r.status_code == 404
+    _publicar_plantilla_html(db_session, tienda_a)
+    assert client.get("/html-shop/tienda-a").status_code == 200
@@ -111,6 +111,28 @@ def test_get_public_products_tienda_inexistente(client):
     assert r.status_code == 404
 
 
+def test_get_public_products_etag_304(client, tienda, producto):
+    r = client.get("/public/shop/mi-tienda/products")
+    etag = r.headers["etag"]
+    r2 = client.get("/public/shop/mi-tienda/products", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.content == b""
+    assert r2.headers["etag"] == etag
+
+
+def test_get_public_products_invalida_al_editar(client, tienda, producto):
+    import security
+    p, _ = producto
+    etag = client.get("/public/shop/mi-tienda/products").headers["etag"]
+    token = security.create_access_token(data={"sub": tienda.email})
+    r = client.put(f"/products/{p.id}", json={"name": "Camiseta Nueva", "price": 50000},
+                   headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200
+    r = client.get("/public/shop/mi-tienda/products", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()[0]["name"] == "Camiseta Nueva"
+
+
 # ── GET /public/shop-info/{slug} ──────────────────────────────────────────
 
 def test_get_shop_info(client, tienda):
@@ -247,6 +269,103 @@ def test_checkout_idempotencia(client, tienda, producto):
     assert r1.json()["payment_id"] == r2.json()["payment_id"]
 
 
+def _catalog_selects(db_session, fn):
+    """Ejecuta fn() contando los SELECT contra product_variants / products."""
+    from sqlalchemy import event
+    selects = []
+    engine = db_session.get_bind()
+
+    def _count(conn, cursor, statement, *args):
+        head = statement.lstrip().upper()
+        if head.startswith("SELECT") and ("FROM PRODUCT_VARIANTS" in head or "FROM PRODUCTS" in head):
+            selects.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+    return result, selects
+
+
+def _catalogo(db_session, tienda, n):
+    variants = []
+    for i in range(n):
+        p = models.Product(owner_id=tienda.id, name=f"Prod {i}", price=1000, status="active")
+        db_session.add(p)
+        db_session.flush()
+        v = models.ProductVariant(product_id=p.id, name=f"Var {i}", price=1000 * (i + 1), stock=5)
+        db_session.add(v)
+        variants.append(v)
+    db_session.commit()
+    return variants
+
+
+def test_checkout_resuelve_catalogo_en_dos_consultas(client, db_session, tienda):
+    variants = _catalogo(db_session, tienda, 6)
+    payload = {
+        "tenant_id": str(tienda.id),
+        "customer_name": "Lote",
+        "customer_email": "lote@test.com",
+        "customer_phone": "3001234567",
+        "items": [{"product_variant_id": str(v.id), "quantity": 1} for v in variants],
+        "currency": "COP",
+    }
+    db_session.expire_all()
+    r, selects = _catalog_selects(db_session, lambda: client.post("/public/checkout", json=payload))
+    assert r.status_code == 200
+    assert r.json()["amount"] == sum(1000 * (i + 1) for i in range(6))
+    assert len(selects) == 2
+    payment = db_session.query(models.Payment).one()
+    assert [i["name"] for i in payment.items] == [f"Prod {i} — Var {i}" for i in range(6)]
+
+
+def test_tracking_pedido_resuelve_catalogo_en_dos_consultas(client, db_session, tienda):
+    variants = _catalogo(db_session, tienda, 5)
+    r = client.post("/public/orders", json={
+        "tenant_id": str(tienda.id),
+        "total_price": 0,
+        "customer_name": "Seguimiento",
+        "source": "web",
+        "items": [{"product_variant_id": str(v.id), "quantity": 1, "price_at_purchase": 0} for v in variants],
+    })
+    assert r.status_code == 200
+    db_session.expire_all()
+    t, selects = _catalog_selects(db_session, lambda: client.get(f"/public/orders/{r.json()['id']}"))
+    assert t.status_code == 200
+    assert [i["name"] for i in t.json()["items"]] == [f"Prod {i} — Var {i}" for i in range(5)]
+    assert len(selects) == 2
+
+
+def test_checkout_producto_sin_variantes_y_ajeno(client, db_session, tienda):
+    otra = models.User(email="otra@public.com", hashed_password="x", role="admin_tienda", status="Activo")
+    db_session.add(otra)
+    db_session.flush()
+    propio = models.Product(owner_id=tienda.id, name="Sin variantes", price=7000, status="active")
+    ajeno = models.Product(owner_id=otra.id, name="Ajeno", price=1, status="active")
+    db_session.add_all([propio, ajeno])
+    db_session.flush()
+    ajena = models.ProductVariant(product_id=ajeno.id, name="X", price=1, stock=5)
+    db_session.add(ajena)
+    db_session.commit()
+    propio_id, ajena_id = str(propio.id), str(ajena.id)
+    base = {"tenant_id": str(tienda.id), "customer_name": "Mix", "customer_email": "m@test.com",
+            "customer_phone": "3001234567", "currency": "COP"}
+
+    r = client.post("/public/checkout", json={**base, "items": [
+        {"product_variant_id": propio_id, "quantity": 1},
+        {"product_variant_id": propio_id, "quantity": 2},
+    ]})
+    assert r.status_code == 200
+    assert r.json()["amount"] == 21000
+    # El mismo producto repetido reutiliza una sola variante "Base"
+    assert db_session.query(models.ProductVariant).filter_by(product_id=uuid.UUID(propio_id)).count() == 1
+
+    r = client.post("/public/checkout", json={**base, "items": [{"product_variant_id": ajena_id, "quantity": 1}]})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Variante no pertenece a esta tienda"
+
+
 # ── GET /public/payment/{payment_id} ─────────────────────────────────────
 
 def test_get_payment_status(client, tienda, producto, db_session):
@@ -344,3 +463,4 @@ def test_webhook_aprueba_pago_y_crea_orden(client, tienda, producto, db_session,
     orders = db_session.query(models.Order).filter(models.Order.tenant_id == tienda.id).all()
     assert len(orders) == 1
     assert orders[0].payment_method == "wompi"
+
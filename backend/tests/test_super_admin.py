@@ -12,6 +12,83 @@ def test_sa_stats(client, admin_token):
     assert "total_tenants" in data or "tenants" in data or isinstance(data, dict)
 
 
+def _orden(db, tenant, total, comision, cuando):
+    db.add(models.Order(tenant_id=tenant.id, customer_name="Ana", total_price=total,
+                        commission_amount=comision, status="completed", created_at=cuando))
+
+
+def test_sa_stats_una_consulta_sin_snapshot(client, admin_token, tenant_user, db_session):
+    import datetime as dt
+    import re
+    from sqlalchemy import event
+    engine = db_session.get_bind()
+    ahora = dt.datetime.utcnow()
+    _orden(db_session, tenant_user, 1000.0, 30.0, ahora)
+    _orden(db_session, tenant_user, 500.0, 15.0, dt.datetime(2020, 1, 1))
+    db_session.commit()
+    consultas = []
+    listener = lambda conn, cur, stmt, *a: consultas.append(stmt)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        r = client.get("/super-admin/stats", headers={"Authorization": f"Bearer {admin_token}"})
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    data = r.json()
+    assert r.status_code == 200
+    assert data["total_companies"] == 1 and data["active_companies"] == 1
+    assert data["total_users"] == 2  # super admin + tenant
+    assert data["total_orders"] == 2
+    assert data["total_revenue"] == 1500.0 and data["total_commission"] == 45.0
+    assert data["revenue_today"] == 1000.0 and data["commission_today"] == 30.0
+    assert data["revenue_month"] == 1000.0 and data["kpi_snapshot_at"] is None
+    # Los pedidos se leen en una sola consulta
+    assert len([q for q in consultas if re.search(r"\borders\b", q)]) == 1
+
+
+def test_sa_stats_snapshot_mas_delta(client, admin_token, tenant_user, db_session):
+    import datetime as dt
+    import platform_kpis
+    ahora = dt.datetime.utcnow()
+    _orden(db_session, tenant_user, 1000.0, 30.0, ahora - dt.timedelta(hours=1))
+    _orden(db_session, tenant_user, 500.0, 15.0, dt.datetime(2020, 1, 1))
+    db_session.commit()
+    platform_kpis.refresh(db_session, now=ahora)
+    # Pedido posterior al watermark: entra por el delta
+    _orden(db_session, tenant_user, 200.0, 6.0, ahora)
+    db_session.commit()
+
+    r = client.get("/super-admin/stats", headers={"Authorization": f"Bearer {admin_token}"})
+    data = r.json()
+    assert data["kpi_snapshot_at"] is not None
+    assert data["total_orders"] == 3 and data["total_users"] == 2
+    assert data["total_revenue"] == 1700.0 and data["total_commission"] == 51.0
+    if ahora - dt.timedelta(hours=1) >= dt.datetime(ahora.year, ahora.month, ahora.day):
+        assert data["revenue_today"] == 1200.0
+    # Igual al cálculo completo en vivo
+    vivo = platform_kpis.aggregate(db_session, *platform_kpis._buckets(ahora))
+    assert (vivo["orders"], vivo["revenue"]) == (data["total_orders"], data["total_revenue"])
+
+
+def test_platform_kpis_snapshot_de_ayer_no_suma_al_dia(db_session, tenant_user):
+    import datetime as dt
+    import platform_kpis
+    ayer = dt.datetime(2026, 3, 10, 12, 0)
+    hoy = dt.datetime(2026, 3, 11, 9, 0)
+    _orden(db_session, tenant_user, 1000.0, 30.0, ayer - dt.timedelta(hours=2))
+    db_session.commit()
+    platform_kpis.refresh(db_session, now=ayer)
+    _orden(db_session, tenant_user, 300.0, 9.0, hoy - dt.timedelta(hours=1))
+    db_session.commit()
+
+    data = platform_kpis.get_kpis(db_session, now=hoy)
+    assert data["total_revenue"] == 1300.0 and data["total_orders"] == 2
+    assert data["revenue_today"] == 300.0 and data["commission_today"] == 9.0
+    assert data["revenue_month"] == 1300.0 and data["commission_month"] == 39.0
+    # Mes nuevo: el acumulado mensual del snapshot ya no cuenta
+    data = platform_kpis.get_kpis(db_session, now=dt.datetime(2026, 4, 1, 0, 5))
+    assert data["revenue_month"] == 0.0 and data["total_revenue"] == 1300.0
+
+
 def test_sa_stats_requiere_super_admin(client, tenant_token):
     r = client.get("/super-admin/stats", headers={"Authorization": f"Bearer {tenant_token}"})
     assert r.status_code == 403
@@ -48,6 +125,13 @@ def test_sa_suspender_empresa(client, admin_token, tenant_user, db_session):
     assert tenant_user.status == "Suspendido"
 
 
+def test_sa_suspender_corta_sesion_activa(client, admin_token, tenant_user, tenant_token):
+    headers = {"Authorization": f"Bearer {tenant_token}"}
+    assert client.get("/auth/me", headers=headers).status_code == 200
+    client.put(f"/super-admin/companies/{tenant_user.id}/suspend", headers={"Authorization": f"Bearer {admin_token}"})
+    assert client.get("/auth/me", headers=headers).status_code == 403
+
+
 def test_sa_reactivar_empresa(client, admin_token, tenant_user, db_session):
     tenant_user.status = "Suspendido"
     db_session.commit()
@@ -105,6 +189,96 @@ def test_sa_treasury(client, admin_token):
     assert isinstance(data, dict)
 
 
+def _rollup(db, tenant):
+    return {r.day: (r.revenue, r.commission, r.orders) for r in
+            db.query(models.TenantDailyRevenue).filter(models.TenantDailyRevenue.tenant_id == tenant.id)}
+
+
+def test_tenant_revenue_se_mantiene_en_escrituras(db_session, tenant_user):
+    import datetime as dt
+    import tenant_revenue  # noqa: F401
+    d1, d2 = dt.datetime(2026, 5, 3, 10), dt.datetime(2026, 5, 4, 9)
+    a = models.Order(tenant_id=tenant_user.id, total_price=1000.0, commission_amount=30.0, created_at=d1)
+    b = models.Order(tenant_id=tenant_user.id, total_price=500.0, commission_amount=15.0, created_at=d1)
+    db_session.add_all([a, b])
+    db_session.commit()
+    assert _rollup(db_session, tenant_user) == {d1.date(): (1500.0, 45.0, 2)}
+
+    # Cambio de monto (con el atributo expirado tras el commit) y de día
+    a.total_price = 1200.0
+    b.created_at = d2
+    db_session.commit()
+    assert _rollup(db_session, tenant_user) == {d1.date(): (1200.0, 30.0, 1), d2.date(): (500.0, 15.0, 1)}
+
+    db_session.delete(a)
+    db_session.commit()
+    assert _rollup(db_session, tenant_user)[d1.date()] == (0.0, 0.0, 0)
+
+    # Un flush que falla no deja deltas para el siguiente
+    db_session.add(models.Order(tenant_id=tenant_user.id, total_price=1.0, created_at=d2))
+    db_session.add(models.User(email=tenant_user.email, hashed_password="x"))  # email duplicado
+    with pytest.raises(Exception):
+        db_session.commit()
+    db_session.rollback()
+    db_session.commit()
+    assert _rollup(db_session, tenant_user)[d2.date()] == (500.0, 15.0, 1)
+
+
+def test_sa_treasury_y_reports_desde_rollup(client, admin_token, tenant_user, db_session):
+    import datetime as dt
+    plan = models.Plan(name="Pro", commission_rate=0.03)
+    db_session.add(plan)
+    db_session.flush()
+    tenant_user.plan_id = plan.id
+    tenant_user.category = "Moda"
+    ahora = dt.datetime.utcnow()
+    for total, cuando in ((1000.0, ahora - dt.timedelta(hours=2)), (400.0, ahora - dt.timedelta(days=3)),
+                          (300.0, ahora - dt.timedelta(days=10)), (999.0, ahora - dt.timedelta(days=400))):
+        db_session.add(models.Order(tenant_id=tenant_user.id, total_price=total, commission_amount=total / 100,
+                                    customer_email=f"c{int(total)}@x.com", created_at=cuando))
+    db_session.commit()
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    data = client.get("/super-admin/treasury", headers=headers).json()
+    assert sum(m["rev"] for m in data["monthly"]) == 1700.0
+    assert sum(m["orders"] for m in data["monthly"]) == 3
+    assert data["companies"] == [{"name": "Tienda Test", "rev": 1700.0, "orders": 3, "plan": "Pro", "pct": 100}]
+    assert [t["amount"] for t in data["transactions"]] == [1000.0, 400.0, 300.0]
+    assert data["transactions"][0]["company"] == "Tienda Test"
+
+    data = client.get("/super-admin/reports?period=semana", headers=headers).json()
+    assert data["kpis"]["rev"] == 1400.0 and data["kpis"]["orders"] == 2
+    assert data["kpis"]["com"] == 14.0 and data["kpis"]["users"] == 2
+    assert data["kpis"]["delta"] == round((1400.0 - 300.0) / 300.0 * 100)
+    assert data["top"] == [{"name": "Tienda Test", "rev": 1400.0, "pct": 100, "plan": "Pro"}]
+    assert data["sectors"][0]["label"] == "Moda"
+    assert max(a["v"] for a in data["activity"]) == 1.0
+
+
+def test_sa_treasury_y_reports_cuentan_pedidos_sin_tenant(client, admin_token, tenant_user, db_session):
+    import datetime as dt
+    ahora = dt.datetime.utcnow()
+    db_session.add(models.Order(tenant_id=tenant_user.id, total_price=1000.0, commission_amount=10.0,
+                                customer_email="c1@x.com", created_at=ahora - dt.timedelta(days=3)))
+    # Uno entero (día completo, va por el rollup) y uno en el borde de hoy
+    for total, cuando in ((200.0, ahora - dt.timedelta(days=2)), (50.0, ahora)):
+        db_session.add(models.Order(tenant_id=None, total_price=total, commission_amount=total / 100,
+                                    customer_email=f"s{int(total)}@x.com", created_at=cuando))
+    db_session.commit()
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    data = client.get("/super-admin/treasury", headers=headers).json()
+    assert sum(m["rev"] for m in data["monthly"]) == 1250.0
+    assert sum(m["orders"] for m in data["monthly"]) == 3
+    assert [c["rev"] for c in data["companies"]] == [1000.0]
+
+    data = client.get("/super-admin/reports?period=semana", headers=headers).json()
+    assert data["kpis"]["rev"] == 1250.0 and data["kpis"]["orders"] == 3
+    assert data["kpis"]["com"] == 12.5
+    assert data["top"] == [{"name": "Tienda Test", "rev": 1000.0, "pct": 100, "plan": "Básico"}]
+    assert [(s["label"], s["pct"]) for s in data["sectors"]] == [("Moda & Accesorios", 100), ("Otros", 25)]
+
+
 def test_sa_treasury_requiere_super_admin(client, tenant_token):
     r = client.get("/super-admin/treasury", headers={"Authorization": f"Bearer {tenant_token}"})
     assert r.status_code == 403
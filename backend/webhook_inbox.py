@@ -0,0 +1,211 @@
+"""
+Inbox de webhooks de pasarelas de pago.
+
+payment_webhook verificaba la firma, bloqueaba el pago y, antes de responder,
+creaba el pedido (finalize_web_order) dentro del request. Con la base lenta
+Wompi no recibía el 200 a tiempo y reintentaba, sumando más carga sobre el
+mismo pago.
+
+Ahora el webhook sólo verifica la firma, guarda el evento en webhook_inbox y
+responde 200:
+  - Deduplicación: índice único (provider, transaction_id, tx_status). Una
+    reentrega del mismo evento choca con el índice y no se encola dos veces;
+    un cambio de estado de la misma transacción (PENDING → APPROVED) sí entra.
+  - Orden por pago: sólo el evento abierto más antiguo de cada `reference` es
+    elegible, así dos eventos del mismo pago nunca se procesan a la vez ni
+    fuera de orden.
+  - Reclamo sin locks largos: UPDATE ... SET status='processing' WHERE
+    status='pending' con un lease (locked_until). Si el worker muere, el
+    evento vuelve a ser elegible al vencer el lease.
+  - Reintentos con backoff exponencial; tras MAX_ATTEMPTS queda en "dead".
+
+Sin los workers corriendo (tests, scripts) el evento se procesa en línea con
+la sesión del request, justo después de guardarlo.
+"""
+import datetime as _dt
+import logging
+import os
+import threading
+
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+import models
+
+logger = logging.getLogger("bayup.webhook_inbox")
+
+WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+POLL_INTERVAL_MS = int(os.getenv("WEBHOOK_POLL_MS", "500"))
+BATCH_SIZE = 20
+LEASE_S = 120
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_S = 5
+BACKOFF_MAX_S = 3600
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+DEAD = "dead"
+_OPEN = (PENDING, PROCESSING)
+
+_wakeup = threading.Event()
+
+
+def _handler(provider: str):
+    if provider == "wompi":
+        from routers.payments import apply_wompi_event
+        return apply_wompi_event
+    raise ValueError(f"proveedor de webhook desconocido: {provider}")
+
+
+# ── Recepción (dentro del request del webhook) ────────────────────────────
+
+def store(db, provider: str, transaction_id: str, tx_status: str, reference: str, payload: dict):
+    """Guarda el evento y hace commit. Devuelve la fila, o None si ya estaba
+    (reentrega del mismo evento)."""
+    row = models.WebhookInbox(
+        provider=provider, transaction_id=transaction_id, tx_status=tx_status,
+        reference=reference, payload=payload,
+    )
+    db.add(row)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return row
+
+
+def after_commit(db, row) -> None:
+    """Despierta a los workers, o procesa el evento en línea si no corren."""
+    if _workers_started:
+        _wakeup.set()
+        return
+    if _claim_one(db, row.id):
+        _process(db, row.id)
+
+
+# ── Proceso ───────────────────────────────────────────────────────────────
+
+def _backoff(attempts: int) -> _dt.timedelta:
+    return _dt.timedelta(seconds=min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (attempts - 1)))
+
+
+def _claim_one(db, event_id: int) -> bool:
+    """Pasa un evento a 'processing' si nadie lo tomó (o su lease venció)."""
+    I = models.WebhookInbox
+    now = _dt.datetime.utcnow()
+    res = db.execute(
+        update(I).where(
+            I.id == event_id,
+            or_(I.status == PENDING, and_(I.status == PROCESSING, I.locked_until < now)),
+        ).values(status=PROCESSING, locked_until=now + _dt.timedelta(seconds=LEASE_S))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return res.rowcount == 1
+
+
+def _claim(db, limit: int) -> list[int]:
+    """Reclama hasta `limit` eventos: el más antiguo abierto de cada pago,
+    listo para (re)intentar."""
+    I = models.WebhookInbox
+    older = aliased(models.WebhookInbox)
+    now = _dt.datetime.utcnow()
+    head = db.query(func.min(older.id)).filter(
+        older.reference == I.reference, older.status.in_(_OPEN),
+    ).scalar_subquery()
+    ids = [r[0] for r in db.query(I.id).filter(
+        I.status.in_(_OPEN),
+        I.next_attempt_at <= now,
+        or_(I.status == PENDING, I.locked_until < now),
+        I.id == head,
+    ).order_by(I.id).limit(limit)]
+    db.rollback()
+    return [i for i in ids if _claim_one(db, i)]
+
+
+def _process(db, event_id: int) -> None:
+    row = db.get(models.WebhookInbox, event_id)
+    try:
+        _handler(row.provider)(db, row.payload)
+        row.status = DONE
+        row.processed_at = _dt.datetime.utcnow()
+        row.last_error = None
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        row = db.get(models.WebhookInbox, event_id)
+        row.attempts = (row.attempts or 0) + 1
+        row.last_error = str(e)[:500]
+        if row.attempts >= MAX_ATTEMPTS:
+            row.status = DEAD
+            logger.error("webhook_inbox: evento %s descartado tras %d intentos: %s", event_id, row.attempts, e)
+        else:
+            row.status = PENDING
+            row.next_attempt_at = _dt.datetime.utcnow() + _backoff(row.attempts)
+            logger.warning("webhook_inbox: evento %s falló (intento %d): %s", event_id, row.attempts, e)
+        row.locked_until = None
+        db.commit()
+
+
+def process_pending(db, limit: int = BATCH_SIZE) -> int:
+    ids = _claim(db, limit)
+    for event_id in ids:
+        _process(db, event_id)
+    return len(ids)
+
+
+def stats(db) -> dict:
+    I = models.WebhookInbox
+    now = _dt.datetime.utcnow()
+    by_status = {s: n for s, n in db.query(I.status, func.count()).group_by(I.status)}
+    oldest = db.query(func.min(I.received_at)).filter(I.status.in_(_OPEN)).scalar()
+    recent = db.query(I.received_at, I.processed_at).filter(
+        I.status == DONE, I.processed_at >= now - _dt.timedelta(hours=1),
+    ).all()
+    latencies = sorted((p - r).total_seconds() for r, p in recent if r and p)
+    return {
+        "by_status": by_status,
+        "oldest_open_at": oldest.isoformat() if oldest else None,
+        "lag_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0,
+        "processed_last_hour": len(latencies),
+        "latency_p50_s": round(latencies[len(latencies) // 2], 2) if latencies else None,
+        "latency_max_s": round(latencies[-1], 2) if latencies else None,
+        "workers_running": _workers_started,
+    }
+
+
+# ── Workers en segundo plano ──────────────────────────────────────────────
+
+def _worker_loop() -> None:
+    from database import SessionLocal
+    while True:
+        _wakeup.wait(POLL_INTERVAL_MS / 1000)
+        _wakeup.clear()
+        db = SessionLocal()
+        try:
+            while process_pending(db) == BATCH_SIZE:
+                pass
+        except Exception as e:
+            db.rollback()
+            logger.warning("webhook_inbox worker error: %s", e)
+        finally:
+            db.close()
+
+
+_workers_started = False
+_workers_lock = threading.Lock()
+
+
+def start_workers() -> None:
+    """Arranca WEBHOOK_WORKERS workers en background. Idempotente."""
+    global _workers_started
+    with _workers_lock:
+        if _workers_started:
+            return
+        _workers_started = True
+    for i in range(max(1, WORKERS)):
+        threading.Thread(target=_worker_loop, daemon=True, name=f"webhook-inbox-{i}").start()
+    logger.info("webhook_inbox: %d workers iniciados", max(1, WORKERS))